@@ -60,6 +60,7 @@ class SmartHomeConfig:
             'smart_home_config.json',
             'smart_home_1st_conf.json',
             'management_logs.json',
+            'management_logs.jsonl',
             'notifications_settings.json'
         ]
         
@@ -1,4 +1,3 @@
-import json
 import os
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -6,6 +5,7 @@ import requests
 import uuid
 import threading
 import time
+from utils import json_serializer
 from utils.weather_service import WeatherService
 from utils.json_backup_manager import JSONBackupManager
 
@@ -73,8 +73,8 @@ class SmartHomeSystem:
         """Wczytuje pierwszą konfigurację z niezahaszowanymi hasłami"""
         try:
             if os.path.exists(self.first_config_file):
-                with open(self.first_config_file, 'r') as f:
-                    config = json.load(f)
+                with open(self.first_config_file, 'rb') as f:
+                    config = json_serializer.loads(f.read())
                     
                     self.users = config.get('users', self.default_config['users'].copy())
                     self.temperature_states = config.get('temperature_states', self.default_config['temperature_states'].copy())
@@ -102,26 +102,26 @@ class SmartHomeSystem:
         """Wczytuje standardową konfigurację"""
         try:
             if os.path.exists(self.config_file):
-                with open(self.config_file, 'r') as f:
-                    config = json.load(f)
-                    self.users = config.get('users', self.default_config['users'].copy())
-                    self.temperature_states = config.get('temperature_states', self.default_config['temperature_states'].copy())
-                    self.security_state = config.get('security_state', self.default_config['security_state'])
-                    self.rooms = config.get('rooms', self.default_config['rooms'].copy())
-                    self.buttons = config.get('buttons', self.default_config['buttons'].copy())
-                    self.temperature_controls = config.get('temperature_controls', self.default_config['temperature_controls'].copy())
-                    self.automations = config.get('automations', self.default_config['automations'].copy())
-                    
-                    # MIGRACJA: nadaj brakujące id po wczytaniu
-                    for device in self.buttons:
-                        if 'id' not in device:
-                            device['id'] = str(uuid.uuid4())
-                    for device in self.temperature_controls:
-                        if 'id' not in device:
-                            device['id'] = str(uuid.uuid4())
-                    # MIGRACJA użytkowników na UUID
-                    self.migrate_users_to_uuid()
-                    print(f"Załadowano konfigurację z {self.config_file}")
+                # Przez JSONBackupManager, aby uwzględnić dziennik operacji i shardy domów
+                config = self.json_backup.get_config()
+                self.users = config.get('users', self.default_config['users'].copy())
+                self.temperature_states = config.get('temperature_states', self.default_config['temperature_states'].copy())
+                self.security_state = config.get('security_state', self.default_config['security_state'])
+                self.rooms = config.get('rooms', self.default_config['rooms'].copy())
+                self.buttons = config.get('buttons', self.default_config['buttons'].copy())
+                self.temperature_controls = config.get('temperature_controls', self.default_config['temperature_controls'].copy())
+                self.automations = config.get('automations', self.default_config['automations'].copy())
+                
+                # MIGRACJA: nadaj brakujące id po wczytaniu
+                for device in self.buttons:
+                    if 'id' not in device:
+                        device['id'] = str(uuid.uuid4())
+                for device in self.temperature_controls:
+                    if 'id' not in device:
+                        device['id'] = str(uuid.uuid4())
+                # MIGRACJA użytkowników na UUID
+                self.migrate_users_to_uuid()
+                print(f"Załadowano konfigurację z {self.config_file}")
             else:
                 print(f"Plik {self.config_file} nie istnieje. Używam domyślnej konfiguracji.")
                 self.load_default_config()
@@ -169,7 +169,11 @@ class SmartHomeSystem:
                     if 'id' not in device:
                         device['id'] = str(uuid.uuid4())
                 
-                config = {
+                # Zapis przez JSONBackupManager: trzyma międzyprocesową blokadę
+                # pliku i zachowuje klucze spoza tej klasy (domy, członkostwa,
+                # metadata.journal_seq), więc dziennik nie jest odtwarzany ponownie
+                config = self.json_backup.get_config()
+                config.update({
                     'users': self.users,
                     'temperature_states': self.temperature_states,
                     'security_state': self.security_state,
@@ -177,18 +181,13 @@ class SmartHomeSystem:
                     'buttons': self.buttons,
                     'temperature_controls': self.temperature_controls,
                     'automations': self.automations
-                }
+                })
                 
                 # Spróbuj zapisać z mechanizmem ponawiania
                 for attempt in range(max_retries):
                     try:
-                        # Zapisz do tymczasowego pliku, potem przenieś
-                        temp_file = self.config_file + '.tmp'
-                        with open(temp_file, 'w') as f:
-                            json.dump(config, f, indent=4, ensure_ascii=False)
-                        
-                        # Atomowe przeniesienie pliku
-                        os.replace(temp_file, self.config_file)
+                        if not self.json_backup.save_config(config):
+                            raise OSError("JSONBackupManager.save_config nie powiódł się")
                         
                         self.last_save_time = datetime.now()
                         print(f"Zapisano konfigurację do {self.config_file} (próba {attempt + 1})")
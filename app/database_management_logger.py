@@ -3,26 +3,55 @@ Database Management Logger for SmartHome System
 Handles persistent logging of management events using PostgreSQL database
 This replaces the JSON-based logging system with database storage.
 Supports multi-home logging by using MultiHomeDBManager when available.
+
+log_event() only puts the event on a bounded queue; a background writer
+resolves users through a small cache and stores events in batches with
+one multi-row INSERT. Pending events are flushed before logs are read or
+deleted and when the interpreter exits. Expired rows are removed by the
+daily retention job (utils.log_retention), not on the write path.
+
+Configuration (environment variables):
+    MANAGEMENT_LOG_ASYNC            false to write on the calling thread
+    MANAGEMENT_LOG_QUEUE_SIZE       Events buffered before new ones are dropped (default: 10000)
+    MANAGEMENT_LOG_BATCH_SIZE       Events per INSERT (default: 200)
+    MANAGEMENT_LOG_FLUSH_INTERVAL   Seconds the writer gathers a batch (default: 1.0)
+    MANAGEMENT_LOG_USER_CACHE_TTL   Seconds a resolved username is cached (default: 300)
 """
-from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+import atexit
+import queue
+import time
+from datetime import datetime
+from typing import Any, List, Dict, Optional
 import threading
 import uuid
 import os
+from utils import log_analytics
 from utils.smart_home_db_manager import SmartHomeDatabaseManager, DatabaseError
 
+# Queue marker asking the writer to store its batch right away
+_FLUSH = object()
+# Seconds a user's current home is cached for events logged without home_id
+_HOME_CACHE_TTL = 30.0
+_CACHE_MAX_ENTRIES = 1024
+
 
 class DatabaseManagementLogger:
     """Database-backed logging system for admin dashboard events"""
     
-    def __init__(self, max_logs: int = 1000, max_days: int = 7, multi_db=None):
+    def __init__(self, max_logs: int = 1000, max_days: int = 7, multi_db=None,
+                 async_writes: Optional[bool] = None, queue_size: Optional[int] = None,
+                 batch_size: Optional[int] = None, flush_interval: Optional[float] = None):
         """
         Initialize database logger
         
         Args:
             max_logs: Maximum number of logs to keep (for compatibility)
-            max_days: Maximum days to keep logs (for auto-cleanup)
+            max_days: Maximum days to keep logs (for compatibility; see utils.log_retention)
             multi_db: Optional MultiHomeDBManager for multi-home support
+            async_writes: Write from a background thread (default: MANAGEMENT_LOG_ASYNC env, on)
+            queue_size: Maximum buffered events (default: MANAGEMENT_LOG_QUEUE_SIZE env)
+            batch_size: Maximum events per INSERT (default: MANAGEMENT_LOG_BATCH_SIZE env)
+            flush_interval: Seconds to gather a batch (default: MANAGEMENT_LOG_FLUSH_INTERVAL env)
         """
         self.max_logs = max_logs
         self.max_days = max_days
@@ -35,6 +64,34 @@ class DatabaseManagementLogger:
         except DatabaseError as e:
             print(f"Failed to initialize database for logging: {e}")
             raise
+        
+        # Background writer
+        if async_writes is None:
+            async_writes = os.getenv('MANAGEMENT_LOG_ASYNC', 'true').lower() in ('true', '1', 'yes')
+        self.async_writes = async_writes
+        self.batch_size = max(1, batch_size or int(os.getenv('MANAGEMENT_LOG_BATCH_SIZE', '200')))
+        if flush_interval is None:
+            flush_interval = float(os.getenv('MANAGEMENT_LOG_FLUSH_INTERVAL', '1.0'))
+        self.flush_interval = max(0.0, flush_interval)
+        self.user_cache_ttl = float(os.getenv('MANAGEMENT_LOG_USER_CACHE_TTL', '300'))
+        self._queue = queue.Queue(maxsize=queue_size or int(os.getenv('MANAGEMENT_LOG_QUEUE_SIZE', '10000')))
+        self._writer = None
+        self._writer_pid = None
+        self._closed = False
+        self._user_cache = {}  # username -> (expires, user_id)
+        self._home_cache = {}  # user_id -> (expires, home_id)
+        self._stats = {
+            'queued': 0,
+            'written': 0,
+            'batches': 0,
+            'dropped': 0,     # queue full, event discarded
+            'failed': 0,      # INSERT failed
+            'skipped': 0,     # no home to log to
+            'max_queue_depth': 0,
+            'last_batch_ms': 0.0,
+        }
+        if self.async_writes:
+            atexit.register(self.close)
     
     def log_event(self, level: str, message: str, event_type: str = 'general', 
                   user: Optional[str] = None, ip_address: Optional[str] = None, 
@@ -42,6 +99,9 @@ class DatabaseManagementLogger:
         """
         Log a management event to database
         
+        The event is timestamped now and queued; it is written by the
+        background writer (or right away when async writes are off).
+        
         Args:
             level: 'info', 'warning', 'error'
             message: Human readable message
@@ -51,90 +111,250 @@ class DatabaseManagementLogger:
             details: Additional event details
             home_id: Optional home ID for multi-home logging
         """
+        event = {
+            'timestamp': datetime.now().astimezone(),
+            'level': level,
+            'message': message,
+            'event_type': event_type,
+            'user': user or "",
+            'ip_address': ip_address or "",
+            'details': details or {},
+            'home_id': home_id,
+        }
+        if not self.async_writes or self._closed:
+            self._write_batch([event])
+            return
+        
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            with self._lock:
+                self._stats['dropped'] += 1
+            return
+        with self._lock:
+            self._stats['queued'] += 1
+            self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'], self._queue.qsize())
+    
+    # ------------------------------------------------------------------
+    # Background writer
+    # ------------------------------------------------------------------
+    
+    def _ensure_writer(self):
+        """Start the writer thread (again after a fork, which only copies the calling thread)"""
+        if self._writer is not None and self._writer_pid == os.getpid() and self._writer.is_alive():
+            return
+        with self._lock:
+            if self._writer is not None and self._writer_pid == os.getpid() and self._writer.is_alive():
+                return
+            if self._writer_pid is not None and self._writer_pid != os.getpid():
+                # The parent's queued events are the parent's to write
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._writer_pid = os.getpid()
+            self._writer = threading.Thread(target=self._run_writer, name='management-log-writer', daemon=True)
+            self._writer.start()
+    
+    def _run_writer(self):
+        """Gather events for up to flush_interval (or batch_size events) and store them"""
+        events_queue = self._queue
+        while True:
+            try:
+                item = events_queue.get(timeout=1.0)
+            except queue.Empty:
+                if self._closed:
+                    return
+                continue
+            
+            items = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while item is not _FLUSH and len(items) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = events_queue.get(timeout=remaining) if remaining > 0 else events_queue.get_nowait()
+                except queue.Empty:
+                    break
+                items.append(item)
+            
+            try:
+                self._write_batch([event for event in items if event is not _FLUSH])
+            finally:
+                for _ in items:
+                    events_queue.task_done()
+            if self._closed and events_queue.empty():
+                return
+    
+    def flush(self, timeout: Optional[float] = 5.0) -> bool:
+        """
+        Wait until queued events are written
+        
+        Args:
+            timeout: Maximum seconds to wait (None = no limit)
+            
+        Returns:
+            True if nothing is pending anymore
+        """
+        events_queue = self._queue
+        if not events_queue.unfinished_tasks or self._writer is None or not self._writer.is_alive():
+            return not events_queue.unfinished_tasks
+        try:
+            # Cut the writer's gathering short
+            events_queue.put(_FLUSH, timeout=timeout)
+        except queue.Full:
+            return False
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with events_queue.all_tasks_done:
+            while events_queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                events_queue.all_tasks_done.wait(remaining)
+        return True
+    
+    def close(self, timeout: float = 5.0):
+        """Flush pending events and stop the writer (registered to run at exit)"""
+        if self._closed:
+            return
+        self.flush(timeout)
+        self._closed = True
+        if self._writer is not None and self._writer_pid == os.getpid():
+            try:
+                self._queue.put_nowait(_FLUSH)  # wake the writer so it sees _closed
+            except queue.Full:
+                pass
+            self._writer.join(timeout)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Writer counters (queued, written, dropped, failed, ...) and the current queue depth"""
         with self._lock:
+            stats = dict(self._stats)
+        stats['queue_depth'] = self._queue.qsize()
+        stats['async_writes'] = self.async_writes
+        return stats
+    
+    def _cached(self, cache: Dict, key: Any, ttl: float, load):
+        """Get a value from a small TTL cache, loading it on a miss"""
+        now = time.monotonic()
+        entry = cache.get(key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        value = load()
+        if len(cache) >= _CACHE_MAX_ENTRIES:
+            cache.clear()
+        cache[key] = (now + ttl, value)
+        return value
+    
+    def _resolve_user_id(self, user: str) -> Optional[str]:
+        """User id for a username or email (cached)"""
+        if not user:
+            return None
+        
+        def load():
+            if self.multi_db:
+                user_data = self.multi_db.find_user_by_email_or_username(user)
+                return user_data.get('id') if user_data else None
+            user_data = self.db.get_user_by_login(user)
+            if user_data and len(user_data) >= 2 and user_data[0] and user_data[1]:
+                return user_data[0]
+            return None
+        return self._cached(self._user_cache, user, self.user_cache_ttl, load)
+    
+    def _resolve_home_id(self, user_id: Optional[str], user: str) -> Optional[str]:
+        """Home for an event logged without home_id: the user's current, else first home (cached)"""
+        if not user_id:
+            return None
+        
+        def load():
             try:
-                # Get user_id if user is provided
-                user_id = None
-                if user:
-                    if self.multi_db:
-                        user_data = self.multi_db.find_user_by_email_or_username(user)
-                        if user_data:
-                            user_id = user_data.get('id')
-                    else:
-                        user_data = self.db.get_user_by_login(user)
-                        if user_data and len(user_data) >= 2 and user_data[0] and user_data[1]:
-                            user_id = user_data[0]
+                home_id = self.multi_db.get_user_current_home(user_id)
+            except Exception:
+                home_id = None
+            if not home_id:
+                print(f"[WARNING] No home_id provided for log event. User: {user}")
+                # Get user's first home as fallback
+                try:
+                    homes = self.multi_db.get_user_homes(user_id)
+                    if homes:
+                        home_id = homes[0]['home_id']
+                        print(f"[INFO] Using fallback home_id: {home_id}")
+                except Exception:
+                    pass
+            return home_id
+        return self._cached(self._home_cache, user_id, _HOME_CACHE_TTL, load)
+    
+    def _write_batch(self, events: List[Dict[str, Any]]):
+        """Store events; never raises so logging can't break the application"""
+        if not events:
+            return
+        started = time.perf_counter()
+        written = failed = skipped = 0
+        try:
+            entries = []
+            for event in events:
+                try:
+                    user_id = self._resolve_user_id(event['user'])
+                except Exception as e:
+                    print(f"Failed to resolve user for log event: {e}")
+                    user_id = None
                 
-                # Use multi-home logging if multi_db is available
-                if self.multi_db:
-                    # If home_id is None, try to get it from user's current home
-                    effective_home_id = home_id
-                    if not effective_home_id and user_id:
-                        # Try to get user's current home
-                        try:
-                            effective_home_id = self.multi_db.get_user_current_home(user_id)
-                        except:
-                            pass
-                    
-                    # If still None, use default (this shouldn't happen in normal operation)
-                    if not effective_home_id:
-                        print(f"[WARNING] No home_id provided for log event. Event: {event_type}, User: {user}")
-                        # Get user's first home as fallback
-                        if user_id:
-                            try:
-                                homes = self.multi_db.get_user_homes(user_id)
-                                if homes:
-                                    effective_home_id = homes[0]['home_id']
-                                    print(f"[INFO] Using fallback home_id: {effective_home_id}")
-                            except:
-                                pass
-                    
-                    if effective_home_id:
-                        self.multi_db.add_home_management_log(
-                            home_id=effective_home_id,
-                            level=level,
-                            message=message,
-                            event_type=event_type,
+                if not self.multi_db:
+                    # Single-home logging
+                    try:
+                        self.db.add_management_log(
+                            level=event['level'],
+                            message=event['message'],
+                            event_type=event['event_type'],
                             user_id=user_id,
-                            username=user or "",
-                            ip_address=ip_address or "",
-                            details=details or {}
+                            username=event['user'],
+                            ip_address=event['ip_address'],
+                            details=event['details']
                         )
-                    else:
-                        print(f"[WARNING] Cannot log to multi-home system: no home_id available for user {user}. Skipping log.")
-                        # Don't fail - just skip logging for users without homes (e.g., during password reset before first login)
-                else:
-                    # Fallback to single-home logging
-                    self.db.add_management_log(
-                        level=level,
-                        message=message,
-                        event_type=event_type,
-                        user_id=user_id,
-                        username=user or "",
-                        ip_address=ip_address or "",
-                        details=details or {}
-                    )
+                        written += 1
+                    except Exception as e:
+                        print(f"Failed to log event: {e}")
+                        failed += 1
+                    continue
                 
-                # Auto-cleanup old logs if enabled
-                self._auto_cleanup_old_logs()
-                
-            except Exception as e:
-                print(f"Failed to log event: {e}")
-                import traceback
-                traceback.print_exc()
-                # Don't raise exception to avoid breaking the main application
-    
-    def _auto_cleanup_old_logs(self):
-        """Remove logs older than max_days"""
-        try:
-            if self.max_days > 0:
-                # Use the database method to delete old logs
-                cutoff_date = datetime.now() - timedelta(days=self.max_days)
-                # We can implement this cleanup in the database manager if needed
-                # For now, we'll skip auto-cleanup to avoid complexity
-                pass
+                home_id = event['home_id'] or self._resolve_home_id(user_id, event['user'])
+                if not home_id:
+                    # Don't fail - just skip logging for users without homes (e.g., during password reset before first login)
+                    print(f"[WARNING] Cannot log to multi-home system: no home_id available for user {event['user']}. Skipping log.")
+                    skipped += 1
+                    continue
+                entries.append({
+                    'home_id': home_id,
+                    'timestamp': event['timestamp'],
+                    'level': event['level'],
+                    'message': event['message'],
+                    'event_type': event['event_type'],
+                    'user_id': user_id,
+                    'username': event['user'],
+                    'ip_address': event['ip_address'],
+                    'details': event['details'],
+                })
+            
+            if entries:
+                try:
+                    written += self.multi_db.add_home_management_logs(entries)
+                except Exception as e:
+                    # One bad row fails the whole INSERT; store the others one by one
+                    print(f"Failed to write {len(entries)} log events in one batch: {e}")
+                    for entry in entries:
+                        try:
+                            written += self.multi_db.add_home_management_logs([entry])
+                        except Exception as row_error:
+                            print(f"Failed to log event: {row_error}")
+                            failed += 1
         except Exception as e:
-            print(f"Failed to cleanup old logs: {e}")
+            print(f"Failed to log events: {e}")
+            import traceback
+            traceback.print_exc()
+        finally:
+            with self._lock:
+                self._stats['written'] += written
+                self._stats['failed'] += failed
+                self._stats['skipped'] += skipped
+                self._stats['batches'] += 1
+                self._stats['last_batch_ms'] = round((time.perf_counter() - started) * 1000, 2)
     
     def get_logs(self, limit: Optional[int] = None, 
                  level_filter: Optional[str] = None,
@@ -147,6 +367,8 @@ class DatabaseManagementLogger:
             level_filter: Filter by log level
             event_type_filter: Filter by event type
         """
+        # Write events still waiting in the queue first
+        self.flush()
         with self._lock:
             try:
                 # Use database method with filters
@@ -184,6 +406,21 @@ class DatabaseManagementLogger:
                 print(f"Failed to get logs: {e}")
                 return []
     
+    def get_log_analytics(self, start=None, end=None, bucket: str = 'hour') -> Dict[str, Any]:
+        """
+        Count events by type, level, user and time bucket
+        
+        Used without a home context; per-home analytics come from the
+        rollup via MultiHomeDBManager.get_home_log_analytics. Covers the
+        newest max_logs entries.
+        """
+        start_dt, end_dt = log_analytics.resolve_range(start, end, bucket)
+        logs = self.get_logs(limit=self.max_logs)
+        return log_analytics.summarize(
+            ((log['timestamp'], log['event_type'], log['level'], log['user']) for log in logs),
+            start_dt, end_dt, bucket
+        )
+    
     def clear_logs(self, home_id: Optional[str] = None, user_id: Optional[str] = None):
         """
         Clear all logs for a specific home (multi-home mode) or all logs (legacy mode)
@@ -192,6 +429,8 @@ class DatabaseManagementLogger:
             home_id: Home ID to clear logs for (required in multi-home mode)
             user_id: User ID performing the action (for permission check)
         """
+        # Write events still waiting in the queue first
+        self.flush()
         with self._lock:
             try:
                 if self.multi_db and home_id and user_id:
@@ -220,6 +459,8 @@ class DatabaseManagementLogger:
         Returns:
             Number of logs deleted
         """
+        # Write events still waiting in the queue first
+        self.flush()
         with self._lock:
             try:
                 # Validate date formats
@@ -266,6 +507,8 @@ class DatabaseManagementLogger:
         Returns:
             Number of logs deleted
         """
+        # Write events still waiting in the queue first
+        self.flush()
         with self._lock:
             try:
                 if days < 0:
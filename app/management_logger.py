@@ -1,37 +1,150 @@
 """
 Management Logger for SmartHome System
 Handles persistent logging of management events for admin dashboard
+
+Events are appended as JSON lines to the active segment
+(management_logs.jsonl). Once it grows past MANAGEMENT_LOG_SEGMENT_BYTES
+or its oldest entry is older than MANAGEMENT_LOG_SEGMENT_HOURS it is
+renamed to management_logs.<oldest>-<newest>.jsonl, so age-based cleanup
+and date-range deletion drop whole segments without parsing them.
+get_logs() reads the segments backwards from the newest entry.
+A management_logs.json array written by earlier versions is converted on
+start.
 """
 import json
 import os
+import re
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import Iterator, List, Dict, Optional, Tuple
 import threading
 
+from utils import json_serializer, log_analytics
+from utils.file_lock import InterProcessLock
+
+# Timestamps in rotated segment names (oldest-newest entry)
+_SEGMENT_TIME_FORMAT = '%Y%m%d%H%M%S'
+_READ_BLOCK_SIZE = 64 * 1024
+
 
 class ManagementLogger:
     """Persistent logging system for admin dashboard events"""
     
-    def __init__(self, log_file: str = 'management_logs.json', max_logs: int = 1000, max_days: int = 7):
+    def __init__(self, log_file: str = 'management_logs.json', max_logs: int = 1000, max_days: int = 7,
+                 segment_bytes: Optional[int] = None, segment_hours: Optional[float] = None):
+        """
+        Initialize the logger
+        
+        Args:
+            log_file: Legacy JSON file; segments are stored next to it
+            max_logs: Number of newest logs kept (older segments are dropped)
+            max_days: Maximum days to keep logs
+            segment_bytes: Rotate the active segment above this size
+                (default: MANAGEMENT_LOG_SEGMENT_BYTES env, 256 KiB)
+            segment_hours: Rotate the active segment once its oldest entry
+                is this old (default: MANAGEMENT_LOG_SEGMENT_HOURS env, 24)
+        """
         self.log_file = log_file
         self.max_logs = max_logs
         self.max_days = max_days  # Maximum days to keep logs
+        stem = os.path.splitext(os.path.abspath(log_file))[0]
+        self.segment_file = stem + '.jsonl'
+        self._segment_dir = os.path.dirname(stem)
+        self._segment_pattern = re.compile(
+            re.escape(os.path.basename(stem)) + r'\.(\d{14})-(\d{14})(?:-(\d+))?\.jsonl$'
+        )
+        if segment_bytes is None:
+            segment_bytes = int(os.getenv('MANAGEMENT_LOG_SEGMENT_BYTES', str(256 * 1024)))
+        if segment_hours is None:
+            segment_hours = float(os.getenv('MANAGEMENT_LOG_SEGMENT_HOURS', '24'))
+        self.segment_bytes = segment_bytes
+        self.segment_hours = segment_hours
+        self._active_first = None  # (inode, oldest timestamp) of the active segment
         self._lock = threading.RLock()
+        # Other worker processes write the same files; writers hold this
+        # exclusively, readers shared
+        self._file_lock = InterProcessLock(log_file + '.lock')
         self._ensure_log_file_exists()
     
     def _ensure_log_file_exists(self):
-        """Create log file if it doesn't exist"""
-        if not os.path.exists(self.log_file):
-            with open(self.log_file, 'w', encoding='utf-8') as f:
-                json.dump([], f)
+        """Create the active segment, converting a legacy JSON log file"""
+        with self._file_lock.exclusive(), self._lock:
+            if os.path.exists(self.log_file):
+                try:
+                    logs = json_serializer.load(self.log_file)
+                except (OSError, json.JSONDecodeError):
+                    logs = []
+                # The JSON array is newest first, segments are oldest first
+                with open(self.segment_file, 'ab') as f:
+                    for log in reversed(logs if isinstance(logs, list) else []):
+                        f.write(json_serializer.dumps(log) + b'\n')
+                os.replace(self.log_file, self.log_file + '.migrated')
+            elif not os.path.exists(self.segment_file):
+                open(self.segment_file, 'ab').close()
     
-    def _load_logs(self) -> List[Dict]:
-        """Load logs from file"""
+    def _segments(self) -> List[Tuple[str, datetime, datetime]]:
+        """Rotated segments as (path, oldest, newest), oldest first"""
+        found = []
         try:
-            with open(self.log_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
+            names = os.listdir(self._segment_dir)
+        except OSError:
             return []
+        for name in names:
+            match = self._segment_pattern.match(name)
+            if match:
+                first, last = (datetime.strptime(value, _SEGMENT_TIME_FORMAT) for value in match.groups()[:2])
+                # Segments rotated within one second get a -N suffix in creation order
+                found.append((first, last, int(match.group(3) or 0), os.path.join(self._segment_dir, name)))
+        found.sort()
+        return [(path, first, last) for first, last, _, path in found]
+    
+    def _read_lines_reversed(self, path: str) -> Iterator[bytes]:
+        """Yield the lines of a segment from the last to the first"""
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            position = f.seek(0, os.SEEK_END)
+            remainder = b''
+            while position > 0:
+                size = min(_READ_BLOCK_SIZE, position)
+                position -= size
+                f.seek(position)
+                lines = (f.read(size) + remainder).split(b'\n')
+                remainder = lines.pop(0)
+                for line in reversed(lines):
+                    if line.strip():
+                        yield line
+            if remainder.strip():
+                yield remainder
+    
+    def _iter_segment(self, path: str, reverse: bool = False) -> Iterator[Dict]:
+        """Parse the entries of one segment (torn or corrupt lines are skipped)"""
+        if reverse:
+            lines = self._read_lines_reversed(path)
+        else:
+            try:
+                with open(path, 'rb') as f:
+                    lines = f.read().splitlines()
+            except FileNotFoundError:
+                return
+        for line in lines:
+            try:
+                log = json_serializer.loads(line)
+            except ValueError:
+                continue
+            if isinstance(log, dict):
+                yield log
+    
+    def _iter_logs(self) -> Iterator[Dict]:
+        """Yield all entries, newest first"""
+        yield from self._iter_segment(self.segment_file, reverse=True)
+        for path, _, _ in reversed(self._segments()):
+            yield from self._iter_segment(path, reverse=True)
+    
+    def _load_logs(self) -> List[Dict]:
+        """Load all logs, newest first"""
+        return list(self._iter_logs())
     
     def _parse_timestamp(self, timestamp_str: str) -> datetime:
         """Parse timestamp string to datetime object"""
@@ -44,29 +157,68 @@ class ManagementLogger:
             except ValueError:
                 return datetime.now()  # Return current time if parsing fails
     
-    def _auto_cleanup_old_logs(self):
-        """Remove logs older than max_days"""
-        logs = self._load_logs()
-        if not logs:
+    def _entry_time(self, line_or_log) -> datetime:
+        """Timestamp of an entry (a parsed dict or a raw line)"""
+        if not isinstance(line_or_log, dict):
+            try:
+                line_or_log = json_serializer.loads(line_or_log)
+            except ValueError:
+                return datetime.now()
+        return self._parse_timestamp(str(line_or_log.get('timestamp', '')))
+    
+    def _rotate_if_needed(self):
+        """Rename the active segment once it is too large or too old. Locks must be held."""
+        try:
+            stat = os.stat(self.segment_file)
+        except FileNotFoundError:
+            return
+        if stat.st_size == 0:
+            return
+        if self._active_first is None or self._active_first[0] != stat.st_ino:
+            first = next(self._iter_segment(self.segment_file), None)
+            self._active_first = (stat.st_ino, self._entry_time(first) if first else datetime.now())
+        too_old = datetime.now() - self._active_first[1] > timedelta(hours=self.segment_hours)
+        if stat.st_size < self.segment_bytes and not too_old:
             return
         
+        last_line = next(self._read_lines_reversed(self.segment_file), None)
+        last = self._entry_time(last_line) if last_line else self._active_first[1]
+        first = min(self._active_first[1], last)
+        base = os.path.splitext(self.segment_file)[0]
+        name = f"{base}.{first.strftime(_SEGMENT_TIME_FORMAT)}-{last.strftime(_SEGMENT_TIME_FORMAT)}"
+        rotated, suffix = name + '.jsonl', 1
+        while os.path.exists(rotated):
+            rotated = f"{name}-{suffix}.jsonl"
+            suffix += 1
+        os.replace(self.segment_file, rotated)
+        self._active_first = None
+        self._auto_cleanup_old_logs()
+    
+    def _count_lines(self, path: str) -> int:
+        """Number of entries in a segment"""
+        try:
+            with open(path, 'rb') as f:
+                return sum(block.count(b'\n') for block in iter(lambda: f.read(_READ_BLOCK_SIZE), b''))
+        except FileNotFoundError:
+            return 0
+    
+    def _auto_cleanup_old_logs(self):
+        """
+        Drop rotated segments whose newest entry is older than max_days and
+        segments no longer needed to keep the newest max_logs entries.
+        Runs when a segment is rotated; locks must be held.
+        """
         cutoff_date = datetime.now() - timedelta(days=self.max_days)
-        
-        # Filter out old logs
-        filtered_logs = []
-        for log in logs:
-            log_date = self._parse_timestamp(log.get('timestamp', ''))
-            if log_date >= cutoff_date:
-                filtered_logs.append(log)
-        
-    def _save_logs(self, logs: List[Dict]):
-        """Save logs to file"""
-        with open(self.log_file, 'w', encoding='utf-8') as f:
-            json.dump(logs, f, ensure_ascii=False, indent=2)
+        kept = self._count_lines(self.segment_file)
+        for path, _, last in reversed(self._segments()):
+            if last < cutoff_date or kept >= self.max_logs:
+                os.remove(path)
+            else:
+                kept += self._count_lines(path)
     
     def log_event(self, level: str, message: str, event_type: str = 'general', 
                   user: Optional[str] = None, ip_address: Optional[str] = None, 
-                  details: Optional[Dict] = None):
+                  details: Optional[Dict] = None, home_id: Optional[str] = None):
         """
         Log a management event
         
@@ -77,148 +229,186 @@ class ManagementLogger:
             user: Username associated with the event
             ip_address: IP address associated with the event
             details: Additional event details
+            home_id: Home the event belongs to (stored with the entry)
         """
-        with self._lock:
-            logs = self._load_logs()
-            log_entry = {
-                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'level': level,
-                'message': message,
-                'event_type': event_type,
-                'user': user or "",
-                'ip_address': ip_address or "",
-                'details': details if details is not None else {}
-            }
-            logs.insert(0, log_entry)
-            if len(logs) > self.max_logs:
-                logs = logs[:self.max_logs]
-            
-            self._save_logs(logs)
-            
-            # Auto-cleanup old logs after adding new ones
-            self._auto_cleanup_old_logs()
+        log_entry = {
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'level': level,
+            'message': message,
+            'event_type': event_type,
+            'user': user or "",
+            'ip_address': ip_address or "",
+            'details': details if details is not None else {}
+        }
+        if home_id:
+            log_entry['home_id'] = home_id
+        line = json_serializer.dumps(log_entry) + b'\n'
+        with self._file_lock.exclusive(), self._lock:
+            self._rotate_if_needed()
+            with open(self.segment_file, 'ab') as f:
+                f.write(line)
     
     def get_logs(self, limit: Optional[int] = None, 
                  level_filter: Optional[str] = None,
                  event_type_filter: Optional[str] = None) -> List[Dict]:
         """
-        Retrieve logs with optional filtering
+        Retrieve logs with optional filtering, newest first
+        
+        Only as much of the segments is read as is needed to fill the
+        limit (max_logs when not given).
         
         Args:
             limit: Maximum number of logs to return
             level_filter: Filter by log level
             event_type_filter: Filter by event type
         """
-        with self._lock:
-            logs = self._load_logs()
-            
-            # Apply filters
-            if level_filter:
-                logs = [log for log in logs if log.get('level') == level_filter]
-            
-            if event_type_filter:
-                logs = [log for log in logs if log.get('event_type') == event_type_filter]
-            
-            # Apply limit
-            if limit:
-                logs = logs[:limit]
-            
-            return logs
+        limit = limit or self.max_logs
+        logs = []
+        with self._file_lock.shared(), self._lock:
+            for log in self._iter_logs():
+                if level_filter and log.get('level') != level_filter:
+                    continue
+                if event_type_filter and log.get('event_type') != event_type_filter:
+                    continue
+                logs.append(log)
+                if len(logs) >= limit:
+                    break
+        return logs
     
-    def clear_logs(self):
-        """Clear all logs"""
-        with self._lock:
-            self._save_logs([])
+    def get_log_analytics(self, start=None, end=None, bucket: str = 'hour') -> Dict:
+        """
+        Count events by type, level, user and time bucket
+        
+        Same result as MultiHomeDBManager.get_home_log_analytics (see
+        utils.log_analytics). The file log has no rollup, so the entries
+        are read newest first until the start of the range.
+        
+        Args:
+            start: Range start (ISO string or datetime)
+            end: Range end, exclusive (default: now)
+            bucket: Timeline granularity, 'hour' or 'day'
+        """
+        start_dt, end_dt = log_analytics.resolve_range(start, end, bucket)
+        # Entries are stored in local time without offset
+        first = start_dt.replace(tzinfo=None)
+        events = []
+        with self._file_lock.shared(), self._lock:
+            for log in self._iter_logs():
+                moment = self._entry_time(log)
+                if moment < first:
+                    break
+                events.append((moment, log.get('event_type'), log.get('level'), log.get('user')))
+        return log_analytics.summarize(events, start_dt, end_dt, bucket)
     
-    def delete_logs_by_date_range(self, start_date: str = "", end_date: str = "") -> int:
+    def clear_logs(self, home_id: Optional[str] = None, user_id: Optional[str] = None) -> int:
+        """
+        Clear all logs
+        
+        The file log is shared by all homes; home_id and user_id are
+        accepted for compatibility with DatabaseManagementLogger.
+        
+        Returns:
+            Number of logs deleted
+        """
+        with self._file_lock.exclusive(), self._lock:
+            deleted = self._count_lines(self.segment_file)
+            for path, _, _ in self._segments():
+                deleted += self._count_lines(path)
+                os.remove(path)
+            open(self.segment_file, 'wb').close()
+            self._active_first = None
+            return deleted
+    
+    def _delete_range(self, start_dt: Optional[datetime], end_dt: Optional[datetime]) -> int:
+        """
+        Delete entries with start_dt <= timestamp < end_dt (open-ended when None)
+        
+        Rotated segments entirely inside the range are removed without
+        reading them, segments outside it are left alone and only the
+        overlapping ones are rewritten.
+        """
+        def in_range(moment: datetime) -> bool:
+            return (start_dt is None or moment >= start_dt) and (end_dt is None or moment < end_dt)
+        
+        deleted = 0
+        with self._file_lock.exclusive(), self._lock:
+            for path, first, last in self._segments() + [(self.segment_file, None, None)]:
+                if first is not None:
+                    if in_range(first) and in_range(last):
+                        deleted += self._count_lines(path)
+                        os.remove(path)
+                        continue
+                    if (end_dt is not None and first >= end_dt) or (start_dt is not None and last < start_dt):
+                        continue
+                
+                kept, removed = [], 0
+                try:
+                    with open(path, 'rb') as f:
+                        lines = f.read().splitlines()
+                except FileNotFoundError:
+                    continue
+                for line in lines:
+                    if line.strip() and in_range(self._entry_time(line)):
+                        removed += 1
+                    elif line.strip():
+                        kept.append(line + b'\n')
+                if removed:
+                    temp_file = path + '.tmp'
+                    with open(temp_file, 'wb') as f:
+                        f.writelines(kept)
+                    os.replace(temp_file, path)
+                    deleted += removed
+            self._active_first = None
+        return deleted
+    
+    def delete_logs_by_date_range(self, start_date: str = "", end_date: str = "",
+                                  home_id: Optional[str] = None, user_id: Optional[str] = None) -> int:
         """
         Delete logs within a specific date range
         
         Args:
             start_date: Start date in 'YYYY-MM-DD' format (inclusive)
             end_date: End date in 'YYYY-MM-DD' format (inclusive)
+            home_id: Accepted for compatibility with DatabaseManagementLogger
+            user_id: Accepted for compatibility with DatabaseManagementLogger
             
         Returns:
             Number of logs deleted
         """
-        with self._lock:
-            logs = self._load_logs()
-            original_count = len(logs)
-            
-            if not logs:
-                return 0
-            
-            # Parse date parameters
-            start_dt = None
-            end_dt = None
-            
-            if start_date:
-                try:
-                    start_dt = datetime.strptime(start_date, '%Y-%m-%d')
-                except ValueError:
-                    raise ValueError("start_date must be in YYYY-MM-DD format")
-            
-            if end_date:
-                try:
-                    end_dt = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)  # Include end date
-                except ValueError:
-                    raise ValueError("end_date must be in YYYY-MM-DD format")
-            
-            # Filter logs
-            filtered_logs = []
-            for log in logs:
-                log_date = self._parse_timestamp(log.get('timestamp', ''))
-                
-                # Check if log should be kept
-                keep_log = True
-                
-                if start_dt and log_date < start_dt:
-                    keep_log = True  # Before start date, keep
-                elif end_dt and log_date >= end_dt:
-                    keep_log = True  # After end date, keep
-                elif start_dt and end_dt and start_dt <= log_date < end_dt:
-                    keep_log = False  # Within range, delete
-                elif start_dt and not end_dt and log_date >= start_dt:
-                    keep_log = False  # From start date onwards, delete
-                elif end_dt and not start_dt and log_date < end_dt:
-                    keep_log = False  # Up to end date, delete
-                
-                if keep_log:
-                    filtered_logs.append(log)
-            
-            # Save filtered logs
-            self._save_logs(filtered_logs)
-            return original_count - len(filtered_logs)
+        # Parse date parameters
+        start_dt = None
+        end_dt = None
+        
+        if start_date:
+            try:
+                start_dt = datetime.strptime(start_date, '%Y-%m-%d')
+            except ValueError:
+                raise ValueError("start_date must be in YYYY-MM-DD format")
+        
+        if end_date:
+            try:
+                end_dt = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)  # Include end date
+            except ValueError:
+                raise ValueError("end_date must be in YYYY-MM-DD format")
+        
+        if start_dt is None and end_dt is None:
+            return 0
+        return self._delete_range(start_dt, end_dt)
     
-    def delete_logs_older_than(self, days: int) -> int:
+    def delete_logs_older_than(self, days: int, home_id: Optional[str] = None,
+                               user_id: Optional[str] = None) -> int:
         """
         Delete logs older than specified number of days
         
         Args:
             days: Number of days to keep (delete older logs)
+            home_id: Accepted for compatibility with DatabaseManagementLogger
+            user_id: Accepted for compatibility with DatabaseManagementLogger
             
         Returns:
             Number of logs deleted
         """
-        with self._lock:
-            logs = self._load_logs()
-            original_count = len(logs)
-            
-            if not logs:
-                return 0
-            
-            cutoff_date = datetime.now() - timedelta(days=days)
-            
-            # Filter out old logs
-            filtered_logs = []
-            for log in logs:
-                log_date = self._parse_timestamp(log.get('timestamp', ''))
-                if log_date >= cutoff_date:
-                    filtered_logs.append(log)
-            
-            # Save filtered logs
-            self._save_logs(filtered_logs)
-            return original_count - len(filtered_logs)
+        return self._delete_range(None, datetime.now() - timedelta(days=days))
     
     # Convenience methods for common events
     def log_login(self, username: str, ip_address: str, success: bool = True):
@@ -23,26 +23,20 @@ def multi_home_context_processor():
         
         # Get current home
         current_home_id = get_current_home_id()
-        current_home = None
-        user_homes = []
         
-        if current_home_id:
-            current_home = multi_db.get_home_details(str(current_home_id), user_id)
-        
-        # Get all user homes for the dropdown
-        user_homes = multi_db.get_user_homes(user_id)
-        
-        # Check admin access
-        is_sys_admin = multi_db.is_sys_admin(user_id)
-        has_admin_access = multi_db.has_admin_access(user_id, str(current_home_id) if current_home_id else None)
+        # Current home, homes for the dropdown and admin flags come from one
+        # cached membership snapshot (at most one query per render)
+        context = multi_db.get_membership_context(
+            user_id, str(current_home_id) if current_home_id else None
+        )
         
         return {
             'multi_home_enabled': True,
-            'current_home': current_home,
-            'user_homes': user_homes,
+            'current_home': context['current_home'],
+            'user_homes': context['user_homes'],
             'current_home_id': current_home_id,
-            'is_sys_admin': is_sys_admin,
-            'has_admin_access': has_admin_access
+            'is_sys_admin': context['is_sys_admin'],
+            'has_admin_access': context['has_admin_access']
         }
         
     except Exception as e:
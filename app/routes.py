@@ -57,6 +57,15 @@ class MultiHomeHelpersMixin:
 
         return str(home_id) if home_id else None
 
+    def _get_home_entities(self, entity, home_id, user_id):
+        """Entity list of a home, read through the home-scoped cache when available."""
+        cached_data = getattr(self, 'cached_data', None)  # type: ignore
+        if cached_data:
+            return getattr(cached_data, f'get_{entity}')(home_id=str(home_id), user_id=str(user_id))
+        if entity == 'rooms':
+            return self.multi_db.get_home_rooms(home_id, str(user_id))  # type: ignore
+        return getattr(self.multi_db, f'get_{entity}')(home_id, str(user_id))  # type: ignore
+
     def _normalize_rooms_for_response(self, rooms, default_home_id=None):
         """Normalize various room payload formats to a consistent API response."""
         normalized = []
@@ -99,7 +108,7 @@ class MultiHomeHelpersMixin:
 
         if self.multi_db and resolved_home_id:  # type: ignore
             try:
-                rooms_data = self.multi_db.get_home_rooms(resolved_home_id, str(user_id))  # type: ignore
+                rooms_data = self._get_home_entities('rooms', resolved_home_id, user_id)
             except Exception as exc:
                 if self.app:  # type: ignore
                     self.app.logger.error(f"Failed to load rooms for home {resolved_home_id}: {exc}")  # type: ignore
@@ -142,7 +151,7 @@ class MultiHomeHelpersMixin:
             if not resolved_home_id:
                 return base_controls
 
-            raw_controls = self.multi_db.get_temperature_controls(resolved_home_id, str(user_id))  # type: ignore
+            raw_controls = self._get_home_entities('temperature_controls', resolved_home_id, user_id)
             normalized = []
             for control in raw_controls or []:
                 settings = control.get('settings') or {}
@@ -283,7 +292,7 @@ class RoutesManager(MultiHomeHelpersMixin):
         self.limiter = limiter  # SECURITY: Rate limiter for protecting endpoints
         print(f"[DEBUG] RoutesManager init - cache: {cache}, cached_data_access: {cached_data_access}")
         # Use injected cached_data_access if provided, else fallback
-        self.cached_data = cached_data_access or (CachedDataAccess(cache, smart_home) if cache else None)
+        self.cached_data = cached_data_access or (CachedDataAccess(cache, smart_home, multi_db) if cache else None)
         print(f"[DEBUG] RoutesManager init - self.cached_data: {type(self.cached_data)} {self.cached_data}")
         # Initialize management logger
         self.management_logger = management_logger or ManagementLogger()
@@ -329,7 +338,7 @@ class RoutesManager(MultiHomeHelpersMixin):
             if not resolved_home_id:
                 return self.smart_home.buttons
 
-            raw_buttons = self.multi_db.get_buttons(resolved_home_id, str(user_id))
+            raw_buttons = self._get_home_entities('buttons', resolved_home_id, user_id)
             normalized = []
             for button in raw_buttons or []:
                 room_id = button.get('room_id')
@@ -410,7 +419,7 @@ class RoutesManager(MultiHomeHelpersMixin):
 
         if self.multi_db and resolved_home_id:
             try:
-                rooms_data = self.multi_db.get_home_rooms(resolved_home_id, str(user_id))
+                rooms_data = self._get_home_entities('rooms', resolved_home_id, user_id)
             except Exception as exc:
                 if self.app:
                     self.app.logger.error(f"Failed to load rooms for home {resolved_home_id}: {exc}")
@@ -700,14 +709,14 @@ class RoutesManager(MultiHomeHelpersMixin):
         @self.auth_manager.login_required
         def cache_stats():
             """Get cache performance statistics"""
-            from utils.cache_manager import cache_stats, get_cache_hit_rate
+            from utils.cache_manager import cache_stats, get_cache_hit_rate, revalidate_stats, single_flight_stats
             cache_type = 'Disabled'
             cache_default_timeout = 'Unknown'
             cache_obj = getattr(self, 'cache', None)
             if cache_obj and hasattr(cache_obj, 'config'):
                 cache_type = cache_obj.config.get('CACHE_TYPE', 'Unknown')
                 cache_default_timeout = cache_obj.config.get('CACHE_DEFAULT_TIMEOUT', 'Unknown')
-            return jsonify({
+            response = {
                 'status': 'success',
                 'cache_stats': {
                     'hits': cache_stats['hits'],
@@ -718,8 +727,14 @@ class RoutesManager(MultiHomeHelpersMixin):
                 'cache_config': {
                     'type': cache_type,
                     'default_timeout': cache_default_timeout
-                }
-            })
+                },
+                'single_flight': dict(single_flight_stats),
+                'stale_while_revalidate': dict(revalidate_stats)
+            }
+            # Local/Redis tiers (TieredCache only)
+            if cache_obj and callable(getattr(type(cache_obj), 'get_stats', None)):
+                response['cache_tiers'] = cache_obj.get_stats()
+            return jsonify(response)
         
         # Database monitoring endpoint
         @self.app.route('/api/database/stats', methods=['GET'])
@@ -727,9 +742,11 @@ class RoutesManager(MultiHomeHelpersMixin):
         def database_stats():
             """Get database performance statistics"""
             try:
+                from utils.green_db import get_cooperative_mode
                 stats = {
                     'status': 'success',
                     'database_mode': hasattr(self.smart_home, 'db'),
+                    'cooperative_mode': get_cooperative_mode(),
                     'connection_pool': {'enabled': False}
                 }
                 
@@ -746,6 +763,18 @@ class RoutesManager(MultiHomeHelpersMixin):
                     except Exception as e:
                         stats['database_error'] = str(e)
                 
+                # Multi-home manager pool (used by request threads, sockets and scheduler)
+                if self.multi_db and hasattr(self.multi_db, 'get_pool_status'):
+                    try:
+                        stats['multi_home_pool'] = self.multi_db.get_pool_status()
+                    except Exception as e:
+                        stats['multi_home_pool_error'] = str(e)
+                if self.multi_db and hasattr(self.multi_db, 'get_membership_cache_stats'):
+                    stats['membership_cache'] = self.multi_db.get_membership_cache_stats()
+                json_backup = getattr(self.multi_db, 'json_backup', None) if self.multi_db else None
+                if json_backup and hasattr(json_backup, 'get_write_stats'):
+                    stats['json_backend'] = json_backup.get_write_stats()
+                
                 return jsonify(stats)
             except Exception as e:
                 return jsonify({
@@ -1030,20 +1059,41 @@ class RoutesManager(MultiHomeHelpersMixin):
         @self.auth_manager.login_required
         @self.auth_manager.admin_required
         def api_admin_logs():
+            """Management logs of the current home, newest first.
+            Query: limit (1-500, default 50), level, event_type and cursor;
+            the X-Next-Cursor response header holds the cursor of the next
+            (older) page and is absent on the last one.
+            """
             user_id = session.get('user_id')
             current_home_id = session.get('current_home_id')
+            limit = min(max(request.args.get('limit', 50, type=int) or 50, 1), 500)
+            level = request.args.get('level') or None
+            event_type = request.args.get('event_type') or None
+            next_cursor = None
             
             if self.multi_db and user_id and current_home_id:
                 try:
-                    logs = self.multi_db.get_home_management_logs(current_home_id, user_id)
+                    page = self.multi_db.get_home_management_logs_page(
+                        current_home_id, user_id, limit=limit,
+                        cursor=request.args.get('cursor') or None,
+                        level=level, event_type=event_type
+                    )
+                    logs, next_cursor = page['logs'], page['next_cursor']
                 except PermissionError:
                     return jsonify({"error": "Access denied"}), 403
+                except ValueError as e:
+                    return jsonify({"error": str(e)}), 400
                 except Exception as e:
                     return jsonify({"error": str(e)}), 500
             else:
-                logs = self._get_management_logs()
+                logs = self.management_logger.get_logs(
+                    limit=limit, level_filter=level, event_type_filter=event_type
+                )
             
-            return jsonify(logs)
+            response = jsonify(logs)
+            if next_cursor:
+                response.headers['X-Next-Cursor'] = next_cursor
+            return response
 
         # Notification settings (recipients) API
         @self.app.route('/api/notifications/settings', methods=['GET', 'POST'])
@@ -1192,6 +1242,36 @@ class RoutesManager(MultiHomeHelpersMixin):
             except Exception as e:
                 return jsonify({ 'status': 'error', 'message': str(e) }), 500
 
+        @self.app.route('/api/admin/logs/analytics')
+        @self.auth_manager.login_required
+        @self.auth_manager.admin_required
+        def api_admin_logs_analytics():
+            """Event counts of the current home by type, level, user and time.
+            Query: start, end (ISO dates, default the last 24 hours / 30 days)
+            and bucket (hour | day).
+            """
+            user_id = session.get('user_id')
+            current_home_id = session.get('current_home_id')
+            start = request.args.get('start') or None
+            end = request.args.get('end') or None
+            bucket = request.args.get('bucket', 'hour')
+            
+            try:
+                if self.multi_db and user_id and current_home_id:
+                    analytics = self.multi_db.get_home_log_analytics(
+                        current_home_id, user_id, start=start, end=end, bucket=bucket
+                    )
+                else:
+                    analytics = self.management_logger.get_log_analytics(start=start, end=end, bucket=bucket)
+            except PermissionError:
+                return jsonify({"error": "Access denied"}), 403
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            except Exception as e:
+                return jsonify({"error": str(e)}), 500
+            
+            return jsonify(analytics)
+
         @self.app.route('/api/admin/logs/clear', methods=['POST'])
         @self.auth_manager.login_required
         @self.auth_manager.admin_required
@@ -2255,7 +2335,7 @@ class APIManager(MultiHomeHelpersMixin):
         self.async_mail_manager = async_mail_manager
         # Use the same caching approach as RoutesManager to share cache keys
         try:
-            self.cached_data = cached_data_access or (CachedDataAccess(cache, smart_home) if cache else None)
+            self.cached_data = cached_data_access or (CachedDataAccess(cache, smart_home, multi_db) if cache else None)
         except Exception:
             # Fallback to no caching helper if backend cache isn't available
             self.cached_data = None
@@ -2366,7 +2446,7 @@ class APIManager(MultiHomeHelpersMixin):
             
             if current_home_id:
                 # Get buttons from multi-home system
-                buttons_data = self.multi_db.get_buttons(current_home_id, user_id)
+                buttons_data = self._get_home_entities('buttons', current_home_id, user_id)
                 # Convert to old format for compatibility, preserving display_order
                 buttons = []
                 for button in buttons_data:
@@ -2576,7 +2656,7 @@ class APIManager(MultiHomeHelpersMixin):
                     if self.cached_data:
                         invalidate = getattr(self.cached_data, 'invalidate_rooms_cache', None)
                         if callable(invalidate):
-                            invalidate()
+                            invalidate(resolved_home_id)
 
                     try:
                         self.management_logger.log_room_change(
@@ -2692,13 +2772,13 @@ class APIManager(MultiHomeHelpersMixin):
                         try:
                             invalidate_rooms = getattr(self.cached_data, 'invalidate_rooms_cache', None)
                             if callable(invalidate_rooms):
-                                invalidate_rooms()
+                                invalidate_rooms(resolved_home_id)
                             invalidate_buttons = getattr(self.cached_data, 'invalidate_buttons_cache', None)
                             if callable(invalidate_buttons):
-                                invalidate_buttons()
+                                invalidate_buttons(resolved_home_id)
                             invalidate_temp = getattr(self.cached_data, 'invalidate_temperature_cache', None)
                             if callable(invalidate_temp):
-                                invalidate_temp()
+                                invalidate_temp(resolved_home_id)
                         except Exception:
                             pass
 
@@ -2823,7 +2903,7 @@ class APIManager(MultiHomeHelpersMixin):
                         try:
                             invalidate_rooms = getattr(self.cached_data, 'invalidate_rooms_cache', None)
                             if callable(invalidate_rooms):
-                                invalidate_rooms()
+                                invalidate_rooms(resolved_home_id)
                         except Exception:
                             pass
 
@@ -2967,7 +3047,7 @@ class APIManager(MultiHomeHelpersMixin):
                         try:
                             invalidate = getattr(self.cached_data, 'invalidate_rooms_cache', None)
                             if callable(invalidate):
-                                invalidate()
+                                invalidate(resolved_home_id)
                         except Exception:
                             pass
 
@@ -3064,11 +3144,16 @@ class APIManager(MultiHomeHelpersMixin):
                     # Invalidate caches after batch update
                     if updated_count > 0 and self.cached_data:
                         try:
-                            methods = ['invalidate_buttons_cache', 'invalidate_temperature_cache', 'invalidate_room_cache']
-                            for method_name in methods:
-                                method = getattr(self.cached_data, method_name, None)
-                                if callable(method):
-                                    method()
+                            # Only the homes of the updated devices are dropped
+                            updated_homes = set()
+                            for device_id in result['updated']:
+                                device = self.multi_db.get_device(device_id, str(user_id))
+                                if device and device.get('home_id'):
+                                    updated_homes.add(str(device['home_id']))
+                            invalidate = getattr(self.cached_data, 'invalidate_rooms_cache', None)
+                            if callable(invalidate):
+                                for home_id in updated_homes or [self._resolve_home_id(user_id)]:
+                                    invalidate(home_id)
                             print(f"[DEBUG] Cache invalidation completed")
                         except Exception as cache_error:
                             print(f"[WARNING] Cache invalidation error: {cache_error}")
@@ -3147,7 +3232,7 @@ class APIManager(MultiHomeHelpersMixin):
                     if self.cached_data:
                         invalidate = getattr(self.cached_data, 'invalidate_buttons_cache', None)
                         if callable(invalidate):
-                            invalidate()
+                            invalidate(resolved_home_id, room_id)
 
                     buttons_payload = self.get_current_home_buttons(user_id)
                     if self.socketio:
@@ -3231,7 +3316,7 @@ class APIManager(MultiHomeHelpersMixin):
                     if self.cached_data:
                         invalidate = getattr(self.cached_data, 'invalidate_temperature_cache', None)
                         if callable(invalidate):
-                            invalidate()
+                            invalidate(resolved_home_id, room_id)
 
                     controls_payload = self.get_current_home_temperature_controls(user_id)
                     if self.socketio:
@@ -3392,7 +3477,7 @@ class APIManager(MultiHomeHelpersMixin):
                         if self.cached_data:
                             invalidate = getattr(self.cached_data, 'invalidate_buttons_cache', None)
                             if callable(invalidate):
-                                invalidate()
+                                invalidate(resolved_home_id)
 
                         buttons = self.get_current_home_buttons(user_id)
                         created_button = next((btn for btn in buttons if str(btn.get('id')) == str(new_id)), None)
@@ -3424,8 +3509,8 @@ class APIManager(MultiHomeHelpersMixin):
                     if hasattr(self.smart_home, 'add_button'):
                         print(f"[DEBUG] POST /api/buttons add_button legacy path: name={name}, room={room_value}")
                         new_id = self.smart_home.add_button(name, room_value, state=False)
-                        if self.cached_data and hasattr(self.cached_data, 'cache'):
-                            self.cached_data.cache.delete('buttons_list')
+                        if self.cached_data:
+                            self.cached_data.invalidate_buttons_cache(room_id=room_value)
                         if self.socketio:
                             self.socketio.emit('update_buttons', self.smart_home.buttons)
                         return jsonify({"status": "success", "id": new_id})
@@ -3512,7 +3597,7 @@ class APIManager(MultiHomeHelpersMixin):
                         try:
                             invalidate = getattr(self.cached_data, 'invalidate_buttons_cache', None)
                             if callable(invalidate):
-                                invalidate()
+                                invalidate(device.get('home_id') or self._resolve_home_id(user_id))
                         except Exception:
                             pass
 
@@ -3570,7 +3655,7 @@ class APIManager(MultiHomeHelpersMixin):
 
                 if self.socketio:
                     print(f"[DEBUG] Emitting socket update")
-                    fresh_buttons = self.cached_data.get_buttons() if self.cached_data else self.smart_home.buttons
+                    fresh_buttons = self.cached_data.get_buttons(self._resolve_home_id(user_id), user_id) if self.cached_data else self.smart_home.buttons
                     print(f"[DEBUG] Fresh buttons data from cache: {fresh_buttons}")
                     self.socketio.emit('update_buttons', fresh_buttons)
 
@@ -3596,7 +3681,7 @@ class APIManager(MultiHomeHelpersMixin):
                         try:
                             invalidate = getattr(self.cached_data, 'invalidate_buttons_cache', None)
                             if callable(invalidate):
-                                invalidate()
+                                invalidate(device.get('home_id') or resolved_home_id)
                         except Exception:
                             pass
 
@@ -3640,6 +3725,15 @@ class APIManager(MultiHomeHelpersMixin):
                 
                 if not user_id:
                     return jsonify({'status': 'error', 'message': 'User not logged in'}), 401
+
+                # Get new state from request; omitted means flip the current one
+                data = {}
+                if request.content_type and 'application/json' in request.content_type:
+                    data = request.get_json() or {}
+                requested_state = data.get('state')
+                if requested_state is not None and not isinstance(requested_state, bool):
+                    # bool("false") would switch the device on
+                    return jsonify({'status': 'error', 'message': 'state must be true or false'}), 400
                 
                 # Use multi-home system if available
                 if self.multi_db:
@@ -3649,77 +3743,56 @@ class APIManager(MultiHomeHelpersMixin):
                     if device_id is None:
                         return jsonify({'status': 'error', 'message': 'Invalid device identifier'}), 400
 
-                    # Get device details from multi-home system
+                    # Access check, state change and room lookup in one round trip
                     try:
-                        device = self.multi_db.get_device(device_id, user_id)
-                        print(f"[DEBUG] get_device returned: {device}")
+                        device = self.multi_db.toggle_device_state(device_id, user_id, state=requested_state)
                     except Exception as e:
-                        print(f"[DEBUG ERROR] Exception in get_device: {e}")
-                        return jsonify({'status': 'error', 'message': f'Error getting device: {str(e)}'}), 500
-                    
+                        print(f"[DEBUG ERROR] Exception in toggle_device_state: {e}")
+                        return jsonify({'status': 'error', 'message': f'Error updating device: {str(e)}'}), 500
+
                     if not device:
-                        print(f"[DEBUG] Device not found with id: {id}")
+                        print(f"[DEBUG] Device not found or access denied for id: {id}")
                         return jsonify({'status': 'error', 'message': 'Device not found or access denied'}), 404
-                    
-                    print(f"[DEBUG] Found device: {device['name']} in room_id: {device['room_id']}, current state: {device.get('state', False)}")
-                    
-                    # Get new state from request or toggle current state
-                    data = {}
-                    if request.content_type and 'application/json' in request.content_type:
-                        data = request.get_json() or {}
-                    
-                    new_state = data.get('state')
-                    if new_state is None:
-                        new_state = not device.get('state', False)
-                    
-                    print(f"[DEBUG] New state will be: {new_state} (type: {type(new_state)})")
-                    
-                    # Update device state in multi-home system
-                    try:
-                        target_device_id = normalize_device_id(device.get('id', device_id))
-                        if target_device_id is None:
-                            fallback_id = device_id if device_id is not None else device.get('id')
-                            target_device_id = normalize_device_id(fallback_id)
-                        if target_device_id is None:
-                            return jsonify({'status': 'error', 'message': 'Invalid device identifier'}), 400
-                        print(f"[DEBUG] Calling update_device with device_id={target_device_id}, raw_id={id}, user_id={user_id}, state={new_state}")
-                        success = self.multi_db.update_device(target_device_id, user_id, state=new_state)
-                        print(f"[DEBUG] update_device returned: {success} (type: {type(success)})")
-                        if not success:
-                            return jsonify({'status': 'error', 'message': 'Failed to update device state'}), 500
-                        
-                        print(f"[DEBUG] Device state updated successfully in multi-home system")
-                        
-                        # Trigger automation execution after successful state change
-                        if self.automation_executor:
-                            try:
-                                home_id = device.get('home_id') or session.get('current_home_id')
-                                logger.info(f"[AUTOMATION] Calling automation executor: device={device['name']}, room={device.get('room_name')}, home_id={home_id}")
-                                results = self.automation_executor.process_device_trigger(
-                                    device_id=str(target_device_id),
-                                    room_name=device.get('room_name', ''),
-                                    device_name=device['name'],
-                                    new_state=new_state,
-                                    home_id=str(home_id),
-                                    user_id=str(user_id)
-                                )
-                                if results:
-                                    logger.info(f"[AUTOMATION] Executed {len(results)} automations for device {device['name']}")
-                                    for result in results:
-                                        logger.info(f"  - {result.get('automation_name')}: {result.get('status')} ({result.get('actions_executed')} actions)")
-                                else:
-                                    logger.info(f"[AUTOMATION] No automations matched for device {device['name']}")
-                            except Exception as auto_error:
-                                logger.error(f"[AUTOMATION] Error processing automations: {auto_error}")
-                                import traceback
-                                traceback.print_exc()
-                                # Don't fail the toggle operation if automation fails
-                        else:
-                            logger.warning(f"[AUTOMATION] automation_executor is None - automations disabled")
-                    except Exception as e:
-                        print(f"[DEBUG ERROR] Exception in update_device: {e}")
-                        return jsonify({'status': 'error', 'message': f'Error updating device: {str(e)}'}), 500
-                    
+
+                    new_state = device.get('state')
+                    print(f"[DEBUG] Device {device['name']} in room_id {device['room_id']} toggled to {new_state}")
+
+                    # Trigger automation execution after successful state change
+                    if self.automation_executor:
+                        try:
+                            home_id = device.get('home_id') or session.get('current_home_id')
+                            logger.info(f"[AUTOMATION] Calling automation executor: device={device['name']}, room={device.get('room_name')}, home_id={home_id}")
+                            results = self.automation_executor.process_device_trigger(
+                                device_id=str(device['id']),
+                                room_name=device.get('room_name', ''),
+                                device_name=device['name'],
+                                new_state=new_state,
+                                home_id=str(home_id),
+                                user_id=str(user_id)
+                            )
+                            if results:
+                                logger.info(f"[AUTOMATION] Executed {len(results)} automations for device {device['name']}")
+                                for result in results:
+                                    logger.info(f"  - {result.get('automation_name')}: {result.get('status')} ({result.get('actions_executed')} actions)")
+                            else:
+                                logger.info(f"[AUTOMATION] No automations matched for device {device['name']}")
+                        except Exception as auto_error:
+                            logger.error(f"[AUTOMATION] Error processing automations: {auto_error}")
+                            import traceback
+                            traceback.print_exc()
+                            # Don't fail the toggle operation if automation fails
+                    else:
+                        logger.warning(f"[AUTOMATION] automation_executor is None - automations disabled")
+
+                    # Automations may have changed other devices of the home too
+                    if self.cached_data:
+                        try:
+                            toggled_home_id = device.get('home_id') or self._resolve_home_id(user_id)
+                            self.cached_data.invalidate_buttons_cache(toggled_home_id)
+                            self.cached_data.invalidate_temperature_cache(toggled_home_id)
+                        except Exception as cache_err:
+                            print(f"[DEBUG] Failed to invalidate button caches: {cache_err}")
+
                     # Emit socket updates
                     if self.socketio:
                         self.socketio.emit('update_button', {
@@ -3728,19 +3801,20 @@ class APIManager(MultiHomeHelpersMixin):
                             'state': new_state
                         })
                     
-                    # Log the action
+                    # Log the action (session username is the user's name; avoids a user lookup)
                     if hasattr(self.management_logger, 'log_device_action'):
-                        user_data = self.smart_home.get_user_data(user_id) if user_id else None
-                        current_home_id = session.get('current_home_id')
-                        print(f"[DEBUG] Logging device action - current_home_id from session: {current_home_id}")
+                        username = session.get('username')
+                        if not username:
+                            user_data = self.smart_home.get_user_data(user_id) if user_id else None
+                            username = user_data.get('name', 'Unknown') if user_data else 'Unknown'
                         self.management_logger.log_device_action(
-                            user=user_data.get('name', 'Unknown') if user_data else session.get('username', 'Unknown'),
+                            user=username,
                             device_name=device['name'],
                             room=device.get('room_name', ''),
                             action='toggle',
                             new_state=new_state,
                             ip_address=request.environ.get('REMOTE_ADDR', ''),
-                            home_id=current_home_id
+                            home_id=session.get('current_home_id')
                         )
                     
                     return jsonify({
@@ -3771,12 +3845,8 @@ class APIManager(MultiHomeHelpersMixin):
                 
                 print(f"[DEBUG] Found button: {button['name']} in {button['room']}, current state: {button.get('state', False)}")
                 
-                # Get new state from request or toggle current state
-                data = {}
-                if request.content_type and 'application/json' in request.content_type:
-                    data = request.get_json() or {}
-                
-                new_state = data.get('state')
+                # Requested state or toggle current state
+                new_state = requested_state
                 if new_state is None:
                     new_state = not button.get('state', False)
                 
@@ -3929,7 +3999,7 @@ class APIManager(MultiHomeHelpersMixin):
                             if self.cached_data:
                                 invalidate = getattr(self.cached_data, 'invalidate_temperature_cache', None)
                                 if callable(invalidate):
-                                    invalidate()
+                                    invalidate(resolved_home_id)
 
                             controls = self.get_current_home_temperature_controls(user_id)
                             created_control = next((ctrl for ctrl in controls if str(ctrl.get('id')) == str(new_id)), None)
@@ -4048,7 +4118,7 @@ class APIManager(MultiHomeHelpersMixin):
                         try:
                             invalidate = getattr(self.cached_data, 'invalidate_temperature_cache', None)
                             if callable(invalidate):
-                                invalidate()
+                                invalidate(device.get('home_id') or self._resolve_home_id(user_id))
                         except Exception:
                             pass
 
@@ -4111,7 +4181,7 @@ class APIManager(MultiHomeHelpersMixin):
 
                 if self.socketio:
                     print(f"[DEBUG] Emitting socket update")
-                    fresh_controls = self.cached_data.get_temperature_controls() if self.cached_data else self.smart_home.temperature_controls
+                    fresh_controls = self.cached_data.get_temperature_controls(self._resolve_home_id(user_id), user_id) if self.cached_data else self.smart_home.temperature_controls
                     print(f"[DEBUG] Fresh temperature controls data from cache: {fresh_controls}")
                     self.socketio.emit('update_temperature_controls', fresh_controls)
 
@@ -4157,7 +4227,7 @@ class APIManager(MultiHomeHelpersMixin):
                     if self.cached_data:
                         invalidate = getattr(self.cached_data, 'invalidate_temperature_cache', None)
                         if callable(invalidate):
-                            invalidate()
+                            invalidate(device.get('home_id') or resolved_home_id)
 
                     updated_controls = self.get_current_home_temperature_controls(user_id)
                     if self.socketio:
@@ -4467,7 +4537,7 @@ class APIManager(MultiHomeHelpersMixin):
                             try:
                                 invalidate = getattr(self.cached_data, 'invalidate_temperature_cache', None)
                                 if callable(invalidate):
-                                    invalidate()
+                                    invalidate(updated_device.get('home_id') or self._resolve_home_id(user_id))
                             except Exception:
                                 pass
 
@@ -4908,6 +4978,7 @@ class APIManager(MultiHomeHelpersMixin):
                                     WHERE user_id = %s AND home_id = %s
                                 """, (user_id, current_home_id))
                                 # Commit is automatic in get_cursor context manager
+                            self.multi_db.invalidate_membership_cache(user_id)
                         except Exception as e:
                             # Rollback is automatic in get_cursor context manager
                             self.app.logger.error(f"Error removing user from home: {e}")
@@ -4971,6 +5042,9 @@ class APIManager(MultiHomeHelpersMixin):
             for key, value in updates.items():
                 user[key] = value
             self.smart_home.save_config()
+            if 'role' in updates and self.multi_db:
+                # The sys-admin flag is part of the cached membership snapshot
+                self.multi_db.invalidate_membership_cache(user_id)
             return jsonify({"status": "success", "message": "Użytkownik zaktualizowany (POST)"})
 
         @self.app.route('/api/users/<user_id>/password', methods=['PUT'])
@@ -71,7 +71,7 @@ else:
 from app.routes import RoutesManager
 from app.mail_manager import MailManager
 from utils.async_manager import AsyncMailManager
-from utils.cache_manager import CacheManager, setup_smart_home_caching
+from utils.cache_manager import CacheManager, CachedDataAccess, HOME_ENTITIES, setup_smart_home_caching
 from app.management_logger import ManagementLogger
 from app.database_management_logger import DatabaseManagementLogger
 
@@ -150,6 +150,15 @@ class SmartHomeApp:
             )
             print(f"✓ SocketIO initialized (async_mode={fallback_mode})")
         
+        # Make psycopg2 yield to the eventlet/gevent hub instead of blocking it.
+        # Must run before any database manager opens its connections.
+        try:
+            from utils.green_db import configure_cooperative_db
+            cooperative_mode = configure_cooperative_db(self.socketio.async_mode)
+            print(f"✓ Cooperative database access: {cooperative_mode}")
+        except Exception as e:
+            print(f"⚠ Failed to configure cooperative database access: {e}")
+        
         # SECURITY: Enable CSRF protection (CRITICAL FIX)
         try:
             from flask_wtf.csrf import CSRFProtect
@@ -215,37 +224,14 @@ class SmartHomeApp:
         try:
             print("🔥 Warming up cache with critical data...")
             
-            # Pre-load rooms configuration
-            if hasattr(self.smart_home, 'rooms'):
-                rooms = self.smart_home.rooms
-                if rooms:
-                    timeout = self.cache_manager.get_timeout('rooms')
-                    self.cache.set("rooms_list", rooms, timeout=timeout)
-                    print(f"✓ Cached {len(rooms) if isinstance(rooms, list) else 'N/A'} rooms")
-            
-            # Pre-load buttons configuration  
-            if hasattr(self.smart_home, 'buttons'):
-                buttons = self.smart_home.buttons
-                if buttons:
-                    timeout = self.cache_manager.get_timeout('buttons')
-                    self.cache.set("buttons_list", buttons, timeout=timeout)
-                    print(f"✓ Cached {len(buttons) if isinstance(buttons, list) else 'N/A'} buttons")
-            
-            # Pre-load temperature controls
-            if hasattr(self.smart_home, 'temperature_controls'):
-                temp_controls = self.smart_home.temperature_controls
-                if temp_controls:
-                    timeout = self.cache_manager.get_timeout('temperature')
-                    self.cache.set("temperature_controls", temp_controls, timeout=timeout)
-                    print(f"✓ Cached {len(temp_controls) if isinstance(temp_controls, list) else 'N/A'} temperature controls")
-            
-            # Pre-load automations
-            if hasattr(self.smart_home, 'automations'):
-                automations = self.smart_home.automations
-                if automations:
-                    timeout = self.cache_manager.get_timeout('automations')
-                    self.cache.set("automations_list", automations, timeout=timeout)
-                    print(f"✓ Cached {len(automations) if isinstance(automations, list) else 'N/A'} automations")
+            # Pre-load the legacy lists; per-home entries fill on first request
+            for entity, timeout_type in HOME_ENTITIES.items():
+                if hasattr(self.smart_home, entity):
+                    values = getattr(self.smart_home, entity)
+                    if values:
+                        timeout = self.cache_manager.get_timeout(timeout_type)
+                        self.cache.set(self.cache_manager.home_key(None, entity), values, timeout=timeout)
+                        print(f"✓ Cached {len(values) if isinstance(values, (list, dict)) else 'N/A'} {entity.replace('_', ' ')}")
             
             print("✓ Cache warming completed")
             
@@ -655,8 +641,23 @@ class SmartHomeApp:
                 cache_config = {'CACHE_TYPE': 'SimpleCache', 'CACHE_DEFAULT_TIMEOUT': 600, 'CACHE_THRESHOLD': 500}
                 self.cache = Cache(self.app, config=cache_config)
             
-            # Initialize cache manager
-            self.cache_manager = CacheManager(self.cache, self.smart_home)
+            # Per-worker LRU in front of Redis, kept coherent over pub/sub
+            if (cache_config.get('CACHE_TYPE') == 'RedisCache'
+                    and os.getenv('CACHE_LOCAL_ENABLED', 'true').lower() in ('true', '1', 'yes')):
+                from utils.tiered_cache import TieredCache
+                self.cache = TieredCache(self.cache)
+                print(f"✓ Local cache tier enabled ({self.cache.local.max_entries} entries, {self.cache.local.ttl:g}s TTL)")
+            
+            # Initialize cache manager; stale entity lists are reloaded in the background
+            from utils.async_manager import BackgroundTaskManager
+            self.cache_refresh_tasks = BackgroundTaskManager(max_workers=2)
+            self.cache_manager = CacheManager(self.cache, self.smart_home, task_manager=self.cache_refresh_tasks)
+            self.cached_data_access = CachedDataAccess(self.cache, self.smart_home, self.multi_db,
+                                                       cache_manager=self.cache_manager)
+            if self.multi_db and cache_config.get('CACHE_TYPE') == 'RedisCache':
+                # Role and membership changes reach every worker's snapshots
+                self.multi_db.share_membership_versions(self.cache_manager)
+                print("✓ Membership cache versions shared through Redis")
             
             # SECURITY: Initialize rate limiter (HIGH PRIORITY FIX)
             if os.getenv('FLASK_ENV') == 'testing' or os.getenv('DISABLE_RATE_LIMITING', '').lower() in ('1', 'true', 'yes', 'on'):
@@ -720,7 +721,11 @@ class SmartHomeApp:
             try:
                 from utils.background_scheduler import scheduler
                 if not scheduler.running:
-                    scheduler.start()
+                    log_retention = None
+                    if DATABASE_MODE and self.multi_db:
+                        from utils.log_retention import LogRetentionJob
+                        log_retention = LogRetentionJob(self.multi_db)
+                    scheduler.start(log_retention=log_retention)
                     print("✅ Background scheduler started (City cache updates: Mondays at 22:00)")
             except Exception as e:
                 print(f"⚠️  Warning: Failed to start background scheduler: {e}")
@@ -767,6 +772,7 @@ class SmartHomeApp:
                 mail_manager=self.mail_manager,
                 async_mail_manager=self.async_mail_manager,
                 cache=self.cache,  # Pass the Flask cache object, not the cache_manager
+                cached_data_access=self.cached_data_access,
                 management_logger=self.management_logger,
                 socketio=self.socketio,  # Add socketio parameter
                 multi_db=self.multi_db,  # Add multi_db parameter
@@ -784,6 +790,7 @@ class SmartHomeApp:
                 'auth_manager': self.auth_manager,
                 'management_logger': self.management_logger,
                 'cache': self.cache,
+                'cached_data_access': self.cached_data_access,
                 'multi_db': self.multi_db,
                 'mail_manager': self.mail_manager,
                 'async_mail_manager': self.async_mail_manager,
@@ -923,8 +930,14 @@ class SmartHomeApp:
                 room = data.get('room')
                 name = data.get('name')
                 new_state = data.get('state')
+                requested_device_id = self._normalize_device_id(data.get('device_id'))
                 
-                if room is None or name is None or not isinstance(new_state, bool):
+                if requested_device_id is not None:
+                    # Direct toggle by id: state is optional (omitted = flip)
+                    if new_state is not None and not isinstance(new_state, bool):
+                        emit('error', {'message': 'Invalid toggle payload'})
+                        return
+                elif room is None or name is None or not isinstance(new_state, bool):
                     emit('error', {'message': 'Invalid toggle payload'})
                     return
 
@@ -949,40 +962,52 @@ class SmartHomeApp:
                         emit('error', {'message': 'No home selected'})
                         return
 
-                    # Find target button in current home (case-insensitive match)
-                    buttons = multi_db.get_buttons(str(current_home_id), user_id) or []
-                    name_norm = _normalize(name)
-                    room_norm = _normalize(room)
-                    target_button = None
-                    name_only_match = None
-                    for button in buttons:
-                        btn_name = _normalize(button.get('name'))
-                        btn_room = _normalize(button.get('room_name'))
-                        if btn_name == name_norm and btn_room == room_norm:
-                            target_button = button
-                            break
-                        if name_only_match is None and btn_name == name_norm:
-                            name_only_match = button
-                    if target_button is None:
-                        target_button = name_only_match
-
-                    if not target_button:
-                        emit('error', {'message': 'Button not found'})
-                        return
+                    if requested_device_id is not None:
+                        target_button_id = requested_device_id
+                    else:
+                        # Find target button in current home (case-insensitive match)
+                        buttons = multi_db.get_buttons(str(current_home_id), user_id) or []
+                        name_norm = _normalize(name)
+                        room_norm = _normalize(room)
+                        target_button = None
+                        name_only_match = None
+                        for button in buttons:
+                            btn_name = _normalize(button.get('name'))
+                            btn_room = _normalize(button.get('room_name'))
+                            if btn_name == name_norm and btn_room == room_norm:
+                                target_button = button
+                                break
+                            if name_only_match is None and btn_name == name_norm:
+                                name_only_match = button
+                        if target_button is None:
+                            target_button = name_only_match
+
+                        if not target_button:
+                            emit('error', {'message': 'Button not found'})
+                            return
+                        target_button_id = target_button['id']
 
-                    success = multi_db.update_device(target_button['id'], user_id, state=bool(new_state))
-                    if not success:
+                    # Access check, state change and room lookup in one round trip
+                    updated_button = multi_db.toggle_device_state(
+                        target_button_id, user_id,
+                        state=bool(new_state) if new_state is not None else None
+                    )
+                    if not updated_button:
                         emit('error', {'message': 'Failed to toggle button'})
                         return
+                    payload_room = updated_button.get('room_name') or room
+                    payload_name = updated_button.get('name') or name
+                    payload_state = updated_button.get('state')
+                    payload_room_id = updated_button.get('room_id', '')  # Add room_id for consistent switch matching
 
                     # Trigger automation execution after successful state change
                     if self.socket_automation_executor:
                         try:
                             results = self.socket_automation_executor.process_device_trigger(
-                                device_id=str(target_button['id']),
-                                room_name=target_button.get('room_name', ''),
-                                device_name=target_button.get('name', ''),
-                                new_state=bool(new_state),
+                                device_id=str(updated_button['id']),
+                                room_name=updated_button.get('room_name') or '',
+                                device_name=updated_button.get('name', ''),
+                                new_state=bool(payload_state),
                                 home_id=str(current_home_id),
                                 user_id=str(user_id)
                             )
@@ -993,19 +1018,13 @@ class SmartHomeApp:
                             import traceback
                             traceback.print_exc()
 
-                    updated_button = multi_db.get_device(target_button['id'], user_id) or target_button
-                    payload_room = updated_button.get('room_name') or room
-                    payload_name = updated_button.get('name') or name
-                    payload_state = updated_button.get('state') if updated_button.get('state') is not None else new_state
-                    payload_room_id = updated_button.get('room_id', '')  # Add room_id for consistent switch matching
-
                     # Broadcast update to all connected clients
                     self.socketio.emit('update_button', {
                         'room': payload_room,
                         'room_id': str(payload_room_id) if payload_room_id else '',  # Include room_id for UUID-based switch IDs
                         'name': payload_name,
                         'state': payload_state,
-                        'device_id': str(target_button['id'])  # Include device_id for fallback matching
+                        'device_id': str(updated_button['id'])  # Include device_id for fallback matching
                     })
                     self.socketio.emit('sync_button_states', {
                         f"{payload_room}_{payload_name}": payload_state
@@ -1014,16 +1033,21 @@ class SmartHomeApp:
                     # Invalidate relevant caches to reflect immediate state change
                     try:
                         if hasattr(self, 'cache_manager') and self.cache_manager:
-                            self.cache.delete('buttons_list')
-                            self.cache.delete(f'buttons_room_{payload_room}')
+                            self.cache_manager.invalidate_device_cache(
+                                home_id=str(updated_button.get('home_id') or current_home_id),
+                                room_ids=[payload_room_id] if payload_room_id else None
+                            )
                     except Exception as cache_err:
                         print(f"[DEBUG] Failed to invalidate button caches: {cache_err}")
 
                     # Log the action using management logger if available
                     if hasattr(self.management_logger, 'log_device_action'):
-                        user_data = self.smart_home.get_user_data(user_id) if user_id else None
+                        username = session.get('username')
+                        if not username:
+                            user_data = self.smart_home.get_user_data(user_id) if user_id else None
+                            username = user_data.get('name', 'Unknown') if user_data else 'Unknown'
                         self.management_logger.log_device_action(
-                            user=user_data.get('name', 'Unknown') if user_data else session.get('username', 'Unknown'),
+                            user=username,
                             device_name=payload_name,
                             room=payload_room,
                             action='toggle',
@@ -1063,9 +1087,8 @@ class SmartHomeApp:
                     # Invalidate relevant caches to reflect immediate state change
                     try:
                         if hasattr(self, 'cache_manager') and self.cache_manager:
-                            self.cache.delete('buttons_list')
-                            # Room-specific caches (best-effort) - names follow pattern buttons_room_<room>
-                            self.cache.delete(f'buttons_room_{room}')
+                            # Legacy devices are cached per room name
+                            self.cache_manager.invalidate_device_cache(room_ids=[room])
                     except Exception as cache_err:
                         print(f"[DEBUG] Failed to invalidate button caches: {cache_err}")
                     
@@ -1172,8 +1195,10 @@ class SmartHomeApp:
 
                     try:
                         if hasattr(self, 'cache_manager') and self.cache_manager:
-                            self.cache.delete('temperature_controls')
-                            self.cache.delete(f'temp_controls_room_{payload_room}')
+                            self.cache_manager.invalidate_device_cache(
+                                home_id=str(updated_device['home_id']) if updated_device.get('home_id') else None,
+                                room_ids=[updated_device['room_id']] if updated_device.get('room_id') else None
+                            )
                     except Exception as cache_err:
                         print(f"[DEBUG] Failed to invalidate temperature caches: {cache_err}")
 
@@ -1226,8 +1251,7 @@ class SmartHomeApp:
 
                     try:
                         if hasattr(self, 'cache_manager') and self.cache_manager:
-                            self.cache.delete('temperature_controls')
-                            self.cache.delete(f'temp_controls_room_{room}')
+                            self.cache_manager.invalidate_device_cache(room_ids=[room])
                     except Exception as cache_err:
                         print(f"[DEBUG] Failed to invalidate temperature caches: {cache_err}")
 
@@ -1352,8 +1376,10 @@ class SmartHomeApp:
 
                     try:
                         if hasattr(self, 'cache_manager') and self.cache_manager:
-                            self.cache.delete('temperature_controls')
-                            self.cache.delete(f'temp_controls_room_{payload_room}')
+                            self.cache_manager.invalidate_device_cache(
+                                home_id=str(updated_device['home_id']) if updated_device.get('home_id') else None,
+                                room_ids=[updated_device['room_id']] if updated_device.get('room_id') else None
+                            )
                     except Exception as cache_err:
                         print(f"[DEBUG] Failed to invalidate temperature caches: {cache_err}")
 
@@ -1400,8 +1426,7 @@ class SmartHomeApp:
 
                     try:
                         if hasattr(self, 'cache_manager') and self.cache_manager:
-                            self.cache.delete('temperature_controls')
-                            self.cache.delete(f'temp_controls_room_{room}')
+                            self.cache_manager.invalidate_device_cache(room_ids=[room])
                     except Exception as cache_err:
                         print(f"[DEBUG] Failed to invalidate temperature caches: {cache_err}")
 
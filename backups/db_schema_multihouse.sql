@@ -181,6 +181,17 @@ CREATE TABLE IF NOT EXISTS management_logs (
     created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
 );
 
+-- Hourly counts of management log events, maintained on insert (log analytics)
+CREATE TABLE IF NOT EXISTS management_log_hourly (
+    home_id UUID NOT NULL REFERENCES homes(id) ON DELETE CASCADE,
+    bucket TIMESTAMPTZ NOT NULL,
+    event_type VARCHAR(100) NOT NULL DEFAULT '',
+    level VARCHAR(50) NOT NULL,
+    username VARCHAR(255) NOT NULL DEFAULT '',
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (home_id, bucket, event_type, level, username)
+);
+
 -- Notification recipients (who gets notifications)
 CREATE TABLE IF NOT EXISTS notification_recipients (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -318,7 +329,7 @@ CREATE INDEX IF NOT EXISTS idx_session_tokens_user ON session_tokens(user_id);
 CREATE INDEX IF NOT EXISTS idx_session_tokens_token ON session_tokens(token);
 CREATE INDEX IF NOT EXISTS idx_session_tokens_expires ON session_tokens(expires_at);
 
-CREATE INDEX IF NOT EXISTS idx_management_logs_home ON management_logs(home_id);
+CREATE INDEX IF NOT EXISTS idx_management_logs_home_time ON management_logs(home_id, timestamp DESC, id DESC);
 CREATE INDEX IF NOT EXISTS idx_management_logs_user ON management_logs(user_id);
 CREATE INDEX IF NOT EXISTS idx_management_logs_event ON management_logs(event_type);
 
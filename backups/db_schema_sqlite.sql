@@ -0,0 +1,327 @@
+-- ============================================================================
+-- SmartHome Multi-Home Database Schema (SQLite fallback backend)
+-- Mirrors db_schema_multihouse.sql; used by utils/sqlite_backend.py when
+-- DB_FALLBACK_BACKEND=sqlite and PostgreSQL is unavailable.
+--
+-- Differences from the PostgreSQL schema:
+--   * NOW() and gen_random_uuid() are registered by the backend on every
+--     connection (stored timestamps are local time, 'YYYY-MM-DD HH:MM:SS')
+--   * Foreign keys are declared inline (no ALTER TABLE ADD CONSTRAINT)
+--   * Tables the application creates at runtime in PostgreSQL
+--     (home_automations, home_invitations, home_security_states) use the
+--     columns of MultiHomeDBManager._ensure_*_table
+-- ============================================================================
+
+-- ============================================================================
+-- CORE TABLES
+-- ============================================================================
+
+-- Users table (global system users)
+CREATE TABLE IF NOT EXISTS users (
+    id UUID PRIMARY KEY DEFAULT (gen_random_uuid()),
+    name VARCHAR(255) NOT NULL UNIQUE,
+    email VARCHAR(255) NOT NULL UNIQUE,
+    password_hash TEXT NOT NULL,
+    role VARCHAR(50) NOT NULL DEFAULT 'user',
+    profile_picture TEXT DEFAULT '',
+    default_home_id UUID REFERENCES homes(id) ON DELETE SET NULL,
+    timezone VARCHAR(100) DEFAULT 'Europe/Warsaw',
+    language VARCHAR(10) DEFAULT 'pl',
+    created_at TIMESTAMPTZ NOT NULL DEFAULT (NOW()),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT (NOW())
+);
+
+-- Homes table (multi-home support)
+CREATE TABLE IF NOT EXISTS homes (
+    id UUID PRIMARY KEY DEFAULT (gen_random_uuid()),
+    name VARCHAR(255) NOT NULL,
+    owner_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    description TEXT,
+    address TEXT,
+    latitude NUMERIC(10, 7),
+    longitude NUMERIC(10, 7),
+    city VARCHAR(255),
+    country VARCHAR(255),
+    country_code VARCHAR(2),
+    street VARCHAR(255),
+    house_number VARCHAR(50),
+    apartment_number VARCHAR(50),
+    postal_code VARCHAR(20),
+    timezone VARCHAR(100) DEFAULT 'Europe/Warsaw',
+    created_at TIMESTAMPTZ NOT NULL DEFAULT (NOW()),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT (NOW())
+);
+
+-- User-Home membership (many-to-many with roles)
+CREATE TABLE IF NOT EXISTS user_homes (
+    id UUID PRIMARY KEY DEFAULT (gen_random_uuid()),
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    home_id UUID NOT NULL REFERENCES homes(id) ON DELETE CASCADE,
+    role VARCHAR(50) NOT NULL DEFAULT 'member',
+    permissions JSONB NOT NULL DEFAULT '[]',
+    joined_at TIMESTAMPTZ NOT NULL DEFAULT (NOW()),
+    UNIQUE(user_id, home_id)
+);
+
+-- Rooms (belong to a home)
+CREATE TABLE IF NOT EXISTS rooms (
+    id UUID PRIMARY KEY DEFAULT (gen_random_uuid()),
+    name VARCHAR(255) NOT NULL,
+    home_id UUID REFERENCES homes(id) ON DELETE CASCADE,
+    description TEXT,
+    display_order INTEGER DEFAULT 0,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT (NOW()),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT (NOW())
+);
+
+-- Devices (belong to rooms and homes)
+CREATE TABLE IF NOT EXISTS devices (
+    id UUID PRIMARY KEY DEFAULT (gen_random_uuid()),
+    home_id UUID NOT NULL REFERENCES homes(id) ON DELETE CASCADE,
+    room_id UUID REFERENCES rooms(id) ON DELETE SET NULL,
+    name VARCHAR(255) NOT NULL,
+    device_type VARCHAR(50) NOT NULL,
+    state BOOLEAN DEFAULT FALSE,  -- NULL allowed for devices like temperature_control
+    temperature NUMERIC(5,2) DEFAULT 22.0,
+    min_temperature NUMERIC(5,2) DEFAULT 16.0,
+    max_temperature NUMERIC(5,2) DEFAULT 30.0,
+    display_order INTEGER DEFAULT 0,
+    enabled BOOLEAN DEFAULT TRUE,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT (NOW()),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT (NOW()),
+    settings JSONB
+);
+
+-- Home automations (per-home automation rules)
+CREATE TABLE IF NOT EXISTS home_automations (
+    id UUID PRIMARY KEY DEFAULT (gen_random_uuid()),
+    home_id UUID NOT NULL REFERENCES homes(id) ON DELETE CASCADE,
+    name VARCHAR(255) NOT NULL,
+    name_normalized TEXT NOT NULL,
+    trigger_config JSONB NOT NULL DEFAULT '{}',
+    actions_config JSONB NOT NULL DEFAULT '[]',
+    enabled BOOLEAN NOT NULL DEFAULT TRUE,
+    execution_count INTEGER NOT NULL DEFAULT 0,
+    last_executed TIMESTAMPTZ,
+    error_count INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    last_error_time TIMESTAMPTZ,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT (NOW()),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT (NOW()),
+    UNIQUE(home_id, name_normalized)
+);
+
+-- Automation execution history
+CREATE TABLE IF NOT EXISTS automation_executions (
+    id UUID PRIMARY KEY DEFAULT (gen_random_uuid()),
+    automation_id UUID REFERENCES home_automations(id) ON DELETE CASCADE,
+    execution_status VARCHAR(20) NOT NULL,
+    trigger_data JSONB,
+    actions_executed JSONB,
+    error_message TEXT,
+    execution_time_ms INTEGER,
+    executed_at TIMESTAMPTZ NOT NULL DEFAULT (NOW())
+);
+
+-- Legacy single-home automations (for compatibility)
+CREATE TABLE IF NOT EXISTS automations (
+    id UUID PRIMARY KEY DEFAULT (gen_random_uuid()),
+    name VARCHAR(255) NOT NULL UNIQUE,
+    trigger_config JSONB NOT NULL DEFAULT '{}',
+    actions_config JSONB NOT NULL DEFAULT '[]',
+    enabled BOOLEAN NOT NULL DEFAULT TRUE,
+    execution_count INTEGER NOT NULL DEFAULT 0,
+    last_executed TIMESTAMPTZ,
+    error_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT (NOW()),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT (NOW())
+);
+
+-- Home invitations
+CREATE TABLE IF NOT EXISTS home_invitations (
+    id UUID PRIMARY KEY DEFAULT (gen_random_uuid()),
+    home_id UUID NOT NULL REFERENCES homes(id) ON DELETE CASCADE,
+    email VARCHAR(255) NOT NULL,
+    role VARCHAR(50) NOT NULL CHECK (role IN ('admin', 'member', 'guest')),
+    invitation_code VARCHAR(20) NOT NULL UNIQUE,
+    invited_by UUID NOT NULL REFERENCES users(id),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT (NOW()),
+    expires_at TIMESTAMPTZ NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'accepted', 'expired', 'rejected')),
+    accepted_at TIMESTAMPTZ,
+    accepted_by UUID REFERENCES users(id)
+);
+
+-- Home security states
+CREATE TABLE IF NOT EXISTS home_security_states (
+    home_id UUID PRIMARY KEY REFERENCES homes(id) ON DELETE CASCADE,
+    state VARCHAR(32) NOT NULL,
+    last_changed TIMESTAMPTZ NOT NULL,
+    changed_by UUID REFERENCES users(id) ON DELETE SET NULL,
+    details JSONB
+);
+
+-- Session tokens (user sessions with home context)
+CREATE TABLE IF NOT EXISTS session_tokens (
+    id UUID PRIMARY KEY DEFAULT (gen_random_uuid()),
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    token VARCHAR(255) NOT NULL UNIQUE,
+    current_home_id UUID REFERENCES homes(id) ON DELETE SET NULL,
+    ip_address VARCHAR(45),
+    user_agent TEXT,
+    last_activity TIMESTAMPTZ NOT NULL DEFAULT (NOW()),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT (NOW()),
+    updated_at TIMESTAMPTZ,
+    expires_at TIMESTAMPTZ NOT NULL,
+    revoked BOOLEAN DEFAULT FALSE
+);
+
+-- Management logs (audit trail with multi-home support)
+CREATE TABLE IF NOT EXISTS management_logs (
+    id UUID PRIMARY KEY DEFAULT (gen_random_uuid()),
+    timestamp TIMESTAMPTZ NOT NULL DEFAULT (NOW()),
+    level VARCHAR(50) NOT NULL,
+    message TEXT NOT NULL,
+    event_type VARCHAR(100),
+    user_id UUID REFERENCES users(id) ON DELETE SET NULL,
+    username VARCHAR(255),
+    ip_address VARCHAR(45),
+    details JSONB,
+    home_id UUID REFERENCES homes(id) ON DELETE CASCADE,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT (NOW())
+);
+
+-- Hourly counts of management log events, maintained on insert (log analytics)
+CREATE TABLE IF NOT EXISTS management_log_hourly (
+    home_id UUID NOT NULL REFERENCES homes(id) ON DELETE CASCADE,
+    bucket TIMESTAMPTZ NOT NULL,
+    event_type VARCHAR(100) NOT NULL DEFAULT '',
+    level VARCHAR(50) NOT NULL,
+    username VARCHAR(255) NOT NULL DEFAULT '',
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (home_id, bucket, event_type, level, username)
+);
+
+-- Notification recipients (who gets notifications)
+CREATE TABLE IF NOT EXISTS notification_recipients (
+    id UUID PRIMARY KEY DEFAULT (gen_random_uuid()),
+    home_id UUID NOT NULL REFERENCES homes(id) ON DELETE CASCADE,
+    email VARCHAR(255) NOT NULL,
+    is_active BOOLEAN DEFAULT TRUE,
+    added_by UUID REFERENCES users(id) ON DELETE SET NULL,
+    added_at TIMESTAMPTZ NOT NULL DEFAULT (NOW()),
+    UNIQUE(home_id, email)
+);
+
+-- Notification settings (per-home notification config)
+CREATE TABLE IF NOT EXISTS notification_settings (
+    home_id UUID PRIMARY KEY REFERENCES homes(id) ON DELETE CASCADE,
+    enabled BOOLEAN DEFAULT TRUE,
+    notify_on_events JSONB DEFAULT '["security_alert", "device_offline"]',
+    created_at TIMESTAMPTZ NOT NULL DEFAULT (NOW()),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT (NOW())
+);
+
+-- Room temperature states (latest reading per room)
+CREATE TABLE IF NOT EXISTS room_temperature_states (
+    id UUID PRIMARY KEY DEFAULT (gen_random_uuid()),
+    room_id UUID NOT NULL UNIQUE REFERENCES rooms(id) ON DELETE CASCADE,
+    current_temperature NUMERIC(5,2),
+    target_temperature NUMERIC(5,2),
+    humidity NUMERIC(5,2),
+    last_updated TIMESTAMPTZ NOT NULL DEFAULT (NOW())
+);
+
+-- System settings (global key-value config)
+CREATE TABLE IF NOT EXISTS system_settings (
+    id UUID PRIMARY KEY DEFAULT (gen_random_uuid()),
+    setting_key VARCHAR(255) NOT NULL UNIQUE,
+    setting_value JSONB,
+    description TEXT,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT (NOW()),
+    updated_by UUID REFERENCES users(id) ON DELETE SET NULL
+);
+
+-- ============================================================================
+-- INDEXES FOR PERFORMANCE
+-- ============================================================================
+
+CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
+CREATE INDEX IF NOT EXISTS idx_users_name ON users(name);
+
+CREATE INDEX IF NOT EXISTS idx_homes_owner ON homes(owner_id);
+
+CREATE INDEX IF NOT EXISTS idx_user_homes_user ON user_homes(user_id);
+CREATE INDEX IF NOT EXISTS idx_user_homes_home ON user_homes(home_id);
+
+CREATE INDEX IF NOT EXISTS idx_rooms_home ON rooms(home_id);
+CREATE INDEX IF NOT EXISTS idx_rooms_display ON rooms(display_order);
+
+CREATE INDEX IF NOT EXISTS idx_devices_room ON devices(room_id);
+CREATE INDEX IF NOT EXISTS idx_devices_home ON devices(home_id);
+
+CREATE INDEX IF NOT EXISTS idx_home_automations_home ON home_automations(home_id);
+CREATE INDEX IF NOT EXISTS idx_home_automations_enabled ON home_automations(enabled);
+
+CREATE INDEX IF NOT EXISTS idx_automation_executions_time ON automation_executions(automation_id, executed_at);
+
+CREATE INDEX IF NOT EXISTS idx_automations_name ON automations(name);
+
+CREATE INDEX IF NOT EXISTS idx_home_invitations_code ON home_invitations(invitation_code) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_home_invitations_home_email ON home_invitations(home_id, email, status);
+
+CREATE INDEX IF NOT EXISTS idx_session_tokens_user ON session_tokens(user_id);
+CREATE INDEX IF NOT EXISTS idx_session_tokens_expires ON session_tokens(expires_at);
+
+CREATE INDEX IF NOT EXISTS idx_management_logs_home_time ON management_logs(home_id, timestamp DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_management_logs_user ON management_logs(user_id);
+CREATE INDEX IF NOT EXISTS idx_management_logs_event ON management_logs(event_type);
+
+CREATE INDEX IF NOT EXISTS idx_notification_recipients_home ON notification_recipients(home_id);
+
+-- ============================================================================
+-- TRIGGERS FOR AUTOMATIC TIMESTAMPS
+-- (only when the UPDATE did not set updated_at itself)
+-- ============================================================================
+
+CREATE TRIGGER IF NOT EXISTS users_update_updated_at AFTER UPDATE ON users
+    FOR EACH ROW WHEN NEW.updated_at IS OLD.updated_at
+    BEGIN UPDATE users SET updated_at = NOW() WHERE id = NEW.id; END;
+
+CREATE TRIGGER IF NOT EXISTS homes_update_updated_at AFTER UPDATE ON homes
+    FOR EACH ROW WHEN NEW.updated_at IS OLD.updated_at
+    BEGIN UPDATE homes SET updated_at = NOW() WHERE id = NEW.id; END;
+
+CREATE TRIGGER IF NOT EXISTS rooms_update_updated_at AFTER UPDATE ON rooms
+    FOR EACH ROW WHEN NEW.updated_at IS OLD.updated_at
+    BEGIN UPDATE rooms SET updated_at = NOW() WHERE id = NEW.id; END;
+
+CREATE TRIGGER IF NOT EXISTS devices_update_updated_at AFTER UPDATE ON devices
+    FOR EACH ROW WHEN NEW.updated_at IS OLD.updated_at
+    BEGIN UPDATE devices SET updated_at = NOW() WHERE id = NEW.id; END;
+
+CREATE TRIGGER IF NOT EXISTS home_automations_update_updated_at AFTER UPDATE ON home_automations
+    FOR EACH ROW WHEN NEW.updated_at IS OLD.updated_at
+    BEGIN UPDATE home_automations SET updated_at = NOW() WHERE id = NEW.id; END;
+
+CREATE TRIGGER IF NOT EXISTS automations_update_updated_at AFTER UPDATE ON automations
+    FOR EACH ROW WHEN NEW.updated_at IS OLD.updated_at
+    BEGIN UPDATE automations SET updated_at = NOW() WHERE id = NEW.id; END;
+
+CREATE TRIGGER IF NOT EXISTS notification_settings_update_updated_at AFTER UPDATE ON notification_settings
+    FOR EACH ROW WHEN NEW.updated_at IS OLD.updated_at
+    BEGIN UPDATE notification_settings SET updated_at = NOW() WHERE home_id = NEW.home_id; END;
+
+CREATE TRIGGER IF NOT EXISTS system_settings_update_updated_at AFTER UPDATE ON system_settings
+    FOR EACH ROW WHEN NEW.updated_at IS OLD.updated_at
+    BEGIN UPDATE system_settings SET updated_at = NOW() WHERE id = NEW.id; END;
+
+-- ============================================================================
+-- SCHEMA VERSION INFO
+-- ============================================================================
+
+INSERT INTO system_settings (setting_key, setting_value, description)
+VALUES ('schema_version', '"1.0.0"', 'Database schema version')
+ON CONFLICT (setting_key) DO NOTHING;
+
+-- END OF SCHEMA
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+batch_update_devices: per-device loop vs single set-based UPDATE
+================================================================
+
+Creates a throwaway user, home, room and N devices, then times
+    legacy  - the previous implementation (permission SELECT, up to three
+              user_has_home_permission queries and one UPDATE per device)
+    batch   - MultiHomeDBManager.batch_update_devices (one membership lookup,
+              one UPDATE ... FROM (VALUES ...) RETURNING)
+for 10/100/1000 devices. All benchmark rows are deleted afterwards.
+
+Requires a reachable PostgreSQL configured through DB_HOST/DB_PORT/DB_USER/
+DB_PASSWORD/DB_NAME (or .env) with the multi-home schema.
+
+Usage:
+    python benchmarks/bench_batch_update.py
+    python benchmarks/bench_batch_update.py --sizes 10 100 1000 --repeat 5
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(ROOT, '.env'), override=False)
+except ImportError:
+    pass
+
+from utils.multi_home_db_manager import MultiHomeDBManager
+
+
+def legacy_batch_update(db, device_updates, user_id):
+    """Previous per-device implementation, kept here as the baseline"""
+    updated, failed = [], []
+    allowed_fields = ['name', 'state', 'temperature', 'enabled', 'room_id', 'display_order']
+    with db.get_cursor() as cursor:
+        for update_data in device_updates:
+            device_id = update_data['id']
+            cursor.execute("""
+                SELECT d.room_id, r.home_id
+                FROM devices d
+                LEFT JOIN rooms r ON d.room_id = r.id
+                LEFT JOIN user_homes uh ON r.home_id = uh.home_id
+                WHERE d.id = %s AND (uh.user_id = %s OR d.room_id IS NULL)
+            """, (device_id, user_id))
+            row = cursor.fetchone()
+            if not row:
+                failed.append({'device_id': device_id, 'error': 'No permission or device not found'})
+                continue
+            _, home_id = row
+            if home_id and not db.user_has_home_permission(user_id, home_id, 'control_devices'):
+                failed.append({'device_id': device_id, 'error': 'No permission to access device'})
+                continue
+            fields = [(f, v) for f, v in update_data.items() if f in allowed_fields]
+            cursor.execute(
+                f"UPDATE devices SET {', '.join(f + ' = %s' for f, _ in fields)}, updated_at = NOW() WHERE id = %s",
+                [v for _, v in fields] + [device_id]
+            )
+            if cursor.rowcount > 0:
+                updated.append(str(device_id))
+    return {'updated': updated, 'failed': failed}
+
+
+def setup_fixture(db, size):
+    user_id, home_id, room_id = (str(uuid.uuid4()) for _ in range(3))
+    device_ids = [str(uuid.uuid4()) for _ in range(size)]
+    with db.get_cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO users (id, name, email, password_hash, role) VALUES (%s, %s, %s, 'x', 'user')",
+            (user_id, f'bench-{user_id[:8]}', f'bench-{user_id[:8]}@example.invalid')
+        )
+        cursor.execute("INSERT INTO homes (id, name, owner_id) VALUES (%s, 'bench', %s)", (home_id, user_id))
+        cursor.execute(
+            "INSERT INTO user_homes (user_id, home_id, role, permissions) VALUES (%s, %s, 'member', %s)",
+            (user_id, home_id, '["control_devices"]')
+        )
+        cursor.execute("INSERT INTO rooms (id, name, home_id) VALUES (%s, 'bench', %s)", (room_id, home_id))
+        for index, device_id in enumerate(device_ids):
+            cursor.execute(
+                "INSERT INTO devices (id, home_id, room_id, name, device_type, state) "
+                "VALUES (%s, %s, %s, %s, 'button', FALSE)",
+                (device_id, home_id, room_id, f'bench-{index}')
+            )
+    return user_id, home_id, device_ids
+
+
+def teardown_fixture(db, user_id, home_id):
+    with db.get_cursor() as cursor:
+        cursor.execute("DELETE FROM homes WHERE id = %s", (home_id,))
+        cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+
+
+def time_call(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark batch_update_devices')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    db = MultiHomeDBManager()
+    if db.json_fallback_mode:
+        print("PostgreSQL is not available (JSON fallback mode active); nothing to benchmark.")
+        sys.exit(1)
+
+    print(f"{'devices':>8} {'legacy ms':>11} {'batch ms':>10} {'speedup':>8}")
+    for size in args.sizes:
+        user_id, home_id, device_ids = setup_fixture(db, size)
+        try:
+            state = [False]
+
+            def payload():
+                state[0] = not state[0]
+                return [{'id': d, 'state': state[0]} for d in device_ids]
+
+            legacy_ms = time_call(lambda: legacy_batch_update(db, payload(), user_id), args.repeat)
+            batch_ms = time_call(lambda: db.batch_update_devices(payload(), user_id), args.repeat)
+            result = db.batch_update_devices(payload(), user_id)
+            assert len(result['updated']) == size and not result['failed'], result['failed'][:3]
+        finally:
+            teardown_fixture(db, user_id, home_id)
+        print(f"{size:>8} {legacy_ms:>11.1f} {batch_ms:>10.1f} {legacy_ms / batch_ms:>7.1f}x")
+
+    db.close_connection()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Socket event latency under concurrent DB load
+=============================================
+
+Measures how long the eventlet/gevent hub is stalled by PostgreSQL queries,
+with and without the cooperative wait callback from utils.green_db.
+
+A ticker green thread stands in for Socket.IO event dispatch: it asks to be
+woken every 10 ms and records how late each wake-up is. Meanwhile N workers
+run ``SELECT pg_sleep(...)`` in a loop. With blocking psycopg2 every query
+freezes the hub, so ticker lateness approaches the query time; in
+cooperative mode it should stay close to zero.
+
+Requires a reachable PostgreSQL configured through DB_HOST/DB_PORT/DB_USER/
+DB_PASSWORD/DB_NAME (or .env).
+
+Usage:
+    python benchmarks/bench_green_db.py                      # eventlet, both modes
+    python benchmarks/bench_green_db.py --hub gevent
+    python benchmarks/bench_green_db.py --workers 20 --query-ms 50 --duration 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_single(hub, cooperative, workers, query_ms, duration):
+    """Run one measurement inside an already monkey-patched process"""
+    if hub == 'eventlet':
+        import eventlet
+        eventlet.monkey_patch()
+        spawn, sleep = eventlet.spawn, eventlet.sleep
+
+        def join_all(threads):
+            for thread in threads:
+                thread.wait()
+    else:
+        from gevent import monkey
+        monkey.patch_all()
+        import gevent
+        spawn, sleep = gevent.spawn, gevent.sleep
+
+        def join_all(threads):
+            gevent.joinall(threads)
+
+    import time
+    sys.path.insert(0, ROOT)
+    try:
+        from dotenv import load_dotenv
+        load_dotenv(os.path.join(ROOT, '.env'), override=False)
+    except ImportError:
+        pass
+    import psycopg2
+    from utils.green_db import configure_cooperative_db
+
+    os.environ['DB_COOPERATIVE_MODE'] = hub if cooperative else 'off'
+    configure_cooperative_db(hub)
+
+    def connect():
+        return psycopg2.connect(
+            host=os.getenv('DB_HOST'),
+            port=int(os.getenv('DB_PORT', '5432')),
+            user=os.getenv('DB_USER'),
+            password=os.getenv('DB_PASSWORD'),
+            dbname=os.getenv('DB_NAME'),
+            connect_timeout=10,
+        )
+
+    stop_at = time.monotonic() + duration
+    queries = [0]
+
+    def db_worker():
+        conn = connect()
+        try:
+            cur = conn.cursor()
+            while time.monotonic() < stop_at:
+                cur.execute("SELECT pg_sleep(%s)", (query_ms / 1000.0,))
+                cur.fetchall()
+                queries[0] += 1
+            cur.close()
+        finally:
+            conn.close()
+
+    lateness = []
+
+    def ticker():
+        interval = 0.010
+        while time.monotonic() < stop_at:
+            expected = time.monotonic() + interval
+            sleep(interval)
+            lateness.append(max(0.0, time.monotonic() - expected) * 1000)
+
+    threads = [spawn(db_worker) for _ in range(workers)]
+    threads.append(spawn(ticker))
+    join_all(threads)
+
+    return {
+        'hub': hub,
+        'mode': 'cooperative' if cooperative else 'blocking',
+        'workers': workers,
+        'query_ms': query_ms,
+        'queries': queries[0],
+        'ticks': len(lateness),
+        'latency_p50_ms': round(_percentile(lateness, 50), 2),
+        'latency_p95_ms': round(_percentile(lateness, 95), 2),
+        'latency_max_ms': round(max(lateness) if lateness else 0.0, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Socket event latency under DB load')
+    parser.add_argument('--hub', choices=['eventlet', 'gevent'], default='eventlet')
+    parser.add_argument('--workers', type=int, default=10, help='Concurrent DB workers')
+    parser.add_argument('--query-ms', type=int, default=50, help='Duration of each query')
+    parser.add_argument('--duration', type=float, default=5.0, help='Seconds per mode')
+    parser.add_argument('--single', choices=['blocking', 'cooperative'],
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        result = run_single(args.hub, args.single == 'cooperative',
+                            args.workers, args.query_ms, args.duration)
+        print(json.dumps(result))
+        return
+
+    # Each mode runs in its own process so monkey patching starts clean
+    results = []
+    for mode in ('blocking', 'cooperative'):
+        cmd = [sys.executable, os.path.abspath(__file__), '--hub', args.hub,
+               '--workers', str(args.workers), '--query-ms', str(args.query_ms),
+               '--duration', str(args.duration), '--single', mode]
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(proc.stderr, file=sys.stderr)
+            sys.exit(proc.returncode)
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    print(f"{'mode':<12} {'queries':>8} {'ticks':>6} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    for r in results:
+        print(f"{r['mode']:<12} {r['queries']:>8} {r['ticks']:>6} "
+              f"{r['latency_p50_ms']:>8} {r['latency_p95_ms']:>8} {r['latency_max_ms']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+JSON storage: save/load time per encoder and format
+===================================================
+
+Builds a JSON-fallback configuration with N devices and N management log
+entries and times writing it to a file and reading it back for
+    json-indent   - the previous format (stdlib json, indent=4)
+    json-compact  - stdlib json without indentation
+    orjson        - orjson without indentation (skipped if not installed)
+for 1k/10k devices and logs. utils.json_serializer uses orjson when it is
+installed and the json-compact format otherwise.
+
+Usage:
+    python benchmarks/bench_json_serializer.py
+    python benchmarks/bench_json_serializer.py --sizes 1000 10000 --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils import json_serializer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def build_config(size):
+    home_id = str(uuid.uuid4())
+    room_ids = [str(uuid.uuid4()) for _ in range(max(1, size // 20))]
+    now = datetime.now().isoformat()
+    return {
+        'users': {'sys-admin': {'id': str(uuid.uuid4()), 'name': 'System Administrator', 'role': 'admin'}},
+        'homes': {home_id: {'id': home_id, 'name': 'Dom', 'created_at': now}},
+        'rooms': [{'id': room_id, 'home_id': home_id, 'name': f'Pokój {index}'}
+                  for index, room_id in enumerate(room_ids)],
+        'buttons': [{'id': str(uuid.uuid4()), 'home_id': home_id, 'room_id': room_ids[index % len(room_ids)],
+                     'name': f'Światło {index}', 'state': index % 2 == 0, 'display_order': index}
+                    for index in range(size)],
+        'management_logs': [{'id': str(uuid.uuid4()), 'home_id': home_id, 'timestamp': now, 'level': 'info',
+                             'message': f'Użytkownik admin przełączył urządzenie {index}',
+                             'event_type': 'device_action', 'user': 'admin', 'ip_address': '127.0.0.1',
+                             'details': {'device': index, 'new_state': True}}
+                            for index in range(size)],
+        'metadata': {'created_at': now, 'version': '1.0'},
+    }
+
+
+def variants():
+    yield 'json-indent', (lambda obj: json.dumps(obj, indent=4, ensure_ascii=False).encode('utf-8')), json.loads
+    yield ('json-compact', (lambda obj: json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')),
+           json.loads)
+    if orjson is not None:
+        yield 'orjson', (lambda obj: orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)), orjson.loads
+
+
+def time_call(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark JSON storage serialization')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"utils.json_serializer backend: {json_serializer.BACKEND}")
+    print(f"{'size':>6} {'format':<13} {'save ms':>9} {'load ms':>9} {'KiB':>8}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'config.json')
+        for size in args.sizes:
+            config = build_config(size)
+            for name, dumps, loads in variants():
+                def save():
+                    with open(path, 'wb') as f:
+                        f.write(dumps(config))
+
+                def load():
+                    with open(path, 'rb') as f:
+                        return loads(f.read())
+
+                save_ms = time_call(save, args.repeat)
+                load_ms = time_call(load, args.repeat)
+                assert load() == config
+                print(f"{size:>6} {name:<13} {save_ms:>9.1f} {load_ms:>9.1f} {os.path.getsize(path) / 1024:>8.0f}")
+
+
+if __name__ == '__main__':
+    main()
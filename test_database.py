@@ -49,10 +49,9 @@ class DatabaseConnectionTests(unittest.TestCase):
     @classmethod
     def tearDownClass(cls):
         """Clean up database connection"""
-        if hasattr(cls, 'db_manager') and hasattr(cls.db_manager, '_connection'):
+        if hasattr(cls, 'db_manager'):
             try:
-                if cls.db_manager._connection:
-                    cls.db_manager._connection.close()
+                cls.db_manager.close_connection()
             except Exception:
                 pass
 
@@ -100,10 +99,9 @@ class MultiHomeDatabaseTests(unittest.TestCase):
     @classmethod
     def tearDownClass(cls):
         """Clean up database connection"""
-        if hasattr(cls, 'db_manager') and hasattr(cls.db_manager, '_connection'):
+        if hasattr(cls, 'db_manager'):
             try:
-                if cls.db_manager._connection:
-                    cls.db_manager._connection.close()
+                cls.db_manager.close_connection()
             except Exception:
                 pass
 
@@ -294,9 +292,9 @@ class ManagementLogTests(unittest.TestCase):
     @classmethod
     def tearDownClass(cls):
         """Clean up database connection"""
-        if hasattr(cls.db_manager, '_connection') and cls.db_manager._connection:
+        if hasattr(cls, 'db_manager'):
             try:
-                cls.db_manager._connection.close()
+                cls.db_manager.close_connection()
             except Exception:
                 pass
 
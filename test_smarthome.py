@@ -245,6 +245,13 @@ class DeviceManagementTests(BaseTestCase):
             content_type='application/json')
         self.assertIn(response.status_code, [302, 401, 403, 404])  # 404 if button doesn't exist
 
+    def test_api_toggle_button_rejects_non_boolean_state(self):
+        """Test a string state is rejected instead of being read as truthy"""
+        self.force_login()
+        response = self.client.post('/api/buttons/00000000-0000-0000-0000-000000000001/toggle',
+            data=json.dumps({'state': 'false'}),
+            content_type='application/json')
+        self.assertEqual(response.status_code, 400)
     
     def test_api_set_temperature_requires_auth(self):
         """Test temperature set API requires authentication"""
@@ -445,6 +452,1282 @@ class IntegrationTests(BaseTestCase):
         self.assertEqual(response.status_code, 200)
 
 
+class ConnectionPoolTests(unittest.TestCase):
+    """Test the bounded connection pool with fake DB-API connections"""
+
+    class FakeCursor:
+        def __init__(self, conn):
+            self.conn = conn
+
+        def execute(self, query, params=None):
+            if self.conn.fail_ping:
+                raise RuntimeError("server closed the connection")
+
+        def close(self):
+            pass
+
+    class FakeConnection:
+        def __init__(self):
+            self.closed = False
+            self.commits = 0
+            self.rollbacks = 0
+            self.fail_ping = False
+
+        def cursor(self):
+            return ConnectionPoolTests.FakeCursor(self)
+
+        def commit(self):
+            self.commits += 1
+
+        def rollback(self):
+            self.rollbacks += 1
+
+        def close(self):
+            self.closed = True
+
+    def make_pool(self, **kwargs):
+        from utils.db_pool import ConnectionPool
+        self.created = []
+
+        def connect():
+            conn = self.FakeConnection()
+            self.created.append(conn)
+            return conn
+
+        return ConnectionPool(connect, **kwargs)
+
+    def test_commit_and_rollback_per_checkout(self):
+        pool = self.make_pool(min_size=1, max_size=2)
+        with pool.connection() as conn:
+            pass
+        self.assertEqual(conn.commits, 1)
+        with self.assertRaises(ValueError):
+            with pool.connection() as conn:
+                raise ValueError("boom")
+        self.assertEqual(conn.rollbacks, 1)
+        self.assertEqual(pool.get_stats()['in_use'], 0)
+
+    def test_wait_timeout_when_exhausted(self):
+        from utils.db_pool import PoolTimeoutError
+        pool = self.make_pool(min_size=0, max_size=1, timeout=0.05)
+        with pool.connection():
+            with self.assertRaises(PoolTimeoutError):
+                with pool.connection():
+                    pass
+        stats = pool.get_stats()
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertEqual(stats['open_connections'], 1)
+
+    def test_waiter_receives_released_connection(self):
+        import threading
+        pool = self.make_pool(min_size=0, max_size=1, timeout=2)
+        results = []
+
+        def worker():
+            with pool.connection() as conn:
+                results.append(conn)
+
+        with pool.connection() as first:
+            thread = threading.Thread(target=worker)
+            thread.start()
+            time.sleep(0.05)
+        thread.join(timeout=2)
+        self.assertEqual(results, [first])
+        self.assertEqual(pool.get_stats()['waits'], 1)
+
+    def test_stale_connections_are_replaced(self):
+        pool = self.make_pool(min_size=1, max_size=1, pre_ping_idle=0)
+        self.created[0].fail_ping = True
+        with pool.connection() as conn:
+            self.assertIsNot(conn, self.created[0])
+        self.assertTrue(self.created[0].closed)
+        self.assertEqual(pool.get_stats()['pre_ping_failures'], 1)
+
+        recycling_pool = self.make_pool(min_size=1, max_size=1, recycle=0.01, pre_ping_idle=None)
+        time.sleep(0.02)
+        with recycling_pool.connection():
+            pass
+        self.assertEqual(recycling_pool.get_stats()['connections_recycled'], 1)
+
+
+class CooperativeDBModeTests(unittest.TestCase):
+    """Test selection of the green-thread aware psycopg2 wait callback"""
+
+    def tearDown(self):
+        from utils.green_db import configure_cooperative_db
+        os.environ.pop('DB_COOPERATIVE_MODE', None)
+        configure_cooperative_db('threading')
+
+    def test_mode_follows_socketio_async_mode(self):
+        from utils.green_db import resolve_cooperative_mode
+        self.assertEqual(resolve_cooperative_mode('eventlet'), 'eventlet')
+        self.assertEqual(resolve_cooperative_mode('gevent_uwsgi'), 'gevent')
+        self.assertEqual(resolve_cooperative_mode('threading'), 'off')
+
+    def test_env_override_installs_callback(self):
+        from psycopg2 import extensions
+        from utils.green_db import configure_cooperative_db
+        os.environ['DB_COOPERATIVE_MODE'] = 'off'
+        self.assertEqual(configure_cooperative_db('eventlet'), 'off')
+        self.assertIsNone(extensions.get_wait_callback())
+        os.environ['DB_COOPERATIVE_MODE'] = 'gevent'
+        with patch('utils.green_db._threading_patched', return_value=True):
+            self.assertEqual(configure_cooperative_db('threading'), 'gevent')
+        self.assertIsNotNone(extensions.get_wait_callback())
+
+    def test_unpatched_threading_keeps_blocking_mode(self):
+        from psycopg2 import extensions
+        from utils.green_db import configure_cooperative_db
+        # This test process never monkey-patches threading
+        self.assertEqual(configure_cooperative_db('eventlet'), 'off')
+        self.assertIsNone(extensions.get_wait_callback())
+
+
+class MembershipMemoTests(unittest.TestCase):
+    """Test memoization and caching of membership and role checks"""
+
+    def setUp(self):
+        from flask import Flask
+        from utils.multi_home_db_manager import MultiHomeDBManager
+        self.flask_app = Flask(__name__)
+        self.backup = Mock()
+        self.backup.read_config.return_value = {
+            'users': {'u1': {'id': 'u1', 'role': 'user'}}
+        }
+        self.backup.get_user_homes.return_value = [{
+            'id': 'h1', 'name': 'Home', 'description': '', 'owner_id': 'u1',
+            'role': 'member', 'permissions': ['control_devices'],
+            'joined_at': None, 'is_owner': True
+        }]
+        self.backup.membership_version.return_value = 1
+        self.db = MultiHomeDBManager.__new__(MultiHomeDBManager)
+        self.db.json_fallback_mode = True
+        self.db.json_backup = self.backup
+        self.db.membership_cache_ttl = 300
+        self.db._reset_membership_cache()
+
+    def test_checks_share_one_load_per_request(self):
+        with self.flask_app.test_request_context():
+            self.assertTrue(self.db.user_has_home_access('u1', 'h1'))
+            self.assertTrue(self.db.user_has_home_permission('u1', 'h1', 'control_devices'))
+            self.assertFalse(self.db.user_has_home_permission('u1', 'h1', 'manage_users'))
+            self.assertEqual(self.db.get_user_role_in_home('u1', 'h1'), 'member')
+            self.assertFalse(self.db.is_sys_admin('u1'))
+            self.assertEqual(self.backup.get_user_homes.call_count, 1)
+
+    def test_snapshot_reused_across_requests_until_version_bump(self):
+        for _ in range(3):
+            with self.flask_app.test_request_context():
+                self.assertTrue(self.db.user_has_home_access('u1', 'h1'))
+        self.assertEqual(self.backup.get_user_homes.call_count, 1)
+        self.backup.get_user_homes.return_value = []
+        self.db.invalidate_membership_cache()
+        with self.flask_app.test_request_context():
+            self.assertFalse(self.db.user_has_home_access('u1', 'h1'))
+        self.assertEqual(self.backup.get_user_homes.call_count, 2)
+
+    def test_template_context_uses_one_snapshot(self):
+        with self.flask_app.test_request_context():
+            context = self.db.get_membership_context('u1', 'h1')
+            self.assertEqual(context['current_home']['name'], 'Home')
+            self.assertEqual(len(context['user_homes']), 1)
+            self.assertFalse(context['has_admin_access'])
+            self.assertFalse(context['is_sys_admin'])
+            self.assertEqual(self.db.get_home_details('h1', 'u1')['role'], 'member')
+            self.assertIsNone(self.db.get_home_details('h2', 'u1'))
+        self.assertEqual(self.backup.get_user_homes.call_count, 1)
+
+    def test_snapshot_expires_after_ttl(self):
+        self.assertTrue(self.db.user_has_home_access('u1', 'h1'))
+        self.db.membership_cache_ttl = 0
+        self.db.user_has_home_access('u1', 'h1')
+        self.assertEqual(self.backup.get_user_homes.call_count, 2)
+
+    def test_invalidation_reloads_memberships(self):
+        with self.flask_app.test_request_context():
+            self.assertTrue(self.db.user_has_home_access('u1', 'h1'))
+            self.backup.get_user_homes.return_value = []
+            self.assertTrue(self.db.user_has_home_access('u1', 'h1'))
+            self.db.invalidate_membership_cache('u1')
+            self.assertFalse(self.db.user_has_home_access('u1', 'h1'))
+
+    def test_shared_versions_reach_other_workers(self):
+        from flask_caching import Cache
+        from utils.cache_manager import CacheManager
+        from utils.multi_home_db_manager import MultiHomeDBManager
+        shared = CacheManager(Cache(self.flask_app, config={'CACHE_TYPE': 'SimpleCache'}))
+        other = MultiHomeDBManager.__new__(MultiHomeDBManager)
+        other.json_fallback_mode = True
+        other.json_backup = self.backup
+        other._reset_membership_cache()
+        for db in (self.db, other):
+            db.share_membership_versions(shared)
+        with self.flask_app.app_context():
+            self.assertTrue(other.user_has_home_access('u1', 'h1'))
+            self.backup.get_user_homes.return_value = []
+            self.assertTrue(other.user_has_home_access('u1', 'h1'))
+            # Revoked in one worker, reloaded by the other
+            self.db.invalidate_membership_cache('u1')
+            self.assertFalse(other.user_has_home_access('u1', 'h1'))
+
+    def test_json_removal_revokes_access_immediately(self):
+        import tempfile
+        from utils.json_backup_manager import JSONBackupManager
+        with tempfile.TemporaryDirectory() as tmpdir, patch('builtins.print'):
+            self.db.json_backup = JSONBackupManager(os.path.join(tmpdir, 'config.json'))
+            config = self.db.json_backup.get_config()
+            home_id = next(iter(config['homes']))
+            user_id = config['user_homes'][home_id][0]['user_id']
+            self.assertTrue(self.db.user_has_home_access(user_id, home_id))
+            # What the JSON-mode remove-user route does, without invalidating
+            config['user_homes'][home_id] = []
+            self.assertTrue(self.db.json_backup.save_config(config))
+            self.assertFalse(self.db.user_has_home_access(user_id, home_id))
+
+
+class JSONConfigCacheTests(unittest.TestCase):
+    """Test the in-memory configuration cache of JSONBackupManager"""
+
+    def setUp(self):
+        import tempfile
+        from utils.json_backup_manager import JSONBackupManager
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.config_file = os.path.join(self.tmpdir.name, 'config.json')
+        with patch('builtins.print'):
+            self.manager = JSONBackupManager(self.config_file)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_unchanged_file_is_parsed_once(self):
+        self.manager.get_config()
+        with patch('utils.json_backup_manager.json_serializer.load') as json_load:
+            self.manager.get_config()
+            self.manager.read_config()
+            json_load.assert_not_called()
+
+    def test_get_config_returns_independent_copy(self):
+        config = self.manager.get_config()
+        config['rooms'].append({'id': 'r1'})
+        self.assertEqual(self.manager.get_config()['rooms'], [])
+        self.assertTrue(self.manager.save_config(config))
+        config['rooms'].append({'id': 'r2'})
+        self.assertEqual(len(self.manager.get_config()['rooms']), 1)
+
+    def test_read_config_is_read_only(self):
+        view = self.manager.read_config()
+        with self.assertRaises(TypeError):
+            view['rooms'].append({'id': 'r1'})
+        with self.assertRaises(TypeError):
+            view['metadata'] = {}
+
+    def test_external_write_is_detected(self):
+        config = self.manager.get_config()
+        config['rooms'] = [{'id': 'external'}]
+        with open(self.config_file, 'w', encoding='utf-8') as f:
+            json.dump(config, f)
+        self.assertEqual(self.manager.read_config()['rooms'][0]['id'], 'external')
+
+    def test_backup_rotated_from_previous_file(self):
+        with open(self.config_file, 'rb') as f:
+            previous = f.read()
+        config = self.manager.get_config()
+        config['rooms'] = [{'id': 'r1'}]
+        self.assertTrue(self.manager.save_config(config))
+        with open(self.config_file + '.backup', 'rb') as f:
+            self.assertEqual(f.read(), previous)
+        stats = self.manager.get_write_stats()
+        self.assertEqual(stats['file_writes'], 1)
+        self.assertEqual(stats['write_amplification'], 1.0)
+
+    def test_write_behind_coalesces_saves(self):
+        self.manager.write_behind_window = 60
+        with open(self.config_file, 'rb') as f:
+            on_disk = f.read()
+        for index in range(5):
+            config = self.manager.get_config()
+            config['rooms'] = [{'id': f'r{index}'}]
+            self.manager.save_config(config)
+        self.assertEqual(self.manager.read_config()['rooms'][0]['id'], 'r4')
+        with open(self.config_file, 'rb') as f:
+            self.assertEqual(f.read(), on_disk)
+        self.assertTrue(self.manager.flush())
+        with open(self.config_file, 'r', encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['rooms'][0]['id'], 'r4')
+        stats = self.manager.get_write_stats()
+        self.assertEqual(stats['file_writes'], 1)
+        self.assertEqual(stats['coalesced_saves'], 4)
+        self.assertEqual(stats['write_amplification'], 0.2)
+
+
+    def test_journal_appends_without_rewriting_snapshot(self):
+        with open(self.config_file, 'rb') as f:
+            snapshot = f.read()
+        self.assertTrue(self.manager.append_record('management_logs', {'id': 'l1'}))
+        self.assertTrue(self.manager.set_value(['user_current_home', 'u1'], 'h1'))
+        with open(self.config_file, 'rb') as f:
+            self.assertEqual(f.read(), snapshot)
+        self.assertEqual(self.manager.read_config()['management_logs'][0]['id'], 'l1')
+        # A fresh manager replays the journal on load
+        from utils.json_backup_manager import JSONBackupManager
+        with patch('builtins.print'):
+            other = JSONBackupManager(self.config_file)
+        self.assertEqual(other.get_user_current_home('u1'), 'h1')
+        self.assertEqual(len(other.read_config()['management_logs']), 1)
+
+    def test_append_after_torn_journal_line_survives_reload(self):
+        self.assertTrue(self.manager.append_record('management_logs', {'id': 'l1'}))
+        # A crash in the middle of an append leaves a line without newline
+        with open(self.config_file + '.journal', 'ab') as f:
+            f.write(b'{"op": "append", "path": ["manag')
+        self.manager.invalidate_cache()
+        self.assertTrue(self.manager.append_record('management_logs', {'id': 'l2'}))
+        from utils.json_backup_manager import JSONBackupManager
+        with patch('builtins.print'):
+            other = JSONBackupManager(self.config_file)
+        self.assertEqual([log['id'] for log in other.read_config()['management_logs']], ['l1', 'l2'])
+
+    def test_update_record_merges_changes(self):
+        config = self.manager.get_config()
+        config['buttons'] = [{'id': 'b1', 'name': 'Lamp', 'state': False}]
+        self.manager.save_config(config)
+        self.assertTrue(self.manager.update_record('buttons', 'b1', {'state': True}))
+        self.assertFalse(self.manager.update_record('buttons', 'missing', {'state': True}))
+        self.assertEqual(self.manager.read_config()['buttons'][0],
+                         {'id': 'b1', 'name': 'Lamp', 'state': True})
+
+    def test_compaction_folds_journal_once(self):
+        import shutil
+        self.manager.append_record('management_logs', {'id': 'l1'})
+        journal = self.config_file + '.journal'
+        shutil.copyfile(journal, journal + '.copy')
+        self.assertTrue(self.manager.compact())
+        self.assertFalse(os.path.exists(journal))
+        # A journal surviving a crash after compaction is not applied twice
+        os.replace(journal + '.copy', journal)
+        self.manager.invalidate_cache()
+        self.assertEqual(len(self.manager.read_config()['management_logs']), 1)
+
+
+    def test_indexes_follow_mutations(self):
+        config = self.manager.get_config()
+        config['rooms'] = [{'id': 'r1', 'home_id': 'h1', 'name': 'Kitchen'}]
+        config['buttons'] = [{'id': 'b1', 'home_id': 'h1', 'room_id': 'r1', 'state': False}]
+        config['temperature_controls'] = [{'id': 't1', 'home_id': 'h2'}]
+        config['user_homes']['h1'] = [{'user_id': 'u1', 'role': 'member'}]
+        config['homes']['h1'] = {'id': 'h1', 'name': 'Flat', 'owner_id': 'u0'}
+        self.manager.save_config(config)
+
+        self.assertEqual(self.manager.find_device('t1')[0], 'temperature_controls')
+        self.assertEqual(self.manager.find_room('r1')['name'], 'Kitchen')
+        self.assertEqual([d['id'] for d in self.manager.get_home_devices('h1')], ['b1'])
+        self.assertEqual([h['id'] for h in self.manager.get_user_homes('u1')], ['h1'])
+        self.assertEqual(self.manager.find_user('admin@localhost')[0], 'sys-admin')
+
+        rebuilds = self.manager.get_write_stats()['index_rebuilds']
+        self.manager.update_record('buttons', 'b1', {'state': True})
+        self.assertTrue(self.manager.find_device('b1')[2]['state'])
+        self.assertEqual(self.manager.get_write_stats()['index_rebuilds'], rebuilds)
+
+        self.manager.append_record('buttons', {'id': 'b2', 'home_id': 'h1'})
+        self.assertEqual([d['id'] for d in self.manager.get_home_devices('h1')], ['b1', 'b2'])
+
+    def test_home_shards_scope_writes(self):
+        from utils.json_backup_manager import JSONBackupManager
+        config = self.manager.get_config()
+        config['buttons'] = [{'id': 'b1', 'home_id': 'h1', 'state': False},
+                             {'id': 'b2', 'home_id': 'h2', 'state': False}]
+        self.manager.save_config(config)
+        with patch('builtins.print'):
+            manager = JSONBackupManager(self.config_file, shard_homes=True)
+        # The single-file config is split into shards on the next save
+        manager.save_config(manager.get_config())
+        self.assertEqual(sorted(os.listdir(manager.shards_dir)), ['h1.json', 'h2.json'])
+        with open(self.config_file, 'r', encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['buttons'], [])
+
+        h2_file = os.path.join(manager.shards_dir, 'h2.json')
+        h2_stat = os.stat(h2_file)
+        config = manager.get_config()
+        config['buttons'][0]['state'] = True
+        manager.save_config(config)
+        self.assertEqual(os.stat(h2_file).st_mtime_ns, h2_stat.st_mtime_ns)
+
+        self.assertTrue(manager.update_record('buttons', 'b2', {'state': True}))
+        self.assertTrue(os.path.exists(h2_file + '.journal'))
+        self.assertEqual(os.stat(h2_file).st_mtime_ns, h2_stat.st_mtime_ns)
+
+        with patch('builtins.print'):
+            other = JSONBackupManager(self.config_file, shard_homes=True)
+        self.assertEqual([(b['id'], b['state']) for b in other.read_config()['buttons']],
+                         [('b1', True), ('b2', True)])
+        self.assertTrue(other.compact())
+        self.assertFalse(os.path.exists(h2_file + '.journal'))
+
+    def test_smart_home_save_keeps_journal_position(self):
+        from app.configure import SmartHomeSystem
+        from utils.json_backup_manager import JSONBackupManager
+        with patch('builtins.print'):
+            system = SmartHomeSystem(self.config_file)
+            self.manager.invalidate_cache()
+            self.assertTrue(self.manager.append_record('management_logs', {'id': 'l1'}))
+            system.rooms.append('Kuchnia')
+            self.assertTrue(system.save_config())
+            other = JSONBackupManager(self.config_file)
+        config = other.read_config()
+        # The journaled log is saved once, not replayed on top of the snapshot
+        self.assertEqual([log['id'] for log in config['management_logs']], ['l1'])
+        self.assertEqual(config['rooms'], ['Kuchnia'])
+        self.assertEqual(config['homes'], self.manager.read_config()['homes'])
+
+    def test_homes_append_concurrently(self):
+        import threading
+        from utils import json_backup_manager
+        from utils.json_backup_manager import JSONBackupManager
+        with patch('builtins.print'):
+            manager = JSONBackupManager(self.config_file, shard_homes=True)
+        config = manager.get_config()
+        config['buttons'] = [{'id': 'b1', 'home_id': 'h1', 'state': False},
+                             {'id': 'b2', 'home_id': 'h2', 'state': False}]
+        manager.save_config(config)
+
+        append = json_backup_manager._append_journal_line
+        h1_writing, h1_release = threading.Event(), threading.Event()
+
+        def slow_h1_append(journal_file, line):
+            if os.path.basename(journal_file).startswith('h1.'):
+                h1_writing.set()
+                h1_release.wait(5)
+            return append(journal_file, line)
+
+        with patch.object(json_backup_manager, '_append_journal_line', slow_h1_append):
+            h1 = threading.Thread(target=manager.update_record, args=('buttons', 'b1', {'state': True}))
+            h1.start()
+            self.assertTrue(h1_writing.wait(5))
+            # h1's append holds its home's locks; h2 is not blocked by them
+            h2 = threading.Thread(target=manager.update_record, args=('buttons', 'b2', {'state': True}))
+            h2.start()
+            h2.join(5)
+            self.assertFalse(h2.is_alive())
+            self.assertTrue(manager.read_config()['buttons'][1]['state'])
+            h1_release.set()
+            h1.join(5)
+
+        self.assertEqual([b['state'] for b in manager.read_config()['buttons']], [True, True])
+        with patch('builtins.print'):
+            other = JSONBackupManager(self.config_file, shard_homes=True)
+        self.assertEqual([(b['id'], b['state']) for b in other.read_config()['buttons']],
+                         [('b1', True), ('b2', True)])
+
+    def test_compact_files_and_pretty_export(self):
+        from utils import json_serializer
+        config = self.manager.get_config()
+        config['rooms'].append({'id': 'r1', 'name': 'Łazienka'})
+        self.assertTrue(self.manager.save_config(config))
+        with open(self.config_file, 'rb') as f:
+            data = f.read()
+        self.assertNotIn(b'\n', data.strip())
+        self.assertIn('Łazienka'.encode('utf-8'), data)
+
+        export_file = os.path.join(self.tmpdir.name, 'export.json')
+        self.assertTrue(self.manager.export_config(export_file))
+        with open(export_file, 'r', encoding='utf-8') as f:
+            self.assertGreater(len(f.read().splitlines()), 10)
+        # Either backend reads the other's output
+        with patch.object(json_serializer, 'BACKEND', 'json'):
+            self.assertEqual(json_serializer.load(self.config_file)['rooms'][0]['name'], 'Łazienka')
+            data = json_serializer.dumps({'a': [1, 2]})
+        self.assertEqual(json_serializer.loads(data), {'a': [1, 2]})
+
+
+class SQLiteBackendTests(unittest.TestCase):
+    """Test the embedded SQLite fallback of the multi-home manager"""
+
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.TemporaryDirectory()
+        env = {'DB_FALLBACK_BACKEND': 'sqlite',
+               'SQLITE_DB_PATH': os.path.join(self.tmpdir.name, 'smart_home.sqlite3')}
+        self.env = patch.dict(os.environ, env)
+        self.env.start()
+        for key in ('DB_HOST', 'DB_NAME', 'DB_USER', 'DB_PASSWORD'):
+            os.environ.pop(key, None)
+        from utils.multi_home_db_manager import MultiHomeDBManager
+        with patch('builtins.print'):
+            self.manager = MultiHomeDBManager()
+
+    def tearDown(self):
+        self.manager.close_connection()
+        self.env.stop()
+        self.tmpdir.cleanup()
+
+    def test_translate_postgres_dialect(self):
+        from utils.sqlite_backend import translate
+        self.assertEqual(translate("SELECT 1 WHERE id = ANY(%s::uuid[]) AND perms ? 'admin'"),
+                         "SELECT 1 WHERE id IN (SELECT value FROM json_each(?)) AND "
+                         "EXISTS (SELECT 1 FROM json_each(perms) WHERE value = 'admin')")
+        self.assertEqual(translate("UPDATE devices d SET state = %s WHERE d.id = %s RETURNING d.id"),
+                         "UPDATE devices AS d SET state = ? WHERE d.id = ? RETURNING devices.id")
+
+    def test_device_round_trip(self):
+        self.assertEqual(self.manager.backend, 'sqlite')
+        self.assertFalse(self.manager.json_fallback_mode)
+        admin = self.manager.find_user_by_email_or_username('sys-admin')
+        home_id = self.manager.get_user_homes(admin['id'])[0]['id']
+        room_id = self.manager.create_room(home_id, 'Kitchen', admin['id'])
+        device_id = self.manager.create_device(room_id, 'Lamp', 'light', admin['id'])
+
+        device = self.manager.toggle_device_state(device_id, admin['id'])
+        self.assertIs(device['state'], True)
+        result = self.manager.batch_update_devices([{'id': device_id, 'state': False}], admin['id'])
+        self.assertEqual(result['updated'], [device_id])
+        devices = self.manager.get_home_devices(home_id, admin['id'])
+        self.assertEqual([(d['name'], d['state']) for d in devices], [('Lamp', False)])
+
+    def test_nested_cursor_failure_keeps_the_outer_transaction(self):
+        admin = self.manager.find_user_by_email_or_username('sys-admin')
+        home_id = self.manager.get_user_homes(admin['id'])[0]['id']
+        with self.manager.get_cursor() as cursor:
+            self.manager.create_room(home_id, 'Kitchen', admin['id'])
+            with self.assertRaises(ValueError):
+                with self.manager.get_cursor() as nested:
+                    nested.execute("DELETE FROM rooms WHERE home_id = %s", (home_id,))
+                    raise ValueError('rolled back to the savepoint')
+            cursor.execute("SELECT name FROM rooms WHERE home_id = %s", (home_id,))
+            self.assertEqual([row[0] for row in cursor.fetchall()], ['Kitchen'])
+
+        # An outer failure also undoes a nested block that opened the transaction
+        with self.assertRaises(ValueError):
+            with self.manager.get_cursor():
+                self.manager.create_room(home_id, 'Hall', admin['id'])
+                raise ValueError('outer failure')
+        rooms = self.manager.get_home_rooms(home_id, admin['id'])
+        self.assertEqual([room['name'] for room in rooms], ['Kitchen'])
+
+    def test_management_log_keyset_pages(self):
+        from datetime import datetime, timedelta
+        admin = self.manager.find_user_by_email_or_username('sys-admin')
+        home_id = self.manager.get_user_homes(admin['id'])[0]['id']
+        start = datetime(2026, 1, 1, 12, 0, 0)
+        # Pairs of entries share a timestamp, so pages must break ties by id
+        self.manager.add_home_management_logs([
+            {'home_id': home_id, 'level': 'warning' if index % 3 == 0 else 'info',
+             'message': f'event {index}', 'event_type': 'device_action',
+             'timestamp': start + timedelta(minutes=index // 2)}
+            for index in range(11)
+        ])
+
+        messages, cursor = [], None
+        while True:
+            page = self.manager.get_home_management_logs_page(home_id, admin['id'], limit=4, cursor=cursor)
+            self.assertLessEqual(len(page['logs']), 4)
+            messages.extend(log['message'] for log in page['logs'])
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(len(messages), 11)
+        self.assertEqual(len(set(messages)), 11)
+        self.assertEqual(messages[0], 'event 10')
+
+        warnings = self.manager.get_home_management_logs(home_id, admin['id'], level='warning')
+        self.assertEqual([log['message'] for log in warnings], ['event 9', 'event 6', 'event 3', 'event 0'])
+        with self.assertRaises(ValueError):
+            self.manager.get_home_management_logs_page(home_id, admin['id'], cursor='not-a-cursor')
+        bad_id = self.manager._encode_log_cursor(start, 'not-a-uuid')
+        with self.assertRaises(ValueError):
+            self.manager.get_home_management_logs_page(home_id, admin['id'], cursor=bad_id)
+
+    def test_log_analytics_from_rollup(self):
+        admin = self.manager.find_user_by_email_or_username('sys-admin')
+        home_id = self.manager.get_user_homes(admin['id'])[0]['id']
+        day = datetime(2026, 3, 2, 9, 0, 0)
+        self.manager.add_home_management_logs([
+            {'home_id': home_id, 'level': 'warning' if index % 4 == 0 else 'info',
+             'message': f'event {index}', 'event_type': 'login' if index % 2 else 'device_action',
+             'username': 'admin' if index < 6 else 'anna', 'timestamp': day + timedelta(minutes=20 * index)}
+            for index in range(9)
+        ])
+        self.manager.add_home_management_log(home_id, 'info', 'now', 'login', username='anna')
+
+        analytics = self.manager.get_home_log_analytics(
+            home_id, admin['id'], start='2026-03-02T00:00:00', end='2026-03-03T00:00:00')
+        self.assertEqual(analytics['total'], 9)
+        self.assertEqual(analytics['by_event_type'], {'device_action': 5, 'login': 4})
+        self.assertEqual(analytics['by_level'], {'info': 6, 'warning': 3})
+        self.assertEqual(analytics['by_user'], {'admin': 6, 'anna': 3})
+        self.assertEqual([point['count'] for point in analytics['timeline']], [3, 3, 3])
+        self.assertTrue(analytics['timeline'][0]['bucket'].startswith('2026-03-02T09:00:00'))
+
+        daily = self.manager.get_home_log_analytics(
+            home_id, admin['id'], start='2026-03-01', end=datetime.now() + timedelta(hours=1), bucket='day')
+        self.assertEqual(daily['total'], 10)
+        self.assertEqual(daily['timeline'][0]['count'], 9)
+
+        # Rebuilding from the raw rows gives the same counts
+        self.manager.rebuild_management_log_rollup(home_id)
+        self.assertEqual(self.manager.get_home_log_analytics(
+            home_id, admin['id'], start='2026-03-02T00:00:00', end='2026-03-03T00:00:00'), analytics)
+        with self.assertRaises(ValueError):
+            self.manager.get_home_log_analytics(home_id, admin['id'], bucket='week')
+
+    def test_clearing_logs_resets_analytics(self):
+        admin = self.manager.find_user_by_email_or_username('sys-admin')
+        home_id = self.manager.get_user_homes(admin['id'])[0]['id']
+        self.manager.add_home_management_logs([
+            {'home_id': home_id, 'level': 'info', 'message': f'event {index}', 'event_type': 'login'}
+            for index in range(5)
+        ])
+        self.assertEqual(self.manager.get_home_log_analytics(home_id, admin['id'])['total'], 5)
+        self.assertEqual(self.manager.clear_home_management_logs(home_id, admin['id']), 5)
+        analytics = self.manager.get_home_log_analytics(home_id, admin['id'])
+        self.assertEqual(analytics['total'], 0)
+        self.assertEqual(analytics['timeline'], [])
+
+    def test_deleting_logs_keeps_counts_retention_purged(self):
+        admin = self.manager.find_user_by_email_or_username('sys-admin')
+        home_id = self.manager.get_user_homes(admin['id'])[0]['id']
+        now = datetime.now().astimezone()
+        self.manager.add_home_management_logs(
+            [{'home_id': home_id, 'level': 'info', 'message': 'old', 'timestamp': now - timedelta(days=5)}] * 3
+            + [{'home_id': home_id, 'level': 'info', 'message': 'new', 'timestamp': now}] * 2
+        )
+        # Retention purges the raw rows; the rollup keeps counting them
+        self.assertEqual(self.manager.purge_expired_management_logs(home_id, now - timedelta(days=1)), 3)
+        start = (now - timedelta(days=7)).isoformat()
+        self.assertEqual(self.manager.get_home_log_analytics(home_id, admin['id'], start, bucket='day')['total'], 5)
+        today = now.date().isoformat()
+        self.assertEqual(self.manager.delete_home_logs_by_date_range(home_id, admin['id'], today, today), 2)
+        self.assertEqual(self.manager.get_home_log_analytics(home_id, admin['id'], start, bucket='day')['total'], 3)
+
+
+class ManagementLoggerTests(unittest.TestCase):
+    """Test the segmented JSONL storage of ManagementLogger"""
+
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.log_file = os.path.join(self.tmpdir.name, 'management_logs.json')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _segments(self):
+        return sorted(name for name in os.listdir(self.tmpdir.name)
+                      if name.endswith('.jsonl') and name != 'management_logs.jsonl')
+
+    def test_legacy_file_is_converted(self):
+        with open(self.log_file, 'w', encoding='utf-8') as f:
+            json.dump([{'timestamp': '2024-01-02 10:00:00', 'level': 'info', 'message': 'new'},
+                       {'timestamp': '2024-01-01 10:00:00', 'level': 'info', 'message': 'old'}], f)
+        from app.management_logger import ManagementLogger
+        logger = ManagementLogger(self.log_file)
+        self.assertFalse(os.path.exists(self.log_file))
+        self.assertEqual([log['message'] for log in logger.get_logs()], ['new', 'old'])
+
+    def test_rotation_tail_and_segment_deletion(self):
+        from app.management_logger import ManagementLogger
+        logger = ManagementLogger(self.log_file, max_logs=1000, max_days=3650, segment_bytes=1500)
+        for i in range(40):
+            logger.log_event('warning' if i % 4 == 0 else 'info', f'event {i}', 'device_action')
+        segments = self._segments()
+        self.assertGreater(len(segments), 1)
+
+        self.assertEqual([log['message'] for log in logger.get_logs(limit=3)],
+                         ['event 39', 'event 38', 'event 37'])
+        self.assertEqual([log['message'] for log in logger.get_logs(limit=2, level_filter='warning')],
+                         ['event 36', 'event 32'])
+        self.assertEqual(len(logger.get_logs()), 40)
+
+        # Whole segments inside the range are dropped without being parsed
+        today = datetime.now().strftime('%Y-%m-%d')
+        with patch.object(logger, '_iter_segment', side_effect=AssertionError('segment parsed')):
+            with patch.object(logger, '_entry_time', return_value=datetime.now()):
+                deleted = logger.delete_logs_by_date_range(today, today)
+        self.assertEqual(deleted, 40)
+        self.assertEqual(self._segments(), [])
+        self.assertEqual(logger.get_logs(), [])
+
+    def test_log_analytics(self):
+        from app.management_logger import ManagementLogger
+        logger = ManagementLogger(self.log_file, max_logs=1000, max_days=3650, segment_bytes=1500)
+        for i in range(30):
+            logger.log_event('warning' if i % 3 == 0 else 'info', f'event {i}',
+                             'login' if i % 2 else 'device_action', user='admin')
+        analytics = logger.get_log_analytics()
+        self.assertEqual(analytics['total'], 30)
+        self.assertEqual(analytics['by_level'], {'info': 20, 'warning': 10})
+        self.assertEqual(analytics['by_event_type'], {'device_action': 15, 'login': 15})
+        self.assertEqual(sum(point['count'] for point in analytics['timeline']), 30)
+
+class DatabaseLogWriterTests(unittest.TestCase):
+    """Test the buffered background writer of DatabaseManagementLogger"""
+
+    def setUp(self):
+        patcher = patch('app.database_management_logger.SmartHomeDatabaseManager')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.multi_db = Mock()
+        self.multi_db.find_user_by_email_or_username.return_value = {'id': 'u1'}
+        self.multi_db.add_home_management_logs.side_effect = lambda entries: len(entries)
+
+    def _logger(self, **kwargs):
+        from app.database_management_logger import DatabaseManagementLogger
+        logger = DatabaseManagementLogger(multi_db=self.multi_db, async_writes=True, **kwargs)
+        self.addCleanup(logger.close)
+        return logger
+
+    def test_events_are_written_in_batches(self):
+        logger = self._logger(flush_interval=5.0)
+        for i in range(5):
+            logger.log_event('info', f'event {i}', 'device_action', 'admin', '127.0.0.1', home_id='h1')
+        self.multi_db.add_home_management_logs.assert_not_called()
+        self.assertTrue(logger.flush(timeout=5))
+
+        self.multi_db.add_home_management_logs.assert_called_once()
+        entries = self.multi_db.add_home_management_logs.call_args[0][0]
+        self.assertEqual([entry['message'] for entry in entries], [f'event {i}' for i in range(5)])
+        self.assertEqual({entry['user_id'] for entry in entries}, {'u1'})
+        self.multi_db.find_user_by_email_or_username.assert_called_once_with('admin')
+        stats = logger.get_stats()
+        self.assertEqual((stats['queued'], stats['written'], stats['dropped']), (5, 5, 0))
+
+    def test_full_queue_drops_events_and_failed_batches_retry_per_row(self):
+        logger = self._logger(queue_size=2, flush_interval=0)
+        with patch.object(logger, '_ensure_writer'):
+            for i in range(3):
+                logger.log_event('info', f'event {i}', home_id='h1')
+        self.assertEqual(logger.get_stats()['dropped'], 1)
+
+        def insert(entries):
+            if len(entries) > 1 or entries[0]['message'] == 'event 0':
+                raise Exception('invalid input syntax for type inet')
+            return 1
+        self.multi_db.add_home_management_logs.side_effect = insert
+        logger._ensure_writer()
+        self.assertTrue(logger.flush(timeout=5))
+        stats = logger.get_stats()
+        self.assertEqual((stats['written'], stats['failed']), (1, 1))
+
+
+class LogRetentionTests(unittest.TestCase):
+    """Test batched deletion and archiving of expired log rows"""
+
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.TemporaryDirectory()
+        env = {'DB_FALLBACK_BACKEND': 'sqlite',
+               'SQLITE_DB_PATH': os.path.join(self.tmpdir.name, 'smart_home.sqlite3')}
+        self.env = patch.dict(os.environ, env)
+        self.env.start()
+        for key in ('DB_HOST', 'DB_NAME', 'DB_USER', 'DB_PASSWORD'):
+            os.environ.pop(key, None)
+        from utils.multi_home_db_manager import MultiHomeDBManager
+        with patch('builtins.print'):
+            self.manager = MultiHomeDBManager()
+        self.admin = self.manager.find_user_by_email_or_username('sys-admin')
+        self.home_id = self.manager.get_user_homes(self.admin['id'])[0]['id']
+
+    def tearDown(self):
+        self.manager.close_connection()
+        self.env.stop()
+        self.tmpdir.cleanup()
+
+    def _job(self, **kwargs):
+        from utils.log_retention import LogRetentionJob
+        kwargs.setdefault('retention_days', {'management_logs': 30, 'automation_executions': 30})
+        return LogRetentionJob(self.manager, batch_size=4, batch_pause=0,
+                               archive_dir=os.path.join(self.tmpdir.name, 'archive'),
+                               lock_file=os.path.join(self.tmpdir.name, 'retention.lock'), **kwargs)
+
+    def test_run_is_skipped_while_another_worker_holds_the_lock(self):
+        from utils.file_lock import InterProcessLock
+        # A second descriptor on the lock file stands in for another worker
+        other_worker = InterProcessLock(os.path.join(self.tmpdir.name, 'retention.lock'))
+        other_worker.acquire()
+        try:
+            with patch('builtins.print'):
+                self.assertEqual(self._job().run(), {'skipped': True})
+        finally:
+            other_worker.release()
+        with patch('builtins.print'):
+            self.assertNotIn('skipped', self._job().run())
+
+    def test_expired_rows_are_deleted_in_batches(self):
+        old, recent = datetime.now() - timedelta(days=60), datetime.now() - timedelta(days=1)
+        self.manager.add_home_management_logs(
+            [{'home_id': self.home_id, 'level': 'info', 'message': f'old {i}', 'timestamp': old}
+             for i in range(10)]
+            + [{'home_id': self.home_id, 'level': 'info', 'message': 'recent', 'timestamp': recent}]
+        )
+        automation = self.manager.add_home_automation(
+            self.home_id, self.admin['id'], {'name': 'Night', 'trigger': {'type': 'time'}, 'actions': []})
+        with self.manager.get_cursor() as cursor:
+            for executed_at in (old, old, recent):
+                cursor.execute("""
+                    INSERT INTO automation_executions (automation_id, execution_status, executed_at)
+                    VALUES (%s, %s, %s)
+                """, (automation['id'], 'success', executed_at))
+
+        with patch('builtins.print'):
+            report = self._job(max_batches=2).run()
+        logs = report['tables']['management_logs']
+        # Two full batches for the home, one empty one for logs without a home
+        self.assertEqual((logs['deleted'], logs['batches'], logs['complete']), (8, 3, False))
+        self.assertEqual(report['tables']['automation_executions']['deleted'], 2)
+        self.assertIn('duration_ms', report)
+
+        with patch('builtins.print'):
+            report = self._job().run()
+        self.assertEqual(report['tables']['management_logs']['deleted'], 2)
+        self.assertTrue(report['tables']['management_logs']['complete'])
+        remaining = self.manager.get_home_management_logs(self.home_id, self.admin['id'])
+        self.assertEqual([log['message'] for log in remaining], ['recent'])
+
+    def test_archive_is_written_before_delete(self):
+        import gzip
+        self.manager.add_home_management_logs(
+            [{'home_id': self.home_id, 'level': 'info', 'message': f'old {i}',
+              'timestamp': datetime.now() - timedelta(days=60)} for i in range(6)]
+        )
+        with patch('builtins.print'):
+            report = self._job(archive=True).run()
+        result = report['tables']['management_logs']
+        self.assertEqual((result['deleted'], result['archived']), (6, 6))
+        with gzip.open(result['archive_file'], 'rt', encoding='utf-8') as f:
+            archived = [json.loads(line) for line in f]
+        self.assertEqual(sorted(row['message'] for row in archived), [f'old {i}' for i in range(6)])
+        self.assertEqual({row['home_id'] for row in archived}, {self.home_id})
+
+        # A failing archive keeps the rows
+        self.manager.add_home_management_logs(
+            [{'home_id': self.home_id, 'level': 'info', 'message': 'kept',
+              'timestamp': datetime.now() - timedelta(days=60)}]
+        )
+        job = self._job(archive=True)
+        with patch.object(job, '_archive_rows', side_effect=OSError('disk full')), patch('builtins.print'):
+            report = job.run()
+        self.assertIn('error', report['tables']['management_logs'])
+        remaining = self.manager.get_home_management_logs(self.home_id, self.admin['id'])
+        self.assertEqual([log['message'] for log in remaining], ['kept'])
+
+
+_FILE_LOCK_WORKER = """
+import sys
+from unittest.mock import patch
+sys.path.insert(0, sys.argv[1])
+from utils.json_backup_manager import JSONBackupManager
+from app.management_logger import ManagementLogger
+config_file, log_file, worker, count = sys.argv[2], sys.argv[3], sys.argv[4], int(sys.argv[5])
+with patch('builtins.print'):
+    manager = JSONBackupManager(config_file)
+logger = ManagementLogger(log_file, max_logs=100000, max_days=30)
+for i in range(count):
+    manager.append_record('rooms', {'id': f'{worker}-{i}', 'home_id': 'h1'})
+    config = manager.get_config()
+    config['buttons'].append({'id': f'{worker}-{i}', 'state': False})
+    manager.save_config(config)
+    logger.log_event('info', f'{worker}-{i}')
+"""
+
+
+class InterProcessLockTests(unittest.TestCase):
+    """Test that concurrent processes do not lose JSON storage updates"""
+
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.config_file = os.path.join(self.tmpdir.name, 'config.json')
+        self.log_file = os.path.join(self.tmpdir.name, 'management_logs.json')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_concurrent_saves_are_merged(self):
+        from utils.json_backup_manager import JSONBackupManager
+        with patch('builtins.print'):
+            manager = JSONBackupManager(self.config_file)
+        second = manager.get_config()
+
+        def save_first():
+            first = manager.get_config()
+            first['buttons'].append({'id': 'b1', 'state': False})
+            manager.save_config(first)
+        import threading
+        thread = threading.Thread(target=save_first)
+        thread.start()
+        thread.join()
+        second['rooms'].append({'id': 'r1'})
+        second['security_state'] = 'Załączony'
+        self.assertTrue(manager.save_config(second))
+        config = manager.read_config()
+        self.assertEqual([b['id'] for b in config['buttons']], ['b1'])
+        self.assertEqual([r['id'] for r in config['rooms']], ['r1'])
+        self.assertEqual(config['security_state'], 'Załączony')
+        self.assertEqual(manager.get_write_stats()['rebased_saves'], 1)
+
+    def test_save_rebases_on_the_copys_own_snapshot(self):
+        import threading
+        from utils.json_backup_manager import JSONBackupManager
+        with patch('builtins.print'):
+            manager = JSONBackupManager(self.config_file)
+        outer = manager.get_config()
+
+        def save_button():
+            config = manager.get_config()
+            config['buttons'].append({'id': 'b1'})
+            manager.save_config(config)
+        thread = threading.Thread(target=save_button)
+        thread.start()
+        thread.join()
+        # A helper reading the config again must not become outer's base
+        self.assertEqual(len(manager.get_config()['buttons']), 1)
+        outer['rooms'].append({'id': 'r1'})
+        self.assertTrue(manager.save_config(outer))
+        outer['security_state'] = 'Załączony'
+        self.assertTrue(manager.save_config(outer))
+        config = manager.read_config()
+        self.assertEqual([b['id'] for b in config['buttons']], ['b1'])
+        self.assertEqual([r['id'] for r in config['rooms']], ['r1'])
+        self.assertEqual(config['security_state'], 'Załączony')
+
+    def test_processes_do_not_lose_writes(self):
+        import subprocess
+        with patch('builtins.print'):
+            from utils.json_backup_manager import JSONBackupManager
+            JSONBackupManager(self.config_file)
+        root = os.path.dirname(os.path.abspath(__file__))
+        workers = [
+            subprocess.Popen([sys.executable, '-c', _FILE_LOCK_WORKER, root, self.config_file,
+                              self.log_file, str(worker), '25'])
+            for worker in range(4)
+        ]
+        for process in workers:
+            self.assertEqual(process.wait(timeout=120), 0)
+
+        with patch('builtins.print'):
+            config = JSONBackupManager(self.config_file).read_config()
+        expected = {f'{worker}-{i}' for worker in range(4) for i in range(25)}
+        self.assertEqual({r['id'] for r in config['rooms']}, expected)
+        self.assertEqual({b['id'] for b in config['buttons']}, expected)
+        from app.management_logger import ManagementLogger
+        logs = ManagementLogger(self.log_file, max_logs=100000, max_days=30).get_logs()
+        self.assertEqual({log['message'] for log in logs}, expected)
+
+
+class CacheKeyTests(unittest.TestCase):
+    """Test home and room scoped caching of smart home entities"""
+
+    def setUp(self):
+        from flask import Flask
+        from flask_caching import Cache
+        from utils.cache_manager import CachedDataAccess
+        self.app = Flask(__name__)
+        self.cache = Cache(self.app, config={'CACHE_TYPE': 'SimpleCache'})
+        self.smart_home = Mock()
+        self.smart_home.buttons = [{'id': 'b1', 'room': 'Kuchnia'}, {'id': 'b2', 'room': 'Salon'}]
+        self.multi_db = Mock()
+        self.multi_db.user_has_home_access.side_effect = lambda user_id, home_id: user_id == 'u1'
+        self.multi_db.get_home_devices.side_effect = lambda home_id, user_id, device_type=None: [
+            {'id': f'{home_id}-d1', 'room_id': 'r1', 'home_id': home_id},
+            {'id': f'{home_id}-d2', 'room_id': 'r2', 'home_id': home_id},
+        ]
+        self.data = CachedDataAccess(self.cache, self.smart_home, self.multi_db)
+
+    def test_homes_are_cached_separately(self):
+        with self.app.app_context():
+            self.assertEqual([b['id'] for b in self.data.get_buttons('h1', 'u1')], ['h1-d1', 'h1-d2'])
+            self.assertEqual([b['id'] for b in self.data.get_buttons('h2', 'u1')], ['h2-d1', 'h2-d2'])
+            self.assertEqual([b['id'] for b in self.data.get_buttons()], ['b1', 'b2'])
+            self.assertEqual(self.data.get_buttons('h1', 'u2'), [])
+            self.data.get_buttons('h1', 'u1')
+            self.assertEqual(self.multi_db.get_home_devices.call_count, 2)
+
+    def test_device_update_invalidates_only_its_home_and_room(self):
+        with self.app.app_context():
+            self.data.get_buttons_by_room('r1', 'h1', 'u1')
+            self.data.get_buttons_by_room('r2', 'h1', 'u1')
+            self.data.get_buttons_by_room('r1', 'h2', 'u1')
+            self.data.cache_manager.invalidate_device_cache('h1', ['r1'])
+            self.assertIsNone(self.cache.get(self.data.cache_manager.home_key('h1', 'buttons')))
+            self.assertIsNone(self.cache.get(self.data.cache_manager.home_key('h1', 'buttons', 'r1')))
+            self.assertIsNotNone(self.cache.get(self.data.cache_manager.home_key('h1', 'buttons', 'r2')))
+            self.assertIsNotNone(self.cache.get(self.data.cache_manager.home_key('h2', 'buttons')))
+            self.assertIsNotNone(self.cache.get(self.data.cache_manager.home_key('h2', 'buttons', 'r1')))
+
+    def test_home_invalidation_drops_every_cached_room(self):
+        with self.app.app_context():
+            self.assertEqual([b['id'] for b in self.data.get_buttons_by_room('Salon')], ['b2'])
+            self.data.get_buttons_by_room('r1', 'h1', 'u1')
+            self.data.get_buttons_by_room('r2', 'h1', 'u1')
+            self.data.invalidate_buttons_cache('h1')
+            self.assertIsNone(self.cache.get(self.data.cache_manager.home_key('h1', 'buttons', 'r1')))
+            self.assertIsNone(self.cache.get(self.data.cache_manager.home_key('h1', 'buttons', 'r2')))
+            self.assertIsNotNone(self.cache.get(self.data.cache_manager.home_key(None, 'buttons', 'Salon')))
+
+    def test_route_helpers_read_the_requested_home(self):
+        from app.routes import MultiHomeHelpersMixin
+        helpers = MultiHomeHelpersMixin()
+        helpers.app = None
+        helpers.multi_db = self.multi_db
+        helpers.cached_data = self.data
+        self.multi_db.get_home_rooms.return_value = [{'id': 'r1', 'name': 'Kuchnia'}]
+        with self.app.app_context():
+            rooms, home_id = helpers._get_rooms_payload('u1', 'h1')
+            self.assertEqual((rooms[0]['name'], home_id), ('Kuchnia', 'h1'))
+            helpers._get_rooms_payload('u1', 'h1')
+            self.multi_db.get_home_rooms.assert_called_once_with('h1', 'u1')
+            self.assertEqual([b['id'] for b in helpers._get_home_entities('buttons', 'h1', 'u1')],
+                             ['h1-d1', 'h1-d2'])
+            self.data.invalidate_rooms_cache('h2')
+            helpers._get_rooms_payload('u1', 'h1')
+            self.assertEqual(self.multi_db.get_home_rooms.call_count, 1)
+            self.data.invalidate_rooms_cache('h1')
+            helpers._get_rooms_payload('u1', 'h1')
+            self.assertEqual(self.multi_db.get_home_rooms.call_count, 2)
+
+    def test_generation_bump_invalidates_dependent_entries(self):
+        manager = self.data.cache_manager
+        self.smart_home.get_user_data.return_value = {'name': 'Anna'}
+        with self.app.app_context():
+            self.data.get_buttons('h1', 'u1')
+            self.data.get_buttons_by_room('r1', 'h1', 'u1')
+            manager.get_session_user_data('u1', 's1')
+            manager.invalidate_home_cache('h1')
+            self.assertIsNone(self.cache.get(manager.home_key('h1', 'buttons')))
+            self.assertIsNone(self.cache.get(manager.home_key('h1', 'buttons', 'r1')))
+
+            self.assertIsNotNone(self.cache.get(manager.session_user_key('s1', 'u1')))
+            manager.invalidate_user_cache('u1')
+            self.assertIsNone(self.cache.get(manager.user_data_key('u1')))
+            self.assertIsNone(self.cache.get(manager.session_user_key('s1', 'u1')))
+
+    def test_concurrent_misses_load_once(self):
+        import threading
+        calls = []
+
+        def slow_devices(home_id, user_id, device_type=None):
+            calls.append(home_id)
+            time.sleep(0.1)
+            return [{'id': 'd1', 'room_id': 'r1'}]
+        self.multi_db.get_home_devices.side_effect = slow_devices
+        results = []
+
+        def read():
+            with self.app.app_context():
+                results.append(self.data.get_buttons('h1', 'u1'))
+        threads = [threading.Thread(target=read) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(calls, ['h1'])
+        self.assertEqual(results, [[{'id': 'd1', 'room_id': 'r1'}]] * 8)
+
+    def test_waits_for_load_in_another_worker(self):
+        import redis
+        manager = self.data.cache_manager
+        key = 'user_data_u1'
+        client = Mock(spec=redis.Redis)
+        client.lock.return_value.acquire.return_value = False
+
+        def other_worker_finishes(name):
+            self.cache.set(key, {'name': 'Anna'})
+            return 1
+        client.exists.side_effect = other_worker_finishes
+        manager._lock_client = client
+        loader = Mock(return_value={'name': 'Local'})
+        with self.app.app_context():
+            self.assertEqual(manager.get_or_load(key, loader, 60), {'name': 'Anna'})
+        loader.assert_not_called()
+
+    def test_stale_entry_is_served_while_reloading(self):
+        from utils.cache_manager import CacheManager, revalidate_stats
+        tasks = Mock()
+        manager = CacheManager(self.cache, task_manager=tasks)
+        key = 'home:h1:rooms'
+        loader = Mock(return_value=['Kuchnia', 'Salon'])
+        stale_serves = revalidate_stats['stale_serves']
+        with self.app.app_context():
+            self.cache.set(key, {'__fresh_until__': time.time() - 1, 'value': ['Kuchnia']})
+            self.assertEqual(manager.get_or_load(key, loader, 60, revalidate=True), ['Kuchnia'])
+            self.assertEqual(manager.get_or_load(key, loader, 60, revalidate=True), ['Kuchnia'])
+            loader.assert_not_called()
+            self.assertEqual(revalidate_stats['stale_serves'], stale_serves + 2)
+            tasks.add_task.assert_called_once()
+            func, *args = tasks.add_task.call_args[0]
+            func(*args)
+            self.assertEqual(manager.get_or_load(key, loader, 60, revalidate=True), ['Kuchnia', 'Salon'])
+            loader.assert_called_once()
+
+            # Without a task manager a stale entry is a miss
+            self.cache.set(key, {'__fresh_until__': time.time() - 1, 'value': ['Kuchnia']})
+            self.assertEqual(CacheManager(self.cache).get_or_load(key, loader, 60, revalidate=True),
+                             ['Kuchnia', 'Salon'])
+            self.assertEqual(loader.call_count, 2)
+
+    def test_room_refresh_does_not_reuse_stale_home_list(self):
+        from utils.cache_manager import CacheManager, CachedDataAccess
+        tasks = Mock()
+        data = CachedDataAccess(self.cache, self.smart_home, self.multi_db,
+                                cache_manager=CacheManager(self.cache, task_manager=tasks))
+        manager = data.cache_manager
+        stale = {'__fresh_until__': time.time() - 1, 'value': [{'id': 'old', 'room_id': 'r1'}]}
+        with self.app.app_context():
+            self.cache.set(manager.home_key('h1', 'buttons'), stale)
+            self.cache.set(manager.home_key('h1', 'buttons', 'r1'), stale)
+            self.assertEqual([b['id'] for b in data.get_buttons_by_room('r1', 'h1', 'u1')], ['old'])
+            func, *args = tasks.add_task.call_args[0]
+            func(*args)
+            self.assertEqual([b['id'] for b in data.get_buttons_by_room('r1', 'h1', 'u1')], ['h1-d1'])
+
+    def test_api_cache_invalidation_by_endpoint(self):
+        from types import SimpleNamespace
+        manager = self.data.cache_manager
+        calls = []
+
+        @manager.cache_json_response()
+        def list_rooms():
+            calls.append(1)
+            return SimpleNamespace(status_code=200)
+
+        with self.app.test_request_context('/api/rooms'):
+            list_rooms()
+            list_rooms()
+            self.assertEqual(len(calls), 1)
+            manager.invalidate_api_cache('other_view')
+            list_rooms()
+            self.assertEqual(len(calls), 1)
+            manager.invalidate_api_cache('list_rooms')
+            list_rooms()
+            self.assertEqual(len(calls), 2)
+
+
+class _PubSubHub:
+    """In-process stand-in for Redis pub/sub shared by several caches"""
+
+    def __init__(self):
+        import queue
+        self._queue_type = queue.Queue
+        self.subscribers = []
+
+    def publish(self, channel, data):
+        for subscriber in list(self.subscribers):
+            subscriber.put({'type': 'message', 'channel': channel, 'data': data})
+        return len(self.subscribers)
+
+    def pubsub(self, ignore_subscribe_messages=True):
+        hub = self
+        import queue
+
+        class _Subscription:
+            def __init__(self):
+                self.messages = hub._queue_type()
+
+            def put(self, message):
+                self.messages.put(message)
+
+            def subscribe(self, channel):
+                hub.subscribers.append(self)
+
+            def get_message(self, timeout=0.0):
+                try:
+                    return self.messages.get(timeout=timeout)
+                except queue.Empty:
+                    return None
+
+            def close(self):
+                if self in hub.subscribers:
+                    hub.subscribers.remove(self)
+
+        return _Subscription()
+
+
+class TieredCacheTests(unittest.TestCase):
+    """Test the per-worker LRU in front of the shared cache"""
+
+    def setUp(self):
+        from flask import Flask
+        from flask_caching import Cache
+        from utils.tiered_cache import TieredCache
+        self.app = Flask(__name__)
+        self.remote = Cache(self.app, config={'CACHE_TYPE': 'SimpleCache'})
+        self.hub = _PubSubHub()
+        self.first = TieredCache(self.remote, client=self.hub, max_entries=2, ttl=30)
+        self.second = TieredCache(self.remote, client=self.hub, max_entries=2, ttl=30)
+        deadline = time.monotonic() + 5
+        while len(self.hub.subscribers) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def tearDown(self):
+        self.first.close()
+        self.second.close()
+
+    def _wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def test_local_tier_serves_repeated_reads(self):
+        with self.app.app_context():
+            self.remote.set('rooms', ['Kuchnia'])
+            self.assertEqual(self.first.get('rooms'), ['Kuchnia'])
+            self.first.get('rooms').append('Salon')
+            self.assertEqual(self.first.get('rooms'), ['Kuchnia'])
+            stats = self.first.get_stats()
+            self.assertEqual((stats['local']['hits'], stats['local']['misses']), (2, 1))
+            self.assertEqual((stats['remote']['hits'], stats['remote']['misses']), (1, 0))
+
+    def test_local_tier_is_bounded(self):
+        from utils.tiered_cache import LocalLRU
+        lru = LocalLRU(max_entries=2, ttl=0.05)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual(lru.get('b'), (False, None))
+        self.assertEqual(lru.get('a'), (True, 1))
+        self.assertEqual(lru.evictions, 1)
+        time.sleep(0.06)
+        self.assertEqual(lru.get('c'), (False, None))
+
+    def test_writes_invalidate_other_workers(self):
+        with self.app.app_context():
+            self.first.set('buttons', [1])
+            self._wait_for(lambda: self.second.get_stats()['invalidation']['received'] >= 1)
+            self.assertEqual(self.second.get('buttons'), [1])
+            self.first.set('buttons', [2])
+            self._wait_for(lambda: self.second.get_stats()['invalidation']['received'] >= 2)
+            self.assertEqual(self.second.get('buttons'), [2])
+            self.first.delete('buttons')
+            self._wait_for(lambda: self.second.get_stats()['invalidation']['received'] >= 3)
+            self.assertIsNone(self.second.get('buttons'))
+            self.assertEqual(self.first.get_stats()['invalidation']['received'], 0)
+
+    def test_invalidation_during_remote_read_is_not_lost(self):
+        def read_then_other_worker_writes(key):
+            value = self.remote.get(key)
+            received = self.second.get_stats()['invalidation']['received']
+            self.first.set(key, [2])
+            self._wait_for(lambda: self.second.get_stats()['invalidation']['received'] > received)
+            return value
+        with self.app.app_context():
+            self.remote.set('buttons', [1])
+            self.second.remote = Mock(wraps=self.remote)
+            self.second.remote.get.side_effect = read_then_other_worker_writes
+            self.assertEqual(self.second.get('buttons'), [1])
+            self.second.remote = self.remote
+            self.assertEqual(self.second.get('buttons'), [2])
+
+    def test_local_write_fails_pending_fills(self):
+        from utils.tiered_cache import LocalLRU
+        lru = LocalLRU()
+        token = lru.fill_token('buttons')
+        self.assertTrue(lru.set('buttons', [2], token=lru.fill_token('buttons'), write=True))
+        self.assertFalse(lru.set('buttons', [1], token=token))
+        self.assertEqual(lru.get('buttons'), (True, [2]))
+
+
 def run_tests(verbosity=2, fast_mode=False):
     """Run the test suite"""
     loader = unittest.TestLoader()
@@ -462,6 +1745,17 @@ def run_tests(verbosity=2, fast_mode=False):
         CSRFProtectionTests,
         SecurityTests,
         ErrorHandlingTests,
+        ConnectionPoolTests,
+        CooperativeDBModeTests,
+        MembershipMemoTests,
+        JSONConfigCacheTests,
+        SQLiteBackendTests,
+        InterProcessLockTests,
+        ManagementLoggerTests,
+        DatabaseLogWriterTests,
+        LogRetentionTests,
+        CacheKeyTests,
+        TieredCacheTests,
     ]
     
     # Add integration tests unless in fast mode
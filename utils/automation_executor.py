@@ -481,24 +481,24 @@ class AutomationExecutor:
             import json
             # JSON fallback: persist stats in backup config
             if getattr(self.multi_db, 'json_fallback_mode', False) and getattr(self.multi_db, 'json_backup', None):
-                cfg = self.multi_db.json_backup.get_config()
-                autos = cfg.get('automations', [])
-                updated = False
-                for a in autos:
-                    if str(a.get('id')) == str(automation_id):
-                        a['execution_count'] = int(a.get('execution_count', 0)) + 1
-                        a['last_executed'] = datetime.now().isoformat()
-                        if execution_status == 'error':
-                            a['error_count'] = int(a.get('error_count', 0)) + 1
-                            a['last_error'] = error_message
-                            a['last_error_time'] = datetime.now().isoformat()
-                        updated = True
-                        break
-                if updated:
-                    cfg['automations'] = autos
-                    # Optionally append execution log entries (keep light-weight)
-                    execs = cfg.get('automation_executions', [])
-                    execs.append({
+                json_backup = self.multi_db.json_backup
+                cfg = json_backup.read_config()
+                automation = next(
+                    (a for a in cfg.get('automations', []) if str(a.get('id')) == str(automation_id)),
+                    None
+                )
+                if automation is not None:
+                    changes = {
+                        'execution_count': int(automation.get('execution_count', 0)) + 1,
+                        'last_executed': datetime.now().isoformat()
+                    }
+                    if execution_status == 'error':
+                        changes['error_count'] = int(automation.get('error_count', 0)) + 1
+                        changes['last_error'] = error_message
+                        changes['last_error_time'] = datetime.now().isoformat()
+                    # Journaled writes: one stats update, one bounded execution entry
+                    json_backup.update_record('automations', automation.get('id'), changes)
+                    json_backup.append_record('automation_executions', {
                         'automation_id': automation_id,
                         'status': execution_status,
                         'trigger_data': trigger_data,
@@ -506,12 +506,7 @@ class AutomationExecutor:
                         'error_message': error_message,
                         'execution_time_ms': execution_time_ms,
                         'executed_at': datetime.now().isoformat()
-                    })
-                    # Bound list size to avoid unbounded growth
-                    if len(execs) > 500:
-                        execs = execs[-500:]
-                    cfg['automation_executions'] = execs
-                    self.multi_db.json_backup.save_config(cfg)
+                    }, max_items=500)
                 return
 
             # DB mode: write execution record and update stats
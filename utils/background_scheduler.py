@@ -1,6 +1,7 @@
 """
 Background scheduler for SmartHome tasks
-Runs periodic tasks like city cache updates
+Runs periodic tasks like city cache updates and the daily log retention
+job (utils.log_retention)
 """
 import logging
 import schedule
@@ -16,9 +17,15 @@ class BackgroundScheduler:
     def __init__(self):
         self.running = False
         self.thread = None
+        self.log_retention = None
         
-    def start(self):
-        """Start the background scheduler"""
+    def start(self, log_retention=None):
+        """
+        Start the background scheduler
+        
+        Args:
+            log_retention: Optional LogRetentionJob run daily at its run_time
+        """
         if self.running:
             logger.warning("Scheduler is already running")
             return
@@ -27,6 +34,10 @@ class BackgroundScheduler:
         
         # Background tasks can be added here in the future
         # Example: schedule.every().monday.at("22:00").do(self._some_task)
+        self.log_retention = log_retention
+        if log_retention is not None and log_retention.enabled:
+            schedule.every().day.at(log_retention.run_time).do(self._run_log_retention)
+            logger.info(f"Log retention scheduled daily at {log_retention.run_time}")
         
         self.running = True
         self.thread = threading.Thread(target=self._run_schedule, daemon=True)
@@ -42,6 +53,13 @@ class BackgroundScheduler:
         schedule.clear()
         logger.info("Background scheduler stopped")
     
+    def _run_log_retention(self):
+        """Scheduled job: delete expired management logs and automation executions"""
+        try:
+            self.log_retention.run()
+        except Exception as e:
+            logger.error(f"Log retention job failed: {e}")
+    
     def _run_schedule(self):
         """Run the scheduler loop"""
         while self.running:
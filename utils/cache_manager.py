@@ -12,6 +12,40 @@ Features:
 - API response caching decorators
 - User-specific cache management
 
+Cache keys of smart home entities are scoped by home and room id:
+    home:<home_id>:rooms | buttons | temperature_controls | automations
+    home:<home_id>:room:<room_id>:buttons | temperature_controls
+The legacy single-home data of SmartHomeSystem uses the home id 'default'.
+A change to one device only drops the lists of its home and room.
+
+Groups of entries are invalidated through generation counters rather than
+key scans (SimpleCache cannot list keys). Each namespace has a counter key,
+e.g. gen:home:<home_id>, gen:user:<user_id>, gen:session:<session_id> or
+gen:api, holding an opaque token that is embedded into the keys of every
+entry depending on it:
+    home:<home_id>:buttons#<home token>.<buttons token>
+Bumping a counter replaces its token, so all dependent entries become
+unreachable in O(1) on any backend and simply expire.
+
+Misses are loaded single-flight (CacheManager.get_or_load): concurrent
+misses for one key in a process wait on a per-key lock for the first
+loader's result, and with Redis a short-lived lock key does the same
+across workers, so an expiring entry costs one database query instead of
+one per waiting request.
+
+Room, device and automation lists are served stale-while-revalidate: the
+CacheManager timeout of their type is a soft TTL after which the entry is
+still returned while a BackgroundTaskManager task reloads it; the entry
+itself expires at the hard TTL (soft TTL x CACHE_HARD_TTL_FACTOR), after
+which a request loads it synchronously again.
+
+Configuration (environment variables):
+    CACHE_SINGLE_FLIGHT_REDIS      false to coalesce within each worker only (default: true)
+    CACHE_LOCK_TIMEOUT             Seconds a Redis loader lock is held at most (default: 10)
+    CACHE_LOCK_WAIT                Seconds to wait for another worker's load (default: 5)
+    CACHE_STALE_WHILE_REVALIDATE   false to expire entity lists at their TTL (default: true)
+    CACHE_HARD_TTL_FACTOR          Hard TTL as a multiple of the soft TTL (default: 3)
+
 Usage:
     The caching is automatically integrated into the application through
     monkey-patching of SmartHomeSystem methods. No manual cache management
@@ -21,8 +55,13 @@ Dependencies:
     - Flask-Caching
     - Redis (optional, falls back to SimpleCache)
 """
+from contextlib import contextmanager
 from functools import wraps
 import logging
+import os
+import threading
+import time
+import uuid
 
 # Flask imports (optional for standalone usage)
 try:
@@ -31,6 +70,11 @@ except ImportError:
     # Allow module to be imported without Flask for testing
     jsonify = request = session = None
 
+try:
+    import redis
+except ImportError:
+    redis = None
+
 logger = logging.getLogger(__name__)
 
 # Cache statistics for monitoring
@@ -52,22 +96,112 @@ def reset_cache_stats():
     cache_stats = {'hits': 0, 'misses': 0, 'total_requests': 0}
 
 
+# Single-flight loading: loads run, misses served by another loader's result,
+# waits on another worker's Redis lock and waits that gave up
+single_flight_stats = {'loads': 0, 'coalesced': 0, 'remote_waits': 0, 'wait_timeouts': 0}
+# Stale-while-revalidate: stale entries served, background reloads done,
+# failed, and skipped because another worker was already reloading
+revalidate_stats = {'stale_serves': 0, 'refreshes': 0, 'refresh_failures': 0, 'refresh_skipped': 0}
+_flight_guard = threading.Lock()
+# Cache key -> [lock, number of threads using it]
+_flight_locks = {}
+# Keys with a background reload queued or running in this process
+_refreshing = set()
+# Marks a stale-while-revalidate entry: {_FRESH_UNTIL: epoch seconds, 'value': value}
+_FRESH_UNTIL = '__fresh_until__'
+
+
+@contextmanager
+def _key_lock(key):
+    """Per-key lock shared by every CacheManager in the process"""
+    with _flight_guard:
+        entry = _flight_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _flight_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                _flight_locks.pop(key, None)
+
+
+def _count_stat(stats, counter):
+    with _flight_guard:
+        stats[counter] += 1
+
+
+# Scope of the legacy SmartHomeSystem data (no home context)
+LEGACY_HOME = 'default'
+# Entities cached per home, with their CacheManager timeout type
+HOME_ENTITIES = {
+    'rooms': 'rooms',
+    'buttons': 'buttons',
+    'temperature_controls': 'temperature',
+    'automations': 'automations',
+}
+# Entities that are also cached per room
+ROOM_ENTITIES = ('buttons', 'temperature_controls')
+
+
+def home_cache_key(home_id, entity, room_id=None):
+    """
+    Base cache key of a home-scoped entity list
+    
+    CacheManager.home_key appends the home's generation tokens to it.
+    
+    Args:
+        home_id: Home ID; None for the legacy single-home data
+        entity: One of HOME_ENTITIES
+        room_id: Room ID for per-room lists
+    """
+    scope = home_id if home_id is not None else LEGACY_HOME
+    if room_id is not None:
+        return f"home:{scope}:room:{room_id}:{entity}"
+    return f"home:{scope}:{entity}"
+
+
+# Generation tokens outlive every entry that embeds them; a token that does
+# expire is replaced by a new one, which only turns dependents into misses
+GENERATION_TIMEOUT = 86400
+
+
+def generation_key(*namespace):
+    """Cache key of a namespace's generation counter, e.g. gen:home:<id>"""
+    return 'gen:' + ':'.join(str(part) for part in namespace)
+
+
+def _current_home_id():
+    """current_home_id of the Flask session, if called within a request"""
+    try:
+        return (session or {}).get('current_home_id')
+    except RuntimeError:
+        # Outside of a request context
+        return None
+
+
 class CacheManager:
     """
     Central cache management class for the application
     Provides unified interface for all caching operations
     """
     
-    def __init__(self, cache, smart_home=None):
+    def __init__(self, cache, smart_home=None, task_manager=None):
         """
         Initialize cache manager
         
         Args:
             cache: Flask-Caching instance
             smart_home: SmartHomeSystem instance (optional)
+            task_manager: BackgroundTaskManager for stale-while-revalidate
+                reloads (optional; without it entries expire at their TTL)
         """
         self.cache = cache
         self.smart_home = smart_home
+        self.task_manager = task_manager
+        self.stale_while_revalidate = os.getenv('CACHE_STALE_WHILE_REVALIDATE', 'true').lower() in ('true', '1', 'yes')
+        self.hard_ttl_factor = max(1.0, float(os.getenv('CACHE_HARD_TTL_FACTOR', '3')))
         self._cache_timeouts = {
             'user_data': 1800,      # 30 minutes - user profiles rarely change
             'config': 900,          # 15 minutes - configuration is relatively stable
@@ -78,18 +212,234 @@ class CacheManager:
             'api_response': 600,    # 10 minutes - API responses can be cached longer
             'session_user': 3600    # 1 hour - session-level user cache
         }
+        self.lock_timeout = float(os.getenv('CACHE_LOCK_TIMEOUT', '10'))
+        self.lock_wait = float(os.getenv('CACHE_LOCK_WAIT', '5'))
+        self._lock_client = None
+        if redis is not None and os.getenv('CACHE_SINGLE_FLIGHT_REDIS', 'true').lower() in ('true', '1', 'yes'):
+            client = getattr(getattr(cache, 'cache', None), '_write_client', None)
+            if isinstance(client, redis.Redis):
+                self._lock_client = client
     
     def get_timeout(self, cache_type):
         """Get cache timeout for specific data type"""
         return self._cache_timeouts.get(cache_type, 300)
     
+    def get_or_load(self, cache_key, loader, timeout, revalidate=False):
+        """
+        Cached value of a key, loading a miss only once across concurrent callers
+        
+        Args:
+            cache_key: Cache key
+            loader: Function returning the value on a miss
+            timeout: Cache timeout in seconds for a loaded value (the soft
+                TTL when revalidating)
+            revalidate: Serve the value stale after timeout while a
+                background task reloads it
+            
+        Returns:
+            The cached or loaded value (None values are not cached)
+        """
+        revalidate = revalidate and self.stale_while_revalidate and self.task_manager is not None
+        found, value = self._read_entry(cache_key, self.cache.get(cache_key), loader, timeout, revalidate)
+        if found:
+            logger.debug(f"Cache hit for {cache_key}")
+            return value
+        with _key_lock(cache_key):
+            # Loaded meanwhile by the thread this one waited for
+            found, value = self._read_entry(cache_key, self.cache.get(cache_key), loader, timeout, revalidate)
+            if found:
+                _count_stat(single_flight_stats, 'coalesced')
+                return value
+            remote_lock = self._acquire_remote_lock(cache_key)
+            if remote_lock is False:
+                found, value = self._read_entry(cache_key, self._wait_for_remote_load(cache_key),
+                                                loader, timeout, revalidate)
+                if found:
+                    _count_stat(single_flight_stats, 'coalesced')
+                    return value
+                remote_lock = None
+            try:
+                logger.debug(f"Cache miss for {cache_key}, fetching from source")
+                _count_stat(single_flight_stats, 'loads')
+                value = loader()
+                if value is not None:
+                    self._store(cache_key, value, timeout, revalidate)
+            finally:
+                self._release_remote_lock(cache_key, remote_lock)
+            return value
+    
+    def _store(self, cache_key, value, timeout, revalidate):
+        """Cache a loaded value; revalidated values are kept until the hard TTL"""
+        if revalidate:
+            entry = {_FRESH_UNTIL: time.time() + timeout, 'value': value}
+            self.cache.set(cache_key, entry, timeout=max(1, int(timeout * self.hard_ttl_factor)))
+        else:
+            self.cache.set(cache_key, value, timeout=timeout)
+        logger.debug(f"Cached {cache_key} for {timeout}s")
+    
+    def _read_entry(self, cache_key, entry, loader, timeout, revalidate):
+        """(found, value) of a cache entry, queueing a reload for a stale one"""
+        if entry is None:
+            return False, None
+        if not (isinstance(entry, dict) and _FRESH_UNTIL in entry):
+            return True, entry
+        if time.time() >= entry[_FRESH_UNTIL]:
+            if not revalidate:
+                return False, None
+            _count_stat(revalidate_stats, 'stale_serves')
+            self._schedule_refresh(cache_key, loader, timeout)
+        return True, entry['value']
+    
+    def _schedule_refresh(self, cache_key, loader, timeout):
+        """Queue one background reload of a stale key per process"""
+        with _flight_guard:
+            if cache_key in _refreshing:
+                return
+            _refreshing.add(cache_key)
+        try:
+            self.task_manager.start_background_processing()
+            self.task_manager.add_task(self._refresh, cache_key, loader, timeout)
+        except Exception as e:
+            with _flight_guard:
+                _refreshing.discard(cache_key)
+            logger.warning(f"Could not queue cache refresh for {cache_key}: {e}")
+    
+    def _refresh(self, cache_key, loader, timeout):
+        """Background task: reload a stale key (never raises, so it is not retried)"""
+        try:
+            remote_lock = self._acquire_remote_lock(cache_key)
+            if remote_lock is False:
+                # Another worker is reloading it
+                _count_stat(revalidate_stats, 'refresh_skipped')
+                return
+            try:
+                value = loader()
+                if value is not None:
+                    self._store(cache_key, value, timeout, True)
+                _count_stat(revalidate_stats, 'refreshes')
+            finally:
+                self._release_remote_lock(cache_key, remote_lock)
+        except Exception as e:
+            _count_stat(revalidate_stats, 'refresh_failures')
+            logger.warning(f"Cache refresh failed for {cache_key}: {e}")
+        finally:
+            with _flight_guard:
+                _refreshing.discard(cache_key)
+    
+    def _acquire_remote_lock(self, cache_key):
+        """Redis loader lock: the lock, False if another worker holds it, None without Redis"""
+        if self._lock_client is None:
+            return None
+        try:
+            remote_lock = self._lock_client.lock(f"lock:{cache_key}", timeout=self.lock_timeout)
+            return remote_lock if remote_lock.acquire(blocking=False) else False
+        except Exception as e:
+            logger.warning(f"Cache lock unavailable for {cache_key}: {e}")
+            return None
+    
+    def _release_remote_lock(self, cache_key, remote_lock):
+        if remote_lock is None:
+            return
+        try:
+            remote_lock.release()
+        except Exception as e:
+            # Expired (slow load) or Redis unreachable; the lock times out anyway
+            logger.debug(f"Could not release cache lock for {cache_key}: {e}")
+    
+    def _wait_for_remote_load(self, cache_key):
+        """Poll for the entry another worker is loading; None if it does not arrive"""
+        _count_stat(single_flight_stats, 'remote_waits')
+        deadline = time.monotonic() + self.lock_wait
+        delay = 0.01
+        while time.monotonic() < deadline:
+            time.sleep(delay)
+            value = self.cache.get(cache_key)
+            if value is not None:
+                return value
+            try:
+                if not self._lock_client.exists(f"lock:{cache_key}"):
+                    # The other loader finished without a value or gave up
+                    return self.cache.get(cache_key)
+            except Exception:
+                return None
+            delay = min(delay * 2, 0.2)
+        _count_stat(single_flight_stats, 'wait_timeouts')
+        return None
+    
+    def get_generations(self, *namespaces):
+        """
+        Current generation tokens of namespaces, in one cache round trip
+        
+        Args:
+            namespaces: Tuples such as ('home', home_id) or ('user', user_id)
+            
+        Returns:
+            List of tokens; a namespace without a counter gets a fresh one
+        """
+        keys = [generation_key(*namespace) for namespace in namespaces]
+        tokens = list(self.cache.get_many(*keys)) if keys else []
+        for index, (key, token) in enumerate(zip(keys, tokens)):
+            if token is None:
+                token = uuid.uuid4().hex[:12]
+                # add() keeps a token another worker created meanwhile
+                if not self.cache.add(key, token, timeout=GENERATION_TIMEOUT):
+                    token = self.cache.get(key) or token
+                tokens[index] = token
+        return tokens
+    
+    def bump_generation(self, *namespace):
+        """Invalidate every entry that embeds a namespace's generation"""
+        logger.debug(f"Bumping cache generation {generation_key(*namespace)}")
+        self.cache.set(generation_key(*namespace), uuid.uuid4().hex[:12], timeout=GENERATION_TIMEOUT)
+    
+    def scoped_key(self, key, *namespaces):
+        """Cache key embedding the current generations of namespaces"""
+        return f"{key}#{'.'.join(self.get_generations(*namespaces))}"
+    
+    def user_data_key(self, user_id):
+        """Cache key of a user's data"""
+        return self.scoped_key(f"user_data_{user_id}", ('user', user_id))
+    
+    def session_user_key(self, session_id, user_id):
+        """Cache key of a user's data within a session"""
+        return self.scoped_key(f"session_user_{session_id}_{user_id}",
+                               ('user', user_id), ('session', session_id))
+    
+    def home_keys(self, home_id, entities, room_ids=()):
+        """
+        Generation-scoped keys of a home's entity lists
+        
+        Args:
+            home_id: Home ID; None for the legacy single-home data
+            entities: Entity names
+            room_ids: Rooms whose per-room lists are included (room entities only)
+            
+        Returns:
+            Dictionary (entity, room_id or None) -> cache key
+        """
+        scope = home_id if home_id is not None else LEGACY_HOME
+        entities = list(entities)
+        home_token, *entity_tokens = self.get_generations(
+            ('home', scope), *[('home', scope, entity) for entity in entities])
+        keys = {}
+        for entity, entity_token in zip(entities, entity_tokens):
+            suffix = f"#{home_token}.{entity_token}"
+            keys[(entity, None)] = home_cache_key(home_id, entity) + suffix
+            if entity in ROOM_ENTITIES:
+                for room_id in room_ids or ():
+                    keys[(entity, room_id)] = home_cache_key(home_id, entity, room_id) + suffix
+        return keys
+    
+    def home_key(self, home_id, entity, room_id=None):
+        """Generation-scoped key of one home (or room) entity list"""
+        room_ids = [room_id] if room_id is not None else ()
+        return self.home_keys(home_id, [entity], room_ids)[(entity, room_id)]
+    
     def invalidate_user_cache(self, user_id):
         """Invalidate cache for a specific user"""
         logger.info(f"Invalidating cache for user: {user_id}")
-        # Invalidate both regular and session-specific caches
-        self.cache.delete(f"user_data_{user_id}")
-        # Note: Cannot efficiently delete all session caches for a user with SimpleCache
-        # In production with Redis, use pattern matching
+        # Drops the user's data, session copies and API responses
+        self.bump_generation('user', user_id)
         self.cache.delete("smart_home_config")
     
     def invalidate_session_user_cache(self, session_id, user_id=None):
@@ -102,23 +452,65 @@ class CacheManager:
         """
         if user_id:
             logger.info(f"Invalidating session cache for user {user_id} in session {session_id}")
-            self.cache.delete(f"session_user_{session_id}_{user_id}")
+            self.cache.delete(self.session_user_key(session_id, user_id))
         else:
             logger.info(f"Invalidating all session cache for session {session_id}")
-            # Note: With SimpleCache, we can't efficiently pattern-match
-            # In production with Redis, use SCAN with pattern session_user_{session_id}_*
+            self.bump_generation('session', session_id)
     
     def invalidate_config_cache(self):
         """Invalidate configuration-related cache"""
         logger.info("Invalidating configuration cache")
-        cache_keys = [
-            "smart_home_config",
-            "rooms_list", 
-            "buttons_list",
-            "temperature_controls",
-            "automations_list"
-        ]
-        self.cache.delete_many(*cache_keys)
+        self.cache.delete("smart_home_config")
+        self.invalidate_home_cache()
+    
+    def invalidate_home_cache(self, home_id=None, entities=None, room_ids=None):
+        """
+        Invalidate home-scoped entity lists
+        
+        Without a home_id the legacy lists and those of the session's
+        current home (inside a request) are dropped.
+        
+        Args:
+            home_id: Home whose entries are dropped
+            entities: Entity names (default: all of HOME_ENTITIES)
+            room_ids: Rooms whose per-room lists are dropped; None drops
+                those of every room of the home
+        """
+        if home_id is not None:
+            scopes = [home_id]
+        else:
+            scopes = [None] + [scope for scope in [_current_home_id()] if scope is not None]
+        for scope in scopes:
+            generation_scope = scope if scope is not None else LEGACY_HOME
+            if room_ids is None:
+                if entities is None:
+                    # Also drops the home's API responses
+                    self.bump_generation('home', generation_scope)
+                else:
+                    for entity in entities:
+                        self.bump_generation('home', generation_scope, entity)
+                continue
+            # Only the listed rooms (and the home-wide lists) are dropped
+            rooms = [room_id for room_id in room_ids if room_id not in (None, '')]
+            keys = list(self.home_keys(scope, entities or HOME_ENTITIES, rooms).values())
+            logger.debug(f"Invalidating home cache keys: {keys}")
+            # One by one: SimpleCache.delete_many stops at the first missing key
+            for key in keys:
+                self.cache.delete(key)
+    
+    def invalidate_device_cache(self, home_id=None, room_ids=None):
+        """
+        Invalidate device lists after a device change
+        
+        Args:
+            home_id: Home of the device (None: legacy lists and session home)
+            room_ids: Rooms the device was or now is in; None drops the
+                lists of every room of the home
+        """
+        self.invalidate_home_cache(home_id, entities=ROOM_ENTITIES, room_ids=room_ids)
+        if home_id is not None:
+            # The legacy lists hold the devices of every home
+            self.invalidate_home_cache(None, entities=ROOM_ENTITIES)
     
     def get_session_user_data(self, user_id, session_id=None):
         """
@@ -142,7 +534,7 @@ class CacheManager:
             
         # Create session-specific cache key if session_id provided
         if session_id:
-            session_cache_key = f"session_user_{session_id}_{user_id}"
+            session_cache_key = self.session_user_key(session_id, user_id)
             user_data = self.cache.get(session_cache_key)
             if user_data is not None:
                 cache_stats['hits'] += 1
@@ -150,7 +542,7 @@ class CacheManager:
                 return user_data
         
         # Fall back to regular user cache
-        cache_key = f"user_data_{user_id}"
+        cache_key = self.user_data_key(user_id)
         user_data = self.cache.get(cache_key)
         if user_data is None:
             cache_stats['misses'] += 1
@@ -178,7 +570,6 @@ class CacheManager:
             
             # Update session cache if provided
             if session_id:
-                session_cache_key = f"session_user_{session_id}_{user_id}"
                 session_timeout = self.get_timeout('session_user')
                 self.cache.set(session_cache_key, user_data, timeout=session_timeout)
         
@@ -189,14 +580,14 @@ class CacheManager:
         Invalidate API response cache
         
         Args:
-            pattern: Optional pattern to match specific cache keys
+            pattern: Optional name of the cached view function whose
+                responses are dropped; None drops all API responses
         """
         logger.info(f"Invalidating API cache with pattern: {pattern}")
-        # Note: This is a simplified version. In production with Redis,
-        # you would use SCAN or maintain a list of cache keys
         if pattern:
-            # For now, just log the pattern - implement Redis SCAN if needed
-            logger.warning("Pattern-based cache invalidation not implemented for SimpleCache")
+            self.bump_generation('api', pattern)
+        else:
+            self.bump_generation('api')
     
     def cache_json_response(self, timeout=None):
         """
@@ -219,7 +610,12 @@ class CacheManager:
                     req_args_str = '&'.join(f"{k}={v}" for k, v in sorted(req_args.items()))
                 else:
                     req_args_str = str(req_args)
-                cache_key = f"api_{f.__name__}_{user_id}_{getattr(request, 'method', '')}_{args}_{req_args_str}"
+                # Dropped with the endpoint, the user or the user's current home
+                cache_key = self.scoped_key(
+                    f"api_{f.__name__}_{user_id}_{getattr(request, 'method', '')}_{args}_{req_args_str}",
+                    ('api',), ('api', f.__name__), ('user', user_id),
+                    ('home', (session or {}).get('current_home_id') or LEGACY_HOME)
+                )
                 
                 # Try to get from cache
                 cached_response = self.cache.get(cache_key)
@@ -248,188 +644,172 @@ class CachedDataAccess:
     buttons, temperature controls, and automations. It automatically
     handles cache misses by fetching from the source and updating cache.
     
-    All methods return the same data format as the original SmartHomeSystem
-    methods, ensuring 1:1 functionality preservation.
+    Without a home_id the methods return the same data format as the
+    original SmartHomeSystem methods, ensuring 1:1 functionality
+    preservation. With a home_id (and user_id) they return the home's
+    data from MultiHomeDBManager; access is checked on every call, so a
+    cached list is never served to a user outside the home.
     """
     
-    def __init__(self, cache, smart_home):
+    def __init__(self, cache, smart_home, multi_db=None, cache_manager=None):
         """
         Initialize cached data access
         
         Args:
             cache: Flask-Caching instance
             smart_home: SmartHomeSystem instance
+            multi_db: Optional MultiHomeDBManager for home-scoped data
+            cache_manager: Optional shared CacheManager (its task manager
+                enables stale-while-revalidate)
         """
         self.cache = cache
         self.smart_home = smart_home
-        self.cache_manager = CacheManager(cache, smart_home)
+        self.multi_db = multi_db
+        self.cache_manager = cache_manager or CacheManager(cache, smart_home)
+    
+    def _load(self, entity, home_id, user_id):
+        """Fetch an entity list from the source"""
+        if home_id is None:
+            return getattr(self.smart_home, entity)
+        if entity == 'rooms':
+            return self.multi_db.get_home_rooms(home_id, user_id)
+        if entity == 'buttons':
+            return self.multi_db.get_home_devices(home_id, user_id, device_type='button')
+        if entity == 'temperature_controls':
+            return self.multi_db.get_home_devices(home_id, user_id, device_type='temperature_control')
+        return self.multi_db.get_home_automations(home_id, user_id)
     
-    def get_rooms_lazy(self, room_filter=None):
+    def _has_access(self, home_id, user_id):
+        """Whether the caller may see a home's data (always true for legacy data)"""
+        if home_id is None:
+            return True
+        if not self.multi_db or not user_id:
+            return False
+        return self.multi_db.user_has_home_access(str(user_id), str(home_id))
+    
+    def _get_home_entity(self, entity, home_id=None, user_id=None):
+        """Cached entity list of a home (or of the legacy data)"""
+        if not self._has_access(home_id, user_id):
+            return []
+        return self.cache_manager.get_or_load(
+            self.cache_manager.home_key(home_id, entity),
+            lambda: self._load(entity, home_id, user_id),
+            self.cache_manager.get_timeout(HOME_ENTITIES[entity]),
+            revalidate=True
+        )
+    
+    def _get_room_entity(self, entity, room_id, home_id=None, user_id=None):
+        """Cached per-room device list, filtered from the home's list"""
+        if not self._has_access(home_id, user_id):
+            return []
+        timeout = self.cache_manager.get_timeout(HOME_ENTITIES[entity])
+        
+        def load_room():
+            # A stale home list is reloaded, not served: a background refresh
+            # must not store it again as fresh
+            devices = self.cache_manager.get_or_load(
+                self.cache_manager.home_key(home_id, entity),
+                lambda: self._load(entity, home_id, user_id),
+                timeout
+            )
+            # Legacy devices only carry their room name, which serves as their room id
+            return [device for device in devices
+                    if str(device.get('room_id', device.get('room'))) == str(room_id)]
+        
+        return self.cache_manager.get_or_load(
+            self.cache_manager.home_key(home_id, entity, room_id),
+            load_room,
+            timeout,
+            revalidate=True
+        )
+    
+    def get_rooms_lazy(self, room_filter=None, home_id=None, user_id=None):
         """
         Get rooms with lazy loading and optional filtering
         
         Args:
             room_filter: Optional filter function or list of room names
+            home_id: Home to read (None: legacy data)
+            user_id: User requesting a home's rooms
             
         Returns:
             Filtered list of room objects
         """
-        cache_key = "rooms_list"
-        if room_filter and isinstance(room_filter, list):
-            # Create cache key for specific room filter
-            filter_key = "_".join(sorted(room_filter))
-            cache_key = f"rooms_filtered_{filter_key}"
-        
-        rooms = self.cache.get(cache_key)
-        if rooms is None:
-            logger.debug("Cache miss for rooms, fetching from source")
-            all_rooms = self.smart_home.rooms
-            
-            # Apply filter if provided
-            if room_filter:
-                if callable(room_filter):
-                    rooms = [room for room in all_rooms if room_filter(room)]
-                elif isinstance(room_filter, list):
-                    rooms = [room for room in all_rooms if room in room_filter]
-                else:
-                    rooms = all_rooms
-            else:
-                rooms = all_rooms
-            
-            timeout = self.cache_manager.get_timeout('rooms')
-            self.cache.set(cache_key, rooms, timeout=timeout)
-            logger.debug(f"Cached filtered rooms data for {timeout}s")
-        else:
-            logger.debug("Cache hit for filtered rooms")
+        # Filtering the cached list keeps a single entry to invalidate
+        rooms = self.get_rooms(home_id, user_id)
+        if callable(room_filter):
+            return [room for room in rooms if room_filter(room)]
+        if isinstance(room_filter, list):
+            return [room for room in rooms if room in room_filter]
         return rooms
     
-    def get_buttons_by_room(self, room_name):
+    def get_buttons_by_room(self, room_id, home_id=None, user_id=None):
         """
         Get buttons for a specific room with caching
         
         Args:
-            room_name: Name of the room to get buttons for
+            room_id: ID of the room (the room name for legacy data)
+            home_id: Home of the room (None: legacy data)
+            user_id: User requesting a home's data
             
         Returns:
             List of button objects for the specified room
         """
-        cache_key = f"buttons_room_{room_name}"
-        buttons = self.cache.get(cache_key)
-        if buttons is None:
-            logger.debug(f"Cache miss for buttons in room {room_name}")
-            all_buttons = self.smart_home.buttons
-            # Filter buttons for specific room
-            buttons = [btn for btn in all_buttons if btn.get('room') == room_name]
-            timeout = self.cache_manager.get_timeout('buttons')
-            self.cache.set(cache_key, buttons, timeout=timeout)
-            logger.debug(f"Cached buttons for room {room_name} for {timeout}s")
-        else:
-            logger.debug(f"Cache hit for buttons in room {room_name}")
-        return buttons
+        return self._get_room_entity('buttons', room_id, home_id, user_id)
     
-    def get_temperature_controls_by_room(self, room_name):
+    def get_temperature_controls_by_room(self, room_id, home_id=None, user_id=None):
         """
         Get temperature controls for a specific room with caching
         
         Args:
-            room_name: Name of the room to get temperature controls for
+            room_id: ID of the room (the room name for legacy data)
+            home_id: Home of the room (None: legacy data)
+            user_id: User requesting a home's data
             
         Returns:
             List of temperature control objects for the specified room
         """
-        cache_key = f"temp_controls_room_{room_name}"
-        controls = self.cache.get(cache_key)
-        if controls is None:
-            logger.debug(f"Cache miss for temperature controls in room {room_name}")
-            all_controls = self.smart_home.temperature_controls
-            # Filter controls for specific room
-            controls = [ctrl for ctrl in all_controls if ctrl.get('room') == room_name]
-            timeout = self.cache_manager.get_timeout('temperature')
-            self.cache.set(cache_key, controls, timeout=timeout)
-            logger.debug(f"Cached temperature controls for room {room_name} for {timeout}s")
-        else:
-            logger.debug(f"Cache hit for temperature controls in room {room_name}")
-        return controls
+        return self._get_room_entity('temperature_controls', room_id, home_id, user_id)
     
-    def get_rooms(self):
+    def get_rooms(self, home_id=None, user_id=None):
         """
         Get cached rooms list
         
         Returns:
             List of room objects, same format as smart_home.rooms
+            (or MultiHomeDBManager.get_home_rooms with a home_id)
         """
-        cache_key = "rooms_list"
-        rooms = self.cache.get(cache_key)
-        if rooms is None:
-            logger.debug("Cache miss for rooms, fetching from source")
-            rooms = self.smart_home.rooms
-            timeout = self.cache_manager.get_timeout('rooms')
-            self.cache.set(cache_key, rooms, timeout=timeout)
-            logger.debug(f"Cached rooms data for {timeout}s")
-        else:
-            logger.debug("Cache hit for rooms")
-        return rooms
+        return self._get_home_entity('rooms', home_id, user_id)
     
-    def get_buttons(self):
+    def get_buttons(self, home_id=None, user_id=None):
         """
         Get cached buttons list
         
         Returns:
             List of button objects, same format as smart_home.buttons
+            (or MultiHomeDBManager.get_home_devices with a home_id)
         """
-        cache_key = "buttons_list"
-        print(f"[DEBUG] get_buttons called, checking cache key: {cache_key}")
-        buttons = self.cache.get(cache_key)
-        if buttons is None:
-            print(f"[DEBUG] Cache miss for buttons, fetching from source")
-            logger.debug("Cache miss for buttons, fetching from source")
-            buttons = self.smart_home.buttons
-            print(f"[DEBUG] Fetched buttons from smart_home: {buttons}")
-            timeout = self.cache_manager.get_timeout('buttons')
-            self.cache.set(cache_key, buttons, timeout=timeout)
-            logger.debug(f"Cached buttons data for {timeout}s")
-        else:
-            print(f"[DEBUG] Cache hit for buttons: {buttons}")
-            logger.debug("Cache hit for buttons")
-        return buttons
+        return self._get_home_entity('buttons', home_id, user_id)
     
-    def get_temperature_controls(self):
+    def get_temperature_controls(self, home_id=None, user_id=None):
         """
         Get cached temperature controls
         
         Returns:
             List of temperature control objects, same format as smart_home.temperature_controls
+            (or MultiHomeDBManager.get_home_devices with a home_id)
         """
-        cache_key = "temperature_controls"
-        controls = self.cache.get(cache_key)
-        if controls is None:
-            logger.debug("Cache miss for temperature controls, fetching from source")
-            controls = self.smart_home.temperature_controls
-            timeout = self.cache_manager.get_timeout('temperature')
-            self.cache.set(cache_key, controls, timeout=timeout)
-            logger.debug(f"Cached temperature controls for {timeout}s")
-        else:
-            logger.debug("Cache hit for temperature controls")
-        return controls
+        return self._get_home_entity('temperature_controls', home_id, user_id)
     
-    def get_automations(self):
+    def get_automations(self, home_id=None, user_id=None):
         """
         Get cached automations list
         
         Returns:
             List of automation objects, same format as smart_home.automations
+            (or MultiHomeDBManager.get_home_automations with a home_id)
         """
-        cache_key = "automations_list"
-        automations = self.cache.get(cache_key)
-        if automations is None:
-            logger.debug("Cache miss for automations, fetching from source")
-            automations = self.smart_home.automations
-            timeout = self.cache_manager.get_timeout('automations')
-            self.cache.set(cache_key, automations, timeout=timeout)
-            logger.debug(f"Cached automations data for {timeout}s")
-        else:
-            logger.debug("Cache hit for automations")
-        return automations
+        return self._get_home_entity('automations', home_id, user_id)
     
     def get_config(self):
         """
@@ -450,44 +830,28 @@ class CachedDataAccess:
             logger.debug("Cache hit for config")
         return config
     
-    def invalidate_rooms_cache(self):
-        """Invalidate rooms-related cache"""
-        logger.info("Invalidating rooms cache")
-        # delete_many expects varargs; passing a list may not delete anything on SimpleCache
-        try:
-            self.cache.delete_many(
-                "rooms_list",
-                "buttons_list",
-                "temperature_controls"
-            )
-        except TypeError:
-            # Fallback for cache backends that accept a list
-            self.cache.delete_many([
-                "rooms_list",
-                "buttons_list",
-                "temperature_controls"
-            ])
-    
-    def invalidate_buttons_cache(self):
-        """Invalidate buttons cache"""
-        print(f"[DEBUG] invalidate_buttons_cache called")
-        logger.info("Invalidating buttons cache")
-        result = self.cache.delete("buttons_list")
-        print(f"[DEBUG] Cache delete result: {result}")
-        # Force a cache miss by checking if key was actually deleted
-        check = self.cache.get("buttons_list")
-        print(f"[DEBUG] Cache check after delete: {check}")
-        return result
-    
-    def invalidate_temperature_cache(self):
-        """Invalidate temperature controls cache"""
-        logger.info("Invalidating temperature cache")
-        self.cache.delete("temperature_controls")
-    
-    def invalidate_automations_cache(self):
+    def invalidate_rooms_cache(self, home_id=None):
+        """Invalidate rooms-related cache (rooms and their devices)"""
+        logger.info(f"Invalidating rooms cache (home: {home_id or 'current'})")
+        self.cache_manager.invalidate_home_cache(
+            home_id, entities=('rooms', 'buttons', 'temperature_controls'))
+    
+    def invalidate_buttons_cache(self, home_id=None, room_id=None):
+        """Invalidate buttons cache of a home, or of one of its rooms"""
+        logger.info(f"Invalidating buttons cache (home: {home_id or 'current'}, room: {room_id or 'all'})")
+        self.cache_manager.invalidate_home_cache(
+            home_id, entities=('buttons',), room_ids=[room_id] if room_id is not None else None)
+    
+    def invalidate_temperature_cache(self, home_id=None, room_id=None):
+        """Invalidate temperature controls cache of a home, or of one of its rooms"""
+        logger.info(f"Invalidating temperature cache (home: {home_id or 'current'}, room: {room_id or 'all'})")
+        self.cache_manager.invalidate_home_cache(
+            home_id, entities=('temperature_controls',), room_ids=[room_id] if room_id is not None else None)
+    
+    def invalidate_automations_cache(self, home_id=None):
         """Invalidate automations cache"""
-        logger.info("Invalidating automations cache")
-        self.cache.delete("automations_list")
+        logger.info(f"Invalidating automations cache (home: {home_id or 'current'})")
+        self.cache_manager.invalidate_home_cache(home_id, entities=('automations',))
     
     def invalidate_config_cache(self):
         """Invalidate configuration cache"""
@@ -521,17 +885,11 @@ def setup_smart_home_caching(smart_home, cache_manager):
         
         def cached_get_user_data(user_id):
             """Cached version of get_user_data"""
-            cache_key = f"user_data_{user_id}"
-            user_data = cache_manager.cache.get(cache_key)
-            if user_data is None:
-                logger.debug(f"Cache miss for user data: {user_id}")
-                user_data = original_methods['get_user_data'](user_id)
-                timeout = cache_manager.get_timeout('user_data')
-                cache_manager.cache.set(cache_key, user_data, timeout=timeout)
-                logger.debug(f"Cached user data for {user_id} for {timeout}s")
-            else:
-                logger.debug(f"Cache hit for user data: {user_id}")
-            return user_data
+            return cache_manager.get_or_load(
+                cache_manager.user_data_key(user_id),
+                lambda: original_methods['get_user_data'](user_id),
+                cache_manager.get_timeout('user_data')
+            )
         
         smart_home.get_user_data = cached_get_user_data
     
@@ -571,17 +929,29 @@ def setup_smart_home_caching(smart_home, cache_manager):
         original_methods['update_device'] = smart_home.update_device
 
         def cached_update_device(device_id, updates):
-            """Device update with cache invalidation for buttons & temperature controls"""
+            """Device update that invalidates only the device's home and room lists"""
             logger.debug(f"Cached update_device called: id={device_id}, updates={updates}")
+            device = None
+            if hasattr(smart_home, 'get_device_by_id'):
+                try:
+                    device = smart_home.get_device_by_id(device_id)
+                except Exception as e:
+                    logger.debug(f"Could not look up device {device_id} before update: {e}")
             result = original_methods['update_device'](device_id, updates)
             if result:
-                # Always invalidate both device-related caches (cheap & safe)
                 try:
-                    smart_home_cache = cache_manager.cache
-                    smart_home_cache.delete('buttons_list')
-                    smart_home_cache.delete('temperature_controls')
-                    # Room-specific caches (best-effort) - only possible with Redis pattern scan; here just log
-                    logger.debug("Invalidated buttons_list & temperature_controls caches after device update")
+                    home_id = (device or {}).get('home_id')
+                    # Old and new room; legacy devices are identified by room name
+                    if home_id is not None:
+                        room_ids = [(device or {}).get('room_id'), updates.get('room_id')]
+                    else:
+                        room_ids = [(device or {}).get('room'), updates.get('room')]
+                    room_ids = [room_id for room_id in room_ids if room_id not in (None, '')]
+                    cache_manager.invalidate_device_cache(
+                        home_id=str(home_id) if home_id is not None else None,
+                        room_ids=room_ids if device else None
+                    )
+                    logger.debug(f"Invalidated device caches of home {home_id}, rooms {room_ids}")
                 except Exception as e:
                     logger.warning(f"Failed to invalidate device caches: {e}")
             else:
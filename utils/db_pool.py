@@ -0,0 +1,284 @@
+"""
+Bounded PostgreSQL Connection Pool for Site_proj
+
+This file provides a thread-safe connection pool used by MultiHomeDBManager.
+Every request thread, socket handler and the AutomationScheduler check out
+their own connection, so transactions no longer interleave on one shared
+connection.
+
+Features:
+- Minimum/maximum pool size with blocking checkout and wait timeout
+- Pre-ping of idle connections before they are handed out
+- Recycling of connections older than a configurable age
+- Per-checkout transaction scope (commit on success, rollback on error)
+- Occupancy and wait-time statistics for /api/database/stats
+
+Configuration (environment variables):
+    DB_POOL_MIN            Connections opened eagerly (default: 2)
+    DB_POOL_MAX            Hard upper bound of open connections (default: 10)
+    DB_POOL_TIMEOUT        Seconds to wait for a free connection (default: 10)
+    DB_POOL_RECYCLE        Max connection age in seconds, 0 disables (default: 1800)
+    DB_POOL_PRE_PING_IDLE  Ping connections idle longer than N seconds (default: 30)
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection becomes available within the wait timeout"""
+    pass
+
+
+class _PooledConnection:
+    """Bookkeeping wrapper for a raw DB-API connection"""
+
+    __slots__ = ('raw', 'created_at', 'last_used')
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool:
+    """
+    Thread-safe bounded connection pool
+
+    Connections are created lazily up to ``max_size``; when all are checked
+    out, callers wait up to ``timeout`` seconds for one to be returned.
+    """
+
+    def __init__(self, connect: Callable[[], Any], min_size: int = 2, max_size: int = 10,
+                 timeout: float = 10.0, recycle: float = 1800.0, pre_ping_idle: float = 30.0):
+        """
+        Initialize the pool
+
+        Args:
+            connect: Zero-argument factory returning a new DB-API connection
+            min_size: Number of connections opened eagerly
+            max_size: Maximum number of simultaneously open connections
+            timeout: Seconds to wait for a free connection before failing
+            recycle: Connections older than this (seconds) are replaced; 0 disables
+            pre_ping_idle: Connections idle longer than this are pinged on checkout
+        """
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self._connect = connect
+        self.min_size = max(0, min(min_size, max_size))
+        self.max_size = max_size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping_idle = pre_ping_idle
+
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = deque()
+        self._open = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._closed = False
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'total_wait_time': 0.0,
+            'max_wait_time': 0.0,
+            'connections_created': 0,
+            'connections_recycled': 0,
+            'connections_discarded': 0,
+            'pre_ping_failures': 0,
+            'peak_in_use': 0,
+        }
+
+        for _ in range(self.min_size):
+            self._idle.append(self._create())
+
+    @classmethod
+    def from_env(cls, connect: Callable[[], Any]) -> 'ConnectionPool':
+        """Create a pool configured from DB_POOL_* environment variables"""
+        return cls(
+            connect,
+            min_size=int(os.getenv('DB_POOL_MIN', '2')),
+            max_size=int(os.getenv('DB_POOL_MAX', '10')),
+            timeout=float(os.getenv('DB_POOL_TIMEOUT', '10')),
+            recycle=float(os.getenv('DB_POOL_RECYCLE', '1800')),
+            pre_ping_idle=float(os.getenv('DB_POOL_PRE_PING_IDLE', '30')),
+        )
+
+    def _create(self) -> _PooledConnection:
+        """Open a new raw connection and count it as open"""
+        raw = self._connect()
+        with self._cond:
+            self._open += 1
+            self._stats['connections_created'] += 1
+        return _PooledConnection(raw)
+
+    def _discard(self, pooled: _PooledConnection, reason: str = 'discarded'):
+        """Close a connection and release its slot"""
+        try:
+            if not getattr(pooled.raw, 'closed', False):
+                pooled.raw.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._open -= 1
+            self._stats[f'connections_{reason}'] += 1
+            self._cond.notify()
+
+    def _is_usable(self, pooled: _PooledConnection) -> bool:
+        """Check a connection for staleness before handing it out"""
+        if getattr(pooled.raw, 'closed', False):
+            self._discard(pooled)
+            return False
+        now = time.monotonic()
+        if self.recycle and now - pooled.created_at > self.recycle:
+            self._discard(pooled, 'recycled')
+            return False
+        if self.pre_ping_idle is not None and now - pooled.last_used > self.pre_ping_idle:
+            try:
+                cursor = pooled.raw.cursor()
+                try:
+                    cursor.execute("SELECT 1")
+                finally:
+                    cursor.close()
+                pooled.raw.rollback()
+            except Exception as e:
+                logger.warning(f"Pre-ping failed, discarding pooled connection: {e}")
+                with self._cond:
+                    self._stats['pre_ping_failures'] += 1
+                self._discard(pooled)
+                return False
+        return True
+
+    def _acquire(self) -> _PooledConnection:
+        """Take a connection from the pool, waiting if necessary"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        while True:
+            create_slot = False
+            pooled = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolTimeoutError("Connection pool is closed")
+                    if self._idle:
+                        pooled = self._idle.pop()
+                        break
+                    if self._open < self.max_size:
+                        # Reserve the slot before connecting outside the lock
+                        self._open += 1
+                        create_slot = True
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeoutError(
+                            f"No database connection available within {self.timeout}s "
+                            f"(max_size={self.max_size})"
+                        )
+                    waited = True
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+
+            if create_slot:
+                try:
+                    raw = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._open -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._stats['connections_created'] += 1
+                pooled = _PooledConnection(raw)
+            elif not self._is_usable(pooled):
+                continue
+
+            wait_time = time.monotonic() - started
+            with self._cond:
+                self._in_use += 1
+                self._stats['checkouts'] += 1
+                if waited:
+                    self._stats['waits'] += 1
+                self._stats['total_wait_time'] += wait_time
+                self._stats['max_wait_time'] = max(self._stats['max_wait_time'], wait_time)
+                self._stats['peak_in_use'] = max(self._stats['peak_in_use'], self._in_use)
+            return pooled
+
+    def _release(self, pooled: _PooledConnection, broken: bool = False):
+        """Return a connection to the pool"""
+        with self._cond:
+            self._in_use -= 1
+        if broken or self._closed or getattr(pooled.raw, 'closed', False):
+            self._discard(pooled)
+            return
+        pooled.last_used = time.monotonic()
+        with self._cond:
+            self._idle.append(pooled)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """
+        Check out a connection for the duration of a transaction
+
+        Commits when the block exits normally and rolls back on error.
+        Connections that fail to roll back are discarded instead of reused.
+        """
+        pooled = self._acquire()
+        raw = pooled.raw
+        broken = False
+        try:
+            yield raw
+            raw.commit()
+        except BaseException:
+            try:
+                raw.rollback()
+            except Exception:
+                broken = True
+            raise
+        finally:
+            self._release(pooled, broken=broken)
+
+    def close(self):
+        """Close all idle connections and refuse further checkouts"""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for pooled in idle:
+            self._discard(pooled)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get pool occupancy and wait-time statistics"""
+        with self._cond:
+            stats = dict(self._stats)
+            checkouts = stats['checkouts']
+            stats.update({
+                'pool_enabled': True,
+                'pool_type': 'ConnectionPool',
+                'min_connections': self.min_size,
+                'max_connections': self.max_size,
+                'open_connections': self._open,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                'wait_timeout': self.timeout,
+                'recycle_seconds': self.recycle,
+                'avg_wait_time_ms': round(stats['total_wait_time'] / checkouts * 1000, 3) if checkouts else 0.0,
+                'max_wait_time_ms': round(stats['max_wait_time'] * 1000, 3),
+            })
+            stats.pop('total_wait_time')
+            stats.pop('max_wait_time')
+            return stats
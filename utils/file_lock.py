@@ -0,0 +1,140 @@
+"""
+Inter-process file locking for the JSON storage files
+
+threading locks only protect one process. Under gunicorn every worker has
+its own JSONBackupManager and ManagementLogger, so two workers could
+read-modify-write the same file at once and one update would be lost.
+InterProcessLock adds an OS-level advisory lock (fcntl.flock) on a
+separate <file>.lock file:
+    shared()     readers; any number of processes at once
+    exclusive()  writers; excludes readers and writers of other processes
+
+The lock file is never replaced, so it stays valid while the data file is
+atomically swapped. Threads of one process share the OS lock and are
+serialized by the owner's own threading locks; the descriptor is reopened
+after fork() because forked workers would otherwise share one lock.
+
+On platforms without fcntl (Windows) the lock only counts holders and
+multi-process deployments are not protected.
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+
+class InterProcessLock:
+    """Shared/exclusive advisory lock on a lock file"""
+
+    def __init__(self, path: str):
+        """
+        Initialize the lock
+
+        Args:
+            path: Lock file, created on first use
+        """
+        self.path = path
+        self._cond = threading.Condition(threading.Lock())
+        self._fd = None
+        self._pid = None
+        self._mode = None      # fcntl.LOCK_SH / fcntl.LOCK_EX held by this process
+        self._holders = 0      # threads (and nested calls) holding it
+
+    def _descriptor(self) -> int:
+        """Lock file descriptor of the current process. Condition must be held."""
+        if self._fd is None or self._pid != os.getpid():
+            # After fork() the inherited descriptor shares its lock with the parent
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._pid = os.getpid()
+            self._mode = None
+            self._holders = 0
+        return self._fd
+
+    def acquire(self, exclusive: bool = True, blocking: bool = True) -> bool:
+        """
+        Acquire the lock, blocking until other processes release it
+
+        A shared request while this process holds the lock exclusively is
+        granted at once; an exclusive request waits for the process's
+        shared holders to finish first. A thread must not ask for the
+        exclusive lock while it holds the shared one.
+
+        Args:
+            exclusive: Writer (True) or reader (False) lock
+            blocking: False returns at once instead of waiting; a
+                non-blocking exclusive request also fails while any
+                thread of this process holds the lock
+
+        Returns:
+            Whether the lock was acquired (always True when blocking)
+        """
+        if fcntl is None:
+            with self._cond:
+                if not blocking and exclusive and self._holders:
+                    return False
+                self._holders += 1
+            return True
+        mode = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        with self._cond:
+            fd = self._descriptor()
+            if not blocking and self._holders and mode == fcntl.LOCK_EX:
+                return False
+            while self._holders and mode == fcntl.LOCK_EX and self._mode == fcntl.LOCK_SH:
+                self._cond.wait()
+            if not self._holders:
+                try:
+                    fcntl.flock(fd, mode if blocking else mode | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False
+                self._mode = mode
+            self._holders += 1
+        return True
+
+    def exclusive_held(self) -> bool:
+        """
+        Whether a thread of this process holds the lock exclusively
+
+        A shared holder can check this to tell whether its hold was granted
+        alongside another thread's exclusive one. Without fcntl any hold
+        counts as exclusive.
+        """
+        with self._cond:
+            if fcntl is None:
+                return bool(self._holders)
+            return bool(self._holders) and self._mode == fcntl.LOCK_EX
+
+    def release(self):
+        """Release one hold; the OS lock is dropped with the last one"""
+        with self._cond:
+            if self._holders <= 0:
+                raise RuntimeError("InterProcessLock released too many times")
+            self._holders -= 1
+            if self._holders == 0 and fcntl is not None and self._pid == os.getpid():
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+                self._mode = None
+                self._cond.notify_all()
+
+    @contextmanager
+    def shared(self):
+        """Hold the lock for reading"""
+        self.acquire(exclusive=False)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @contextmanager
+    def exclusive(self):
+        """Hold the lock for writing"""
+        self.acquire(exclusive=True)
+        try:
+            yield
+        finally:
+            self.release()
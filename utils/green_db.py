@@ -0,0 +1,140 @@
+"""
+Cooperative PostgreSQL access for green-thread servers
+
+psycopg2 blocks the calling OS thread while a query runs. Under eventlet or
+gevent every websocket client shares one hub, so a single slow query stalls
+all Socket.IO events. This module installs a psycopg2 wait callback that
+yields to the active hub while the driver waits on the socket, turning
+every DB call made by MultiHomeDBManager, SmartHomeDatabaseManager and
+utils.db_manager into a cooperative one.
+
+The mode is selected automatically from the Socket.IO async mode and can be
+overridden with the DB_COOPERATIVE_MODE environment variable:
+    auto      pick from the async mode (default)
+    eventlet  force the eventlet wait callback
+    gevent    force the gevent wait callback
+    off       plain blocking psycopg2
+
+The callback is only installed once threading is monkey-patched for the
+hub (eventlet.monkey_patch() / gevent.monkey.patch_all()). Otherwise the
+thread-local connections and the pool's conditions would be shared by all
+green threads, and two of them yielding mid-query would interleave their
+transactions on one connection.
+
+Note: psycopg2 does not support COPY and large objects while a wait
+callback is installed; use multi-row INSERT statements instead.
+"""
+import logging
+import os
+from typing import Optional
+
+import psycopg2
+from psycopg2 import extensions
+
+logger = logging.getLogger(__name__)
+
+_active_mode = 'off'
+
+
+def _eventlet_wait_callback(conn, timeout=None):
+    """psycopg2 wait callback yielding to the eventlet hub"""
+    from eventlet.hubs import trampoline
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            break
+        elif state == extensions.POLL_READ:
+            trampoline(conn.fileno(), read=True, timeout=timeout)
+        elif state == extensions.POLL_WRITE:
+            trampoline(conn.fileno(), write=True, timeout=timeout)
+        else:
+            raise psycopg2.OperationalError(f"Bad result from poll: {state!r}")
+
+
+def _gevent_wait_callback(conn, timeout=None):
+    """psycopg2 wait callback yielding to the gevent hub"""
+    from gevent.socket import wait_read, wait_write
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            break
+        elif state == extensions.POLL_READ:
+            wait_read(conn.fileno(), timeout=timeout)
+        elif state == extensions.POLL_WRITE:
+            wait_write(conn.fileno(), timeout=timeout)
+        else:
+            raise psycopg2.OperationalError(f"Bad result from poll: {state!r}")
+
+
+_WAIT_CALLBACKS = {
+    'eventlet': _eventlet_wait_callback,
+    'gevent': _gevent_wait_callback,
+}
+
+
+def _threading_patched(mode: str) -> bool:
+    """Whether the threading module is monkey-patched for a mode's hub"""
+    if mode == 'eventlet':
+        from eventlet import patcher
+        return patcher.is_monkey_patched('thread')
+    from gevent import monkey
+    return monkey.is_module_patched('threading')
+
+
+def resolve_cooperative_mode(async_mode: Optional[str]) -> str:
+    """
+    Decide which cooperative DB mode to use
+
+    Args:
+        async_mode: Socket.IO async mode ('threading', 'eventlet', 'gevent', 'gevent_uwsgi')
+
+    Returns:
+        'eventlet', 'gevent' or 'off'
+    """
+    override = (os.getenv('DB_COOPERATIVE_MODE') or 'auto').strip().lower()
+    if override in ('off', 'eventlet', 'gevent'):
+        return override
+    if async_mode == 'eventlet':
+        return 'eventlet'
+    if async_mode in ('gevent', 'gevent_uwsgi'):
+        return 'gevent'
+    return 'off'
+
+
+def configure_cooperative_db(async_mode: Optional[str]) -> str:
+    """
+    Install (or remove) the psycopg2 wait callback matching the async mode
+
+    Must run before database connections are opened; connections created
+    earlier keep blocking semantics. Without monkey-patched threading the
+    mode is always 'off'.
+
+    Args:
+        async_mode: Socket.IO async mode in use
+
+    Returns:
+        The cooperative mode that is now active
+    """
+    global _active_mode
+    mode = resolve_cooperative_mode(async_mode)
+    callback = _WAIT_CALLBACKS.get(mode)
+    if callback is not None:
+        try:
+            # Import eagerly so a missing package falls back to blocking mode
+            __import__(mode)
+        except ImportError:
+            logger.warning(f"{mode} not installed, database access stays blocking")
+            mode, callback = 'off', None
+        else:
+            if not _threading_patched(mode):
+                # e.g. the development server started without monkey patching
+                logger.warning(f"threading is not monkey-patched for {mode}, database access stays blocking")
+                mode, callback = 'off', None
+    extensions.set_wait_callback(callback)
+    _active_mode = mode
+    return mode
+
+
+def get_cooperative_mode() -> str:
+    """Get the currently active cooperative DB mode"""
+    return _active_mode
@@ -7,15 +7,356 @@ database is unavailable. It creates and manages a JSON configuration file
 with a default sys-admin user.
 """
 
-import json
+import atexit
 import os
+import re
 import secrets
+import shutil
 import string
 import uuid
 from datetime import datetime
 from werkzeug.security import generate_password_hash
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 import threading
+import time
+
+from utils import json_serializer
+from utils.file_lock import InterProcessLock
+
+
+# Lists whose records carry a home_id and are stored per home when sharding
+_HOME_SCOPED_LISTS = ('rooms', 'buttons', 'temperature_controls', 'automations',
+                      'management_logs', 'invitations', 'notification_recipients')
+# Home ids that are safe to use as shard file names
+_SHARD_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,128}$')
+# Top-level keys that memberships, roles and home access are derived from
+_MEMBERSHIP_KEYS = ('users', 'homes', 'user_homes')
+
+
+class _FrozenDict(dict):
+    """Read-only dict handed out by JSONBackupManager.read_config()"""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("JSON configuration views are read-only; use get_config() for a mutable copy")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return _thaw(self)
+
+    def __reduce__(self):
+        return (dict, (_thaw(self),))
+
+
+class _FrozenList(list):
+    """Read-only list handed out by JSONBackupManager.read_config()"""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("JSON configuration views are read-only; use get_config() for a mutable copy")
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
+    append = extend = insert = pop = remove = clear = sort = reverse = _readonly
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return _thaw(self)
+
+    def __reduce__(self):
+        return (list, (_thaw(self),))
+
+
+class _ConfigCopy(dict):
+    """
+    Mutable configuration handed out by JSONBackupManager.get_config()
+    
+    Remembers the snapshot it was copied from, so save_config() can tell
+    the caller's changes from those others saved meanwhile.
+    """
+    __slots__ = ('base_snapshot',)
+
+
+def _freeze(value: Any) -> Any:
+    """Deep-copy parsed JSON into read-only containers"""
+    if isinstance(value, dict):
+        return _FrozenDict((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return _FrozenList(_freeze(item) for item in value)
+    return value
+
+
+def _thaw(value: Any) -> Any:
+    """Deep-copy a (possibly frozen) JSON structure into plain dicts and lists"""
+    if isinstance(value, dict):
+        return {key: _thaw(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_thaw(item) for item in value]
+    return value
+
+
+def _apply_operation(config: Dict[str, Any], op: Dict[str, Any],
+                     copy_on_write: bool = False) -> Tuple[Dict[str, Any], bool]:
+    """
+    Apply one journal operation to a configuration
+    
+    Operations address containers by a path of dict keys:
+        set     store op['value'] under the last key of op['path']
+        append  append op['value'] to the list at op['path'], keeping at
+                most op['max_items'] entries when given
+        update  merge op['changes'] into the item of the list at op['path']
+                whose id matches op['id']
+    
+    With copy_on_write the frozen input is left untouched: only containers
+    along the path are copied, everything else is shared. Otherwise the
+    plain input is modified in place (used when replaying the journal).
+    
+    Returns:
+        Tuple of (resulting configuration, whether the operation matched)
+    """
+    kind = op['op']
+    path = list(op['path'])
+    container_path = path[:-1] if kind == 'set' else path
+    
+    if not copy_on_write:
+        node = config
+        for depth, key in enumerate(container_path):
+            # The last container of append/update is a list, the rest are dicts
+            expected = list if kind != 'set' and depth == len(container_path) - 1 else dict
+            if not isinstance(node.get(key), expected):
+                node[key] = expected()
+            node = node[key]
+        if kind == 'set':
+            node[path[-1]] = op['value']
+        elif kind == 'append':
+            node.append(op['value'])
+            max_items = op.get('max_items')
+            if max_items and len(node) > max_items:
+                del node[:len(node) - max_items]
+        elif kind == 'update':
+            for item in node:
+                if isinstance(item, dict) and str(item.get('id')) == str(op['id']):
+                    item.update(op['changes'])
+                    return config, True
+            return config, False
+        else:
+            raise ValueError(f"Unknown journal operation: {kind}")
+        return config, True
+    
+    def rebuild(node, depth):
+        if depth < len(container_path):
+            node = node if isinstance(node, dict) else {}
+            key = container_path[depth]
+            child, matched = rebuild(node.get(key), depth + 1)
+            if not matched:
+                return node, False
+            return _FrozenDict({**node, key: child}), True
+        if kind == 'set':
+            node = node if isinstance(node, dict) else {}
+            return _FrozenDict({**node, path[-1]: _freeze(op['value'])}), True
+        items = list(node) if isinstance(node, list) else []
+        if kind == 'append':
+            items.append(_freeze(op['value']))
+            max_items = op.get('max_items')
+            if max_items and len(items) > max_items:
+                del items[:len(items) - max_items]
+            return _FrozenList(items), True
+        if kind == 'update':
+            for index, item in enumerate(items):
+                if isinstance(item, dict) and str(item.get('id')) == str(op['id']):
+                    items[index] = _FrozenDict({**item, **_freeze(op['changes'])})
+                    return _FrozenList(items), True
+            return node, False
+        raise ValueError(f"Unknown journal operation: {kind}")
+    
+    result, matched = rebuild(config, 0)
+    return (result if matched else config), matched
+
+
+_MISSING = object()
+
+
+def _record_ids(records: Any) -> Optional[List[str]]:
+    """Ids of a list of records, or None if it is not a list of records with unique ids"""
+    if not isinstance(records, list):
+        return None
+    ids = []
+    for record in records:
+        if not isinstance(record, dict) or 'id' not in record:
+            return None
+        ids.append(str(record['id']))
+    return ids if len(set(ids)) == len(ids) else None
+
+
+def _rebase(base: Any, mine: Any, theirs: Any) -> Any:
+    """
+    Three-way merge of frozen configurations
+    
+    Re-applies the changes from base to mine on top of theirs, so a save
+    does not revert what another process (or thread) stored after the
+    caller read base. Dicts merge per key and lists of records per id;
+    for anything else changed on both sides mine wins.
+    """
+    if mine == base:
+        return theirs
+    if theirs == base:
+        return mine
+    
+    if isinstance(base, dict) and isinstance(mine, dict) and isinstance(theirs, dict):
+        result = dict(theirs)
+        for key in set(base) | set(mine):
+            base_value = base.get(key, _MISSING)
+            mine_value = mine.get(key, _MISSING)
+            if mine_value is _MISSING:
+                result.pop(key, None)
+            elif base_value is _MISSING or key not in theirs:
+                result[key] = mine_value
+            elif mine_value != base_value:
+                result[key] = _rebase(base_value, mine_value, theirs[key])
+        return _FrozenDict(result)
+
+    base_ids, mine_ids, theirs_ids = _record_ids(base), _record_ids(mine), _record_ids(theirs)
+    if base_ids is None or mine_ids is None or theirs_ids is None:
+        return mine
+    base_by_id = dict(zip(base_ids, base))
+    mine_by_id = dict(zip(mine_ids, mine))
+    result, positions = [], {}
+    for record_id, record in zip(theirs_ids, theirs):
+        if record_id in mine_by_id:
+            if record_id in base_by_id:
+                record = _rebase(base_by_id[record_id], mine_by_id[record_id], record)
+            else:
+                record = mine_by_id[record_id]
+        elif record_id in base_by_id:
+            continue  # deleted by mine
+        positions[record_id] = len(result)
+        result.append(record)
+    
+    # Records added by mine go after their predecessor in mine
+    previous = None
+    for record_id, record in zip(mine_ids, mine):
+        if record_id not in positions and record_id not in base_by_id:
+            index = positions[previous] + 1 if previous is not None else 0
+            result.insert(index, record)
+            positions = {str(item['id']): position for position, item in enumerate(result)}
+        if record_id in positions:
+            previous = record_id
+    return _FrozenList(result)
+
+
+def _append_journal_line(journal_file: str, line: bytes) -> int:
+    """
+    Append a line to a journal and return the bytes written
+    
+    A crash during an earlier append can leave a torn last line without a
+    newline; it is terminated first so the new line is not glued onto it
+    (and dropped together with it on the next replay).
+    """
+    with open(journal_file, 'a+b') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell():
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                line = b'\n' + line
+        f.write(line)
+    return len(line)
+
+
+def _shard_key(home_id: Any) -> Optional[str]:
+    """Shard that stores records of a home (None = the global file)"""
+    if home_id is None:
+        return None
+    home_id = str(home_id)
+    return home_id if _SHARD_ID_PATTERN.match(home_id) else None
+
+
+def _split_config(config: Dict[str, Any]) -> Dict[Optional[str], Dict[str, Any]]:
+    """
+    Split a configuration into the global part (key None) and one part per
+    home holding that home's records of the home-scoped lists
+    """
+    parts = {None: {}}
+    for key, value in config.items():
+        if key not in _HOME_SCOPED_LISTS or not isinstance(value, list):
+            parts[None][key] = value
+            continue
+        shared = []
+        for record in value:
+            home = _shard_key(record.get('home_id')) if isinstance(record, dict) else None
+            if home is None:
+                shared.append(record)
+            else:
+                part = parts.setdefault(home, {list_key: [] for list_key in _HOME_SCOPED_LISTS})
+                part[key].append(record)
+        parts[None][key] = shared
+    return parts
+
+
+class _ConfigIndex:
+    """
+    Secondary indexes over one configuration snapshot
+    
+    Records are referenced by key or list position, so an in-place field
+    update that keeps ids and home ids leaves the index valid.
+    """
+    
+    DEVICE_LISTS = ('buttons', 'temperature_controls')
+    # Top-level keys whose structural changes require a rebuild
+    INDEXED_KEYS = frozenset(('users', 'homes', 'user_homes', 'rooms') + DEVICE_LISTS)
+    
+    def __init__(self, config: Dict[str, Any]):
+        self.devices = {}       # device id -> (list key, position)
+        self.home_devices = {}  # home id -> [device id]
+        self.rooms = {}         # room id -> position in rooms
+        self.home_rooms = {}    # home id -> [room id]
+        self.users = {}         # user id -> key in users
+        self.logins = {}        # username / email / users key -> key in users
+        self.memberships = {}   # user id -> [(home id, position in user_homes[home id])]
+        
+        for list_key in self.DEVICE_LISTS:
+            for position, device in enumerate(config.get(list_key, []) or []):
+                if not isinstance(device, dict):
+                    continue
+                device_id = str(device.get('id'))
+                if device_id not in self.devices:
+                    self.devices[device_id] = (list_key, position)
+                    self.home_devices.setdefault(str(device.get('home_id')), []).append(device_id)
+        
+        for position, room in enumerate(config.get('rooms', []) or []):
+            if not isinstance(room, dict):
+                continue
+            room_id = str(room.get('id'))
+            if room_id not in self.rooms:
+                self.rooms[room_id] = position
+                self.home_rooms.setdefault(str(room.get('home_id')), []).append(room_id)
+        
+        for users_key, user in (config.get('users', {}) or {}).items():
+            if not isinstance(user, dict):
+                continue
+            self.users.setdefault(user.get('id'), users_key)
+            for login in (user.get('email'), user.get('username'), users_key):
+                if login:
+                    self.logins.setdefault(login, users_key)
+        
+        for home_id, members in (config.get('user_homes', {}) or {}).items():
+            seen = set()
+            for position, entry in enumerate(members or []):
+                if isinstance(entry, dict) and entry.get('user_id') not in seen:
+                    # First entry wins if a user is listed twice in a home
+                    seen.add(entry.get('user_id'))
+                    self.memberships.setdefault(entry.get('user_id'), []).append((home_id, position))
+    
+    @classmethod
+    def survives(cls, op: Dict[str, Any]) -> bool:
+        """Whether the index of the previous snapshot stays valid after op"""
+        if op['path'][0] not in cls.INDEXED_KEYS:
+            return True
+        return (op['op'] == 'update' and len(op['path']) == 1
+                and not {'id', 'home_id', 'user_id', 'email', 'username'} & set(op['changes']))
 
 
 class JSONBackupManager:
@@ -24,17 +365,94 @@ class JSONBackupManager:
     Automatically creates configuration file with default admin user.
     """
     
-    def __init__(self, config_file: str = 'smart_home_config.json'):
+    def __init__(self, config_file: str = 'smart_home_config.json',
+                 write_behind_window: Optional[float] = None,
+                 shard_homes: Optional[bool] = None):
         """
         Initialize JSON backup manager
         
         Args:
             config_file: Path to JSON configuration file
+            write_behind_window: Seconds to coalesce saves before writing the
+                file (default: JSON_WRITE_BEHIND_WINDOW env, 0 = write through)
+            shard_homes: Store each home's records in its own file (default:
+                JSON_SHARD_HOMES env, off)
         """
         self.base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         self.config_file = os.path.join(self.base_dir, 'app', config_file)
         self._lock = threading.RLock()
+        # Serializes writers across processes (e.g. gunicorn workers); taken
+        # before self._lock, while readers take it shared to load the files
+        self._file_lock = InterProcessLock(self.config_file + '.lock')
         self.generated_password = None
+        # Files are compact unless JSON_PRETTY is set; see export_config()
+        self.pretty = json_serializer.PRETTY
+        
+        # Parsed configuration, valid while the file signature is unchanged;
+        # _loads counts how often it was replaced by a read from disk
+        self._cached_config = None
+        self._cached_signature = None
+        self._loads = 0
+        # Snapshot as last read from or written to disk
+        self._disk_config = None
+        
+        # Write-behind state: save_config() updates the in-memory config and
+        # a timer writes the file once per window
+        if write_behind_window is None:
+            write_behind_window = float(os.getenv('JSON_WRITE_BEHIND_WINDOW', '0'))
+        self.write_behind_window = max(0.0, write_behind_window)
+        self._dirty = False
+        self._flush_timer = None
+        self._write_stats = {
+            'save_requests': 0,
+            'file_writes': 0,
+            'bytes_written': 0,
+            'backup_rotations': 0,
+            'failed_writes': 0,
+            'coalesced_saves': 0,
+            'last_write_ms': 0.0,
+        }
+        self._pending_saves = 0
+        if self.write_behind_window > 0:
+            atexit.register(self.flush)
+        
+        # Append-only operation journal (see append_record/update_record/
+        # set_value), folded into the main file once it grows too large
+        self.journal_file = self.config_file + '.journal'
+        self.journal_enabled = os.getenv('JSON_JOURNAL', 'true').lower() in ('true', '1', 'yes')
+        self.journal_compact_bytes = int(os.getenv('JSON_JOURNAL_COMPACT_BYTES', str(1024 * 1024)))
+        self._journal_seq = 0
+        self._compaction_thread = None
+        
+        # Secondary indexes, valid for the snapshot object in _index_config
+        self._index = None
+        self._index_config = None
+        
+        # See membership_version()
+        self._membership_sources = None
+        self._membership_version = 0
+        
+        # Per-home shards: users, homes and memberships stay in config_file,
+        # each home's rooms, devices, automations and logs live in
+        # <config>.homes/<home_id>.json with its own journal and lock
+        if shard_homes is None:
+            shard_homes = os.getenv('JSON_SHARD_HOMES', 'false').lower() in ('true', '1', 'yes')
+        self.shard_homes = shard_homes
+        self.shards_dir = os.path.splitext(self.config_file)[0] + '.homes'
+        self._shard_locks = {}
+        self._shard_file_locks = {}
+        self._shard_seqs = {}       # home id -> journal_seq of its shard file
+        self._written_parts = {}    # shard -> part as last read from or written to disk
+        self._write_stats.update({
+            'journal_appends': 0,
+            'journal_bytes': 0,
+            'journal_replayed': 0,
+            'compactions': 0,
+            'index_rebuilds': 0,
+            'shard_writes': 0,
+            'shard_writes_skipped': 0,
+            'rebased_saves': 0,
+        })
         
         # Initialize or load configuration
         self._initialize_config()
@@ -55,11 +473,10 @@ class JSONBackupManager:
     
     def _initialize_config(self):
         """Initialize or load JSON configuration file"""
-        with self._lock:
+        with self._file_lock.exclusive(), self._lock:
             if os.path.exists(self.config_file):
                 try:
-                    with open(self.config_file, 'r', encoding='utf-8') as f:
-                        config = json.load(f)
+                    config = json_serializer.load(self.config_file)
                     
                     # Validate configuration structure
                     if self._validate_config(config):
@@ -159,8 +576,17 @@ class JSONBackupManager:
             os.makedirs(os.path.dirname(self.config_file), exist_ok=True)
             
             # Write configuration file
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(default_config, f, indent=4, ensure_ascii=False)
+            with open(self.config_file, 'wb') as f:
+                f.write(json_serializer.dumps(default_config, pretty=self.pretty))
+            
+            # A journal left over from the replaced configuration no longer applies
+            if os.path.exists(self.journal_file):
+                os.remove(self.journal_file)
+            # Neither do home shards; keep them aside rather than merging them in
+            if os.path.isdir(self.shards_dir):
+                os.rename(self.shards_dir, f"{self.shards_dir}.reset-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+            self._shard_seqs = {}
+            self._written_parts = {}
             
             # Print credentials to console
             print("\n" + "="*70)
@@ -178,53 +604,694 @@ class JSONBackupManager:
             print(f"✗ Failed to create JSON configuration: {e}")
             raise
     
-    def get_config(self) -> Dict[str, Any]:
+    def _shard_file(self, shard: Optional[str]) -> str:
+        """File holding a shard (None = the global configuration file)"""
+        if shard is None:
+            return self.config_file
+        return os.path.join(self.shards_dir, shard + '.json')
+    
+    def _shard_lock(self, shard: Optional[str]) -> threading.Lock:
+        """Lock serializing file access to one shard and its journal"""
+        lock = self._shard_locks.get(shard)
+        if lock is None:
+            lock = self._shard_locks.setdefault(shard, threading.Lock())
+        return lock
+    
+    def _shard_file_lock(self, shard: str) -> InterProcessLock:
+        """Inter-process lock serializing journal appends to one home's shard"""
+        lock = self._shard_file_locks.get(shard)
+        if lock is None:
+            lock = self._shard_file_locks.setdefault(shard, InterProcessLock(self._shard_file(shard) + '.lock'))
+        return lock
+    
+    def _file_signature(self) -> Optional[tuple]:
+        """Identify the current config file and journal versions (changes on every write)"""
+        try:
+            stat = os.stat(self.config_file)
+        except OSError:
+            return None
+        try:
+            journal = os.stat(self.journal_file)
+            journal_signature = (journal.st_ino, journal.st_mtime_ns, journal.st_size)
+        except OSError:
+            journal_signature = None
+        if not self.shard_homes:
+            return (stat.st_ino, stat.st_mtime_ns, stat.st_size, journal_signature)
+        shards = []
+        try:
+            with os.scandir(self.shards_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.lock'):
+                        continue
+                    entry_stat = entry.stat()
+                    shards.append((entry.name, entry_stat.st_ino, entry_stat.st_mtime_ns, entry_stat.st_size))
+        except OSError:
+            pass
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size, journal_signature, tuple(sorted(shards)))
+    
+    @staticmethod
+    def _with_shard_journal(signature: Optional[tuple], journal_file: str,
+                            stat: os.stat_result) -> Optional[tuple]:
         """
-        Get current configuration
+        A sharded file signature with only the entry of one shard journal
+        replaced, so changes to other files stay detectable
+        """
+        if signature is None or len(signature) < 5:
+            return None
+        name = os.path.basename(journal_file)
+        shards = [entry for entry in signature[4] if entry[0] != name]
+        shards.append((name, stat.st_ino, stat.st_mtime_ns, stat.st_size))
+        return signature[:4] + (tuple(sorted(shards)),)
+    
+    def _merge_shards(self, config: Dict[str, Any]):
+        """
+        Append the records of every home shard to a freshly loaded global
+        configuration (in place), known homes first
+        """
+        self._shard_seqs = {}
+        try:
+            names = [name[:-5] for name in os.listdir(self.shards_dir) if name.endswith('.json')]
+        except OSError:
+            return
+        homes = config.get('homes', {}) or {}
+        names.sort(key=lambda home_id: (home_id not in homes, home_id))
+        for home_id in names:
+            part = json_serializer.load(self._shard_file(home_id))
+            for key in _HOME_SCOPED_LISTS:
+                records = part.get(key) or []
+                if records:
+                    if not isinstance(config.get(key), list):
+                        config[key] = []
+                    config[key].extend(records)
+            self._shard_seqs[home_id] = int(part.get('journal_seq', 0) or 0)
+    
+    def _replay_journal(self, config: Dict[str, Any]) -> int:
+        """
+        Apply journal operations newer than the snapshot to a freshly loaded
+        configuration (in place). A torn last line from a crash is ignored.
+        
+        With home shards every shard has its own journal; operations of all
+        journals are applied in sequence order, each skipped when its shard
+        file already contains it.
         
         Returns:
-            Configuration dictionary
+            Number of operations applied
+        """
+        snapshot_seq = int(config.get('metadata', {}).get('journal_seq', 0) or 0)
+        self._journal_seq = max([snapshot_seq] + list(self._shard_seqs.values()))
+        journals = [(self.journal_file, snapshot_seq)]
+        if self.shard_homes and os.path.isdir(self.shards_dir):
+            for name in os.listdir(self.shards_dir):
+                if name.endswith('.json.journal'):
+                    home_id = name[:-len('.json.journal')]
+                    journals.append((os.path.join(self.shards_dir, name), self._shard_seqs.get(home_id, 0)))
+        
+        ops = []
+        for journal_file, file_seq in journals:
+            if not os.path.exists(journal_file):
+                continue
+            with open(journal_file, 'rb') as f:
+                for line in f:
+                    try:
+                        op = json_serializer.loads(line)
+                    except ValueError:
+                        continue
+                    if int(op.get('seq', 0)) > file_seq:  # else already part of the snapshot
+                        ops.append(op)
+        ops.sort(key=lambda op: int(op.get('seq', 0)))
+        for op in ops:
+            _apply_operation(config, op)
+            self._journal_seq = max(self._journal_seq, int(op.get('seq', 0)))
+        self._write_stats['journal_replayed'] += len(ops)
+        return len(ops)
+    
+    def _load_cached_config(self) -> Dict[str, Any]:
+        """
+        Get the parsed configuration, re-reading the file only when its
+        inode, mtime or size changed (e.g. another process saved it).
+        Must be called with the lock held.
+        """
+        if self._dirty:
+            # Pending write-behind changes are newer than the files
+            return self._cached_config
+        signature = self._file_signature()
+        if signature is not None and signature == self._cached_signature:
+            return self._cached_config
+        
+        # Another process may be halfway through writing several files
+        with self._file_lock.shared():
+            signature = self._file_signature()
+            config = self._read_files()
+        self._cached_config = config
+        self._cached_signature = signature
+        self._disk_config = config
+        self._loads += 1
+        return config
+    
+    def _read_files(self) -> Dict[str, Any]:
+        """Parse the configuration, its shards and journals into a frozen snapshot"""
+        config = json_serializer.load(self.config_file)
+        migrating = False
+        if self.shard_homes:
+            # Home records still in the global file move to shards on the next write
+            migrating = len(_split_config(config)) > 1
+            self._merge_shards(config)
+        self._replay_journal(config)
+        config = _freeze(config)
+        if self.shard_homes:
+            self._written_parts = _split_config(config)
+            if migrating:
+                self._written_parts.pop(None)
+        return config
+    
+    def read_config(self) -> Dict[str, Any]:
+        """
+        Get a read-only view of the current configuration
+        
+        Cheaper than get_config() because nothing is copied; any attempt to
+        modify the view raises TypeError.
+        
+        Returns:
+            Read-only configuration dictionary
         """
         with self._lock:
             try:
-                with open(self.config_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                return self._load_cached_config()
             except Exception as e:
                 print(f"⚠ Failed to load configuration: {e}")
-                return {}
+                return _FrozenDict()
+    
+    def get_config(self) -> Dict[str, Any]:
+        """
+        Get current configuration
+        
+        Returns:
+            Mutable copy of the configuration dictionary; changes only take
+            effect once passed to save_config(), which merges them with
+            changes saved since the copy was made
+        """
+        snapshot = self.read_config()
+        config = _ConfigCopy((key, _thaw(value)) for key, value in snapshot.items())
+        config.base_snapshot = snapshot
+        return config
+    
+    def invalidate_cache(self):
+        """Drop the in-memory configuration so the next read hits the file"""
+        with self._lock:
+            if self._dirty:
+                self.flush()
+            self._cached_config = None
+            self._cached_signature = None
+            self._disk_config = None
     
     def save_config(self, config: Dict[str, Any]) -> bool:
         """
         Save configuration to file
         
+        With a write-behind window the new configuration is visible to
+        readers immediately and written to disk once per window (or on
+        flush()/interpreter exit).
+        
+        For a copy from get_config(), changes saved by other processes or
+        threads since it was made are kept: only what the caller changed
+        relative to the snapshot it was copied from is applied on top of
+        the current configuration. Any other dictionary replaces the
+        configuration as a whole.
+        
         Args:
             config: Configuration dictionary to save
             
         Returns:
             True if successful, False otherwise
         """
+        with self._file_lock.exclusive(), self._lock:
+            self._write_stats['save_requests'] += 1
+            # Keep our own copy so the caller's later edits can't leak in
+            mine = frozen = _freeze(config)
+            base = getattr(config, 'base_snapshot', None)
+            if base is not None and not self._dirty:
+                try:
+                    current = self._load_cached_config()
+                except Exception:
+                    current = base
+                if current is not base:
+                    frozen = _rebase(base, mine, current)
+                    self._write_stats['rebased_saves'] += 1
+            if isinstance(config, _ConfigCopy):
+                # A later save of the same copy only applies edits made after this one
+                config.base_snapshot = mine
+            return self._store(frozen)
+    
+    def _store(self, frozen: Dict[str, Any]) -> bool:
+        """Persist a full configuration (write-through or write-behind). Lock must be held."""
+        if self.write_behind_window <= 0:
+            return self._write_config_file(frozen)
+        
+        self._cached_config = frozen
+        self._dirty = True
+        self._pending_saves += 1
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.write_behind_window, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+        return True
+    
+    # ------------------------------------------------------------------
+    # Journaled mutations
+    # ------------------------------------------------------------------
+    
+    def _record_operation(self, op: Dict[str, Any]) -> bool:
+        """
+        Apply an operation to the in-memory configuration and persist it
+        
+        With the journal enabled only one JSONL line is appended, so the
+        cost does not depend on the configuration size. Without it (or
+        while a write-behind save is pending) the whole configuration is
+        stored as by save_config().
+        
+        With home shards the line goes to the journal of the home owning
+        the record, so a home's journal only grows with its own changes.
+        Such an operation holds the file lock shared, which keeps full
+        saves of every process out, plus the locks of its home (see
+        _record_home_operation), so different homes are written
+        concurrently.
+        
+        Other operations hold the file lock exclusively from loading the
+        current configuration until the line is written, so operations of
+        other processes are never lost or given the same sequence number.
+        """
+        if self.shard_homes and self.journal_enabled:
+            with self._file_lock.shared():
+                # A shared hold is granted alongside another thread's exclusive one
+                if not self._file_lock.exclusive_held():
+                    recorded = self._record_home_operation(op)
+                    if recorded is not None:
+                        return recorded
+        with self._file_lock.exclusive():
+            return self._record_operation_locked(op)
+    
+    def _record_home_operation(self, op: Dict[str, Any]) -> Optional[bool]:
+        """
+        Journal an operation on one home's records under that home's locks
+        
+        The file lock must be held shared. The home's in-process and
+        inter-process locks are held from loading the configuration until
+        the line is written, so appends to one home keep their order while
+        appends to other homes proceed.
+        
+        Returns:
+            None if the operation needs the exclusive file lock (it touches
+            the global file, more than one home, or is not journaled),
+            otherwise whether it was recorded
+        """
         with self._lock:
+            if self._dirty:
+                return None
             try:
-                # Create backup of current config
-                if os.path.exists(self.config_file):
-                    backup_file = self.config_file + '.backup'
-                    with open(self.config_file, 'r', encoding='utf-8') as f:
-                        backup_config = json.load(f)
-                    with open(backup_file, 'w', encoding='utf-8') as f:
-                        json.dump(backup_config, f, indent=4, ensure_ascii=False)
-                
-                # Write new configuration
-                temp_file = self.config_file + '.tmp'
-                with open(temp_file, 'w', encoding='utf-8') as f:
-                    json.dump(config, f, indent=4, ensure_ascii=False)
-                
-                # Atomic replace
-                os.replace(temp_file, self.config_file)
-                
+                journaled, shard = self._route_operation(self._load_cached_config(), op)
+            except Exception as e:
+                print(f"⚠ Failed to load configuration: {e}")
+                return False
+        if not journaled or shard is None:
+            return None
+        
+        journal_file = self._shard_file(shard) + '.journal'
+        with self._shard_lock(shard), self._shard_file_lock(shard).exclusive():
+            with self._lock:
+                try:
+                    current = self._load_cached_config()
+                except Exception as e:
+                    print(f"⚠ Failed to load configuration: {e}")
+                    return False
+                # The record may have moved to another home meanwhile
+                if self._dirty or self._route_operation(current, op) != (True, shard):
+                    return None
+                updated, matched = _apply_operation(current, op, copy_on_write=True)
+                if not matched:
+                    return False
+                # Other homes may use the same number; replay compares it per journal
+                op = dict(op, seq=self._journal_seq + 1)
+                self._journal_seq = op['seq']
+                loads = self._loads
+            
+            try:
+                os.makedirs(self.shards_dir, exist_ok=True)
+                written = _append_journal_line(journal_file, json_serializer.dumps(op) + b'\n')
+                journal_stat = os.stat(journal_file)
+            except Exception as e:
+                print(f"✗ Failed to append to configuration journal: {e}")
+                return False
+            
+            with self._lock:
+                # After a reload from disk the snapshot is already newer
+                if self._loads == loads:
+                    previous = self._cached_config
+                    if previous is not current:
+                        # Another home's operation was applied meanwhile
+                        updated, _ = _apply_operation(previous, op, copy_on_write=True)
+                    self._cached_config = updated
+                    if self._index_config is previous and _ConfigIndex.survives(op):
+                        self._index_config = updated
+                    self._cached_signature = self._with_shard_journal(
+                        self._cached_signature, journal_file, journal_stat)
+                self._write_stats['journal_appends'] += 1
+                self._write_stats['journal_bytes'] += written
+        
+        if journal_stat.st_size > self.journal_compact_bytes:
+            self._schedule_compaction()
+        return True
+    
+    def _record_operation_locked(self, op: Dict[str, Any]) -> bool:
+        """_record_operation() body; the file lock must be held exclusively"""
+        with self._lock:
+            try:
+                current = self._load_cached_config()
+            except Exception as e:
+                print(f"⚠ Failed to load configuration: {e}")
+                return False
+            updated, matched = _apply_operation(current, op, copy_on_write=True)
+            if not matched:
+                return False
+            
+            journaled, shard = True, None
+            if self.shard_homes:
+                journaled, shard = self._route_operation(current, op)
+            
+            if not self.journal_enabled or self._dirty or not journaled:
+                self._write_stats['save_requests'] += 1
+                if not self._store(updated):
+                    return False
+                if self._index_config is current and _ConfigIndex.survives(op):
+                    self._index_config = self._cached_config
                 return True
+            
+            op = dict(op, seq=self._journal_seq + 1)
+            line = json_serializer.dumps(op) + b'\n'
+            journal_file = self._shard_file(shard) + '.journal' if self.shard_homes else self.journal_file
+            try:
+                with self._shard_lock(shard if self.shard_homes else None):
+                    if self.shard_homes and shard is not None:
+                        os.makedirs(self.shards_dir, exist_ok=True)
+                    written = _append_journal_line(journal_file, line)
+                    journal_size = os.path.getsize(journal_file)
             except Exception as e:
-                print(f"✗ Failed to save configuration: {e}")
+                print(f"✗ Failed to append to configuration journal: {e}")
                 return False
+            
+            self._journal_seq = op['seq']
+            self._cached_config = updated
+            if self._index_config is current and _ConfigIndex.survives(op):
+                self._index_config = updated
+            self._cached_signature = self._file_signature()
+            self._write_stats['journal_appends'] += 1
+            self._write_stats['journal_bytes'] += written
+            if journal_size > self.journal_compact_bytes:
+                self._schedule_compaction()
+            return True
+    
+    def _route_operation(self, current: Dict[str, Any], op: Dict[str, Any]) -> Tuple[bool, Optional[str]]:
+        """
+        Pick the shard journal for an operation
+        
+        Returns:
+            Tuple of (whether it can be journaled, shard). Operations that
+            touch more than one home (replacing a whole list, trimming it or
+            moving a record to another home) are stored as full saves.
+        """
+        path = op['path']
+        if path[0] not in _HOME_SCOPED_LISTS:
+            return True, None
+        if len(path) != 1 or op['op'] == 'set':
+            return False, None
+        records = current.get(path[0])
+        records = records if isinstance(records, list) else []
+        if op['op'] == 'append':
+            if op.get('max_items') and len(records) >= op['max_items']:
+                return False, None
+            value = op['value']
+            return True, _shard_key(value.get('home_id') if isinstance(value, dict) else None)
+        for record in records:
+            if isinstance(record, dict) and str(record.get('id')) == str(op['id']):
+                shard = _shard_key(record.get('home_id'))
+                if 'home_id' in op['changes'] and _shard_key(op['changes']['home_id']) != shard:
+                    return False, None
+                return True, shard
+        return False, None
+    
+    def append_record(self, path, record: Dict[str, Any], max_items: Optional[int] = None) -> bool:
+        """
+        Append a record to a list in the configuration
+        
+        Args:
+            path: Key (or list of nested keys) of the list, e.g. 'management_logs'
+            record: Record to append
+            max_items: Keep only the newest max_items records
+            
+        Returns:
+            True if successful, False otherwise
+        """
+        op = {'op': 'append', 'path': [path] if isinstance(path, str) else list(path), 'value': record}
+        if max_items:
+            op['max_items'] = max_items
+        return self._record_operation(op)
+    
+    def update_record(self, path, record_id: Any, changes: Dict[str, Any]) -> bool:
+        """
+        Merge changes into the record with the given id in a list
+        
+        Args:
+            path: Key (or list of nested keys) of the list, e.g. 'buttons'
+            record_id: Value of the record's 'id' field
+            changes: Fields to set on the record
+            
+        Returns:
+            True if the record was found and the change persisted
+        """
+        return self._record_operation({
+            'op': 'update', 'path': [path] if isinstance(path, str) else list(path),
+            'id': record_id, 'changes': changes
+        })
+    
+    def set_value(self, path, value: Any) -> bool:
+        """
+        Set a value in the configuration
+        
+        Args:
+            path: Key (or list of nested keys), e.g. ['user_current_home', user_id]
+            value: Value to store
+            
+        Returns:
+            True if successful, False otherwise
+        """
+        return self._record_operation({
+            'op': 'set', 'path': [path] if isinstance(path, str) else list(path), 'value': value
+        })
+    
+    def _schedule_compaction(self):
+        """Start a background compaction unless one is already running"""
+        if self._compaction_thread is not None and self._compaction_thread.is_alive():
+            return
+        self._compaction_thread = threading.Thread(target=self.compact, name='json-journal-compaction', daemon=True)
+        self._compaction_thread.start()
+    
+    def compact(self) -> bool:
+        """
+        Fold the journal into the main configuration file
+        
+        Returns:
+            True if there was nothing to compact or the snapshot was written
+        """
+        with self._file_lock.exclusive(), self._lock:
+            if self._dirty:
+                return self.flush()
+            if not self._has_journal():
+                return True
+            try:
+                current = self._load_cached_config()
+            except Exception as e:
+                print(f"⚠ Failed to load configuration for compaction: {e}")
+                return False
+            if self._write_config_file(current):
+                self._write_stats['compactions'] += 1
+                return True
+            return False
+    
+    def flush(self) -> bool:
+        """
+        Write pending write-behind changes to disk
+        
+        Changes other processes wrote in the meantime are merged with the
+        pending configuration rather than overwritten.
+        
+        Returns:
+            True if nothing was pending or the write succeeded
+        """
+        with self._file_lock.exclusive(), self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if not self._dirty:
+                return True
+            pending = self._cached_config
+            if self._disk_config is not None and self._file_signature() != self._cached_signature:
+                try:
+                    pending = _rebase(self._disk_config, pending, self._read_files())
+                    self._write_stats['rebased_saves'] += 1
+                except Exception as e:
+                    print(f"⚠ Failed to merge configuration changed on disk: {e}")
+            return self._write_config_file(pending)
+    
+    def _has_journal(self) -> bool:
+        """Whether any journal (global or per home) holds operations"""
+        if os.path.exists(self.journal_file):
+            return True
+        if self.shard_homes and os.path.isdir(self.shards_dir):
+            return any(name.endswith('.journal') for name in os.listdir(self.shards_dir))
+        return False
+    
+    def _rotate_backup(self, path: Optional[str] = None):
+        """
+        Keep the current file as .backup without re-serializing it
+        
+        The current file is hard-linked to the backup name, so the old
+        contents survive the atomic replace that follows. Filesystems
+        without hard links fall back to a byte copy.
+        """
+        path = path or self.config_file
+        if not os.path.exists(path):
+            return
+        backup_file = path + '.backup'
+        link_file = backup_file + '.tmp'
+        try:
+            if os.path.exists(link_file):
+                os.remove(link_file)
+            os.link(path, link_file)
+            os.replace(link_file, backup_file)
+        except OSError:
+            shutil.copyfile(path, backup_file)
+        self._write_stats['backup_rotations'] += 1
+    
+    def _replace_file(self, path: str, data: bytes):
+        """Write data next to path, rotate the backup and atomically replace path"""
+        temp_file = path + '.tmp'
+        with open(temp_file, 'wb') as f:
+            f.write(data)
+        
+        self._rotate_backup(path)
+        
+        # Atomic replace
+        os.replace(temp_file, path)
+    
+    def _write_shards(self, frozen: Dict[str, Any]) -> int:
+        """
+        Write the global file and the shards of homes whose records changed
+        since they were last read or written. Lock must be held.
+        
+        Returns:
+            Number of bytes written
+        """
+        parts = _split_config(frozen)
+        bytes_written = 0
+        for shard, part in parts.items():
+            path = self._shard_file(shard)
+            journal_file = path + '.journal'
+            if (shard in self._written_parts and self._written_parts[shard] == part
+                    and os.path.exists(path) and not os.path.exists(journal_file)):
+                self._write_stats['shard_writes_skipped'] += 1
+                continue
+            
+            if shard is None:
+                # Record which journal operations the snapshot already contains
+                payload = dict(part, metadata={**(part.get('metadata') or {}), 'journal_seq': self._journal_seq})
+            else:
+                payload = dict(part, home_id=shard, journal_seq=self._journal_seq)
+            data = json_serializer.dumps(payload, pretty=self.pretty)
+            with self._shard_lock(shard):
+                if shard is not None:
+                    os.makedirs(self.shards_dir, exist_ok=True)
+                self._replace_file(path, data)
+                # The shard now contains every operation of its journal
+                if os.path.exists(journal_file):
+                    os.remove(journal_file)
+            self._written_parts[shard] = part
+            if shard is not None:
+                self._shard_seqs[shard] = self._journal_seq
+            self._write_stats['shard_writes'] += 1
+            bytes_written += len(data)
+        
+        # Homes left without records (e.g. deleted homes)
+        for shard in [shard for shard in self._written_parts if shard not in parts]:
+            path = self._shard_file(shard)
+            with self._shard_lock(shard):
+                for stale_file in (path + '.journal', path, path + '.backup'):
+                    if os.path.exists(stale_file):
+                        os.remove(stale_file)
+            self._written_parts.pop(shard)
+            self._shard_seqs.pop(shard, None)
+        return bytes_written
+    
+    def _write_config_file(self, frozen: Dict[str, Any]) -> bool:
+        """Serialize once, rotate the backup and atomically replace the file"""
+        started = time.perf_counter()
+        try:
+            if self.shard_homes:
+                bytes_written = self._write_shards(frozen)
+            else:
+                if self.journal_enabled:
+                    # Record which journal operations the snapshot already contains
+                    frozen, _ = _apply_operation(frozen, {
+                        'op': 'set', 'path': ['metadata', 'journal_seq'], 'value': self._journal_seq
+                    }, copy_on_write=True)
+                data = json_serializer.dumps(frozen, pretty=self.pretty)
+                self._replace_file(self.config_file, data)
+                
+                # The snapshot now contains every journaled operation
+                if os.path.exists(self.journal_file):
+                    os.remove(self.journal_file)
+                bytes_written = len(data)
+            
+            self._cached_config = frozen
+            self._cached_signature = self._file_signature()
+            self._disk_config = frozen
+            self._dirty = False
+            if self._pending_saves > 1:
+                self._write_stats['coalesced_saves'] += self._pending_saves - 1
+            self._pending_saves = 0
+            self._write_stats['file_writes'] += 1
+            self._write_stats['bytes_written'] += bytes_written
+            self._write_stats['last_write_ms'] = round((time.perf_counter() - started) * 1000, 2)
+            return True
+        except Exception as e:
+            self._write_stats['failed_writes'] += 1
+            if not self._dirty:
+                # Write-through failure: readers must not see unsaved data
+                self._cached_config = None
+                self._cached_signature = None
+            print(f"✗ Failed to save configuration: {e}")
+            return False
+    
+    def get_write_stats(self) -> Dict[str, Any]:
+        """
+        Get write statistics
+        
+        write_amplification is file writes per save_config() call: 1.0 in
+        write-through mode, below 1.0 when write-behind coalesces saves.
+        Journaled mutations are counted separately (journal_appends,
+        journal_bytes, compactions).
+        
+        Returns:
+            Dictionary with write counters
+        """
+        with self._lock:
+            stats = dict(self._write_stats)
+            stats['write_behind_window'] = self.write_behind_window
+            stats['shard_homes'] = self.shard_homes
+            stats['serializer'] = json_serializer.BACKEND
+            stats['pending_saves'] = self._pending_saves
+            requests = stats['save_requests']
+            stats['write_amplification'] = round(stats['file_writes'] / requests, 3) if requests else 0.0
+            stats['avg_bytes_per_save'] = int(stats['bytes_written'] / requests) if requests else 0
+            return stats
     
     def update_metadata(self, key: str, value: Any) -> bool:
         """
@@ -246,6 +1313,27 @@ class JSONBackupManager:
         
         return self.save_config(config)
     
+    def export_config(self, export_file: str, pretty: bool = True) -> bool:
+        """
+        Write the current configuration (shards and journal included) to a
+        single JSON file, e.g. for a backup or a hand-edited copy
+        
+        Args:
+            export_file: Destination path
+            pretty: Indent the output
+            
+        Returns:
+            True if successful, False otherwise
+        """
+        try:
+            data = json_serializer.dumps(self.read_config(), pretty=pretty)
+            with open(export_file, 'wb') as f:
+                f.write(data)
+            return True
+        except Exception as e:
+            print(f"✗ Failed to export configuration: {e}")
+            return False
+    
     def get_admin_credentials(self) -> Optional[Dict[str, str]]:
         """
         Get sys-admin credentials (only if just generated)
@@ -260,67 +1348,132 @@ class JSONBackupManager:
             }
         return None
     
+    # ------------------------------------------------------------------
+    # Indexed lookups
+    # ------------------------------------------------------------------
+    
+    def _indexed_config(self) -> Tuple[Dict[str, Any], _ConfigIndex]:
+        """Get the read-only configuration and its (lazily rebuilt) index"""
+        with self._lock:
+            config = self.read_config()
+            if self._index is None or self._index_config is not config:
+                self._index = _ConfigIndex(config)
+                self._index_config = config
+                self._write_stats['index_rebuilds'] += 1
+            return config, self._index
+    
+    def find_device(self, device_id: Any) -> Optional[Tuple[str, int, Dict[str, Any]]]:
+        """
+        Find a button or temperature control by id
+        
+        Returns:
+            Tuple of (list key, position, read-only record) or None
+        """
+        config, index = self._indexed_config()
+        location = index.devices.get(str(device_id))
+        if location is None:
+            return None
+        list_key, position = location
+        return list_key, position, config[list_key][position]
+    
+    def find_room(self, room_id: Any) -> Optional[Dict[str, Any]]:
+        """Find a room by id (read-only record)"""
+        config, index = self._indexed_config()
+        position = index.rooms.get(str(room_id))
+        return config['rooms'][position] if position is not None else None
+    
+    def find_user(self, identifier: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """
+        Find a user by username, email or users key
+        
+        Returns:
+            Tuple of (users key, read-only record) or None
+        """
+        config, index = self._indexed_config()
+        users_key = index.logins.get(identifier)
+        return (users_key, config['users'][users_key]) if users_key is not None else None
+    
+    def find_user_by_id(self, user_id: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """
+        Find a user by id
+        
+        Returns:
+            Tuple of (users key, read-only record) or None
+        """
+        config, index = self._indexed_config()
+        users_key = index.users.get(user_id)
+        return (users_key, config['users'][users_key]) if users_key is not None else None
+    
+    def membership_version(self) -> int:
+        """
+        Counter that changes whenever users, homes or user_homes change
+        
+        Snapshots are copy-on-write, so a change replaces exactly the
+        containers along its path, and a reload after another process's
+        write replaces all of them; comparing the containers by identity
+        catches every change, including routes editing get_config() copies.
+        
+        Returns:
+            Version to compare with the one cached membership data was built from
+        """
+        with self._lock:
+            config = self.read_config()
+            sources = tuple(config.get(key) for key in _MEMBERSHIP_KEYS)
+            previous = self._membership_sources
+            if previous is None or any(source is not seen for source, seen in zip(sources, previous)):
+                # Holding the containers keeps their identities from being reused
+                self._membership_sources = sources
+                self._membership_version += 1
+            return self._membership_version
+    
     def get_user_homes(self, user_id: str) -> list:
         """Get all homes a user has access to in JSON mode"""
-        config = self.get_config()
+        config, index = self._indexed_config()
         user_homes_data = config.get('user_homes', {})
         homes_data = config.get('homes', {})
         
         result = []
-        for home_id, users_list in user_homes_data.items():
-            # Check if this user is in the users_list for this home
-            for user_entry in users_list:
-                if user_entry.get('user_id') == user_id:
-                    home_info = homes_data.get(home_id)
-                    if home_info:
-                        result.append({
-                            'id': home_id,
-                            'name': home_info.get('name', 'Unknown'),
-                            'description': home_info.get('description', ''),
-                            'owner_id': home_info.get('owner_id'),
-                            'role': user_entry.get('role'),
-                            'permissions': user_entry.get('permissions', []),
-                            'joined_at': user_entry.get('joined_at'),
-                            'is_owner': home_info.get('owner_id') == user_id
-                        })
-                    break
+        for home_id, position in index.memberships.get(user_id, []):
+            user_entry = user_homes_data[home_id][position]
+            home_info = homes_data.get(home_id)
+            if home_info:
+                result.append({
+                    'id': home_id,
+                    'name': home_info.get('name', 'Unknown'),
+                    'description': home_info.get('description', ''),
+                    'owner_id': home_info.get('owner_id'),
+                    'role': user_entry.get('role'),
+                    'permissions': list(user_entry.get('permissions', []) or []),
+                    'joined_at': user_entry.get('joined_at'),
+                    'is_owner': home_info.get('owner_id') == user_id
+                })
         
         return result
     
     def get_user_current_home(self, user_id: str) -> Optional[str]:
         """Get the current home ID for a user in JSON mode"""
-        config = self.get_config()
+        config = self.read_config()
         user_current_home = config.get('user_current_home', {})
         return user_current_home.get(user_id)
     
     def set_user_current_home(self, user_id: str, home_id: str) -> bool:
         """Set the current home for a user in JSON mode"""
-        config = self.get_config()
-        if 'user_current_home' not in config:
-            config['user_current_home'] = {}
-        config['user_current_home'][user_id] = home_id
-        return self.save_config(config)
+        return self.set_value(['user_current_home', user_id], home_id)
     
     def get_home_rooms(self, home_id: str) -> list:
         """Get all rooms in a home in JSON mode"""
-        config = self.get_config()
+        config, index = self._indexed_config()
         rooms = config.get('rooms', [])
-        return [room for room in rooms if room.get('home_id') == home_id]
+        return [_thaw(rooms[index.rooms[room_id]]) for room_id in index.home_rooms.get(str(home_id), [])]
     
     def get_home_devices(self, home_id: str) -> list:
         """Get all devices in a home in JSON mode"""
-        config = self.get_config()
+        config, index = self._indexed_config()
         devices = []
-        
-        # Get buttons for this home
-        for button in config.get('buttons', []):
-            if button.get('home_id') == home_id:
-                devices.append({**button, 'device_type': 'button'})
-        
-        # Get temperature controls for this home
-        for temp_control in config.get('temperature_controls', []):
-            if temp_control.get('home_id') == home_id:
-                devices.append({**temp_control, 'device_type': 'temperature_control'})
+        for device_id in index.home_devices.get(str(home_id), []):
+            list_key, position = index.devices[device_id]
+            device_type = 'button' if list_key == 'buttons' else 'temperature_control'
+            devices.append({**_thaw(config[list_key][position]), 'device_type': device_type})
         
         return devices
     
@@ -331,8 +1484,18 @@ class JSONBackupManager:
         Returns:
             True if successful, False otherwise
         """
-        with self._lock:
+        with self._file_lock.exclusive(), self._lock:
             try:
+                # Pending write-behind changes are discarded by a reset
+                if self._flush_timer is not None:
+                    self._flush_timer.cancel()
+                    self._flush_timer = None
+                self._dirty = False
+                self._pending_saves = 0
+                self._cached_config = None
+                self._cached_signature = None
+                self._disk_config = None
+                
                 # Backup current config
                 if os.path.exists(self.config_file):
                     backup_file = f"{self.config_file}.reset-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
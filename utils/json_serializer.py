@@ -0,0 +1,81 @@
+"""
+JSON serialization for the file-based storage
+
+JSONBackupManager, ManagementLogger and SmartHomeSystem persist everything
+as JSON. This module picks the encoder once at import:
+    orjson  when installed (several times faster to dump and load)
+    json    standard library fallback
+
+Files are written compact (no indentation) unless pretty output is asked
+for, e.g. by an export or with JSON_PRETTY=true for hand-edited configs.
+Output is always UTF-8 without ASCII escaping, and either backend reads
+what the other one wrote.
+
+Configuration (environment variables):
+    JSON_SERIALIZER   auto (default) | orjson | json
+    JSON_PRETTY       true to indent persisted files (default: false)
+"""
+import json
+import logging
+import os
+from typing import Any, Union
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _select_backend() -> str:
+    requested = os.getenv('JSON_SERIALIZER', 'auto').lower()
+    if requested == 'json':
+        return 'json'
+    if orjson is None:
+        if requested == 'orjson':
+            logger.warning("JSON_SERIALIZER=orjson but orjson is not installed, using json")
+        return 'json'
+    return 'orjson'
+
+
+BACKEND = _select_backend()
+PRETTY = os.getenv('JSON_PRETTY', 'false').lower() in ('true', '1', 'yes')
+
+
+def dumps(obj: Any, pretty: bool = False) -> bytes:
+    """
+    Serialize to UTF-8 JSON
+
+    Args:
+        obj: JSON-compatible value
+        pretty: Indent the output (orjson indents by 2, json by 4 spaces)
+
+    Returns:
+        Encoded document
+    """
+    if BACKEND == 'orjson':
+        option = orjson.OPT_NON_STR_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, option=option)
+    if pretty:
+        return json.dumps(obj, indent=4, ensure_ascii=False).encode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Parse a JSON document (bytes or str)"""
+    if BACKEND == 'orjson':
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # NaN/Infinity literals written by json are not valid for orjson
+            return json.loads(data)
+    return json.loads(data)
+
+
+def load(path: str) -> Any:
+    """Read and parse a JSON file"""
+    with open(path, 'rb') as f:
+        return loads(f.read())
@@ -0,0 +1,122 @@
+"""
+Management log analytics: event counts by type, level, user and time bucket
+
+MultiHomeDBManager.get_home_log_analytics aggregates in SQL over the
+management_log_hourly rollup, which is kept up to date as logs are
+written, so a chart costs the same whatever the raw log volume. The JSON
+fallback and the file-based ManagementLogger have no rollup and use
+summarize() over their entries instead. All three return the shape built
+by build_summary():
+
+    {
+        'start': ISO, 'end': ISO, 'bucket': 'hour' | 'day', 'total': n,
+        'by_event_type': {event_type: n}, 'by_level': {level: n},
+        'by_user': {username: n},
+        'timeline': [{'bucket': ISO, 'count': n}, ...]   # oldest first, empty buckets omitted
+    }
+
+Counts are per whole hour: start is rounded down to the hour.
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+BUCKETS = ('hour', 'day')
+# Range used when the caller gives no start
+DEFAULT_SPAN = {'hour': timedelta(hours=24), 'day': timedelta(days=30)}
+
+
+def _as_local(value: Any) -> datetime:
+    """ISO string or datetime -> aware local datetime (naive values are local time)"""
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value))
+    return value.astimezone()
+
+
+def bucket_start(moment: Any, bucket: str = 'hour') -> datetime:
+    """Start of the hour or day a moment falls into, in local time"""
+    moment = _as_local(moment).replace(minute=0, second=0, microsecond=0)
+    if bucket == 'day':
+        moment = moment.replace(hour=0)
+    return moment
+
+
+def resolve_range(start: Any = None, end: Any = None, bucket: str = 'hour') -> Tuple[datetime, datetime]:
+    """
+    Validate and default an analytics range
+
+    Args:
+        start: ISO string or datetime; defaults to 24 hours (hour buckets)
+            or 30 days (day buckets) before end
+        end: ISO string or datetime (exclusive); defaults to now
+        bucket: 'hour' or 'day'
+
+    Returns:
+        (start rounded down to the hour, end) as aware local datetimes
+
+    Raises:
+        ValueError: Unknown bucket, malformed dates or an empty range
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of: {', '.join(BUCKETS)}")
+    end_dt = _as_local(end) if end else datetime.now().astimezone()
+    start_dt = _as_local(start) if start else end_dt - DEFAULT_SPAN[bucket]
+    start_dt = bucket_start(start_dt)
+    if start_dt >= end_dt:
+        raise ValueError("start must be before end")
+    return start_dt, end_dt
+
+
+def build_summary(start: datetime, end: datetime, bucket: str,
+                  groups: Iterable[Tuple[Optional[str], Optional[str], Optional[str], int]],
+                  timeline: Iterable[Tuple[Any, int]]) -> Dict[str, Any]:
+    """
+    Assemble the analytics response
+
+    Args:
+        groups: (event_type, level, username, count) per combination
+        timeline: (bucket start, count) per non-empty bucket
+    """
+    by_event_type, by_level, by_user = Counter(), Counter(), Counter()
+    total = 0
+    for event_type, level, username, count in groups:
+        count = int(count)
+        total += count
+        by_event_type[event_type or 'general'] += count
+        by_level[level or ''] += count
+        by_user[username or ''] += count
+    points = sorted((_as_local(moment), int(count)) for moment, count in timeline)
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'bucket': bucket,
+        'total': total,
+        'by_event_type': dict(by_event_type.most_common()),
+        'by_level': dict(by_level.most_common()),
+        'by_user': dict(by_user.most_common()),
+        'timeline': [{'bucket': moment.isoformat(), 'count': count} for moment, count in points],
+    }
+
+
+def summarize(events: Iterable[Tuple[Any, Optional[str], Optional[str], Optional[str]]],
+              start: datetime, end: datetime, bucket: str) -> Dict[str, Any]:
+    """
+    Aggregate raw entries in Python (backends without a rollup)
+
+    Args:
+        events: (timestamp, event_type, level, username) per log entry;
+            entries outside [start, end) or with bad timestamps are skipped
+    """
+    groups, timeline = Counter(), Counter()
+    for timestamp, event_type, level, username in events:
+        try:
+            moment = _as_local(timestamp)
+        except (TypeError, ValueError):
+            continue
+        if not start <= moment < end:
+            continue
+        groups[(event_type, level, username)] += 1
+        timeline[bucket_start(moment, bucket)] += 1
+    return build_summary(start, end, bucket,
+                         (key + (count,) for key, count in groups.items()),
+                         timeline.items())
@@ -0,0 +1,176 @@
+"""
+Retention for management_logs and automation_executions
+
+Both tables only ever grow: every admin action and every automation run
+adds a row. LogRetentionJob deletes rows older than the configured number
+of days, home by home and in bounded batches (DELETE ... LIMIT through the
+(home_id, timestamp) / (automation_id, executed_at) indexes), so each
+transaction stays short and never locks a whole table. A run stops after
+LOG_RETENTION_MAX_BATCHES batches per home and table; the rest is picked
+up by the next run.
+
+With archiving enabled the expired rows are first appended to gzip
+compressed JSONL files under backups/archive/ (one file per table and
+run). Each batch is written and synced before its DELETE commits, so a
+crash never loses rows that were not archived.
+
+The job is registered with utils.background_scheduler and runs daily.
+Every gunicorn worker registers it, so a run takes a non-blocking
+exclusive lock on LOG_RETENTION_LOCK_FILE and a worker that finds the
+lock held skips its run instead of purging (and archiving) the same rows.
+
+Configuration (environment variables):
+    LOG_RETENTION_ENABLED                 false to disable the daily job (default: true)
+    LOG_RETENTION_TIME                    Daily run time, HH:MM (default: 03:30)
+    MANAGEMENT_LOG_RETENTION_DAYS         Days management logs are kept (default: 90, 0 keeps all)
+    AUTOMATION_EXECUTION_RETENTION_DAYS   Days automation executions are kept (default: 30, 0 keeps all)
+    LOG_RETENTION_BATCH_SIZE              Rows per DELETE (default: 1000)
+    LOG_RETENTION_MAX_BATCHES             Batches per home and table in one run (default: 100)
+    LOG_RETENTION_BATCH_PAUSE             Seconds to sleep between batches (default: 0.05)
+    LOG_RETENTION_ARCHIVE                 true to archive rows before deleting them (default: false)
+    LOG_RETENTION_ARCHIVE_DIR             Archive directory (default: backups/archive)
+    LOG_RETENTION_LOCK_FILE               Lock file shared by the workers (default: backups/log_retention.lock)
+"""
+import gzip
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from utils import json_serializer
+from utils.file_lock import InterProcessLock
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Table -> (retention days env variable, default days, MultiHomeDBManager purge method)
+_TABLES = {
+    'management_logs': ('MANAGEMENT_LOG_RETENTION_DAYS', 90, 'purge_expired_management_logs'),
+    'automation_executions': ('AUTOMATION_EXECUTION_RETENTION_DAYS', 30, 'purge_expired_automation_executions'),
+}
+
+
+class LogRetentionJob:
+    """Deletes (and optionally archives) expired log rows in bounded batches"""
+
+    def __init__(self, multi_db, retention_days: Optional[Dict[str, int]] = None,
+                 batch_size: Optional[int] = None, max_batches: Optional[int] = None,
+                 batch_pause: Optional[float] = None, archive: Optional[bool] = None,
+                 archive_dir: Optional[str] = None, lock_file: Optional[str] = None):
+        """
+        Initialize the job
+
+        Args:
+            multi_db: MultiHomeDBManager (PostgreSQL, SQLite or JSON backend)
+            retention_days: Days kept per table (default: *_RETENTION_DAYS env)
+            batch_size: Rows per DELETE (default: LOG_RETENTION_BATCH_SIZE env)
+            max_batches: Batches per home and table (default: LOG_RETENTION_MAX_BATCHES env)
+            batch_pause: Seconds between batches (default: LOG_RETENTION_BATCH_PAUSE env)
+            archive: Archive rows before deleting (default: LOG_RETENTION_ARCHIVE env)
+            archive_dir: Archive directory (default: LOG_RETENTION_ARCHIVE_DIR env)
+            lock_file: Run lock file (default: LOG_RETENTION_LOCK_FILE env)
+        """
+        self.multi_db = multi_db
+        self.enabled = os.getenv('LOG_RETENTION_ENABLED', 'true').lower() in ('true', '1', 'yes')
+        self.run_time = os.getenv('LOG_RETENTION_TIME', '03:30')
+        self.retention_days = {
+            table: int(os.getenv(env, str(default)))
+            for table, (env, default, _) in _TABLES.items()
+        }
+        self.retention_days.update(retention_days or {})
+        self.batch_size = max(1, batch_size or int(os.getenv('LOG_RETENTION_BATCH_SIZE', '1000')))
+        self.max_batches = max(1, max_batches or int(os.getenv('LOG_RETENTION_MAX_BATCHES', '100')))
+        self.batch_pause = (batch_pause if batch_pause is not None
+                            else float(os.getenv('LOG_RETENTION_BATCH_PAUSE', '0.05')))
+        self.archive = (archive if archive is not None
+                        else os.getenv('LOG_RETENTION_ARCHIVE', 'false').lower() in ('true', '1', 'yes'))
+        self.archive_dir = archive_dir or os.getenv('LOG_RETENTION_ARCHIVE_DIR',
+                                                    os.path.join(BASE_DIR, 'backups', 'archive'))
+        self.last_report: Optional[Dict[str, Any]] = None
+        self._run_lock = InterProcessLock(lock_file or os.getenv(
+            'LOG_RETENTION_LOCK_FILE', os.path.join(BASE_DIR, 'backups', 'log_retention.lock')))
+
+    def _archive_rows(self, path: str, rows: List[Dict]):
+        """Append rows to a gzip JSONL file as one gzip member and sync it"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'ab') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as archive:
+                archive.write(b''.join(json_serializer.dumps(row) + b'\n' for row in rows))
+            raw.flush()
+            os.fsync(raw.fileno())
+
+    def _purge_table(self, table: str, home_ids: List[Optional[str]], stamp: str) -> Dict[str, Any]:
+        """Delete the expired rows of one table, home by home"""
+        days = self.retention_days.get(table, 0)
+        result = {'retention_days': days, 'deleted': 0, 'archived': 0, 'batches': 0,
+                  'homes': 0, 'complete': True, 'archive_file': None}
+        if days <= 0:
+            return result
+
+        cutoff = datetime.now().astimezone() - timedelta(days=days)
+        purge = getattr(self.multi_db, _TABLES[table][2])
+        archive_path = os.path.join(self.archive_dir, f"{table}-{stamp}.jsonl.gz")
+
+        def archive(rows):
+            self._archive_rows(archive_path, rows)
+            result['archived'] += len(rows)
+            result['archive_file'] = archive_path
+
+        for home_id in home_ids:
+            home_deleted = 0
+            for batch in range(self.max_batches):
+                deleted = purge(home_id, cutoff, self.batch_size, archive if self.archive else None)
+                result['batches'] += 1
+                home_deleted += deleted
+                if deleted < self.batch_size:
+                    break
+                if batch == self.max_batches - 1:
+                    # Left for the next run
+                    result['complete'] = False
+                elif self.batch_pause:
+                    time.sleep(self.batch_pause)
+            if home_deleted:
+                result['deleted'] += home_deleted
+                result['homes'] += 1
+        return result
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Run one retention pass over all homes
+
+        Returns:
+            Report: per-table deleted/archived row counts, batches, homes
+            touched and whether everything expired was removed, plus the
+            duration in milliseconds. A run that finds another one in
+            progress, in this or another process, returns {'skipped': True}.
+        """
+        if not self._run_lock.acquire(exclusive=True, blocking=False):
+            return {'skipped': True}
+        try:
+            started = time.perf_counter()
+            started_at = datetime.now()
+            # None covers rows that belong to no home
+            home_ids: List[Optional[str]] = list(self.multi_db.get_all_home_ids()) + [None]
+            stamp = started_at.strftime('%Y%m%d%H%M%S')
+            report: Dict[str, Any] = {'started_at': started_at.isoformat(), 'tables': {}}
+            for table in _TABLES:
+                try:
+                    report['tables'][table] = self._purge_table(table, home_ids, stamp)
+                except Exception as e:
+                    logger.error(f"Log retention failed for {table}: {e}")
+                    report['tables'][table] = {'error': str(e)}
+            report['duration_ms'] = round((time.perf_counter() - started) * 1000, 2)
+            self.last_report = report
+
+            summary = ', '.join(
+                f"{table}: {result['deleted']} removed" + (f", {result['archived']} archived" if result['archived'] else '')
+                if 'error' not in result else f"{table}: failed"
+                for table, result in report['tables'].items()
+            )
+            logger.info(f"Log retention finished in {report['duration_ms']} ms ({summary})")
+            print(f"✓ Log retention finished in {report['duration_ms']:.0f} ms ({summary})")
+            return report
+        finally:
+            self._run_lock.release()
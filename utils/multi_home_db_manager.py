@@ -1,20 +1,54 @@
 import psycopg2
+import psycopg2.extras
+import base64
+import copy
 import json
 import uuid
 import os
 from datetime import datetime, timedelta, timezone
-from typing import List, Dict, Optional, Any, Tuple
+from typing import Callable, List, Dict, Optional, Any, Tuple
 from contextlib import contextmanager
+from functools import wraps
 import logging
+import threading
+import time
 from psycopg2 import errors, sql
 
+from utils import log_analytics
+from utils.db_pool import ConnectionPool
+from utils.log_analytics import bucket_start
+
 logger = logging.getLogger(__name__)
 
+_POOL_INIT_LOCK = threading.Lock()
+
+
+def _invalidates_membership(method):
+    """Bump the membership version once a method that changes homes,
+    memberships or roles has run (successfully or not)."""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.invalidate_membership_cache()
+    return wrapper
+
 class MultiHomeDBManager:
     """
     Database manager for multi-home smart home system.
     Handles all database operations with home context isolation.
     """
+
+    # Device columns accepted by batch_update_devices, with their SQL types
+    _BATCH_DEVICE_COLUMNS = {
+        'name': 'varchar',
+        'state': 'boolean',
+        'temperature': 'numeric',
+        'enabled': 'boolean',
+        'room_id': 'uuid',
+        'display_order': 'integer',
+    }
     
     def __init__(self, host: Optional[str] = None, port: Optional[int] = None, 
                  user: Optional[str] = None, password: Optional[str] = None, 
@@ -31,24 +65,66 @@ class MultiHomeDBManager:
         # JSON fallback mode flag
         self.json_fallback_mode = False
         self.json_backup = None
+
+        # Storage backend: 'postgresql', or 'sqlite' / 'json' when falling back
+        self.backend = 'postgresql'
+        self.sqlite_db = None
+
+        # Cross-request membership snapshots, see _get_membership. Versions
+        # are per process until share_membership_versions() is called, so
+        # the TTL alone bounds how long other workers see a revoked role.
+        self.membership_cache_ttl = float(os.getenv('MEMBERSHIP_CACHE_TTL', '5'))
+        self._reset_membership_cache()
         
         # Validate required database configuration
+        self._pool = None
+        self._local = threading.local()
+        self._log_rollup_available = False
         if not self.host or not self.user or not self.password or not self.database:
-            print("⚠ Missing database configuration, activating JSON fallback mode")
-            self._activate_json_fallback()
+            print("⚠ Missing database configuration, activating fallback mode")
+            self._activate_fallback()
             return
         
         try:
-            self._connection = None
             self._ensure_connection()
             self._ensure_security_state_table()
             self._ensure_automation_table()
             self._ensure_invitations_table()
+            self._ensure_management_log_indexes()
+            self._ensure_management_log_rollup()
             print("✓ Multi-home database manager initialized with PostgreSQL")
         except Exception as e:
             print(f"⚠ PostgreSQL connection failed: {e}")
-            print("⚠ Activating JSON fallback mode for multi-home manager")
-            self._activate_json_fallback()
+            print("⚠ Activating fallback mode for multi-home manager")
+            self._activate_fallback()
+    
+    def _activate_fallback(self):
+        """Activate the fallback backend chosen by DB_FALLBACK_BACKEND (json or sqlite)"""
+        if os.getenv('DB_FALLBACK_BACKEND', 'json').lower() == 'sqlite':
+            try:
+                self._activate_sqlite_fallback()
+                return
+            except Exception as e:
+                logger.error(f"Failed to activate SQLite fallback: {e}")
+                print(f"⚠ SQLite fallback failed ({e}), using JSON fallback")
+        self._activate_json_fallback()
+    
+    def _activate_sqlite_fallback(self):
+        """Activate the embedded SQLite backend; all SQL paths stay in use"""
+        from utils.sqlite_backend import SQLiteDatabase
+        self._close_pool()
+        sqlite_db = SQLiteDatabase()
+        sqlite_db.initialize()
+        self.sqlite_db = sqlite_db
+        self.backend = 'sqlite'
+        try:
+            self._ensure_connection()
+        except Exception:
+            self.sqlite_db = None
+            self.backend = 'postgresql'
+            raise
+        self._ensure_management_log_rollup()
+        print(f"✓ Multi-home manager: SQLite fallback mode activated ({sqlite_db.path})")
     
     def _activate_json_fallback(self):
         """Activate JSON backup fallback mode"""
@@ -56,7 +132,8 @@ class MultiHomeDBManager:
         try:
             self.json_backup = ensure_json_backup()
             self.json_fallback_mode = True
-            self._connection = None
+            self.backend = 'json'
+            self._close_pool()
             print("✓ Multi-home manager: JSON fallback mode activated")
         except Exception as e:
             logger.error(f"Failed to activate JSON fallback: {e}")
@@ -64,56 +141,110 @@ class MultiHomeDBManager:
 
     @contextmanager
     def get_cursor(self):
-        """Context manager for database cursor with automatic transaction handling."""
+        """
+        Context manager for database cursor with automatic transaction handling.
+
+        Each thread checks out its own pooled connection; the transaction is
+        committed when the outermost ``get_cursor`` block exits and rolled back
+        on error. Nested calls on the same thread reuse the checked-out
+        connection so helper methods join the caller's transaction; each
+        nested block runs in a SAVEPOINT, so when it fails only its own
+        statements are rolled back and a caller that handles the error can
+        go on with its transaction.
+        """
         if self.json_fallback_mode:
             # In JSON mode, yield a dummy cursor that does nothing
             yield None
             return
-        
-        cursor = None
-        try:
-            self._ensure_connection()
-            if self._connection:
-                cursor = self._connection.cursor()
+
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            depth = getattr(self._local, 'savepoints', 0) + 1
+            savepoint = f"nested_cursor_{depth}"
+            cursor = connection.cursor()
+            self._local.savepoints = depth
+            try:
+                cursor.execute(f"SAVEPOINT {savepoint}")
                 yield cursor
-                self._connection.commit()
+                cursor.execute(f"RELEASE SAVEPOINT {savepoint}")
+            except BaseException:
+                try:
+                    cursor.execute(f"ROLLBACK TO SAVEPOINT {savepoint}")
+                    cursor.execute(f"RELEASE SAVEPOINT {savepoint}")
+                except Exception as rollback_error:
+                    logger.error(f"Failed to roll back to savepoint {savepoint}: {rollback_error}")
+                raise
+            finally:
+                self._local.savepoints = depth - 1
+                cursor.close()
+            return
+
+        self._ensure_connection()
+        try:
+            with self._pool.connection() as connection:
+                self._local.connection = connection
+                cursor = connection.cursor()
+                try:
+                    yield cursor
+                finally:
+                    self._local.connection = None
+                    cursor.close()
         except Exception as e:
-            if self._connection:
-                self._connection.rollback()
             logger.error(f"Database operation failed: {e}")
             raise
-        finally:
-            if cursor:
-                cursor.close()
+
+    def _connect(self):
+        """Open a new raw PostgreSQL (or SQLite fallback) connection for the pool."""
+        if self.sqlite_db is not None:
+            return self.sqlite_db.connect()
+        return psycopg2.connect(
+            host=self.host,
+            port=self.port,
+            user=self.user,
+            password=self.password,
+            database=self.database,
+            connect_timeout=self.connection_timeout
+        )
 
     def _ensure_connection(self):
-        """Ensure database connection is active."""
+        """Ensure the connection pool is initialized."""
         if self.json_fallback_mode:
             return  # Skip DB connection in JSON mode
-        
-        if self._connection is None or self._connection.closed:
-            try:
-                self._connection = psycopg2.connect(
-                    host=self.host,
-                    port=self.port,
-                    user=self.user,
-                    password=self.password,
-                    database=self.database,
-                    connect_timeout=self.connection_timeout
-                )
-                logger.info(f"Connected to database {self.database}")
-            except Exception as e:
-                logger.error(f"Failed to connect to database: {e}")
-                raise
+
+        if self._pool is None:
+            with _POOL_INIT_LOCK:
+                if self._pool is None:
+                    try:
+                        self._pool = ConnectionPool.from_env(self._connect)
+                        logger.info(
+                            f"Connected to {self.backend} database {self.sqlite_db.path if self.sqlite_db else self.database} "
+                            f"(pool {self._pool.min_size}-{self._pool.max_size})"
+                        )
+                    except Exception as e:
+                        logger.error(f"Failed to connect to database: {e}")
+                        raise
+
+    def _close_pool(self):
+        """Close the connection pool if one was created."""
+        pool = getattr(self, '_pool', None)
+        self._pool = None
+        if pool is not None:
+            pool.close()
 
     def close_connection(self):
-        """Close database connection."""
+        """Close all pooled database connections."""
         if self.json_fallback_mode:
             return  # Nothing to close in JSON mode
-        
-        if self._connection and not self._connection.closed:
-            self._connection.close()
-            logger.info("Database connection closed")
+
+        if self._pool is not None:
+            self._close_pool()
+            logger.info("Database connection pool closed")
+
+    def get_pool_status(self) -> Dict[str, Any]:
+        """Get connection pool occupancy and wait-time statistics."""
+        if self.json_fallback_mode or self._pool is None:
+            return {'pool_enabled': False}
+        return self._pool.get_stats()
 
     def test_connection(self) -> bool:
         """Verify database connectivity by executing a simple query."""
@@ -380,10 +511,34 @@ class MultiHomeDBManager:
             cursor.execute(index_sql_1)
             cursor.execute(index_sql_2)
 
+    def _ensure_management_log_indexes(self):
+        """Ensure the indexes used by keyset-paginated log pages and the retention job exist."""
+        if self.json_fallback_mode:
+            return
+        statements = [
+            """
+                CREATE INDEX IF NOT EXISTS idx_management_logs_home_time
+                ON management_logs (home_id, timestamp DESC, id DESC)
+            """,
+            # The composite index also serves home_id-only lookups
+            "DROP INDEX IF EXISTS idx_management_logs_home",
+            """
+                CREATE INDEX IF NOT EXISTS idx_automation_executions_time
+                ON automation_executions (automation_id, executed_at)
+            """,
+        ]
+        for statement in statements:
+            try:
+                with self.get_cursor() as cursor:
+                    cursor.execute(statement)
+            except Exception as e:
+                logger.warning(f"Could not ensure log index: {e}")
+
     # ============================================================================
     # HOME MANAGEMENT
     # ============================================================================
 
+    @_invalidates_membership
     def create_home(self, name: str, owner_id: str, description: Optional[str] = None) -> int:
         """Create a new home and return its ID."""
         if self.json_fallback_mode and self.json_backup:
@@ -445,47 +600,9 @@ class MultiHomeDBManager:
 
     def get_user_homes(self, user_id: str) -> List[Dict]:
         """Get all homes a user has access to. Users (including sys-admins) only see homes they are explicitly members of."""
-        # JSON fallback support
-        if self.json_fallback_mode and self.json_backup:
-            return self.json_backup.get_user_homes(user_id)
-        
-        with self.get_cursor() as cursor:
-            if cursor is None:  # Safety check
-                return []
-            
-            # All users - only homes they're explicitly members of via user_homes
-            cursor.execute("""
-                SELECT h.id, h.name, h.description, h.owner_id, 
-                       uh.role, uh.permissions, uh.joined_at,
-                       (h.owner_id = %s) as is_owner
-                FROM homes h
-                JOIN user_homes uh ON h.id = uh.home_id
-                WHERE uh.user_id = %s
-                ORDER BY h.name
-            """, (user_id, user_id))
-            
-            homes = []
-            for row in cursor.fetchall():
-                # Handle permissions - might already be parsed by psycopg2
-                permissions = row[5]
-                if isinstance(permissions, str):
-                    permissions = json.loads(permissions) if permissions else []
-                elif permissions is None:
-                    permissions = []
-                    
-                homes.append({
-                    'id': row[0],
-                    'name': row[1],
-                    'description': row[2],
-                    'owner_id': row[3],
-                    'role': row[4],
-                    'permissions': permissions,
-                    'joined_at': row[6],
-                    'is_owner': row[7]
-                })
-            
-            return homes
+        return [dict(home) for home in self._get_membership(user_id)['homes']]
 
+    @_invalidates_membership
     def update_home_info(self, home_id: str, name: str, description: Optional[str] = None) -> bool:
         """Update basic home information (name and description)."""
         if self.json_fallback_mode and self.json_backup:
@@ -519,6 +636,7 @@ class MultiHomeDBManager:
                 logger.warning(f"No home found with ID {home_id} to update")
                 return False
 
+    @_invalidates_membership
     def update_home_location(
         self, 
         home_id: str, 
@@ -610,6 +728,7 @@ class MultiHomeDBManager:
                 logger.warning(f"No home found with ID {home_id} to update location")
                 return False
 
+    @_invalidates_membership
     def delete_home_completely(self, home_id: str) -> bool:
         """
         Delete a home and all associated data.
@@ -674,156 +793,269 @@ class MultiHomeDBManager:
 
     def get_home_details(self, home_id: str, user_id: str) -> Optional[Dict]:
         """Get detailed information about a home if user has access."""
-        # JSON fallback support
+        details = self._get_membership(user_id)['details'].get(str(home_id))
+        return dict(details) if details else None
+
+    # ============================================================================
+    # MEMBERSHIP SNAPSHOTS
+    # ============================================================================
+
+    @staticmethod
+    def _request_memo() -> Optional[Dict]:
+        """Return the membership memo of the current Flask request, if any."""
+        try:
+            from flask import g, has_request_context, request
+        except ImportError:
+            return None
+        if not has_request_context():
+            return None
+        # g can outlive a single request when an app context is pushed manually,
+        # so tie the memo to the request object itself
+        current_request = request._get_current_object()
+        memo = g.get('_membership_memo')
+        if memo is None or memo[0] is not current_request:
+            memo = (current_request, {})
+            g._membership_memo = memo
+        return memo[1]
+
+    def _load_membership(self, user_id: str) -> Dict:
+        """Load a user's sys-admin flag and every home membership in one query."""
         if self.json_fallback_mode and self.json_backup:
+            config = self.json_backup.read_config()
+            is_sys_admin = any(
+                user_entry.get('id') == user_id and user_entry.get('role') in ['sys-admin', 'admin']
+                for user_entry in config.get('users', {}).values()
+            )
             homes = self.json_backup.get_user_homes(user_id)
-            for home in homes:
-                if home['id'] == home_id:
-                    return home
-            return None
-        
+            details = {str(home['id']): home for home in homes}
+            return {'is_sys_admin': is_sys_admin, 'homes': homes, 'details': details}
+
         with self.get_cursor() as cursor:
             if cursor is None:  # Safety check
-                return None
-            
+                return {'is_sys_admin': False, 'homes': [], 'details': {}}
             cursor.execute("""
-                SELECT h.id, h.name, h.description, h.owner_id, h.created_at,
-                       uh.role, uh.permissions,
-                       (h.owner_id = %s) as is_owner,
+                SELECT u.role, h.id, h.name, h.description, h.owner_id,
+                       uh.role, uh.permissions, uh.joined_at,
+                       (h.owner_id = u.id) as is_owner, h.created_at,
                        h.address, h.latitude, h.longitude, h.city, h.country,
                        h.street, h.house_number, h.apartment_number, h.postal_code
-                FROM homes h
-                JOIN user_homes uh ON h.id = uh.home_id
-                WHERE h.id = %s AND uh.user_id = %s
-            """, (user_id, home_id, user_id))
-            
-            row = cursor.fetchone()
-            if not row:
-                return None
-                
+                FROM users u
+                LEFT JOIN user_homes uh ON uh.user_id = u.id
+                LEFT JOIN homes h ON h.id = uh.home_id
+                WHERE u.id = %s
+                ORDER BY h.name
+            """, (user_id,))
+            rows = cursor.fetchall()
+
+        homes = []
+        details = {}
+        for row in rows:
+            if row[1] is None:
+                continue
             # Handle permissions - might already be parsed by psycopg2
             permissions = row[6]
             if isinstance(permissions, str):
                 permissions = json.loads(permissions) if permissions else []
             elif permissions is None:
                 permissions = []
-            
-            return {
-                'id': row[0],
-                'name': row[1],
-                'description': row[2],
-                'owner_id': row[3],
-                'created_at': row[4],
+            homes.append({
+                'id': row[1],
+                'name': row[2],
+                'description': row[3],
+                'owner_id': row[4],
                 'role': row[5],
                 'permissions': permissions,
-                'is_owner': row[7],
-                'address': row[8],
-                'latitude': float(row[9]) if row[9] is not None else None,
-                'longitude': float(row[10]) if row[10] is not None else None,
-                'city': row[11],
-                'country': row[12],
-                'street': row[13],
-                'house_number': row[14],
-                'apartment_number': row[15],
-                'postal_code': row[16]
+                'joined_at': row[7],
+                'is_owner': row[8]
+            })
+            # Same shape get_home_details has always returned
+            details[str(row[1])] = {
+                'id': row[1],
+                'name': row[2],
+                'description': row[3],
+                'owner_id': row[4],
+                'created_at': row[9],
+                'role': row[5],
+                'permissions': permissions,
+                'is_owner': row[8],
+                'address': row[10],
+                'latitude': float(row[11]) if row[11] is not None else None,
+                'longitude': float(row[12]) if row[12] is not None else None,
+                'city': row[13],
+                'country': row[14],
+                'street': row[15],
+                'house_number': row[16],
+                'apartment_number': row[17],
+                'postal_code': row[18]
+            }
+        return {
+            'is_sys_admin': bool(rows) and rows[0][0] == 'sys-admin',
+            'homes': homes,
+            'details': details
+        }
+
+    def _reset_membership_cache(self):
+        """Initialise the cross-request membership snapshot cache."""
+        self._membership_lock = threading.Lock()
+        self._membership_cache = {}
+        self._membership_versions = {}
+        self._membership_global_version = 0
+        # CacheManager holding versions shared by all workers, if any
+        self._membership_generations = None
+
+    def share_membership_versions(self, cache_manager):
+        """
+        Keep membership versions in a cache shared by all workers (Redis)
+
+        An invalidation in one worker then reloads the snapshots of every
+        worker, so snapshots can be kept for MEMBERSHIP_SHARED_CACHE_TTL
+        instead of the short per-process MEMBERSHIP_CACHE_TTL.
+
+        Args:
+            cache_manager: CacheManager whose generation counters
+                (gen:membership, gen:membership:<user_id>) hold the versions
+        """
+        with self._membership_lock:
+            self._membership_generations = cache_manager
+            self._membership_cache.clear()
+        self.membership_cache_ttl = float(os.getenv('MEMBERSHIP_SHARED_CACHE_TTL', '300'))
+
+    def _membership_version(self, key: str, source_version: Tuple) -> Tuple:
+        """Version of a user's snapshot. _membership_lock must be held."""
+        return (self._membership_global_version, self._membership_versions.get(key, 0)) + source_version
+
+    def _membership_source_version(self, key: str) -> Tuple:
+        """
+        Version parts kept outside this process: the shared generations,
+        and the JSON configuration's, which routes change without calling
+        invalidate_membership_cache() (they edit user_homes and roles directly).
+        """
+        version = ()
+        if self.json_fallback_mode and self.json_backup:
+            version += (self.json_backup.membership_version(),)
+        generations = self._membership_generations
+        if generations is not None:
+            try:
+                version += tuple(generations.get_generations(('membership',), ('membership', key)))
+            except Exception as e:
+                logger.warning(f"Shared membership versions unavailable: {e}")
+                # Matches no cached snapshot, so it is loaded from the source
+                version += (uuid.uuid4().hex,)
+        return version
+
+    def _get_membership(self, user_id: str) -> Dict:
+        """
+        Get a user's membership snapshot.
+
+        The snapshot answers home access, role, permission and sys-admin
+        checks without further queries. It is memoized for the current
+        request and cached across requests until the membership version of
+        the user changes (see invalidate_membership_cache), the JSON
+        configuration's users, homes or memberships change, or
+        MEMBERSHIP_CACHE_TTL seconds pass, which bounds staleness after
+        changes made outside this process.
+        """
+        key = str(user_id)
+        memo = self._request_memo()
+        if memo is not None and key in memo:
+            return memo[key]
+
+        source_version = self._membership_source_version(key)
+        with self._membership_lock:
+            version = self._membership_version(key, source_version)
+            cached = self._membership_cache.get(key)
+        if (cached is not None and cached[0] == version
+                and time.monotonic() - cached[1] < self.membership_cache_ttl):
+            snapshot = cached[2]
+        else:
+            loaded_at = time.monotonic()
+            snapshot = self._load_membership(key)
+            snapshot['roles'] = {
+                str(home['id']): (home.get('role'), home.get('permissions') or [])
+                for home in snapshot['homes']
+            }
+            with self._membership_lock:
+                # A bump during the load leaves the entry stale on arrival
+                self._membership_cache[key] = (version, loaded_at, snapshot)
+
+        if memo is not None:
+            memo[key] = snapshot
+        return snapshot
+
+    def invalidate_membership_cache(self, user_id: Optional[str] = None):
+        """
+        Bump the membership version so cached snapshots are reloaded.
+
+        Call after changing roles, permissions or memberships outside this
+        manager (e.g. raw SQL in a route). Without user_id every user's
+        snapshot is invalidated. With shared versions the snapshots of
+        other workers are invalidated too.
+        """
+        with self._membership_lock:
+            if user_id is None:
+                self._membership_global_version += 1
+                self._membership_cache.clear()
+            else:
+                key = str(user_id)
+                self._membership_versions[key] = self._membership_versions.get(key, 0) + 1
+                self._membership_cache.pop(key, None)
+            generations = self._membership_generations
+        if generations is not None:
+            try:
+                if user_id is None:
+                    generations.bump_generation('membership')
+                else:
+                    generations.bump_generation('membership', str(user_id))
+            except Exception as e:
+                logger.error(f"Failed to publish membership invalidation: {e}")
+
+        memo = self._request_memo()
+        if memo is None:
+            return
+        if user_id is None:
+            memo.clear()
+        else:
+            memo.pop(str(user_id), None)
+
+    def get_membership_cache_stats(self) -> Dict[str, Any]:
+        """Get cross-request membership cache statistics."""
+        with self._membership_lock:
+            return {
+                'cached_users': len(self._membership_cache),
+                'global_version': self._membership_global_version,
+                'shared_versions': self._membership_generations is not None,
+                'ttl_seconds': self.membership_cache_ttl
             }
 
     def user_has_home_access(self, user_id: str, home_id: str) -> bool:
         """Check if user has access to a specific home. Only users explicitly added to home have access."""
-        # JSON fallback support
-        if self.json_fallback_mode and self.json_backup:
-            homes = self.json_backup.get_user_homes(user_id)
-            return any(home['id'] == home_id for home in homes)
-        
-        with self.get_cursor() as cursor:
-            if cursor is None:  # Safety check
-                return False
-            
-            cursor.execute("""
-                SELECT 1 FROM user_homes 
-                WHERE user_id = %s AND home_id = %s
-            """, (user_id, home_id))
-            
-            return cursor.fetchone() is not None
+        return str(home_id) in self._get_membership(user_id)['roles']
             
     def is_sys_admin(self, user_id: str) -> bool:
         """Check if user has system administrator role."""
-        # JSON fallback support
-        if self.json_fallback_mode and self.json_backup:
-            config = self.json_backup.get_config()
-            users = config.get('users', {})
-            for user_entry in users.values():
-                if user_entry.get('id') == user_id:
-                    return user_entry.get('role') in ['sys-admin', 'admin']
-            return False
-
-        with self.get_cursor() as cursor:
-            if cursor is None:  # Safety check
-                return False
-            cursor.execute("""
-                SELECT 1 FROM users 
-                WHERE id = %s AND role = 'sys-admin'
-            """, (user_id,))
-            return cursor.fetchone() is not None
+        return self._get_membership(user_id)['is_sys_admin']
 
     def user_has_home_permission(self, user_id: str, home_id: str, permission: str) -> bool:
         """Check if user has specific permission in a home."""
-        # JSON fallback support
-        if self.json_fallback_mode and self.json_backup:
-            # Admin/owner/sys-admin have full permissions
-            role = self.get_user_role_in_home(user_id, home_id)
-            if role in ['admin', 'owner', 'sys-admin']:
-                return True
-            config = self.json_backup.get_config()
-            user_homes = config.get('user_homes', {})
-            for user_entry in user_homes.get(home_id, []):
-                if user_entry.get('user_id') == user_id:
-                    perms = user_entry.get('permissions', []) or []
-                    return permission in perms
-            return False
+        role, permissions = self._get_membership(user_id)['roles'].get(str(home_id), (None, []))
+        return self._role_has_permission(role, permissions, permission)
 
-        with self.get_cursor() as cursor:
-            if cursor is None:  # Safety check
-                return False
-            cursor.execute("""
-                SELECT permissions, role FROM user_homes 
-                WHERE user_id = %s AND home_id = %s
-            """, (user_id, home_id))
-            
-            row = cursor.fetchone()
-            if not row:
-                return False
-                
-            permissions = row[0] if row[0] else []  # Already parsed by psycopg2
-            role = row[1]
-            
-            # Admin, owner, and sys-admin roles have all permissions
-            if role in ['admin', 'owner', 'sys-admin']:
-                return True
-                
-            return permission in permissions
+    @staticmethod
+    def _role_has_permission(role: Optional[str], permissions: Any, permission: str) -> bool:
+        """Evaluate a user_homes (role, permissions) pair against a permission."""
+        if role is None:
+            return False
+        # Admin, owner, and sys-admin roles have all permissions
+        if role in ['admin', 'owner', 'sys-admin']:
+            return True
+        if isinstance(permissions, str):
+            permissions = json.loads(permissions) if permissions else []
+        return permission in (permissions or [])
 
     def get_user_role_in_home(self, user_id: str, home_id: str) -> Optional[str]:
         """Get user's role in a specific home."""
-        # JSON fallback support
-        if self.json_fallback_mode and self.json_backup:
-            homes = self.json_backup.get_user_homes(user_id)
-            for home in homes:
-                if home['id'] == home_id:
-                    return home.get('role')
-            return None
-        
-        with self.get_cursor() as cursor:
-            if cursor is None:  # Safety check
-                return None
-            
-            cursor.execute("""
-                SELECT role FROM user_homes 
-                WHERE user_id = %s AND home_id = %s
-            """, (user_id, home_id))
-            
-            row = cursor.fetchone()
-            return row[0] if row else None
+        role, _ = self._get_membership(user_id)['roles'].get(str(home_id), (None, []))
+        return role
             
     def has_admin_access(self, user_id: str, home_id: Optional[str] = None) -> bool:
         """
@@ -854,6 +1086,29 @@ class MultiHomeDBManager:
         user_homes = self.get_user_homes(user_id)
         return any(home.get('role') in ['admin', 'owner'] for home in user_homes)
 
+    def get_membership_context(self, user_id: str, home_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Get everything page templates need about a user's homes at once.
+
+        Built from the membership snapshot, so it costs at most one query
+        and none while the cached snapshot is current.
+
+        Returns:
+            Dict with current_home, user_homes, is_sys_admin and has_admin_access
+        """
+        snapshot = self._get_membership(user_id)
+        current_home = snapshot['details'].get(str(home_id)) if home_id else None
+        if home_id:
+            has_admin_access = current_home is not None and current_home.get('role') in ['owner', 'admin']
+        else:
+            has_admin_access = any(home.get('role') in ['admin', 'owner'] for home in snapshot['homes'])
+        return {
+            'current_home': dict(current_home) if current_home else None,
+            'user_homes': [dict(home) for home in snapshot['homes']],
+            'is_sys_admin': snapshot['is_sys_admin'],
+            'has_admin_access': has_admin_access
+        }
+
     # ============================================================================
     # HOME ADMIN FUNCTIONS
     # ============================================================================
@@ -941,6 +1196,7 @@ class MultiHomeDBManager:
             
             return users
             
+    @_invalidates_membership
     def add_user_to_home(self, home_id: str, username: str, email: str, password: str, 
                         role: str, admin_user_id: str) -> str:
         """
@@ -1000,7 +1256,9 @@ class MultiHomeDBManager:
                 logger.info(f"Created new user {username} and added to home {home_id} with role {role}")
                 return user_id
                 
-    def get_home_management_logs(self, home_id: str, admin_user_id: str, limit: int = 50) -> List[Dict]:
+    def get_home_management_logs(self, home_id: str, admin_user_id: str, limit: int = 50,
+                                 level: Optional[str] = None,
+                                 event_type: Optional[str] = None) -> List[Dict]:
         """
         Get management logs for a specific home.
         
@@ -1008,26 +1266,90 @@ class MultiHomeDBManager:
             home_id: ID of the home
             admin_user_id: ID of the admin requesting logs
             limit: Maximum number of logs to return
+            level: Only logs of this level
+            event_type: Only logs of this event type
+            
+        Returns:
+            List of log entries for this home, newest first
+        """
+        return self.get_home_management_logs_page(
+            home_id, admin_user_id, limit=limit, level=level, event_type=event_type
+        )['logs']
+
+    @staticmethod
+    def _encode_log_cursor(timestamp: Any, log_id: Any) -> str:
+        """Opaque keyset cursor for the position after a log entry"""
+        if isinstance(timestamp, datetime):
+            timestamp = timestamp.isoformat()
+        raw = json.dumps([str(timestamp or ''), str(log_id or '')], separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+    @staticmethod
+    def _decode_log_cursor(cursor: str) -> Tuple[str, str]:
+        """(timestamp, id) of a cursor; ValueError when it is malformed"""
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            timestamp, log_id = json.loads(raw.decode('utf-8'))
+            datetime.fromisoformat(timestamp)
+            # A malformed id would otherwise fail the ::uuid cast in the query
+            log_id = str(uuid.UUID(log_id))
+        except Exception:
+            raise ValueError("Invalid log cursor")
+        return timestamp, log_id
+
+    def get_home_management_logs_page(self, home_id: str, admin_user_id: str, limit: int = 50,
+                                      cursor: Optional[str] = None, level: Optional[str] = None,
+                                      event_type: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Get one page of a home's management logs, newest first.
+        
+        Pages are keyset-paginated on (timestamp, id) and served by the
+        idx_management_logs_home_time index, so a page deep in the history
+        costs the same as the first one (no OFFSET scan).
+        
+        Args:
+            home_id: ID of the home
+            admin_user_id: ID of the admin requesting logs
+            limit: Maximum number of logs on the page
+            cursor: next_cursor of the previous page; None for the newest logs
+            level: Only logs of this level
+            event_type: Only logs of this event type
             
         Returns:
-            List of log entries for this home
+            {'logs': [...], 'next_cursor': str or None when there are no older logs}
+            
+        Raises:
+            PermissionError: The user is not an admin of the home
+            ValueError: The cursor is malformed
         """
         # Check admin access
         if not self.has_admin_access(admin_user_id, home_id):
             raise PermissionError("User doesn't have admin access to this home")
         
+        limit = max(1, int(limit))
+        position = self._decode_log_cursor(cursor) if cursor else None
+        
         # JSON fallback support
         if self.json_fallback_mode and self.json_backup:
             config = self.json_backup.get_config()
             logs_data = config.get('management_logs', [])
-            # Filter by home_id and sort by timestamp desc
-            filtered = [log for log in logs_data if log.get('home_id') == home_id]
-            filtered.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
-            # Respect limit
-            filtered = filtered[:limit]
+            # Filter by home_id, level, event_type and cursor position
+            filtered = []
+            for log in logs_data:
+                if log.get('home_id') != home_id:
+                    continue
+                if level and log.get('level') != level:
+                    continue
+                if event_type and log.get('event_type') != event_type:
+                    continue
+                if position and (log.get('timestamp', ''), str(log.get('id') or '')) >= position:
+                    continue
+                filtered.append(log)
+            filtered.sort(key=lambda x: (x.get('timestamp', ''), str(x.get('id') or '')), reverse=True)
+            has_more = len(filtered) > limit
             # Normalize fields
             result = []
-            for entry in filtered:
+            for entry in filtered[:limit]:
                 result.append({
                     'id': entry.get('id'),
                     'timestamp': entry.get('timestamp'),
@@ -1039,36 +1361,54 @@ class MultiHomeDBManager:
                     'ip_address': entry.get('ip_address'),
                     'details': entry.get('details', {})
                 })
-            return result
-
-        with self.get_cursor() as cursor:
-            if cursor is None:  # Safety check
-                return []
-            
-            cursor.execute("""
-                SELECT id, timestamp, level, message, event_type, 
-                       user_id, username, ip_address, details
-                FROM management_logs 
-                WHERE home_id = %s
-                ORDER BY timestamp DESC
-                LIMIT %s
-            """, (home_id, limit))
-            
-            logs = []
-            for row in cursor.fetchall():
-                logs.append({
-                    'id': str(row[0]),
-                    'timestamp': row[1],
-                    'level': row[2],
-                    'message': row[3],
-                    'event_type': row[4],
-                    'user_id': str(row[5]) if row[5] else None,
-                    'username': row[6],
-                    'ip_address': str(row[7]) if row[7] else None,
-                    'details': row[8] or {}
-                })
+        else:
+            conditions = ["home_id = %s"]
+            params: List[Any] = [home_id]
+            if level:
+                conditions.append("level = %s")
+                params.append(level)
+            if event_type:
+                conditions.append("event_type = %s")
+                params.append(event_type)
+            if position:
+                conditions.append("(timestamp, id) < (%s, %s::uuid)")
+                params.extend([datetime.fromisoformat(position[0]), position[1]])
+            # One extra row tells whether an older page exists
+            params.append(limit + 1)
             
-            return logs
+            result = []
+            with self.get_cursor() as db_cursor:
+                if db_cursor is None:  # Safety check
+                    return {'logs': [], 'next_cursor': None}
+                
+                db_cursor.execute(f"""
+                    SELECT id, timestamp, level, message, event_type, 
+                           user_id, username, ip_address, details
+                    FROM management_logs 
+                    WHERE {' AND '.join(conditions)}
+                    ORDER BY timestamp DESC, id DESC
+                    LIMIT %s
+                """, tuple(params))
+                
+                for row in db_cursor.fetchall():
+                    result.append({
+                        'id': str(row[0]),
+                        'timestamp': row[1],
+                        'level': row[2],
+                        'message': row[3],
+                        'event_type': row[4],
+                        'user_id': str(row[5]) if row[5] else None,
+                        'username': row[6],
+                        'ip_address': str(row[7]) if row[7] else None,
+                        'details': row[8] or {}
+                    })
+            has_more = len(result) > limit
+            result = result[:limit]
+        
+        next_cursor = None
+        if has_more and result:
+            next_cursor = self._encode_log_cursor(result[-1]['timestamp'], result[-1]['id'])
+        return {'logs': result, 'next_cursor': next_cursor}
 
     def add_home_management_log(self, home_id: str, level: str, message: str,
                               event_type: str = 'general', user_id: Optional[str] = None,
@@ -1093,8 +1433,6 @@ class MultiHomeDBManager:
         import json
         # JSON fallback support
         if self.json_fallback_mode and self.json_backup:
-            config = self.json_backup.get_config()
-            logs_data = config.get('management_logs', [])
             entry = {
                 'id': str(uuid.uuid4()),
                 'home_id': home_id,
@@ -1107,24 +1445,76 @@ class MultiHomeDBManager:
                 'ip_address': ip_address,
                 'details': details or {}
             }
-            logs_data.append(entry)
-            config['management_logs'] = logs_data
-            self.json_backup.save_config(config)
-            return True
+            return self.json_backup.append_record('management_logs', entry)
+
+        # Same INSERT as a batch of one, which also updates the hourly rollup
+        return self.add_home_management_logs([{
+            'home_id': home_id,
+            'level': level,
+            'message': message,
+            'event_type': event_type,
+            'user_id': user_id,
+            'username': username,
+            'ip_address': ip_address,
+            'details': details
+        }]) == 1
+
+    def add_home_management_logs(self, entries: List[Dict[str, Any]]) -> int:
+        """
+        Add several management log entries in one multi-row INSERT.
+
+        Args:
+            entries: Dicts with home_id, level, message and optionally
+                timestamp (defaults to now), event_type, user_id, username,
+                ip_address and details
+
+        Returns:
+            Number of entries stored; the hourly rollup is updated in the
+            same transaction
+        """
+        if not entries:
+            return 0
+        now = datetime.now().astimezone()
+        rows = [(
+            entry['home_id'], entry.get('timestamp') or now, entry['level'], entry['message'],
+            entry.get('event_type') or 'general', entry.get('user_id'), entry.get('username'),
+            entry.get('ip_address') or None,  # '' is not a valid INET
+            json.dumps(entry.get('details') or {})
+        ) for entry in entries]
+
+        if self.json_fallback_mode and self.json_backup:
+            stored = 0
+            for home_id, timestamp, level, message, event_type, user_id, username, ip_address, details in rows:
+                stored += bool(self.json_backup.append_record('management_logs', {
+                    'id': str(uuid.uuid4()),
+                    'home_id': home_id,
+                    # Local time without offset, as add_home_management_log stores it
+                    'timestamp': (timestamp.astimezone().replace(tzinfo=None)
+                                  if timestamp.tzinfo else timestamp).isoformat(),
+                    'level': level,
+                    'message': message,
+                    'event_type': event_type,
+                    'user_id': user_id,
+                    'username': username,
+                    'ip_address': ip_address,
+                    'details': json.loads(details)
+                }))
+            return stored
 
         with self.get_cursor() as cursor:
             if cursor is None:  # Safety check
-                return False
-            cursor.execute("""
-                INSERT INTO management_logs 
+                return 0
+            query = """
+                INSERT INTO management_logs
                 (home_id, timestamp, level, message, event_type, user_id, username, ip_address, details)
-                VALUES (%s, NOW(), %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                home_id, level, message, event_type,
-                user_id, username, ip_address, 
-                json.dumps(details or {})
-            ))
-            return True
+                VALUES %s
+            """
+            if self.backend == 'sqlite':
+                cursor.executemany(query.replace('%s', '(%s, %s, %s, %s, %s, %s, %s, %s, %s)'), rows)
+            else:
+                psycopg2.extras.execute_values(cursor, query, rows, page_size=len(rows))
+            self._update_management_log_rollup(cursor, rows)
+            return len(rows)
 
     def clear_home_management_logs(self, home_id: str, admin_user_id: str) -> int:
         """
@@ -1153,11 +1543,7 @@ class MultiHomeDBManager:
         with self.get_cursor() as cursor:
             if cursor is None:
                 return 0
-            cursor.execute("""
-                DELETE FROM management_logs 
-                WHERE home_id = %s
-            """, (home_id,))
-            return cursor.rowcount
+            return self._delete_management_logs(cursor, home_id, "home_id = %s", (home_id,))
 
     def delete_home_logs_by_date_range(self, home_id: str, admin_user_id: str,
                                        start_date: Optional[str] = None, 
@@ -1227,84 +1613,444 @@ class MultiHomeDBManager:
             return deleted
         
         # Build query based on provided dates
-        query_parts = ["DELETE FROM management_logs WHERE home_id = %s"]
+        query_parts = ["home_id = %s"]
         params = [home_id]
         
-        if start_date:
-            query_parts.append("AND timestamp >= %s::date")
-            params.append(start_date)
+        if start_date:
+            query_parts.append("AND timestamp >= %s::date")
+            params.append(start_date)
+        
+        if end_date:
+            # Include the entire end date (up to 23:59:59)
+            query_parts.append("AND timestamp < (%s::date + interval '1 day')")
+            params.append(end_date)
+        
+        condition = " ".join(query_parts)
+        
+        with self.get_cursor() as cursor:
+            if cursor is None:
+                return 0
+            return self._delete_management_logs(cursor, home_id, condition, tuple(params))
+
+    def delete_home_logs_older_than(self, home_id: str, admin_user_id: str, days: int) -> int:
+        """
+        Delete management logs for a specific home older than specified number of days.
+        
+        Args:
+            home_id: ID of the home
+            admin_user_id: ID of the admin performing the action
+            days: Number of days to keep (delete older logs)
+            
+        Returns:
+            Number of logs deleted
+        """
+        # Check admin access
+        if not self.has_admin_access(admin_user_id, home_id):
+            raise PermissionError("User doesn't have admin access to this home")
+        
+        if self.json_fallback_mode and self.json_backup:
+            config = self.json_backup.get_config()
+            logs_data = config.get('management_logs', [])
+            # Use timezone-aware datetime for proper comparison
+            cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+            remaining = []
+            deleted = 0
+            for log in logs_data:
+                if str(log.get('home_id')) != str(home_id):
+                    remaining.append(log)
+                    continue
+                try:
+                    ts_str = log.get('timestamp', '')
+                    # Parse timestamp (may or may not have timezone)
+                    if ts_str:
+                        ts = datetime.fromisoformat(ts_str)
+                        # Make timezone-aware if naive
+                        if ts.tzinfo is None:
+                            ts = ts.replace(tzinfo=timezone.utc)
+                    else:
+                        ts = None
+                except Exception:
+                    ts = None
+                # Delete if timestamp exists and is older than cutoff
+                if ts and ts < cutoff:
+                    deleted += 1
+                else:
+                    remaining.append(log)
+            config['management_logs'] = remaining
+            self.json_backup.save_config(config)
+            logger.info(f"[JSON] Deleted {deleted} logs older than {days} days for home {home_id}")
+            return deleted
+        
+        with self.get_cursor() as cursor:
+            if cursor is None:
+                return 0
+            return self._delete_management_logs(
+                cursor, home_id,
+                "home_id = %s AND timestamp < (NOW() - make_interval(days => %s))",
+                (home_id, days)
+            )
+
+    def _delete_management_logs(self, cursor, home_id: str, condition: str, params: Tuple) -> int:
+        """
+        Delete a home's management logs matching a WHERE condition and
+        subtract them from the hourly rollup (same transaction).
+
+        Only the deleted events are subtracted, so analytics stop counting
+        them while hours whose raw rows retention already purged keep
+        their counts.
+
+        Returns:
+            Number of logs deleted
+        """
+        if not self._log_rollup_available:
+            cursor.execute(f"DELETE FROM management_logs WHERE {condition}", params)
+            return cursor.rowcount
+        cursor.execute(f"""
+            DELETE FROM management_logs
+            WHERE {condition}
+            RETURNING timestamp, event_type, level, username
+        """, params)
+        deleted = 0
+        counts: Dict[Tuple, int] = {}
+        for timestamp, event_type, level, username in cursor.fetchall():
+            deleted += 1
+            key = (bucket_start(timestamp), event_type or '', level, username or '')
+            counts[key] = counts.get(key, 0) + 1
+        if not counts:
+            return deleted
+        query = """
+            UPDATE management_log_hourly SET count = count - %s
+            WHERE home_id = %s AND bucket = %s AND event_type = %s AND level = %s AND username = %s
+        """
+        values = [(count, home_id) + key for key, count in counts.items()]
+        if self.backend == 'sqlite':
+            cursor.executemany(query, values)
+        else:
+            psycopg2.extras.execute_batch(cursor, query, values)
+        cursor.execute("DELETE FROM management_log_hourly WHERE home_id = %s AND count <= 0", (home_id,))
+        return deleted
+
+    # ============================================================================
+    # RETENTION
+    # ============================================================================
+
+    def get_all_home_ids(self) -> List[str]:
+        """IDs of all homes, for system jobs that work home by home."""
+        if self.json_fallback_mode and self.json_backup:
+            return [str(home_id) for home_id in self.json_backup.get_config().get('homes', {})]
+        with self.get_cursor() as cursor:
+            if cursor is None:
+                return []
+            cursor.execute("SELECT id FROM homes ORDER BY id")
+            return [str(row[0]) for row in cursor.fetchall()]
+
+    @staticmethod
+    def _json_timestamp_before(value: Any, cutoff: datetime) -> bool:
+        """Whether a stored ISO timestamp (naive = local time) is older than cutoff"""
+        try:
+            moment = datetime.fromisoformat(str(value))
+        except (TypeError, ValueError):
+            return False
+        return moment.astimezone() < cutoff.astimezone()
+
+    def _purge_json_records(self, key: str, expired, limit: int,
+                            on_deleted: Optional[Callable[[List[Dict]], None]]) -> int:
+        """Remove up to limit records of a JSON fallback list matching expired()"""
+        config = self.json_backup.get_config()
+        records = config.get(key, [])
+        deleted: List[Dict] = []
+        remaining: List[Dict] = []
+        for record in records:
+            if len(deleted) < limit and expired(record):
+                deleted.append(record)
+            else:
+                remaining.append(record)
+        if not deleted:
+            return 0
+        if on_deleted:
+            on_deleted(deleted)
+        config[key] = remaining
+        self.json_backup.save_config(config)
+        return len(deleted)
+
+    def purge_expired_management_logs(self, home_id: Optional[str], cutoff: datetime, limit: int = 1000,
+                                      on_deleted: Optional[Callable[[List[Dict]], None]] = None) -> int:
+        """
+        Delete one batch of a home's management logs older than cutoff.
+        
+        System operation without an access check, used by the retention
+        job. The oldest rows go first and the batch is found through
+        idx_management_logs_home_time, so a call stays cheap on any table size.
+        
+        Args:
+            home_id: ID of the home; None for logs without a home
+            cutoff: Logs with an older timestamp are deleted
+            limit: Maximum rows deleted by this call
+            on_deleted: Called with the deleted rows before the deletion is
+                committed (e.g. to archive them); an exception rolls it back
+            
+        Returns:
+            Number of logs deleted; less than limit when none are left
+        """
+        if self.json_fallback_mode and self.json_backup:
+            return self._purge_json_records(
+                'management_logs',
+                lambda log: (log.get('home_id') == home_id
+                             and self._json_timestamp_before(log.get('timestamp'), cutoff)),
+                limit, on_deleted
+            )
+
+        home_condition = "home_id = %s" if home_id is not None else "home_id IS NULL"
+        params = ((home_id,) if home_id is not None else ()) + (cutoff, limit)
+        returning = ("id, home_id, timestamp, level, message, event_type, user_id, username, ip_address, details"
+                     if on_deleted else "id")
+        with self.get_cursor() as cursor:
+            if cursor is None:
+                return 0
+            cursor.execute(f"""
+                DELETE FROM management_logs
+                WHERE id IN (
+                    SELECT id FROM management_logs
+                    WHERE {home_condition} AND timestamp < %s
+                    ORDER BY timestamp
+                    LIMIT %s
+                )
+                RETURNING {returning}
+            """, params)
+            rows = cursor.fetchall()
+            if on_deleted and rows:
+                on_deleted([{
+                    'id': str(row[0]),
+                    'home_id': str(row[1]) if row[1] else None,
+                    'timestamp': row[2].isoformat() if row[2] else None,
+                    'level': row[3],
+                    'message': row[4],
+                    'event_type': row[5],
+                    'user_id': str(row[6]) if row[6] else None,
+                    'username': row[7],
+                    'ip_address': str(row[8]) if row[8] else None,
+                    'details': row[9] or {}
+                } for row in rows])
+            return len(rows)
+
+    def purge_expired_automation_executions(self, home_id: Optional[str], cutoff: datetime, limit: int = 1000,
+                                            on_deleted: Optional[Callable[[List[Dict]], None]] = None) -> int:
+        """
+        Delete one batch of execution records of a home's automations older than cutoff.
+        
+        Same contract as purge_expired_management_logs; home_id None selects
+        records whose automation belongs to no home. The deleted rows
+        passed to on_deleted carry the home_id.
         
-        if end_date:
-            # Include the entire end date (up to 23:59:59)
-            query_parts.append("AND timestamp < (%s::date + interval '1 day')")
-            params.append(end_date)
+        Returns:
+            Number of execution records deleted
+        """
+        if self.json_fallback_mode and self.json_backup:
+            homes_by_automation = {
+                str(auto.get('id')): auto.get('home_id')
+                for auto in self.json_backup.get_config().get('automations', [])
+            }
+
+            def expired(record):
+                owner = homes_by_automation.get(str(record.get('automation_id')))
+                in_home = str(owner) == str(home_id) if home_id is not None else owner is None
+                return in_home and self._json_timestamp_before(record.get('executed_at'), cutoff)
+
+            def with_home(records):
+                on_deleted([dict(record, home_id=home_id) for record in records])
+
+            return self._purge_json_records('automation_executions', expired, limit,
+                                            with_home if on_deleted else None)
+
+        returning = ("id, automation_id, execution_status, trigger_data, actions_executed, "
+                     "error_message, execution_time_ms, executed_at" if on_deleted else "id")
+        with self.get_cursor() as cursor:
+            if cursor is None:
+                return 0
+            if home_id is not None:
+                home_condition = """
+                    e.automation_id IN (SELECT id FROM home_automations WHERE home_id = %s)
+                """
+                params = (home_id, cutoff, limit)
+            else:
+                home_condition = """
+                    NOT EXISTS (SELECT 1 FROM home_automations a WHERE a.id = e.automation_id)
+                """
+                params = (cutoff, limit)
+            cursor.execute(f"""
+                DELETE FROM automation_executions
+                WHERE id IN (
+                    SELECT e.id FROM automation_executions e
+                    WHERE {home_condition} AND e.executed_at < %s
+                    ORDER BY e.executed_at
+                    LIMIT %s
+                )
+                RETURNING {returning}
+            """, params)
+            rows = cursor.fetchall()
+            if on_deleted and rows:
+                on_deleted([{
+                    'id': str(row[0]),
+                    'home_id': str(home_id) if home_id is not None else None,
+                    'automation_id': str(row[1]) if row[1] else None,
+                    'status': row[2],
+                    'trigger_data': row[3],
+                    'actions_executed': row[4],
+                    'error_message': row[5],
+                    'execution_time_ms': row[6],
+                    'executed_at': row[7].isoformat() if row[7] else None
+                } for row in rows])
+            return len(rows)
+
+    # ============================================================================
+    # LOG ANALYTICS
+    # ============================================================================
+
+    def _ensure_management_log_rollup(self):
+        """Ensure the hourly management log rollup exists; backfill it when it is empty."""
+        self._log_rollup_available = False
+        if self.json_fallback_mode:
+            return
+        try:
+            with self.get_cursor() as cursor:
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS management_log_hourly (
+                        home_id UUID NOT NULL REFERENCES homes(id) ON DELETE CASCADE,
+                        bucket TIMESTAMPTZ NOT NULL,
+                        event_type VARCHAR(100) NOT NULL DEFAULT '',
+                        level VARCHAR(50) NOT NULL,
+                        username VARCHAR(255) NOT NULL DEFAULT '',
+                        count INTEGER NOT NULL DEFAULT 0,
+                        PRIMARY KEY (home_id, bucket, event_type, level, username)
+                    )
+                """)
+                cursor.execute("SELECT 1 FROM management_log_hourly LIMIT 1")
+                empty = cursor.fetchone() is None
+            if empty:
+                self.rebuild_management_log_rollup()
+            self._log_rollup_available = True
+        except Exception as e:
+            logger.warning(f"Management log rollup unavailable: {e}")
+
+    def _update_management_log_rollup(self, cursor, rows: List[Tuple]):
+        """Add freshly inserted management_logs rows to the hourly rollup (same transaction)."""
+        if not getattr(self, '_log_rollup_available', False):
+            return
+        counts: Dict[Tuple, int] = {}
+        for home_id, timestamp, level, _, event_type, _, username, _, _ in rows:
+            if not home_id:
+                continue
+            key = (home_id, bucket_start(timestamp), event_type or '', level, username or '')
+            counts[key] = counts.get(key, 0) + 1
+        if not counts:
+            return
+        query = """
+            INSERT INTO management_log_hourly (home_id, bucket, event_type, level, username, count)
+            VALUES %s
+            ON CONFLICT (home_id, bucket, event_type, level, username)
+            DO UPDATE SET count = management_log_hourly.count + EXCLUDED.count
+        """
+        values = [key + (count,) for key, count in counts.items()]
+        if self.backend == 'sqlite':
+            cursor.executemany(query.replace('%s', '(%s, %s, %s, %s, %s, %s)'), values)
+        else:
+            psycopg2.extras.execute_values(cursor, query, values, page_size=len(values))
+
+    def rebuild_management_log_rollup(self, home_id: Optional[str] = None) -> int:
+        """
+        Recompute the hourly rollup from the raw management logs.
         
-        query = " ".join(query_parts)
+        The rollup counts events as they are logged and keeps them when raw
+        rows are later removed by retention, so long-range charts outlive
+        the logs; logs deleted by an admin are subtracted right away.
+        Rebuilding makes it match the rows that are left, dropping the
+        counts retention kept.
         
+        Args:
+            home_id: Only rebuild this home; None rebuilds all homes
+            
+        Returns:
+            Number of rollup rows written
+        """
+        if self.json_fallback_mode:
+            return 0
         with self.get_cursor() as cursor:
             if cursor is None:
                 return 0
-            cursor.execute(query, tuple(params))
-            return cursor.rowcount
-
-    def delete_home_logs_older_than(self, home_id: str, admin_user_id: str, days: int) -> int:
+            return self._recount_management_log_rollup(cursor, home_id)
+
+    def _recount_management_log_rollup(self, cursor, home_id: Optional[str] = None) -> int:
+        """Replace a home's (or every home's) rollup rows with counts of the raw logs (same transaction)."""
+        home_condition = "AND home_id = %s" if home_id else ""
+        params = (home_id,) if home_id else ()
+        cursor.execute(f"DELETE FROM management_log_hourly WHERE home_id IS NOT NULL {home_condition}", params)
+        cursor.execute(f"""
+            INSERT INTO management_log_hourly (home_id, bucket, event_type, level, username, count)
+            SELECT home_id, date_trunc('hour', timestamp), COALESCE(event_type, ''), level,
+                   COALESCE(username, ''), COUNT(*)
+            FROM management_logs
+            WHERE home_id IS NOT NULL {home_condition}
+            GROUP BY 1, 2, 3, 4, 5
+        """, params)
+        return cursor.rowcount
+
+    def get_home_log_analytics(self, home_id: str, admin_user_id: str, start: Any = None,
+                               end: Any = None, bucket: str = 'hour') -> Dict[str, Any]:
         """
-        Delete management logs for a specific home older than specified number of days.
+        Count a home's management log events by type, level, user and time bucket.
+        
+        Computed with GROUP BY queries over the hourly rollup, so the cost
+        depends on the range, not on the number of raw log rows.
         
         Args:
             home_id: ID of the home
-            admin_user_id: ID of the admin performing the action
-            days: Number of days to keep (delete older logs)
+            admin_user_id: ID of the admin requesting analytics
+            start: Range start (ISO string or datetime), rounded down to the hour
+            end: Range end, exclusive (default: now)
+            bucket: Timeline granularity, 'hour' or 'day'
             
         Returns:
-            Number of logs deleted
+            Summary as described in utils.log_analytics
+            
+        Raises:
+            PermissionError: The user is not an admin of the home
+            ValueError: Invalid bucket or range
         """
-        # Check admin access
         if not self.has_admin_access(admin_user_id, home_id):
             raise PermissionError("User doesn't have admin access to this home")
-        
+        start_dt, end_dt = log_analytics.resolve_range(start, end, bucket)
+
         if self.json_fallback_mode and self.json_backup:
-            config = self.json_backup.get_config()
-            logs_data = config.get('management_logs', [])
-            # Use timezone-aware datetime for proper comparison
-            cutoff = datetime.now(timezone.utc) - timedelta(days=days)
-            remaining = []
-            deleted = 0
-            for log in logs_data:
-                if str(log.get('home_id')) != str(home_id):
-                    remaining.append(log)
-                    continue
-                try:
-                    ts_str = log.get('timestamp', '')
-                    # Parse timestamp (may or may not have timezone)
-                    if ts_str:
-                        ts = datetime.fromisoformat(ts_str)
-                        # Make timezone-aware if naive
-                        if ts.tzinfo is None:
-                            ts = ts.replace(tzinfo=timezone.utc)
-                    else:
-                        ts = None
-                except Exception:
-                    ts = None
-                # Delete if timestamp exists and is older than cutoff
-                if ts and ts < cutoff:
-                    deleted += 1
-                else:
-                    remaining.append(log)
-            config['management_logs'] = remaining
-            self.json_backup.save_config(config)
-            logger.info(f"[JSON] Deleted {deleted} logs older than {days} days for home {home_id}")
-            return deleted
-        
+            logs_data = self.json_backup.get_config().get('management_logs', [])
+            return log_analytics.summarize(
+                ((log.get('timestamp'), log.get('event_type'), log.get('level'), log.get('username'))
+                 for log in logs_data if log.get('home_id') == home_id),
+                start_dt, end_dt, bucket
+            )
+
+        if not getattr(self, '_log_rollup_available', False):
+            raise RuntimeError("Management log rollup is not available")
+        params = (home_id, start_dt, end_dt)
         with self.get_cursor() as cursor:
             if cursor is None:
-                return 0
+                return log_analytics.build_summary(start_dt, end_dt, bucket, [], [])
             cursor.execute("""
-                DELETE FROM management_logs 
-                WHERE home_id = %s 
-                AND timestamp < (NOW() - make_interval(days => %s))
-            """, (home_id, days))
-            return cursor.rowcount
+                SELECT event_type, level, username, SUM(count)
+                FROM management_log_hourly
+                WHERE home_id = %s AND bucket >= %s AND bucket < %s
+                GROUP BY event_type, level, username
+            """, params)
+            groups = cursor.fetchall()
+            # bucket is validated by resolve_range
+            cursor.execute(f"""
+                SELECT date_trunc('{bucket}', bucket) AS period, SUM(count)
+                FROM management_log_hourly
+                WHERE home_id = %s AND bucket >= %s AND bucket < %s
+                GROUP BY period
+                ORDER BY period
+            """, params)
+            timeline = cursor.fetchall()
+        return log_analytics.build_summary(start_dt, end_dt, bucket, groups, timeline)
 
     def get_home_stats(self, home_id: str, admin_user_id: str) -> Dict:
         """
@@ -1675,20 +2421,17 @@ class MultiHomeDBManager:
         
         # JSON fallback support
         if self.json_fallback_mode and self.json_backup:
-            config = self.json_backup.get_config()
-            for r in config.get('rooms', []):
-                if str(r.get('id')) == str(normalized_id):
-                    if not self.user_has_home_access(user_id, r.get('home_id')):
-                        return None
-                    return {
-                        'id': r.get('id'),
-                        'home_id': r.get('home_id'),
-                        'name': r.get('name'),
-                        'description': r.get('description'),
-                        'created_at': r.get('created_at'),
-                        'updated_at': r.get('updated_at')
-                    }
-            return None
+            r = self.json_backup.find_room(normalized_id)
+            if r is None or not self.user_has_home_access(user_id, r.get('home_id')):
+                return None
+            return {
+                'id': r.get('id'),
+                'home_id': r.get('home_id'),
+                'name': r.get('name'),
+                'description': r.get('description'),
+                'created_at': r.get('created_at'),
+                'updated_at': r.get('updated_at')
+            }
 
         with self.get_cursor() as cursor:
             cursor.execute("""
@@ -2254,20 +2997,10 @@ class MultiHomeDBManager:
             raise ValueError("device_id is required for update")
         # JSON fallback support
         if self.json_fallback_mode and self.json_backup:
-            config = self.json_backup.get_config()
-            # Find in buttons
-            found_list_key = None
-            for list_key in ('buttons', 'temperature_controls'):
-                for idx, dev in enumerate(config.get(list_key, [])):
-                    if str(dev.get('id')) == str(normalized_id):
-                        found_list_key = list_key
-                        target = dev
-                        target_idx = idx
-                        break
-                if found_list_key:
-                    break
-            if not found_list_key:
+            found = self.json_backup.find_device(normalized_id)
+            if not found:
                 return False
+            found_list_key, _, target = found
             # Permission: ensure user can control devices in home
             home_id = target.get('home_id')
             if not self.user_has_home_permission(user_id, home_id, 'control_devices'):
@@ -2275,15 +3008,15 @@ class MultiHomeDBManager:
             # Apply allowed updates
             allowed_fields = ['name', 'state', 'enabled', 'display_order', 'room_id']
             settings_updates = {k: v for k, v in updates.items() if k in ('action','target_device_id','target_temperature','mode')}
+            changes = {}
             for field, value in updates.items():
                 if field in allowed_fields:
                     # room move: ensure room exists and same home
                     if field == 'room_id' and value is not None:
-                        rooms = config.get('rooms', [])
-                        match = next((r for r in rooms if str(r.get('id')) == str(value)), None)
+                        match = self.json_backup.find_room(value)
                         if not match or match.get('home_id') != home_id:
                             raise ValueError("Invalid room move")
-                    target[field] = value
+                    changes[field] = value
             if settings_updates:
                 settings = target.get('settings') or {}
                 if isinstance(settings, str):
@@ -2291,15 +3024,12 @@ class MultiHomeDBManager:
                         settings = json.loads(settings)
                     except json.JSONDecodeError:
                         settings = {}
+                settings = dict(settings)
                 settings.update(settings_updates)
-                target['settings'] = settings
-            target['updated_at'] = datetime.now().isoformat()
-            # Write back
-            items = config.get(found_list_key, [])
-            items[target_idx] = target
-            config[found_list_key] = items
-            self.json_backup.save_config(config)
-            return True
+                changes['settings'] = settings
+            changes['updated_at'] = datetime.now().isoformat()
+            # Journaled write of just this device
+            return self.json_backup.update_record(found_list_key, target.get('id'), changes)
 
         # First verify user has access to this device
         with self.get_cursor() as cursor:
@@ -2414,34 +3144,40 @@ class MultiHomeDBManager:
                 
                 logger.debug(f"[BATCH_UPDATE] Processing device {device_id}, type={device_type}")
                 
+                # Indexed lookup; positions match the config copy above
+                # unless another write slipped in between
+                found = self.json_backup.find_device(device_id)
+                found_key, found_idx = (found[0], found[1]) if found else (None, None)
+                lists = {'buttons': buttons, 'temperature_controls': controls}
+                if found_key and not (
+                    found_idx < len(lists[found_key])
+                    and str(lists[found_key][found_idx].get('id')) == device_id
+                ):
+                    found_key, found_idx = None, None
+                
                 # Use type hint from payload if available
                 if device_type in ('button', 'light'):
-                    found_idx = next((i for i, b in enumerate(buttons) if str(b.get('id')) == device_id), None)
-                    if found_idx is not None:
+                    if found_key == 'buttons':
                         button_updates[device_id] = (found_idx, update_data)
                         logger.debug(f"[BATCH_UPDATE] Found button at index {found_idx}")
                     else:
                         failed_updates.append({'device_id': device_id, 'error': 'Device not found in buttons'})
                         logger.warning(f"[BATCH_UPDATE] Button {device_id} not found")
                 elif device_type in ('temperature_control', 'thermostat'):
-                    found_idx = next((i for i, c in enumerate(controls) if str(c.get('id')) == device_id), None)
-                    if found_idx is not None:
+                    if found_key == 'temperature_controls':
                         control_updates[device_id] = (found_idx, update_data)
                         logger.debug(f"[BATCH_UPDATE] Found temperature_control at index {found_idx}")
                     else:
                         failed_updates.append({'device_id': device_id, 'error': 'Device not found in temperature_controls'})
                         logger.warning(f"[BATCH_UPDATE] Temperature control {device_id} not found")
                 else:
-                    # Type not specified, search both lists
-                    found_in_buttons = next((i for i, b in enumerate(buttons) if str(b.get('id')) == device_id), None)
-                    found_in_controls = next((i for i, c in enumerate(controls) if str(c.get('id')) == device_id), None)
-                    
-                    if found_in_buttons is not None:
-                        button_updates[device_id] = (found_in_buttons, update_data)
-                        logger.debug(f"[BATCH_UPDATE] Found button (by search) at index {found_in_buttons}")
-                    elif found_in_controls is not None:
-                        control_updates[device_id] = (found_in_controls, update_data)
-                        logger.debug(f"[BATCH_UPDATE] Found temperature_control (by search) at index {found_in_controls}")
+                    # Type not specified, the index covers both lists
+                    if found_key == 'buttons':
+                        button_updates[device_id] = (found_idx, update_data)
+                        logger.debug(f"[BATCH_UPDATE] Found button (by search) at index {found_idx}")
+                    elif found_key == 'temperature_controls':
+                        control_updates[device_id] = (found_idx, update_data)
+                        logger.debug(f"[BATCH_UPDATE] Found temperature_control (by search) at index {found_idx}")
                     else:
                         failed_updates.append({'device_id': device_id, 'error': 'Device not found'})
                         logger.warning(f"[BATCH_UPDATE] Device {device_id} not found anywhere")
@@ -2512,107 +3248,149 @@ class MultiHomeDBManager:
             logger.info(f"[BATCH_UPDATE] Batch update completed: {len(updated_devices)} updated, {len(failed_updates)} failed")
             return {'updated': updated_devices, 'failed': failed_updates}
 
-        with self.get_cursor() as cursor:
+        # Resolve the whole batch with one permission lookup and apply it
+        # with a single UPDATE ... FROM (VALUES ...) statement.
+        def _canonical_uuid(value: Any) -> Optional[str]:
             try:
-                # Start transaction
-                cursor.execute("BEGIN")
-                
-                for update_data in device_updates:
-                    if not isinstance(update_data, dict) or 'id' not in update_data:
-                        failed_updates.append({'update': update_data, 'error': 'Missing device id'})
-                        continue
-                        
-                    device_id = update_data['id']
-                    normalized_id = self._normalize_device_id(device_id)
-                    
-                    if normalized_id is None:
-                        failed_updates.append({'device_id': device_id, 'error': 'Invalid device id'})
+                return str(uuid.UUID(str(value)))
+            except (TypeError, ValueError):
+                return None
+
+        pending = {}
+        for update_data in device_updates:
+            if not isinstance(update_data, dict) or 'id' not in update_data:
+                failed_updates.append({'update': update_data, 'error': 'Missing device id'})
+                continue
+
+            device_id = update_data['id']
+            key = _canonical_uuid(self._normalize_device_id(device_id))
+            if key is None:
+                failed_updates.append({'device_id': device_id, 'error': 'Invalid device id'})
+                continue
+
+            fields = {f: v for f, v in update_data.items() if f in self._BATCH_DEVICE_COLUMNS}
+            if not fields:
+                failed_updates.append({'device_id': device_id, 'error': 'No valid update fields'})
+                continue
+
+            # Repeated ids behave like sequential updates: later fields win
+            entry = pending.setdefault(key, {'device_id': device_id, 'fields': {}})
+            entry['fields'].update(fields)
+
+        if not pending:
+            return {'updated': updated_devices, 'failed': failed_updates}
+
+        target_room_ids = {
+            _canonical_uuid(entry['fields']['room_id'])
+            for entry in pending.values()
+            if entry['fields'].get('room_id') is not None
+        }
+        target_room_ids.discard(None)
+
+        with self.get_cursor() as cursor:
+            # Device homes and the caller's membership in each, in one query
+            cursor.execute("""
+                SELECT d.id::text, d.home_id::text, uh.role, uh.permissions
+                FROM devices d
+                LEFT JOIN user_homes uh ON uh.home_id = d.home_id AND uh.user_id = %s
+                WHERE d.id = ANY(%s::uuid[])
+            """, (user_id, list(pending.keys())))
+            device_access = {row[0]: row[1:] for row in cursor.fetchall()}
+
+            room_access = {}
+            if target_room_ids:
+                cursor.execute("""
+                    SELECT r.id::text, r.home_id::text, uh.role, uh.permissions
+                    FROM rooms r
+                    LEFT JOIN user_homes uh ON uh.home_id = r.home_id AND uh.user_id = %s
+                    WHERE r.id = ANY(%s::uuid[])
+                """, (user_id, list(target_room_ids)))
+                room_access = {row[0]: row[1:] for row in cursor.fetchall()}
+
+            rows = []
+            for key, entry in pending.items():
+                device_id = entry['device_id']
+                fields = entry['fields']
+                access = device_access.get(key)
+                if access is None or access[1] is None:
+                    failed_updates.append({'device_id': device_id, 'error': 'No permission or device not found'})
+                    continue
+                _, role, permissions = access
+                if not self._role_has_permission(role, permissions, 'control_devices'):
+                    failed_updates.append({'device_id': device_id, 'error': 'No permission to access device'})
+                    continue
+
+                room_id = fields.get('room_id')
+                if room_id is not None:
+                    target = room_access.get(_canonical_uuid(room_id))
+                    if target is None:
+                        failed_updates.append({'device_id': device_id, 'error': f'Room {room_id} not found'})
                         continue
-                        
-                    try:
-                        # Verify user has access to this device
-                        cursor.execute("""
-                            SELECT d.room_id, r.home_id
-                            FROM devices d
-                            LEFT JOIN rooms r ON d.room_id = r.id
-                            LEFT JOIN user_homes uh ON r.home_id = uh.home_id
-                            WHERE d.id = %s AND (uh.user_id = %s OR d.room_id IS NULL)
-                        """, (normalized_id, user_id))
-                        
-                        row = cursor.fetchone()
-                        if not row:
-                            failed_updates.append({'device_id': device_id, 'error': 'No permission or device not found'})
-                            continue
-                            
-                        room_id, home_id = row
-                        
-                        # If device has no room, we'll need to validate permission on target room during update
-                        if home_id and not self.user_has_home_permission(user_id, home_id, 'control_devices'):
-                            failed_updates.append({'device_id': device_id, 'error': 'No permission to access device'})
-                            continue
-                        
-                        # Build update query
-                        update_fields = []
-                        update_values = []
-                        
-                        allowed_fields = ['name', 'state', 'brightness', 'color', 'temperature', 'current_temperature', 
-                                        'target_temperature', 'mode', 'action', 'target_device_id', 'enabled', 'room_id', 'display_order']
-                        
-                        for field, value in update_data.items():
-                            if field in allowed_fields and field != 'id':
-                                if field == 'room_id':
-                                    # Validate new room exists and user has access
-                                    if value is not None:
-                                        cursor.execute("SELECT home_id FROM rooms WHERE id = %s", (value,))
-                                        room_row = cursor.fetchone()
-                                        if not room_row:
-                                            failed_updates.append({'device_id': device_id, 'error': f'Room {value} not found'})
-                                            break
-                                        new_room_home_id = room_row[0]
-                                        if not self.user_has_home_permission(user_id, new_room_home_id, 'manage_devices'):
-                                            failed_updates.append({'device_id': device_id, 'error': 'No permission to move device to target room'})
-                                            break
-                                    update_fields.append(f"{field} = %s")
-                                    update_values.append(value)
-                                else:
-                                    update_fields.append(f"{field} = %s")
-                                    update_values.append(value)
-                        
-                        if not update_fields:
-                            failed_updates.append({'device_id': device_id, 'error': 'No valid update fields'})
-                            continue
-                            
-                        update_fields.append("updated_at = %s")
-                        update_values.append(datetime.now())
-                        update_values.append(normalized_id)
-
-                        cursor.execute(f"""
-                            UPDATE devices 
-                            SET {', '.join(update_fields)}
-                            WHERE id = %s
-                        """, update_values)
-
-                        if cursor.rowcount > 0:
-                            updated_devices.append(str(normalized_id))
-                            logger.info(f"Batch updated device {normalized_id} with fields: {[f for f in update_data.keys() if f != 'id']}")
-                        else:
-                            failed_updates.append({'device_id': device_id, 'error': 'No rows updated'})
-                            
-                    except Exception as device_error:
-                        failed_updates.append({'device_id': device_id, 'error': str(device_error)})
-                        logger.error(f"Error updating device {device_id} in batch: {device_error}")
+                    _, room_role, room_permissions = target
+                    if not self._role_has_permission(room_role, room_permissions, 'manage_devices'):
+                        failed_updates.append({'device_id': device_id, 'error': 'No permission to move device to target room'})
                         continue
-                
-                # Commit transaction
-                cursor.execute("COMMIT")
-                logger.info(f"Batch update completed: {len(updated_devices)} updated, {len(failed_updates)} failed")
+
+                rows.append((key, fields))
+
+            if not rows:
+                logger.info(f"Batch update completed: 0 updated, {len(failed_updates)} failed")
                 return {'updated': updated_devices, 'failed': failed_updates}
-                
-            except Exception as e:
-                # Rollback on any error
-                cursor.execute("ROLLBACK")
-                logger.error(f"Batch update transaction failed: {e}")
-                raise e
+
+            columns = [c for c in self._BATCH_DEVICE_COLUMNS if any(c in fields for _, fields in rows)]
+            template = '(' + ', '.join(
+                ['%s::uuid'] + [f'%s, %s::{self._BATCH_DEVICE_COLUMNS[c]}' for c in columns]
+            ) + ')'
+            values = []
+            for key, fields in rows:
+                value = [key]
+                for column in columns:
+                    value.extend((column in fields, fields.get(column)))
+                values.append(tuple(value))
+
+            value_names = ['id'] + [name for c in columns for name in (f'set_{c}', c)]
+            assignments = [
+                f"{c} = CASE WHEN v.set_{c} THEN v.{c} ELSE d.{c} END" for c in columns
+            ] + ["updated_at = NOW()"]
+            if self.backend == 'sqlite':
+                # SQLite has no VALUES column aliases; name them in a CTE instead
+                cursor.execute(
+                    f"""
+                        WITH v({', '.join(value_names)}) AS (VALUES {', '.join([template] * len(values))})
+                        UPDATE devices AS d
+                        SET {', '.join(assignments)}
+                        FROM v
+                        WHERE d.id = v.id
+                        RETURNING d.id
+                    """,
+                    [param for value in values for param in value]
+                )
+                returned = cursor.fetchall()
+            else:
+                returned = psycopg2.extras.execute_values(
+                    cursor,
+                    f"""
+                        UPDATE devices AS d
+                        SET {', '.join(assignments)}
+                        FROM (VALUES %s) AS v({', '.join(value_names)})
+                        WHERE d.id = v.id
+                        RETURNING d.id::text
+                    """,
+                    values,
+                    template=template,
+                    page_size=len(values),
+                    fetch=True
+                )
+            returned_ids = {row[0] for row in returned}
+
+            for key, _ in rows:
+                if key in returned_ids:
+                    updated_devices.append(key)
+                else:
+                    failed_updates.append({'device_id': pending[key]['device_id'], 'error': 'No rows updated'})
+
+        logger.info(f"Batch update completed: {len(updated_devices)} updated, {len(failed_updates)} failed")
+        return {'updated': updated_devices, 'failed': failed_updates}
 
     def delete_device(self, device_id: Any, user_id: str, home_id: Optional[str] = None) -> bool:
         """Delete a device if the user has permission within the target home."""
@@ -2670,25 +3448,16 @@ class MultiHomeDBManager:
             return None
         # JSON fallback support
         if self.json_fallback_mode and self.json_backup:
-            config = self.json_backup.get_config()
-            device = None
-            list_key = None
-            for key in ('buttons', 'temperature_controls'):
-                for dev in config.get(key, []):
-                    if str(dev.get('id')) == str(normalized_id):
-                        device = dev
-                        list_key = key
-                        break
-                if device:
-                    break
-            if not device:
+            found = self.json_backup.find_device(normalized_id)
+            if not found:
                 return None
+            list_key, _, device = found
             home_id = device.get('home_id')
             if home_id and not self.user_has_home_access(user_id, home_id):
                 return None
             room_name = None
             if device.get('room_id') is not None:
-                room = next((r for r in config.get('rooms', []) if str(r.get('id')) == str(device.get('room_id'))), None)
+                room = self.json_backup.find_room(device.get('room_id'))
                 room_name = room.get('name') if room else None
             dtype = 'button' if list_key == 'buttons' else 'temperature_control'
             return {
@@ -2702,7 +3471,7 @@ class MultiHomeDBManager:
                 'max_temperature': device.get('max_temperature'),
                 'display_order': device.get('display_order'),
                 'enabled': device.get('enabled', True),
-                'settings': device.get('settings'),
+                'settings': copy.deepcopy(device.get('settings')),
                 'created_at': device.get('created_at'),
                 'updated_at': device.get('updated_at'),
                 'home_id': home_id,
@@ -2734,26 +3503,86 @@ class MultiHomeDBManager:
             """, (normalized_id, user_id))
             
             row = cursor.fetchone()
-            if not row:
+            return self._device_row_to_dict(row) if row else None
+
+    @staticmethod
+    def _device_row_to_dict(row: Tuple) -> Dict:
+        """Map a device row selected in get_device column order to a dict."""
+        return {
+            'id': row[0],          # id
+            'name': row[1],        # name
+            'room_id': row[2],     # room_id
+            'type': row[3],        # device_type
+            'state': row[4],       # state
+            'temperature': row[5], # temperature
+            'min_temperature': row[6],  # min_temperature
+            'max_temperature': row[7],  # max_temperature
+            'display_order': row[8],    # display_order
+            'enabled': row[9],     # enabled
+            'settings': row[10],   # settings
+            'created_at': row[11], # created_at
+            'updated_at': row[12], # updated_at
+            'home_id': row[13],    # home_id
+            'room_name': row[14]   # room_name
+        }
+
+    def toggle_device_state(self, device_id: Any, user_id: str, state: Optional[bool] = None) -> Optional[Dict]:
+        """
+        Atomically set or flip a device's state.
+
+        Access check, state change and room lookup happen in one UPDATE ...
+        RETURNING statement. When ``state`` is None the stored state is
+        inverted (``NOT state``).
+
+        Returns:
+            Updated device dict (same shape as get_device), or None if the
+            device does not exist or the user may not control it.
+        """
+        normalized_id = self._normalize_device_id(device_id)
+        if normalized_id is None:
+            return None
+        # JSON fallback support
+        if self.json_fallback_mode and self.json_backup:
+            device = self.get_device(normalized_id, user_id)
+            if not device:
                 return None
-                
-            return {
-                'id': row[0],          # id
-                'name': row[1],        # name
-                'room_id': row[2],     # room_id
-                'type': row[3],        # device_type
-                'state': row[4],       # state
-                'temperature': row[5], # temperature
-                'min_temperature': row[6],  # min_temperature
-                'max_temperature': row[7],  # max_temperature
-                'display_order': row[8],    # display_order
-                'enabled': row[9],     # enabled
-                'settings': row[10],   # settings
-                'created_at': row[11], # created_at
-                'updated_at': row[12], # updated_at
-                'home_id': row[13],    # home_id
-                'room_name': row[14]   # room_name
-            }
+            new_state = bool(state) if state is not None else not device.get('state', False)
+            if not self.update_device(normalized_id, user_id, state=new_state):
+                return None
+            device['state'] = new_state
+            return device
+
+        with self.get_cursor() as cursor:
+            cursor.execute("""
+                UPDATE devices AS d
+                SET state = COALESCE(%s::boolean, NOT COALESCE(d.state, FALSE)),
+                    updated_at = NOW()
+                FROM user_homes uh
+                WHERE d.id = %s
+                  AND uh.home_id = d.home_id
+                  AND uh.user_id = %s
+                  AND (uh.role IN ('admin', 'owner', 'sys-admin')
+                       OR uh.permissions ? 'control_devices')
+                RETURNING
+                    d.id,
+                    d.name,
+                    d.room_id,
+                    d.device_type,
+                    d.state,
+                    d.temperature,
+                    d.min_temperature,
+                    d.max_temperature,
+                    d.display_order,
+                    d.enabled,
+                    d.settings,
+                    d.created_at,
+                    d.updated_at,
+                    d.home_id,
+                    (SELECT r.name FROM rooms r WHERE r.id = d.room_id) AS room_name
+            """, (state, normalized_id, user_id))
+
+            row = cursor.fetchone()
+            return self._device_row_to_dict(row) if row else None
 
     # ============================================================================
     # USER AND SESSION MANAGEMENT
@@ -2837,6 +3666,7 @@ class MultiHomeDBManager:
     # SYSTEM ADMINISTRATION
     # ============================================================================
     
+    @_invalidates_membership
     def upgrade_user_to_sys_admin(self, user_id: str) -> bool:
         """Upgrade a user to system administrator. Can only be done via direct database access."""
         with self.get_cursor() as cursor:
@@ -3378,6 +4208,7 @@ class MultiHomeDBManager:
     # USER MANAGEMENT (for registration, authentication, password management)
     # ============================================================================
 
+    @_invalidates_membership
     def create_user(self, username: str, email: str, password_hash: str, 
                    role: str = 'user', create_default_home: bool = True) -> Tuple[str, Optional[str]]:
         """
@@ -3478,30 +4309,25 @@ class MultiHomeDBManager:
         
         # JSON fallback support
         if self.json_fallback_mode and self.json_backup:
-            config = self.json_backup.get_config()
-            users = config.get('users', {})
-            
-            # Search by email or username
-            for username, user_data in users.items():
-                if (
-                    user_data.get('email') in normalized_candidates
-                    or user_data.get('username') in normalized_candidates
-                    or username in normalized_candidates
-                ):
-                    # Get default home from user_current_home
-                    user_current_home = config.get('user_current_home', {})
-                    default_home_id = user_current_home.get(user_data.get('id'))
-                    
-                    return {
-                        'id': str(user_data.get('id')),
-                        'name': user_data.get('name', user_data.get('username')),
-                        'email': user_data.get('email', ''),
-                        'password_hash': user_data.get('password', ''),
-                        'role': user_data.get('role', 'user'),
-                        'default_home_id': default_home_id,
-                        'created_at': user_data.get('created_at'),
-                        'updated_at': user_data.get('updated_at')
-                    }
+            # Search by email or username (indexed lookup)
+            for candidate in normalized_candidates:
+                found = self.json_backup.find_user(candidate)
+                if not found:
+                    continue
+                _, user_data = found
+                # Get default home from user_current_home
+                default_home_id = self.json_backup.get_user_current_home(user_data.get('id'))
+                
+                return {
+                    'id': str(user_data.get('id')),
+                    'name': user_data.get('name', user_data.get('username')),
+                    'email': user_data.get('email', ''),
+                    'password_hash': user_data.get('password', ''),
+                    'role': user_data.get('role', 'user'),
+                    'default_home_id': default_home_id,
+                    'created_at': user_data.get('created_at'),
+                    'updated_at': user_data.get('updated_at')
+                }
             return None
         
         with self.get_cursor() as cursor:
@@ -3659,27 +4485,24 @@ class MultiHomeDBManager:
         """
         # JSON fallback support
         if self.json_fallback_mode and self.json_backup:
-            config = self.json_backup.get_config()
-            users = config.get('users', {})
-            user_current_home = config.get('user_current_home', {})
-            
-            # Find user by ID
-            for username, user_data in users.items():
-                if user_data.get('id') == user_id:
-                    return {
-                        'id': str(user_data.get('id')),
-                        'name': user_data.get('name', user_data.get('username')),
-                        'email': user_data.get('email', ''),
-                        'password_hash': user_data.get('password', ''),
-                        'role': user_data.get('role', 'user'),
-                        'default_home_id': user_current_home.get(user_id),
-                        'profile_picture': user_data.get('profile_picture', ''),
-                        'timezone': user_data.get('timezone', 'UTC'),
-                        'language': user_data.get('language', 'pl'),
-                        'created_at': user_data.get('created_at'),
-                        'updated_at': user_data.get('updated_at')
-                    }
-            return None
+            # Find user by ID (indexed lookup)
+            found = self.json_backup.find_user_by_id(user_id)
+            if not found:
+                return None
+            _, user_data = found
+            return {
+                'id': str(user_data.get('id')),
+                'name': user_data.get('name', user_data.get('username')),
+                'email': user_data.get('email', ''),
+                'password_hash': user_data.get('password', ''),
+                'role': user_data.get('role', 'user'),
+                'default_home_id': self.json_backup.get_user_current_home(user_id),
+                'profile_picture': user_data.get('profile_picture', ''),
+                'timezone': user_data.get('timezone', 'UTC'),
+                'language': user_data.get('language', 'pl'),
+                'created_at': user_data.get('created_at'),
+                'updated_at': user_data.get('updated_at')
+            }
         
         with self.get_cursor() as cursor:
             if cursor is None:  # Safety check
@@ -3958,6 +4781,7 @@ class MultiHomeDBManager:
                 }
             return None
 
+    @_invalidates_membership
     def accept_invitation(self, invitation_code: str, user_id: str, username: Optional[str] = None) -> bool:
         """
         Accept a home invitation and add user to home.
@@ -4179,6 +5003,7 @@ class MultiHomeDBManager:
             logger.info(f"Admin {admin_user_id} cancelled invitation {invitation_id}")
             return True
     
+    @_invalidates_membership
     def leave_home(self, user_id: str, home_id: str) -> bool:
         """
         Allow a user to leave a home they are a member of.
@@ -0,0 +1,277 @@
+"""
+Embedded SQLite Backend for Site_proj
+
+This file lets MultiHomeDBManager run its PostgreSQL queries against a local
+SQLite database when PostgreSQL is unavailable, as an alternative to the JSON
+fallback. Connections are handed out by the same ConnectionPool, so every
+thread gets its own connection and transaction.
+
+Features:
+- WAL journal mode: readers never block the writer and vice versa
+- Schema from backups/db_schema_sqlite.sql (mirrors db_schema_multihouse.sql)
+- Translation of the PostgreSQL dialect used by the manager (%s placeholders,
+  ::casts, = ANY(array), jsonb ? key, date_trunc('hour'|'day', col),
+  UPDATE ... AS alias ... RETURNING)
+- UUID, TIMESTAMPTZ, BOOLEAN and JSONB columns come back as str, aware
+  datetime, bool and parsed JSON, like psycopg2 returns them
+- Unique violations raise psycopg2.errors.UniqueViolation, so callers keep
+  their existing error handling
+
+Configuration (environment variables):
+    DB_FALLBACK_BACKEND   'sqlite' to use this backend instead of JSON files
+    SQLITE_DB_PATH        Database file (default: app/smart_home.sqlite3)
+    SQLITE_BUSY_TIMEOUT   Seconds a writer waits for the write lock (default: 10)
+"""
+import json
+import logging
+import os
+import re
+import secrets
+import sqlite3
+import string
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Optional, Sequence
+
+from psycopg2 import IntegrityError, errors
+from werkzeug.security import generate_password_hash
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCHEMA_FILE = os.path.join(BASE_DIR, 'backups', 'db_schema_sqlite.sql')
+
+
+def _convert_timestamp(value: bytes) -> datetime:
+    """Stored local time -> aware datetime, like a TIMESTAMPTZ column"""
+    return datetime.fromisoformat(value.decode('utf-8')).astimezone()
+
+
+sqlite3.register_converter('TIMESTAMPTZ', _convert_timestamp)
+sqlite3.register_converter('BOOLEAN', lambda value: value not in (b'0', b''))
+sqlite3.register_converter('JSONB', lambda value: json.loads(value.decode('utf-8')))
+
+
+def _now() -> str:
+    """SQL NOW(): local time in the stored timestamp format"""
+    return datetime.now().isoformat(sep=' ')
+
+
+def _adapt(value: Any) -> Any:
+    """Convert a psycopg2-style query parameter to a SQLite value"""
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone().replace(tzinfo=None)
+        return value.isoformat(sep=' ')
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, (list, tuple, dict)):
+        # Arrays (for = ANY) and JSON documents
+        return json.dumps(value, default=str)
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+_UPDATE_ALIAS = re.compile(r'\bUPDATE\s+(?!SET\b)(\w+)\s+(?:AS\s+)?(?!SET\b)(\w+)\s+SET\b', re.IGNORECASE)
+_REWRITES = [
+    # jsonb key test: perms ? 'key'
+    (re.compile(r"([\w.]+)\s+\?\s+'([^']*)'"),
+     r"EXISTS (SELECT 1 FROM json_each(\1) WHERE value = '\2')"),
+    # x = ANY(%s::uuid[]) with the array bound as JSON
+    (re.compile(r'=\s*ANY\s*\(\s*%s(?:::\w+\[\])?\s*\)', re.IGNORECASE),
+     'IN (SELECT value FROM json_each(%s))'),
+    (re.compile(r"\(\s*%s::date\s*\+\s*interval\s+'1 day'\s*\)", re.IGNORECASE),
+     "date(%s, '+1 day')"),
+    (re.compile(r'\(\s*NOW\(\)\s*-\s*make_interval\(\s*days\s*=>\s*%s\s*\)\s*\)', re.IGNORECASE),
+     "datetime('now', 'localtime', '-' || %s || ' days')"),
+    (re.compile(r"date_trunc\(\s*'hour'\s*,\s*([\w.]+)\s*\)", re.IGNORECASE),
+     r"strftime('%Y-%m-%d %H:00:00', \1)"),
+    (re.compile(r"date_trunc\(\s*'day'\s*,\s*([\w.]+)\s*\)", re.IGNORECASE),
+     r"strftime('%Y-%m-%d 00:00:00', \1)"),
+    # ::casts are implied by the column types
+    (re.compile(r'::\w+(?:\[\])?'), ''),
+]
+
+
+@lru_cache(maxsize=512)
+def translate(query: str) -> str:
+    """
+    Rewrite a PostgreSQL query of MultiHomeDBManager for SQLite
+
+    Args:
+        query: Query with psycopg2 %s placeholders
+
+    Returns:
+        Equivalent SQLite query with ? placeholders
+    """
+    for pattern, replacement in _REWRITES:
+        query = pattern.sub(replacement, query)
+
+    match = _UPDATE_ALIAS.search(query)
+    if match:
+        table, alias = match.groups()
+        query = f"{query[:match.start()]}UPDATE {table} AS {alias} SET{query[match.end():]}"
+        # SQLite's RETURNING only knows the table name, not the alias
+        head, sep, returning = query.partition('RETURNING')
+        if sep:
+            query = head + sep + re.sub(rf'\b{alias}\.', f'{table}.', returning)
+
+    return query.replace('%s', '?').replace('%%', '%')
+
+
+class SQLiteCursor:
+    """DB-API cursor accepting psycopg2-style queries and parameters"""
+
+    def __init__(self, raw: sqlite3.Cursor):
+        self._raw = raw
+
+    def execute(self, query: str, params: Optional[Sequence[Any]] = None):
+        if query.startswith('SAVEPOINT') and not self._raw.connection.in_transaction:
+            # Outside a transaction SQLite's SAVEPOINT starts one that its
+            # RELEASE commits; psycopg2 always has one open, so open it here
+            self._raw.execute('BEGIN')
+        try:
+            self._raw.execute(translate(query), [_adapt(p) for p in params or ()])
+        except sqlite3.IntegrityError as e:
+            if 'UNIQUE' in str(e):
+                raise errors.UniqueViolation(str(e)) from e
+            raise IntegrityError(str(e)) from e
+        return self
+
+    def executemany(self, query: str, seq_of_params):
+        self._raw.executemany(translate(query), ([_adapt(p) for p in params] for params in seq_of_params))
+        return self
+
+    def fetchone(self):
+        return self._raw.fetchone()
+
+    def fetchall(self):
+        return self._raw.fetchall()
+
+    def fetchmany(self, size: Optional[int] = None):
+        return self._raw.fetchmany(size or self._raw.arraysize)
+
+    @property
+    def rowcount(self) -> int:
+        return self._raw.rowcount
+
+    @property
+    def description(self):
+        return self._raw.description
+
+    def close(self):
+        self._raw.close()
+
+    def __iter__(self):
+        return iter(self._raw)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class SQLiteConnection:
+    """Pool-compatible wrapper around a sqlite3 connection"""
+
+    def __init__(self, raw: sqlite3.Connection):
+        self._raw = raw
+        self.closed = False
+
+    def cursor(self) -> SQLiteCursor:
+        return SQLiteCursor(self._raw.cursor())
+
+    def commit(self):
+        self._raw.commit()
+
+    def rollback(self):
+        self._raw.rollback()
+
+    def close(self):
+        self.closed = True
+        self._raw.close()
+
+
+class SQLiteDatabase:
+    """Opens connections to one SQLite database file and creates its schema"""
+
+    def __init__(self, path: Optional[str] = None, busy_timeout: Optional[float] = None):
+        """
+        Initialize the database
+
+        Args:
+            path: Database file (default: SQLITE_DB_PATH env or app/smart_home.sqlite3)
+            busy_timeout: Seconds to wait for the write lock (default: SQLITE_BUSY_TIMEOUT env)
+        """
+        self.path = path or os.getenv('SQLITE_DB_PATH') or os.path.join(BASE_DIR, 'app', 'smart_home.sqlite3')
+        self.busy_timeout = busy_timeout if busy_timeout is not None else float(os.getenv('SQLITE_BUSY_TIMEOUT', '10'))
+        self.generated_password = None
+
+    def connect(self) -> SQLiteConnection:
+        """Open a new connection (used as the ConnectionPool factory)"""
+        raw = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False,  # pooled connections move between threads
+        )
+        raw.create_function('NOW', 0, _now)
+        raw.create_function('gen_random_uuid', 0, lambda: str(uuid.uuid4()))
+        raw.execute('PRAGMA journal_mode=WAL')
+        raw.execute('PRAGMA synchronous=NORMAL')
+        raw.execute('PRAGMA foreign_keys=ON')
+        return SQLiteConnection(raw)
+
+    def initialize(self):
+        """Create the schema if needed and a sys-admin account on an empty database"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self.connect()
+        try:
+            with open(SCHEMA_FILE, 'r', encoding='utf-8') as f:
+                connection._raw.executescript(f.read())
+            cursor = connection.cursor()
+            cursor.execute("SELECT COUNT(*) FROM users")
+            if cursor.fetchone()[0] == 0:
+                self._create_admin(cursor)
+            connection.commit()
+        finally:
+            connection.close()
+
+    def _create_admin(self, cursor: SQLiteCursor):
+        """Create the sys-admin user with a generated password and a default home"""
+        alphabet = string.ascii_letters + string.digits + "!@#$%^&*"
+        self.generated_password = ''.join(secrets.choice(alphabet) for _ in range(16))
+        user_id = str(uuid.uuid4())
+        home_id = str(uuid.uuid4())
+        cursor.execute("""
+            INSERT INTO users (id, name, email, password_hash, role)
+            VALUES (%s, 'sys-admin', 'admin@localhost', %s, 'sys-admin')
+        """, (user_id, generate_password_hash(self.generated_password)))
+        cursor.execute("""
+            INSERT INTO homes (id, name, owner_id, description)
+            VALUES (%s, 'My Home', %s, 'Default home created with system')
+        """, (home_id, user_id))
+        cursor.execute("""
+            INSERT INTO user_homes (user_id, home_id, role, permissions)
+            VALUES (%s, %s, 'owner', %s)
+        """, (user_id, home_id, ['full_control']))
+        cursor.execute("UPDATE users SET default_home_id = %s WHERE id = %s", (home_id, user_id))
+
+        print("\n" + "="*70)
+        print("🔧 SQLITE FALLBACK MODE ACTIVATED")
+        print("="*70)
+        print(f"📄 Database created: {self.path}")
+        print(f"👤 Default admin user created:")
+        print(f"   Username: sys-admin")
+        print(f"   Password: {self.generated_password}")
+        print("="*70)
+        print("⚠️  IMPORTANT: Save these credentials! They will not be shown again.")
+        print("="*70 + "\n")
@@ -0,0 +1,380 @@
+"""
+Two-tier cache: a per-worker LRU in front of the shared Redis cache
+
+Every CachedDataAccess lookup is otherwise a Redis round trip. TieredCache
+wraps the Flask-Caching Redis cache with the same get/set/delete interface
+and answers repeated reads from a small in-process LRU that is bounded by
+entry count and by a short TTL.
+
+Writes go to Redis first and are then broadcast over Redis pub/sub; every
+worker (gunicorn process) listens on the channel and drops the keys from
+its local tier, so a value changed in one worker is not served stale by
+another for longer than the message takes to arrive. If the subscription
+breaks, the local tier is cleared on reconnect and CACHE_LOCAL_TTL bounds
+the staleness meanwhile.
+
+A read that misses locally takes a fill token before it goes to Redis and
+only stores the value locally if no invalidation of that key (or clear)
+arrived meanwhile; otherwise a value read just before another worker's
+write could be kept for the whole local TTL.
+
+Local entries are stored pickled, like in Redis, so callers that modify a
+returned list never change the cached copy.
+
+Configuration (environment variables):
+    CACHE_LOCAL_ENABLED          false to use Redis only (default: true)
+    CACHE_LOCAL_MAX_ENTRIES      Entries kept per worker (default: 1024)
+    CACHE_LOCAL_TTL              Seconds an entry is kept locally (default: 30)
+    CACHE_INVALIDATION_CHANNEL   Pub/sub channel (default: smarthome:cache:invalidate)
+"""
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Message asking every worker to drop its whole local tier
+_ALL_KEYS = '*'
+
+
+class LocalLRU:
+    """Thread-safe LRU of pickled values with a per-entry expiry"""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 30.0):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        # Invalidation counters per key, and of clear(); a fill token is a
+        # snapshot of both
+        self._epochs: Dict[str, int] = {}
+        self._clear_epoch = 0
+
+    def get(self, key: str):
+        """(True, value) for a live entry, else (False, None)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, payload = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+        return True, pickle.loads(payload)
+
+    def fill_token(self, key: str) -> tuple:
+        """Token to take before reading a key's value from the remote cache"""
+        with self._lock:
+            return self._clear_epoch, self._epochs.get(key, 0)
+
+    def set(self, key: str, value: Any, timeout: Optional[float] = None, token: Optional[tuple] = None,
+            write: bool = False) -> bool:
+        """
+        Store a value for the local TTL, or the shorter remote timeout
+
+        With a fill token the value is only stored if the key was not
+        invalidated since the token was taken. A write (the value was just
+        stored remotely) also fails the pending fills of other threads,
+        which may have read the previous value.
+        """
+        ttl = self.ttl if not timeout else min(self.ttl, timeout)
+        payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL) if ttl > 0 else None
+        with self._lock:
+            current = (self._clear_epoch, self._epochs.get(key, 0))
+            if write:
+                self._bump(key)
+            if payload is None:
+                self._entries.pop(key, None)
+                return False
+            if token is not None and token != current:
+                # A fill keeps what was stored after the invalidation; of two
+                # racing writes it is unknown which one reached Redis last
+                if write:
+                    self._entries.pop(key, None)
+                return False
+            self._entries[key] = (time.monotonic() + ttl, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return True
+
+    def _bump(self, key: str):
+        """Fail the pending fills of a key. Lock must be held."""
+        self._epochs[key] = self._epochs.get(key, 0) + 1
+        if len(self._epochs) > self.max_entries * 4:
+            # Bounded: forgetting the counters fails every pending fill
+            self._epochs.clear()
+            self._clear_epoch += 1
+
+    def delete(self, keys: Iterable[str]):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+                self._bump(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._epochs.clear()
+            self._clear_epoch += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class TieredCache:
+    """
+    Flask-Caching compatible cache with a local LRU over a remote cache
+
+    get/get_many/set/set_many/add/delete/delete_many/clear are tier-aware;
+    any other attribute (config, inc, ...) is passed to the remote cache.
+    """
+
+    def __init__(self, remote, client=None, max_entries: Optional[int] = None,
+                 ttl: Optional[float] = None, channel: Optional[str] = None):
+        """
+        Initialize the cache
+
+        Args:
+            remote: Flask-Caching Cache instance (Redis backend)
+            client: Redis client used for pub/sub (default: the remote backend's client)
+            max_entries: Local entries (default: CACHE_LOCAL_MAX_ENTRIES env)
+            ttl: Local TTL in seconds (default: CACHE_LOCAL_TTL env)
+            channel: Invalidation channel (default: CACHE_INVALIDATION_CHANNEL env)
+        """
+        self.remote = remote
+        self.local = LocalLRU(
+            max_entries or int(os.getenv('CACHE_LOCAL_MAX_ENTRIES', '1024')),
+            ttl if ttl is not None else float(os.getenv('CACHE_LOCAL_TTL', '30'))
+        )
+        self.channel = channel or os.getenv('CACHE_INVALIDATION_CHANNEL', 'smarthome:cache:invalidate')
+        self.client = client if client is not None else getattr(getattr(remote, 'cache', None), '_write_client', None)
+        self._lock = threading.Lock()
+        self._listener = None
+        self._listener_pid = None
+        self._origin = None
+        self._closed = False
+        self._stats = {
+            'local_hits': 0, 'local_misses': 0,
+            'remote_hits': 0, 'remote_misses': 0,
+            'invalidations_sent': 0, 'invalidations_received': 0,
+            'publish_errors': 0, 'subscription_errors': 0,
+        }
+        self._ensure_listener()
+
+    def __getattr__(self, name):
+        return getattr(self.remote, name)
+
+    def _count(self, counter: str, amount: int = 1):
+        with self._lock:
+            self._stats[counter] += amount
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def get(self, key: str):
+        self._ensure_listener()
+        found, value = self.local.get(key)
+        if found:
+            self._count('local_hits')
+            return value
+        self._count('local_misses')
+        token = self.local.fill_token(key)
+        value = self.remote.get(key)
+        if value is None:
+            self._count('remote_misses')
+            return None
+        self._count('remote_hits')
+        self.local.set(key, value, token=token)
+        return value
+
+    def get_many(self, *keys: str) -> List[Any]:
+        self._ensure_listener()
+        values: List[Any] = [None] * len(keys)
+        missing = []
+        for index, key in enumerate(keys):
+            found, value = self.local.get(key)
+            if found:
+                values[index] = value
+            else:
+                missing.append(index)
+        self._count('local_hits', len(keys) - len(missing))
+        self._count('local_misses', len(missing))
+        if missing:
+            tokens = {index: self.local.fill_token(keys[index]) for index in missing}
+            fetched = self.remote.get_many(*[keys[index] for index in missing])
+            for index, value in zip(missing, fetched):
+                if value is None:
+                    self._count('remote_misses')
+                    continue
+                self._count('remote_hits')
+                values[index] = value
+                self.local.set(keys[index], value, token=tokens[index])
+        return values
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def set(self, key: str, value: Any, timeout: Optional[int] = None):
+        token = self.local.fill_token(key)
+        result = self.remote.set(key, value, timeout=timeout)
+        self._publish([key])
+        if result:
+            self.local.set(key, value, timeout, token=token, write=True)
+        else:
+            self.local.delete([key])
+        return result
+
+    def set_many(self, mapping: Dict[str, Any], timeout: Optional[int] = None):
+        result = self.remote.set_many(mapping, timeout=timeout)
+        self.local.delete(mapping)
+        self._publish(list(mapping))
+        return result
+
+    def add(self, key: str, value: Any, timeout: Optional[int] = None):
+        token = self.local.fill_token(key)
+        added = self.remote.add(key, value, timeout=timeout)
+        if added:
+            self._publish([key])
+            self.local.set(key, value, timeout, token=token, write=True)
+        return added
+
+    def delete(self, key: str):
+        result = self.remote.delete(key)
+        self.local.delete([key])
+        self._publish([key])
+        return result
+
+    def delete_many(self, *keys: str):
+        result = self.remote.delete_many(*keys)
+        self.local.delete(keys)
+        self._publish(list(keys))
+        return result
+
+    def clear(self):
+        result = self.remote.clear()
+        self.local.clear()
+        self._publish([_ALL_KEYS])
+        return result
+
+    # ------------------------------------------------------------------
+    # Invalidation broadcast
+    # ------------------------------------------------------------------
+
+    def _publish(self, keys: List[str]):
+        """Tell the other workers to drop keys from their local tier"""
+        if self.client is None or not keys:
+            return
+        self._ensure_listener()
+        try:
+            self.client.publish(self.channel, json.dumps({'origin': self._origin, 'keys': keys}))
+            self._count('invalidations_sent')
+        except Exception as e:
+            self._count('publish_errors')
+            logger.warning(f"Cache invalidation broadcast failed: {e}")
+
+    def _handle_message(self, data):
+        """Apply an invalidation message from another worker"""
+        try:
+            message = json.loads(data)
+        except (TypeError, ValueError):
+            return
+        if message.get('origin') == self._origin:
+            return
+        keys = message.get('keys') or []
+        self._count('invalidations_received')
+        if _ALL_KEYS in keys:
+            self.local.clear()
+        else:
+            self.local.delete(keys)
+
+    def _ensure_listener(self):
+        """Subscribe (again after a fork, which only copies the calling thread)"""
+        if self.client is None or self._closed:
+            return
+        if self._listener is not None and self._listener_pid == os.getpid() and self._listener.is_alive():
+            return
+        with self._lock:
+            if self._listener is not None and self._listener_pid == os.getpid() and self._listener.is_alive():
+                return
+            # The parent's entries may already be stale for this process
+            self.local.clear()
+            self._listener_pid = os.getpid()
+            self._origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+            self._listener = threading.Thread(target=self._run_listener, name='cache-invalidation-listener', daemon=True)
+            self._listener.start()
+
+    def _run_listener(self):
+        """Drop local entries named by invalidation messages until closed"""
+        backoff = 1.0
+        while not self._closed:
+            pubsub = None
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # Messages may have been missed while unsubscribed
+                self.local.clear()
+                backoff = 1.0
+                while not self._closed:
+                    # Polling with a timeout keeps clear of the client's socket timeout
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message.get('type') == 'message':
+                        self._handle_message(message.get('data'))
+            except Exception as e:
+                self._count('subscription_errors')
+                logger.warning(f"Cache invalidation subscription lost: {e}; retrying in {backoff:.0f}s")
+                self.local.clear()
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+    def close(self):
+        """Stop the invalidation listener"""
+        self._closed = True
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Per-tier hit/miss counters and invalidation traffic"""
+        with self._lock:
+            stats = dict(self._stats)
+        local_total = stats['local_hits'] + stats['local_misses']
+        remote_total = stats['remote_hits'] + stats['remote_misses']
+        return {
+            'local': {
+                'hits': stats['local_hits'],
+                'misses': stats['local_misses'],
+                'hit_rate_percentage': round(stats['local_hits'] / local_total * 100, 2) if local_total else 0.0,
+                'entries': len(self.local),
+                'max_entries': self.local.max_entries,
+                'ttl': self.local.ttl,
+                'evictions': self.local.evictions,
+            },
+            'remote': {
+                'hits': stats['remote_hits'],
+                'misses': stats['remote_misses'],
+                'hit_rate_percentage': round(stats['remote_hits'] / remote_total * 100, 2) if remote_total else 0.0,
+            },
+            'invalidation': {
+                'channel': self.channel,
+                'subscribed': bool(self._listener is not None and self._listener.is_alive()),
+                'sent': stats['invalidations_sent'],
+                'received': stats['invalidations_received'],
+                'publish_errors': stats['publish_errors'],
+                'subscription_errors': stats['subscription_errors'],
+            },
+        }